@@ -1,5 +1,6 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 # Import Supabase connection
 from supabase_client import supabase_connection
@@ -14,15 +15,29 @@ from pathlib import Path
 import asyncio
 import tempfile
 import logging
+from contextlib import contextmanager
 
 from services.csv_processor import CSVProcessor
-from services.sku_manager import SKUManager
 from services.device_manager import DeviceManager
 from services.validator import Validator
 from services.rakuten_processor import RakutenCSVProcessor
 from services.batch_processor import BatchProcessor
 from services.csv_splitter import CSVSplitter
+from services.streaming_pipeline import StreamingCSVPipeline
+from services.upload_analyzer import UploadAnalyzer
+from services.parsed_file_cache import ParsedFileCache
+from services.job_queue import Job, JobError, JobQueue, JobQueueFull
+from services.encoding_sniffer import EncodingSniffer
+from services.file_delivery import content_disposition, file_response
+from services.output_metadata import ensure_output_metadata, mark_output, sidecar_path
+from services.zip_stream import ArchiveTooLarge, ZipArchiveCache
+from services.shiftjis_scanner import summarize_issues
+from services.instrumentation import Trace, current_trace, metrics, span, trace_event
+from services.request_profiler import PROFILE_HEADER, PROFILE_QUERY, ProfileAccessDenied, ProfilerBusy, RequestProfiler
+from services.device_attribute_resolver import device_attribute_resolver
+from services.brand_attribute_resolver import brand_attribute_resolver
 from database_api import router as database_router
+from brand_mapping import FALLBACK_BRAND_ATTRIBUTES, DEFAULT_BRAND_ATTRIBUTES
 from product_attributes_api_v2 import router as product_attributes_router
 from models.schemas import ProcessRequest, DeviceAction, ProcessingOptions
 
@@ -57,17 +72,72 @@ DATA_DIR = Path("/app/data")
 UPLOAD_DIR = DATA_DIR / "uploads"
 OUTPUT_DIR = DATA_DIR / "outputs"
 STATE_DIR = DATA_DIR / "state"
+ZIP_CACHE_DIR = DATA_DIR / "zip_cache"
+PROFILE_DIR = STATE_DIR / "profiles"
+CSV_MEDIA_TYPE = "text/csv; charset=shift_jis"
 
-for dir_path in [UPLOAD_DIR, OUTPUT_DIR, STATE_DIR]:
+for dir_path in [UPLOAD_DIR, OUTPUT_DIR, STATE_DIR, ZIP_CACHE_DIR]:
     dir_path.mkdir(parents=True, exist_ok=True)
 
-csv_processor = CSVProcessor()
-sku_manager = SKUManager(STATE_DIR / "sku_counters.json")
+# Parsed uploads are reused by /api/devices, /api/process and batch processing
+parsed_file_cache = ParsedFileCache(max_bytes=int(os.getenv("PARSED_CACHE_MB", "512")) * 1024 * 1024)
+# Encoding detected at upload is reused by every later read of the same file
+encoding_sniffer = EncodingSniffer()
+csv_processor = CSVProcessor(cache=parsed_file_cache, encoding_sniffer=encoding_sniffer)
 device_manager = DeviceManager()
+upload_analyzer = UploadAnalyzer()
 validator = Validator()
-rakuten_processor = RakutenCSVProcessor(STATE_DIR / "sku_counters.json")
-batch_processor = BatchProcessor(STATE_DIR)
+rakuten_processor = RakutenCSVProcessor(
+    STATE_DIR / "sku_counters.json",
+    parallel_workers=int(os.getenv("PARALLEL_WORKERS", "0")) or None,
+    parallel_shard_size=int(os.getenv("PARALLEL_SHARD_ROWS", "20000"))
+)
+# デバイス属性は一度だけ読み込み、product_attributes_api_v2 の書き込みで無効化する
+if supabase_connection.is_enabled():
+    device_attribute_resolver.loader = supabase_connection.get_devices
+    brand_attribute_resolver.loader = supabase_connection.get_all_brand_values
+batch_processor = BatchProcessor(STATE_DIR, parsed_cache=parsed_file_cache, encoding_sniffer=encoding_sniffer,
+                                 device_resolver=device_attribute_resolver,
+                                 workers=int(os.getenv("BATCH_WORKERS", "0")) or None)
 csv_splitter = CSVSplitter(max_rows_per_file=60000)
+streaming_pipeline = StreamingCSVPipeline(
+    csv_processor, rakuten_processor, validator,
+    chunk_rows=int(os.getenv("STREAMING_CHUNK_ROWS", "20000"))
+)
+# ZIP downloads are compressed in parallel while streaming and cached by member hashes
+zip_cache = ZipArchiveCache(ZIP_CACHE_DIR, max_workers=int(os.getenv("ZIP_WORKERS", "0")) or None)
+# /api/process runs on this worker pool so the event loop stays responsive
+job_queue = JobQueue(
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("JOB_QUEUE_SIZE", "8")),
+    retention_seconds=int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+)
+# 管理者トークン付きのリクエストだけをプロファイルする（PROFILE_TOKEN未設定なら無効）
+request_profiler = RequestProfiler(PROFILE_DIR, token=os.getenv("PROFILE_TOKEN"), app_version=app.version,
+                                   max_profiles=int(os.getenv("PROFILE_MAX_COUNT", "50")))
+# ジョブの診断イベント（/api/jobs/{job_id}/trace）: DEBUG_TRACE=1 なら全ジョブで記録
+DEBUG_TRACE = os.getenv("DEBUG_TRACE", "0") == "1"
+DEBUG_TRACE_EVENTS = int(os.getenv("DEBUG_TRACE_EVENTS", "10000"))
+
+def profiling_requested(http_request: Request) -> bool:
+    """Whether the request carries the admin profile token (403 for a wrong token)"""
+    try:
+        return request_profiler.requested(http_request.headers, http_request.query_params)
+    except ProfileAccessDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+@contextmanager
+def profiling_session(enabled: bool, kind: str, meta: Optional[Dict] = None):
+    """Profile the with block on the calling thread when enabled (409 while another profile runs)"""
+    if not enabled:
+        yield None
+        return
+    try:
+        session = request_profiler.start(kind, meta=meta)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    with session:
+        yield session
 
 @app.get("/")
 async def root():
@@ -79,9 +149,10 @@ async def root():
     }
 
 @app.post("/api/upload")
-async def upload_csv(file: UploadFile = File(...)):
+async def upload_csv(http_request: Request, file: UploadFile = File(...)):
     """Upload CSV file for processing"""
     logger.info(f"Uploading file: {file.filename}")
+    profile = profiling_requested(http_request)
     
     # ファイル形式チェック
     if not file.filename.endswith('.csv'):
@@ -98,97 +169,134 @@ async def upload_csv(file: UploadFile = File(...)):
             detail=f"File size {file_size / 1024 / 1024:.2f}MB exceeds maximum allowed size of 1000MB"
         )
     
-    # ファイルを元の位置に戻す
-    await file.seek(0)
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"upload_{timestamp}_{file.filename}"
     file_path = UPLOAD_DIR / filename
     
-    try:
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
-        
-        # Detect encoding and read CSV
-        df = csv_processor.read_csv(file_path)
-        
-        # Extract devices and products with device info
-        product_col = '商品管理番号（商品URL）'
-        sku_col = 'SKU管理番号'
-        device_col = 'バリエーション項目選択肢2'
-        
-        # Get products with their devices from variation definition
-        product_devices = {}
-        var_def_col = 'バリエーション2選択肢定義'
-        
-        if product_col in df.columns and sku_col in df.columns and var_def_col in df.columns:
-            # 親行から機種リストを取得
-            for idx, row in df.iterrows():
-                has_product = pd.notna(row.get(product_col))
-                sku_value = row.get(sku_col)
-                is_sku_empty = pd.isna(sku_value) or sku_value == ''
+    def save_and_analyze() -> Dict:
+        # 本文の受信はイベントループで済ませ、プロファイルは保存と解析のみ（このワーカースレッド上）を対象にする
+        with profiling_session(profile, "upload") as session:
+            try:
+                with open(file_path, 'wb') as f:
+                    f.write(contents)
+                if session is not None:
+                    session.add_inputs([file_path])
                 
-                if has_product and is_sku_empty:
-                    # Parent row
-                    product_id = row[product_col]
-                    var_def_value = row.get(var_def_col, None)
-                    
-                    if pd.notna(var_def_value) and var_def_value and str(var_def_value).strip():
-                        # パイプ区切りの機種リストを解析
-                        device_list = [d.strip() for d in str(var_def_value).split('|') if d.strip()]
-                        if device_list:
-                            product_devices[product_id] = device_list
-        
-        # フォールバック: SKU行から取得
-        if not product_devices and device_col in df.columns:
-            current_product = None
-            for _, row in df.iterrows():
-                if pd.notna(row[product_col]) and pd.isna(row[sku_col]):
-                    current_product = row[product_col]
-                    if current_product not in product_devices:
-                        product_devices[current_product] = []
-                elif pd.notna(row.get(sku_col, '')) and current_product:
-                    if pd.notna(row.get(device_col, '')):
-                        if row[device_col] not in product_devices[current_product]:
-                            product_devices[current_product].append(row[device_col])
-        
-        # Get overall device list
-        devices = device_manager.extract_devices(df)
-        
-        # Get product info
-        products = csv_processor.get_product_info(df)
+                # Detect encoding and read CSV
+                df = csv_processor.read_csv(file_path)
+                
+                # Devices, per-product devices and product info in one vectorized analysis
+                analysis = upload_analyzer.analyze(df)
+                
+                result = {
+                    "file_id": filename,
+                    "devices": analysis["devices"],
+                    "products": analysis["products"],
+                    "product_devices": analysis["product_devices"],  # 商品ごとの機種リスト
+                    "row_count": analysis["row_count"],
+                    "column_count": analysis["column_count"],
+                    "encoding": csv_processor.detect_encoding(file_path)
+                }
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
         
-        return {
-            "file_id": filename,
-            "devices": devices,
-            "products": products,
-            "product_devices": product_devices,  # 商品ごとの機種リスト
-            "row_count": len(df),
-            "column_count": len(df.columns)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        if session is not None:
+            result["profile_id"] = session.id
+        return result
+    
+    return await run_in_threadpool(save_and_analyze)
 
 @app.post("/api/process")
-async def process_csv(request: ProcessRequest):
-    """Process CSV with device changes"""
-    print(f"[DEBUG] === PROCESS REQUEST RECEIVED ===")
-    print(f"[DEBUG] Request.devices_to_add: {request.devices_to_add} (type: {type(request.devices_to_add)})")
-    print(f"[DEBUG] Request.device_brand: '{request.device_brand}' (type: {type(request.device_brand)})")
-    print(f"[DEBUG] Request.device_attributes: {request.device_attributes}")
+async def process_csv(request: ProcessRequest, http_request: Request):
+    """Process CSV with device changes
     
+    The work runs on the job queue's worker pool. With background=True the
+    job is returned immediately (202) for polling via /api/jobs/{job_id}.
+    With the admin profile token the job runs under the request profiler
+    """
     file_path = UPLOAD_DIR / request.file_id
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
+    profile = profiling_requested(http_request)
     
-    print(f"Processing file: {file_path}")
-    print(f"Devices to add: {request.devices_to_add}")
-    print(f"Devices to remove: {request.devices_to_remove}")
-    if request.device_brand:
-        print(f"Device brand: {request.device_brand}")
+    try:
+        job = job_queue.submit("process", run_profiled_process_job if profile else run_process_job, request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Too many processing jobs, retry later ({e})")
+    
+    if request.background:
+        return JSONResponse(status_code=202, content=job.to_dict())
     
     try:
+        return await asyncio.wrap_future(job.future)
+    except JobError as e:
+        if e.details is not None:
+            return JSONResponse(status_code=e.status_code, content=job_error_content(job, str(e), e.details))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def job_error_content(job: Job, error: str, details: Optional[List]) -> Dict:
+    """Error body of a failed job; validation failures point to the paged violation table"""
+    content = {"error": error}
+    if details is not None:
+        content["details"] = details
+    if job.violations:
+        content["job_id"] = job.id
+        content["violation_count"] = len(job.violations)
+    return content
+
+def job_spans(job: Job) -> List[Dict]:
+    """Per-stage timings recorded so far (wall time, rows, tracemalloc peak)"""
+    return job.trace.summary() if job.trace is not None else []
+
+def run_profiled_process_job(job: Job, request: ProcessRequest) -> Dict:
+    """run_process_job under the request profiler (the profile covers the job worker thread)"""
+    try:
+        session = request_profiler.start(
+            "process", [UPLOAD_DIR / request.file_id],
+            meta={"engine": request.engine.value, "options": request.model_dump(mode="json")}
+        )
+    except ProfilerBusy as e:
+        raise JobError(str(e), status_code=409)
+    job.info["profile_id"] = session.id
+    with session:
+        result = run_process_job(job, request)
+    result["profile_id"] = session.id
+    return result
+
+def run_process_job(job: Job, request: ProcessRequest) -> Dict:
+    """Process an uploaded CSV (runs on a job worker thread)"""
+    file_path = UPLOAD_DIR / request.file_id
+    # 並行するジョブ間で original_columns を共有しないようジョブごとに作成する
+    job_csv_processor = CSVProcessor(cache=parsed_file_cache, encoding_sniffer=encoding_sniffer)
+    job_streaming_pipeline = StreamingCSVPipeline(
+        job_csv_processor, rakuten_processor, validator, chunk_rows=streaming_pipeline.chunk_rows
+    )
+    # 同じ秒に完了したジョブの出力ファイル名が衝突しないようにする
+    output_suffix = job.id[:8]
+    
+    # 診断イベントはリクエスト（debug_trace）か DEBUG_TRACE=1 で有効にした場合のみ記録する
+    trace = current_trace()
+    if trace is not None and (request.debug_trace or DEBUG_TRACE):
+        trace.enable_events(DEBUG_TRACE_EVENTS)
+    trace_event('job_started', file=str(file_path), devices_to_add=list(request.devices_to_add or []),
+                devices_to_remove=list(request.devices_to_remove or []), device_brand=request.device_brand,
+                engine=request.engine.value)
+    
+    # ストリーミングは商品行が連続しているsingle/split_60k（入力順の分割）出力のみ対応
+    use_streaming = bool(request.streaming) and (
+        request.output_format == "single" or
+        (request.output_format == "split_60k" and request.split_strategy == "sequential")
+    )
+    if request.streaming and not use_streaming:
+        fallback_reason = f"Streaming mode supports only single and sequential split_60k output, processing {request.output_format.value} in memory"
+        logger.warning(fallback_reason)
+        job.info["streaming_fallback"] = fallback_reason
+        trace_event('streaming_fallback', reason=fallback_reason)
+    
+    try:
+        job.start_stage("parse")
         # Product Attributes 8データベースから各デバイスの属性値を取得
         device_db_attributes = {}
         # 新規追加デバイスと既存デバイスの両方を対象にする
@@ -196,8 +304,19 @@ async def process_csv(request: ProcessRequest):
         
         # CSVファイルから既存デバイスを取得して追加
         try:
-            df = csv_processor.read_csv(file_path)
-            existing_devices = device_manager.extract_devices(df)
+            if use_streaming:
+                # 商品・機種列のみを読み込み、商品行の連続性も確認
+                scan_result = job_streaming_pipeline.scan_devices(file_path)
+                existing_devices = scan_result['devices']
+                if not scan_result['contiguous']:
+                    fallback_reason = "Product rows are not contiguous, falling back to in-memory processing"
+                    logger.warning(fallback_reason)
+                    job.info["streaming_fallback"] = fallback_reason
+                    trace_event('streaming_fallback', reason=fallback_reason)
+                    use_streaming = False
+            else:
+                df = job_csv_processor.read_csv(file_path)
+                existing_devices = upload_analyzer.extract_devices(df)
             if existing_devices:
                 all_devices_to_check.extend(existing_devices)
                 # 重複を削除
@@ -205,81 +324,15 @@ async def process_csv(request: ProcessRequest):
         except Exception as e:
             print(f"Error reading existing devices: {e}")
         
+        job.start_stage("attribute_lookup")
         if all_devices_to_check:
             try:
-                import sqlite3
-                
-                # デバイス属性を取得（Supabase優先、SQLiteフォールバック）
-                if supabase_connection.is_enabled():
-                    # Supabase mode
-                    for device_name in all_devices_to_check:
-                        device_name_str = str(device_name)
-                        devices_data = supabase_connection.get_devices()
-                        
-                        if devices_data:
-                            for device in devices_data:
-                                if device['device_name'] == device_name_str:
-                                    device_db_attributes[device_name_str] = {
-                                        'attribute_value': device['attribute_value'],
-                                        'size_category': device.get('size_category', ''),
-                                        'brand': device.get('brand', '')
-                                    }
-                                    print(f"[DB] Found attributes for {device_name_str}: {device['attribute_value']}")
-                                    break
-                else:
-                    # SQLite fallback
-                    db_path = '/app/product_attributes_new.db'
-                    
-                    if os.path.exists(db_path):
-                        conn = sqlite3.connect(db_path)
-                        conn.row_factory = sqlite3.Row
-                        cursor = conn.cursor()
-                    
-                    # すべてのデバイスの属性値を取得（新規追加＋既存）
-                    for device_name in all_devices_to_check:
-                        # デバイス名を文字列に変換（数値も処理）
-                        device_name_str = str(device_name)
-                        # デバイス名で検索
-                        cursor.execute("""
-                            SELECT device_name, attribute_value, size_category, brand
-                            FROM device_attributes 
-                            WHERE device_name = ?
-                            ORDER BY usage_count DESC, updated_at DESC
-                            LIMIT 1
-                        """, (device_name_str,))
-                        
-                        device_row = cursor.fetchone()
-                        
-                        if device_row:
-                            # キーも文字列に統一
-                            device_db_attributes[device_name_str] = {
-                                'attribute_value': device_row['attribute_value'],
-                                'size_category': device_row['size_category'],
-                                'brand': device_row['brand']
-                            }
-                            print(f"[DB] Found attributes for {device_name_str}: {device_row['attribute_value']}")
-                        else:
-                            # 部分一致で再検索
-                            cursor.execute("""
-                                SELECT device_name, attribute_value, size_category, brand
-                                FROM device_attributes 
-                                WHERE device_name LIKE ?
-                                ORDER BY usage_count DESC, updated_at DESC
-                                LIMIT 1
-                            """, (f"%{device_name_str}%",))
-                            
-                            device_row = cursor.fetchone()
-                            if device_row:
-                                device_db_attributes[device_name_str] = {
-                                    'attribute_value': device_row['attribute_value'],
-                                    'size_category': device_row['size_category'],
-                                    'brand': device_row['brand']
-                                }
-                                print(f"[DB] Found partial match for {device_name_str}: {device_row['attribute_value']}")
-                            else:
-                                print(f"[DB] No attributes found for {device_name_str}")
-                    
-                    conn.close()
+                # デバイス属性を一括取得（メモリ上の索引: 完全一致→正規化一致→部分一致）
+                with span("attribute_lookup", rows=len(all_devices_to_check)):
+                    device_db_attributes = device_attribute_resolver.resolve(all_devices_to_check)
+                trace_event('device_attributes_resolved',
+                            found={name: attr['attribute_value'] for name, attr in device_db_attributes.items()},
+                            missing=[str(d) for d in all_devices_to_check if str(d) not in device_db_attributes])
                 
             except Exception as e:
                 print(f"Error fetching device attributes from database: {e}")
@@ -335,207 +388,33 @@ async def process_csv(request: ProcessRequest):
                     'size_category': db_attr['size_category']
                 })
         
-        print(f"[DEBUG] Final device attributes: {final_device_attributes}")
+        trace_event('device_attributes_final', device_attributes=final_device_attributes)
         
         # ブランドに基づいて属性値を取得
         brand_attributes = []
-        print(f"[DEBUG] Checking brand attributes fetch conditions:")
-        print(f"[DEBUG]   request.device_brand: '{request.device_brand}' (type: {type(request.device_brand)})")
-        print(f"[DEBUG]   request.devices_to_add: {request.devices_to_add} (type: {type(request.devices_to_add)})")
-        print(f"[DEBUG]   bool(request.device_brand): {bool(request.device_brand)}")
-        print(f"[DEBUG]   bool(request.devices_to_add): {bool(request.devices_to_add)}")
-        print(f"[DEBUG]   condition result: {bool(request.device_brand and request.devices_to_add)}")
         
         if request.device_brand and request.devices_to_add:
             try:
-                # ブランド属性を取得（Supabase優先、SQLiteフォールバック）
-                if supabase_connection.is_enabled():
-                    # Supabase mode
-                    brand_names_to_try = [
-                        request.device_brand,
-                        request.device_brand.lower(),
-                        request.device_brand.upper(),
-                        request.device_brand.capitalize()
-                    ]
-                    
-                    if 'huawei' in request.device_brand.lower():
-                        brand_names_to_try.extend(['huawei', 'HUAWEI', 'Huawei'])
-                    
-                    for brand_name in brand_names_to_try:
-                        values = supabase_connection.get_brand_values(brand_name)
-                        if values:
-                            brand_attributes = [v['attribute_value'] for v in values if v.get('row_index', 0) > 0]
-                            if brand_attributes:
-                                print(f"[DEBUG] Found brand attributes from Supabase for '{brand_name}': {len(brand_attributes)} attributes")
-                                break
-                else:
-                    # SQLite fallback
-                    brand_db_path = '/app/brand_attributes.db'
-                    if os.path.exists(brand_db_path):
-                        import sqlite3
-                        conn_brand = sqlite3.connect(brand_db_path)
-                        cursor_brand = conn_brand.cursor()
-                    
-                    # ブランド名を正規化（大文字小文字の違いを吸収）
-                    brand_names_to_try = [
-                        request.device_brand,
-                        request.device_brand.lower(),
-                        request.device_brand.upper(),
-                        request.device_brand.capitalize()
-                    ]
-                    
-                    # HUAWEIの特別処理
-                    if 'huawei' in request.device_brand.lower():
-                        brand_names_to_try.extend(['huawei', 'HUAWEI', 'Huawei'])
-                    
-                    print(f"[DEBUG] Searching brand_attributes.db for brand: {request.device_brand}")
-                    print(f"[DEBUG] Will try these brand names: {brand_names_to_try}")
-                    
-                    for brand_name in brand_names_to_try:
-                        print(f"[DEBUG] Trying brand name: '{brand_name}'")
-                        cursor_brand.execute('''
-                            SELECT attribute_value 
-                            FROM brand_values 
-                            WHERE brand_name = ? AND row_index > 0
-                            ORDER BY row_index
-                        ''', (brand_name,))
-                        
-                        results = cursor_brand.fetchall()
-                        print(f"[DEBUG] Query result for '{brand_name}': {len(results)} rows found")
-                        if results:
-                            brand_attributes = [row[0] for row in results]
-                            print(f"[DEBUG] SUCCESS! Found brand attributes from DB for '{brand_name}': {len(brand_attributes)} attributes")
-                            print(f"[DEBUG] First 3 attributes: {brand_attributes[:3]}")
-                            break
-                        else:
-                            print(f"[DEBUG] No results for brand name: '{brand_name}'")
-                    
-                    conn_brand.close()
-                
-                # データベースから取得できなかった場合は、ハードコーディングされた属性値を使用（フォールバック）
-                if not brand_attributes:
-                    # ブランドごとに適切な属性値を設定
-                    brand_attribute_mapping = {
-                        'Huawei': [
-                            'amicoco|ファーウェイ|アップル',
-                            'amicoco|ファーウェイ|グーグル',
-                            'amicoco|ファーウェイ|ソニー',
-                            'amicoco|ファーウェイ|原セラ',
-                            'amicoco|ファーウェイ|ASUS',
-                            'amicoco|ファーウェイ|シャープ',
-                            'amicoco|ファーウェイ|富士通',
-                            'amicoco|ファーウェイ|FCNT',
-                            'amicoco|ファーウェイ|楽天モバイル',
-                            'amicoco|ファーウェイ|サムスン',
-                            'amicoco|ファーウェイ|シャオミ',
-                            'amicoco|ファーウェイ|オッポ'
-                        ],
-                        'huawei': [
-                            'amicoco|ファーウェイ|アップル',
-                            'amicoco|ファーウェイ|グーグル',
-                            'amicoco|ファーウェイ|ソニー',
-                            'amicoco|ファーウェイ|原セラ',
-                            'amicoco|ファーウェイ|ASUS',
-                            'amicoco|ファーウェイ|シャープ',
-                            'amicoco|ファーウェイ|富士通',
-                            'amicoco|ファーウェイ|FCNT',
-                            'amicoco|ファーウェイ|楽天モバイル',
-                            'amicoco|ファーウェイ|サムスン',
-                            'amicoco|ファーウェイ|シャオミ',
-                            'amicoco|ファーウェイ|オッポ'
-                        ],
-                        'iPhone': [
-                            'amicoco|アップル|iPhone',
-                            'amicoco|アップル|Pro',
-                            'amicoco|アップル|Plus',
-                            'amicoco|アップル|ProMax',
-                            'amicoco|アップル|mini'
-                        ],
-                        'Galaxy': [
-                            'amicoco|サムスン|Galaxy',
-                            'amicoco|サムスン|Note',
-                            'amicoco|サムスン|Ultra',
-                            'amicoco|サムスン|Plus'
-                        ],
-                        'Xperia': [
-                            'amicoco|ソニー|Xperia',
-                            'amicoco|ソニー|1',
-                            'amicoco|ソニー|5',
-                            'amicoco|ソニー|10',
-                            'amicoco|ソニー|Ace'
-                        ],
-                        'AQUOS': [
-                            'amicoco|シャープ|AQUOS',
-                            'amicoco|シャープ|sense',
-                            'amicoco|シャープ|wish',
-                            'amicoco|シャープ|R'
-                        ],
-                        'Pixel': [
-                            'amicoco|グーグル|Pixel',
-                            'amicoco|グーグル|Pro',
-                            'amicoco|グーグル|a'
-                        ],
-                        'Xiaomi': [
-                            'amicoco|シャオミ|Xiaomi',
-                            'amicoco|シャオミ|Redmi',
-                            'amicoco|シャオミ|Mi',
-                            'amicoco|シャオミ|Note'
-                        ],
-                        'OPPO': [
-                            'amicoco|オッポ|OPPO',
-                            'amicoco|オッポ|Reno',
-                            'amicoco|オッポ|Find',
-                            'amicoco|オッポ|A'
-                        ],
-                        'OnePlus': [
-                            'amicoco|ワンプラス|OnePlus',
-                            'amicoco|ワンプラス|Pro',
-                            'amicoco|ワンプラス|Nord'
-                        ],
-                        'iPad': [
-                            'amicoco|アップル|iPad',
-                            'amicoco|アップル|iPadPro',
-                            'amicoco|アップル|iPadAir',
-                            'amicoco|アップル|iPadmini'
-                        ],
-                        'Surface': [
-                            'amicoco|マイクロソフト|Surface',
-                            'amicoco|マイクロソフト|Pro',
-                            'amicoco|マイクロソフト|Go',
-                            'amicoco|マイクロソフト|Laptop'
-                        ]
-                    }
-                    
-                    # ブランドに対応する属性値を取得
-                    if request.device_brand in brand_attribute_mapping:
-                        brand_attributes = brand_attribute_mapping[request.device_brand]
-                    else:
-                        # デフォルトの属性値
-                        brand_attributes = [
-                            'amicoco|その他|スマートフォン',
-                            'amicoco|その他|タブレット',
-                            'amicoco|その他|デバイス'
-                        ]
-                    
-                    print(f"[DEBUG] Using fallback attributes for brand {request.device_brand}: {len(brand_attributes)} attributes")
-                    print(f"[DEBUG] First 3 fallback attributes: {brand_attributes[:3]}")
+                # ブランド属性を取得（メモリ上の索引、表記ゆれは正規化キーで吸収）
+                try:
+                    with span("attribute_lookup"):
+                        brand_attributes = brand_attribute_resolver.resolve(request.device_brand)
+                except FileNotFoundError as e:
+                    logger.warning(str(e))
+                fallback = not brand_attributes
+                # データベースから取得できなかった場合は、固定の属性値を使用（フォールバック）
+                if fallback:
+                    brand_attributes = list(FALLBACK_BRAND_ATTRIBUTES.get(request.device_brand, DEFAULT_BRAND_ATTRIBUTES))
+                trace_event('brand_attributes_resolved', brand=request.device_brand, fallback=fallback,
+                            count=len(brand_attributes), first=brand_attributes[:3])
                     
             except Exception as e:
                 print(f"[ERROR] Error fetching brand attributes: {e}")
                 # エラーの場合はデフォルト属性値を使用
                 brand_attributes = []
         
-        # 最終的に使用される brand_attributes をログ出力
-        print(f"[DEBUG] Final brand_attributes to be used: {len(brand_attributes)} attributes")
-        if brand_attributes:
-            print(f"[DEBUG] Final brand_attributes first 3: {brand_attributes[:3]}")
-        
-        # Read CSV
-        df = csv_processor.read_csv(file_path)
-        
-        # Use new Rakuten processor for proper parent-child structure
-        df = rakuten_processor.process_csv(
-            df, 
+        job.start_stage("transform")
+        process_options = dict(
             devices_to_add=request.devices_to_add,
             devices_to_remove=request.devices_to_remove,
             add_position=request.add_position,
@@ -544,18 +423,63 @@ async def process_csv(request: ProcessRequest):
             insert_index=request.insert_index,
             brand_attributes=brand_attributes,
             device_attributes=final_device_attributes,
-            reset_all_devices=request.reset_all_devices
+            reset_all_devices=request.reset_all_devices,
+            engine=request.engine.value,
+            lazy_columns=bool(request.lazy_columns)
         )
         
+        if use_streaming:
+            # 商品境界で区切ったチャンクごとに処理して出力ファイルへ追記
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            base_filename = f"item_{timestamp}_{output_suffix}"
+            output_file = None
+            part_writer = None
+            if request.output_format == "split_60k":
+                # 変換済みチャンクをそのまま分割ファイルへ書き込む
+                part_writer = csv_splitter.part_writer(OUTPUT_DIR, base_filename, job_csv_processor)
+            else:
+                output_file = OUTPUT_DIR / f"{base_filename}.csv"
+            # 検証と書き込みはチャンクごとに変換と同時に行われる
+            stream_result = job_streaming_pipeline.process_file(
+                file_path, output_file, chunk_rows=request.chunk_rows, part_writer=part_writer,
+                **process_options
+            )
+            if not stream_result["valid"]:
+                job.violations = stream_result["violations"]
+                raise JobError("Validation failed", status_code=400, details=stream_result["errors"])
+            
+            output_files = [output_file] if output_file is not None else stream_result["part_files"]
+            for output_path in output_files:
+                mark_output(output_path)
+            job.info["encoding_report"] = stream_result["encoding_report"]
+            return {
+                "success": True,
+                "output_files": [f.name for f in output_files],
+                "total_rows": stream_result["total_rows"],
+                "sku_count": stream_result["sku_count"],
+                "encoding_report": stream_result["encoding_report"],
+                "spans": job_spans(job)
+            }
+        
+        # Read CSV
+        df = job_csv_processor.read_csv(file_path)
+        
+        # Use new Rakuten processor for proper parent-child structure
+        df = rakuten_processor.process_csv(df, **process_options)
+        
         # Validate constraints
-        validation_result = validator.validate_dataframe(df)
+        job.start_stage("validate")
+        validation_result = validator.validate_dataframe(df, engine=request.engine.value)
         if not validation_result["valid"]:
-            return JSONResponse(
-                status_code=400,
-                content={"error": "Validation failed", "details": validation_result["errors"]}
-            )
+            job.violations = validation_result["violations"]
+            raise JobError("Validation failed", status_code=400, details=validation_result["errors"])
+        
+        # 出力全体の文字コードチェック（CP932固有の文字はShift-JISの同じ文字に置き換える）
+        df, encoding_issues = validator.fix_output_encoding(df)
+        job.info["encoding_report"] = summarize_issues(encoding_issues)
         
         # Process and save output
+        job.start_stage("write")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_files = []
         
@@ -569,56 +493,225 @@ async def process_csv(request: ProcessRequest):
             # 確実に空文字を設定（nanやNoneではなく''）
             df.loc[sku_mask, 'バリエーション2選択肢定義'] = ''
             cleared_count = sku_mask.sum()
-            print(f"[FINAL CHECK] Cleared バリエーション2選択肢定義 for {cleared_count} SKU rows before saving")
+            trace_event('sku_variation_definitions_cleared', rows=cleared_count)
         
         if request.output_format == "single":
-            output_file = OUTPUT_DIR / f"item_{timestamp}.csv"
-            print(f"Saving to: {output_file}")
-            csv_processor.save_csv(df, output_file)
+            output_file = OUTPUT_DIR / f"item_{timestamp}_{output_suffix}.csv"
+            job_csv_processor.save_csv(df, output_file)
             output_files.append(str(output_file.name))
-            print(f"Saved file: {output_file.name}")
         
         elif request.output_format == "per_product":
             products = df.groupby('商品管理番号（商品URL）')
             for i, (product_id, product_df) in enumerate(products):
-                output_file = OUTPUT_DIR / f"item_{timestamp}_{i+1}.csv"
-                csv_processor.save_csv(product_df, output_file)
+                output_file = OUTPUT_DIR / f"item_{timestamp}_{output_suffix}_{i+1}.csv"
+                job_csv_processor.save_csv(product_df, output_file)
                 output_files.append(str(output_file.name))
         
         elif request.output_format == "split_60k":
             # Use CSV splitter to maintain parent product integrity
-            base_filename = f"item_{timestamp}"
+            base_filename = f"item_{timestamp}_{output_suffix}"
+            # 書き込み前に分割計画（ファイル数・充填率）を確定して報告する
+            split_plan = csv_splitter.plan(
+                df, strategy=request.split_strategy.value, keep_order=request.split_keep_order
+            )
+            if split_plan is not None:
+                job.info["split_plan"] = {k: v for k, v in split_plan.items() if k != 'parts'}
+                logger.info(f"Split plan: {split_plan['file_count']} files, fill ratio {split_plan['fill_ratio']:.1%}")
             split_files = csv_splitter.split_by_parent_products(
-                df, OUTPUT_DIR, base_filename
+                df, OUTPUT_DIR, base_filename, job_csv_processor, plan=split_plan
             )
             output_files = [str(f.name) for f in split_files]
             logger.info(f"Split into {len(output_files)} files maintaining parent product integrity")
         
-        # Save SKU state
-        sku_manager.save_state()
+        # 出力完了を記録（ダウンロード時は再解析せずにそのまま配信する）
+        for output_name in output_files:
+            mark_output(OUTPUT_DIR / output_name)
         
         # Count SKUs safely
         sku_count = 0
         if 'SKU管理番号' in df.columns:
             sku_count = len(df[df['SKU管理番号'].notna()])
         
-        return {
+        result = {
             "success": True,
             "output_files": output_files,
             "total_rows": len(df),
-            "sku_count": sku_count
+            "sku_count": sku_count,
+            "encoding_report": job.info["encoding_report"]
         }
+        if "split_plan" in job.info:
+            result["split_plan"] = job.info["split_plan"]
+        result["spans"] = job_spans(job)
+        return result
     
+    except JobError:
+        raise
     except Exception as e:
         import traceback
         print(f"Error in process_csv: {str(e)}")
         print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(e))
+        raise
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """List queued, running and recently finished jobs"""
+    return {"jobs": job_queue.list_jobs(), "queue": job_queue.stats()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get job status with per-stage progress"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get the result of a finished job (202 with status while it is still running)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.finished:
+        return JSONResponse(status_code=202, content=job.to_dict())
+    if job.error is not None:
+        return JSONResponse(status_code=job.error_status_code or 500,
+                            content=job_error_content(job, job.error, job.error_details))
+    return job.result
+
+@app.get("/api/jobs/{job_id}/violations")
+async def get_job_violations(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                             type: Optional[str] = None, level: Optional[str] = None):
+    """Page through the validation violations of a job (optionally filtered by type/level)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    violations = [
+        v for v in job.violations
+        if (type is None or v["type"] == type) and (level is None or v["level"] == level)
+    ]
+    counts: Dict[str, int] = {}
+    for v in job.violations:
+        counts[v["type"]] = counts.get(v["type"], 0) + 1
+    return {
+        "job_id": job.id,
+        "total": len(violations),
+        "offset": offset,
+        "limit": limit,
+        "counts": counts,
+        "violations": violations[offset:offset + limit]
+    }
+
+@app.get("/api/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000),
+                        event: Optional[str] = None):
+    """Page through the diagnostic events of a job run with debug_trace (optionally filtered by event)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    log = job.trace.event_log() if job.trace is not None else Trace().event_log()
+    events = [e for e in log["events"] if event is None or e["event"] == event]
+    counts: Dict[str, int] = {}
+    for e in log["events"]:
+        counts[e["event"]] = counts.get(e["event"], 0) + 1
+    return {
+        "job_id": job.id,
+        "enabled": log["enabled"],
+        "capacity": log["capacity"],
+        "recorded": log["recorded"],
+        "dropped": log["dropped"],
+        "total": len(events),
+        "offset": offset,
+        "limit": limit,
+        "counts": counts,
+        "events": events[offset:offset + limit]
+    }
+
+@app.get("/api/metrics")
+async def get_metrics(format: str = Query("json", pattern="^(json|prometheus)$")):
+    """Aggregated per-stage histograms of all traced jobs since startup"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+    return metrics.snapshot()
+
+def require_profile_token(http_request: Request):
+    """Profile endpoints expose code internals; only the admin token may read them"""
+    try:
+        request_profiler.check_token(
+            http_request.headers.get(PROFILE_HEADER) or http_request.query_params.get(PROFILE_QUERY)
+        )
+    except ProfileAccessDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+@app.get("/api/profiles")
+async def list_profiles(http_request: Request, input_hash: Optional[str] = None):
+    """List stored request profiles (optionally only those of one input file hash)"""
+    require_profile_token(http_request)
+    return {"profiles": request_profiler.list_profiles(input_hash)}
+
+@app.get("/api/profiles/diff")
+async def diff_profiles(http_request: Request, base: str, target: str, limit: int = Query(30, ge=1, le=500)):
+    """Compare two profiles (e.g. the same input before and after an engine change)"""
+    require_profile_token(http_request)
+    result = request_profiler.diff(base, target, limit=limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return result
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request, limit: int = Query(30, ge=1, le=500)):
+    """Profile metadata with the slowest functions and largest allocation sites"""
+    require_profile_token(http_request)
+    profile = request_profiler.get(profile_id, limit=limit)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/api/profiles/{profile_id}/download")
+async def download_profile(profile_id: str, http_request: Request):
+    """Download a profile (pstats, allocation snapshot, reports, metadata) as a ZIP"""
+    require_profile_token(http_request)
+    archive = request_profiler.archive(profile_id)
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(archive, media_type="application/zip",
+                    headers={"Content-Disposition": content_disposition(f"{profile_id}.zip")})
+
+def normalize_output_csv(file_path: Path):
+    """Enforce the output invariants on a file written without metadata (older versions)"""
+    normalizer = CSVProcessor(encoding_sniffer=encoding_sniffer)
+    # save_csvが親行以外のバリエーション2選択肢定義をクリアする
+    normalizer.save_csv(normalizer.read_csv(file_path), file_path)
+
+def zip_download(request: Request, member_paths: List[Path], zip_filename: str):
+    """
+    ZIP of member_paths: served from the archive cache when the same files were
+    zipped before, otherwise streamed while the members are compressed in parallel
+    """
+    members = [(path.name, path) for path in member_paths]
+    hashes = [ensure_output_metadata(path, normalize_output_csv)['sha256'] for path in member_paths]
+    key = zip_cache.cache_key([(name, member_hash) for (name, _), member_hash in zip(members, hashes)])
+    
+    cached = zip_cache.get(key)
+    if cached is not None:
+        zip_path, metadata = cached
+        return file_response(request, zip_path, metadata, 'application/zip', zip_filename)
+    
+    try:
+        chunks = zip_cache.stream(members, key)
+    except ArchiveTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type='application/zip',
+        headers={"Content-Disposition": content_disposition(zip_filename)}
+    )
 
 @app.get("/api/download/{filename}")
-async def download_file(filename: str, split: bool = False):
+async def download_file(filename: str, request: Request, split: bool = False):
     """
     Download processed CSV file
+    Output files are served as written (ETag / Last-Modified, conditional
+    requests and Range supported); they are never re-parsed on download
     Args:
         filename: Name of the file to download
         split: If True and file has >60k rows, split into multiple files
@@ -626,89 +719,46 @@ async def download_file(filename: str, split: bool = False):
     # まず通常の出力ディレクトリを確認
     file_path = OUTPUT_DIR / filename
     
-    # ファイルが存在する場合、SKU行のバリエーション2選択肢定義を最終確認してクリア
-    if file_path.exists():
-        try:
-            # ファイルを読み込み
-            df = pd.read_csv(file_path, encoding='shift_jis', dtype=str, keep_default_na=False)
-            
-            # 親行以外のすべての行でバリエーション2選択肢定義をクリア
-            if 'バリエーション2選択肢定義' in df.columns and 'SKU管理番号' in df.columns and '商品管理番号（商品URL）' in df.columns:
-                # 親行の条件：商品管理番号があり、かつSKU管理番号が空
-                parent_mask = (df['商品管理番号（商品URL）'] != '') & \
-                             (df['商品管理番号（商品URL）'].notna()) & \
-                             ((df['SKU管理番号'] == '') | df['SKU管理番号'].isna())
-                
-                # 親行以外をクリア
-                non_parent_mask = ~parent_mask
-                df.loc[non_parent_mask, 'バリエーション2選択肢定義'] = ''
-                
-                # ファイルを上書き保存
-                df.to_csv(file_path, index=False, encoding='shift_jis', line_terminator='\r\n')
-                logger.info(f"Cleared variation2 definitions for {non_parent_mask.sum()} non-parent rows in {filename}")
-        except Exception as e:
-            logger.error(f"Error clearing SKU variation2 definitions: {e}")
+    if not file_path.exists():
+        # バッチディレクトリも確認（バッチ処理されたファイル用）
+        # ファイル名にバッチIDが含まれている場合、該当するバッチディレクトリを検索
+        batch_file_path = next(
+            (batch_dir / filename for batch_dir in UPLOAD_DIR.glob("*_batch") if (batch_dir / filename).exists()),
+            None
+        )
+        if batch_file_path is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        metadata = ensure_output_metadata(batch_file_path, normalize_output_csv)
+        return file_response(request, batch_file_path, metadata, CSV_MEDIA_TYPE, filename)
     
-    # 分割オプションがオンで、ファイルが存在する場合
-    if file_path.exists() and split:
+    # 書き込み時に不変条件を適用済み（メタデータなし＝旧バージョンの出力のみ一度だけ正規化）
+    metadata = ensure_output_metadata(file_path, normalize_output_csv)
+    
+    # 分割オプションがオンの場合
+    if split:
         try:
-            df = pd.read_csv(file_path, encoding='shift_jis')
-            row_count = len(df)
+            base_name = filename.rsplit('.', 1)[0]
+            zip_filename = f"{base_name}_split.zip"
             
-            # 6万行を超える場合は分割
-            if row_count > 60000:
-                logger.info(f"File has {row_count} rows, splitting into multiple files")
-                
-                # 分割処理
-                base_name = filename.rsplit('.', 1)[0]
-                split_files = csv_splitter.split_by_parent_products(
-                    df, OUTPUT_DIR, base_name
-                )
-                
-                # ZIPファイルを作成
-                import zipfile
-                zip_filename = f"{base_name}_split.zip"
-                zip_path = OUTPUT_DIR / zip_filename
-                
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for split_file in split_files:
-                        zipf.write(split_file, split_file.name)
-                
-                return FileResponse(
-                    path=zip_path,
-                    media_type='application/zip',
-                    filename=zip_filename,
-                    headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
-                )
+            split_files = sorted(OUTPUT_DIR.glob(f"{base_name}_part[0-9][0-9][0-9].csv"))
+            if not split_files:
+                # チャンク単位で読みながら商品境界で分割（ファイル全体は読み込まない）
+                split_files = csv_splitter.split_file(file_path, OUTPUT_DIR, base_name)
+                for split_file in split_files:
+                    mark_output(split_file)
+            
+            # 6万行を超える（2ファイル以上になる）場合のみZIPで返す
+            if len(split_files) > 1:
+                logger.info(f"File {filename} is split into {len(split_files)} files")
+                return zip_download(request, split_files, zip_filename)
+            for split_file in split_files:
+                split_file.unlink(missing_ok=True)
+                sidecar_path(split_file).unlink(missing_ok=True)
         except Exception as e:
             logger.error(f"Error splitting file: {e}")
             # エラーの場合は通常のダウンロード
     
-    if file_path.exists():
-        return FileResponse(
-            path=file_path,
-            media_type='text/csv',
-            filename=filename,
-            headers={
-                "Content-Type": "text/csv; charset=shift_jis"
-            }
-        )
-    
-    # バッチディレクトリも確認（バッチ処理されたファイル用）
-    # ファイル名にバッチIDが含まれている場合、該当するバッチディレクトリを検索
-    for batch_dir in UPLOAD_DIR.glob("*_batch"):
-        batch_file_path = batch_dir / filename
-        if batch_file_path.exists():
-            return FileResponse(
-                path=batch_file_path,
-                media_type='text/csv',
-                filename=filename,
-                headers={
-                    "Content-Type": "text/csv; charset=shift_jis"
-                }
-            )
-    
-    raise HTTPException(status_code=404, detail="File not found")
+    return file_response(request, file_path, metadata, CSV_MEDIA_TYPE, filename)
 
 @app.get("/api/devices/{file_id}")
 async def get_devices(file_id: str):
@@ -719,7 +769,7 @@ async def get_devices(file_id: str):
             raise HTTPException(status_code=404, detail="File not found")
         
         df = csv_processor.read_csv(file_path)
-        devices = device_manager.extract_devices(df)
+        devices = upload_analyzer.extract_devices(df)
         
         return {"devices": devices}
     except Exception as e:
@@ -732,11 +782,12 @@ async def cleanup_old_files():
     current_time = time.time()
     deleted_files = []
     
-    for directory in [UPLOAD_DIR, OUTPUT_DIR]:
+    for directory in [UPLOAD_DIR, OUTPUT_DIR, ZIP_CACHE_DIR]:
         for file_path in directory.glob("*"):
             if file_path.is_file():
                 file_age = current_time - file_path.stat().st_mtime
                 if file_age > 86400:  # 24 hours
+                    parsed_file_cache.invalidate(file_path)
                     file_path.unlink()
                     deleted_files.append(str(file_path.name))
     
@@ -782,56 +833,17 @@ async def batch_upload_csv(files: List[UploadFile] = File(...)):
             
             # Quick analysis
             df = csv_processor.read_csv(file_path)
-            devices = device_manager.extract_devices(df)
-            
-            # Get product-specific device information (same as single file upload)
-            product_col = '商品管理番号（商品URL）'
-            sku_col = 'SKU管理番号'
-            var_def_col = 'バリエーション2選択肢定義'
-            device_col = 'バリエーション項目選択肢2'
-            
-            product_devices = {}
-            
-            if product_col in df.columns and sku_col in df.columns and var_def_col in df.columns:
-                # 親行から機種リストを取得
-                for idx, row in df.iterrows():
-                    has_product = pd.notna(row.get(product_col))
-                    sku_value = row.get(sku_col)
-                    is_sku_empty = pd.isna(sku_value) or sku_value == ''
-                    
-                    if has_product and is_sku_empty:
-                        # Parent row
-                        product_id = row[product_col]
-                        var_def_value = row.get(var_def_col, None)
-                        
-                        if pd.notna(var_def_value) and var_def_value and str(var_def_value).strip():
-                            # パイプ区切りの機種リストを解析
-                            device_list = [d.strip() for d in str(var_def_value).split('|') if d.strip()]
-                            if device_list:
-                                product_devices[product_id] = device_list
-            
-            # フォールバック: SKU行から取得
-            if not product_devices and device_col in df.columns:
-                current_product = None
-                for _, row in df.iterrows():
-                    if pd.notna(row.get(product_col)) and pd.isna(row.get(sku_col, '')):
-                        current_product = row[product_col]
-                        if current_product not in product_devices:
-                            product_devices[current_product] = []
-                    elif pd.notna(row.get(sku_col, '')) and current_product:
-                        if pd.notna(row.get(device_col, '')):
-                            device_value = row[device_col]
-                            if device_value not in product_devices[current_product]:
-                                product_devices[current_product].append(device_value)
+            analysis = upload_analyzer.analyze(df, include_products=False)
             
             uploaded_files.append({
                 'filename': filename,
                 'original_name': file.filename,
                 'path': str(file_path),
-                'devices': devices,
-                'product_devices': product_devices,  # 商品ごとの機種リスト
-                'row_count': len(df),
-                'column_count': len(df.columns)
+                'devices': analysis['devices'],
+                'product_devices': analysis['product_devices'],  # 商品ごとの機種リスト
+                'row_count': analysis['row_count'],
+                'column_count': analysis['column_count'],
+                'encoding': csv_processor.detect_encoding(file_path)
             })
             
         except Exception as e:
@@ -932,6 +944,7 @@ async def batch_upload_csv(files: List[UploadFile] = File(...)):
 
 @app.post("/api/batch-process")
 async def batch_process_csv(
+    http_request: Request,
     batch_id: str = Form(...),
     devices_to_add: Optional[str] = Form(None),
     devices_to_remove: Optional[str] = Form(None),
@@ -942,7 +955,11 @@ async def batch_process_csv(
     custom_device_order: Optional[str] = Form(None),
     process_mode: Optional[str] = Form('auto')  # 'auto', 'same_devices', 'different_devices'
 ):
-    """Process multiple CSV files in batch"""
+    """Process multiple CSV files in batch
+    
+    With the admin profile token the files are processed in this process
+    (no worker pool) so the profile covers them
+    """
     logger.info(f"Batch processing: {batch_id}")
     logger.info(f"UPLOAD_DIR: {UPLOAD_DIR}")
     logger.info(f"Looking for batch_dir: {UPLOAD_DIR / batch_id}")
@@ -1022,32 +1039,39 @@ async def batch_process_csv(
             device_attributes = None
     
     # Process batch
-    result = await batch_processor.process_batch_files(
-        file_paths=csv_files,
-        devices_to_add=devices_add,
-        devices_to_remove=devices_remove,
-        output_format=output_format,
-        apply_to_all=apply_to_all,
-        device_attributes=device_attributes,
-        add_position=add_position,
-        after_device=after_device,
-        custom_device_order=custom_order,
-        process_mode=process_mode  # Pass process_mode to batch processor
-    )
+    profile = profiling_requested(http_request)
+    meta = {"options": {"devices_to_add": devices_add, "devices_to_remove": devices_remove,
+                        "output_format": output_format, "apply_to_all": apply_to_all,
+                        "process_mode": process_mode}}
+    with profiling_session(profile, "batch", meta=meta) as session:
+        if session is not None:
+            session.add_inputs(sorted(csv_files))
+        result = await batch_processor.process_batch_files(
+            file_paths=csv_files,
+            devices_to_add=devices_add,
+            devices_to_remove=devices_remove,
+            output_format=output_format,
+            apply_to_all=apply_to_all,
+            device_attributes=device_attributes,
+            add_position=add_position,
+            after_device=after_device,
+            custom_device_order=custom_order,
+            process_mode=process_mode,  # Pass process_mode to batch processor
+            workers=1 if session is not None else None
+        )
     
+    if session is not None:
+        result["profile_id"] = session.id
     return result
 
 @app.get("/api/batch-download/{batch_id}")
-async def download_batch_results(batch_id: str):
-    """Download all processed files from a batch as a zip"""
-    import zipfile
-    import io
-    from fastapi.responses import StreamingResponse
-    
+async def download_batch_results(batch_id: str, request: Request):
+    """Download all processed files from a batch as a zip (streamed, cached per file contents)"""
     logger.info(f"Download request for batch: {batch_id}")
     
     status = batch_processor.get_batch_status(batch_id)
     logger.info(f"Batch status: {status}")
+    zip_filename = f"batch_{batch_id}_results.zip"
     
     if status['status'] == 'not_found':
         # Try to find files directly in the batch directory as fallback
@@ -1055,25 +1079,10 @@ async def download_batch_results(batch_id: str):
         if batch_dir.exists():
             logger.info(f"Batch directory found: {batch_dir}")
             # Find all processed files in the directory
-            processed_files = list(batch_dir.glob("*_processed_*.csv"))
+            processed_files = sorted(batch_dir.glob("*_processed_*.csv"))
             if processed_files:
                 logger.info(f"Found {len(processed_files)} processed files")
-                
-                # ZIPファイルをバッチディレクトリ内に作成
-                zip_file_path = batch_dir / f"batch_{batch_id}_results.zip"
-                
-                with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for file_path in processed_files:
-                        zip_file.write(file_path, file_path.name)
-                
-                logger.info(f"Created ZIP file: {zip_file_path}")
-                
-                # ZIPファイルを返す
-                return FileResponse(
-                    path=zip_file_path,
-                    media_type='application/zip',
-                    filename=f"batch_{batch_id}_results.zip"
-                )
+                return zip_download(request, processed_files, zip_filename)
         
         raise HTTPException(status_code=404, detail="Batch ID not found")
     
@@ -1094,24 +1103,7 @@ async def download_batch_results(batch_id: str):
     if not output_files:
         raise HTTPException(status_code=404, detail="No output files found")
     
-    # ZIPファイルをバッチディレクトリに作成
-    batch_dir = UPLOAD_DIR / batch_id
-    if not batch_dir.exists():
-        batch_dir.mkdir(parents=True, exist_ok=True)
-    
-    zip_file_path = batch_dir / f"batch_{batch_id}_results.zip"
-    
-    with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path in output_files:
-            zip_file.write(file_path, file_path.name)
-    
-    logger.info(f"Created ZIP file: {zip_file_path}")
-    
-    return FileResponse(
-        path=zip_file_path,
-        media_type='application/zip',
-        filename=f"batch_{batch_id}_results.zip"
-    )
+    return zip_download(request, output_files, zip_filename)
 
 @app.get("/api/batch-status/{batch_id}")
 async def get_batch_status(batch_id: str):
@@ -1127,25 +1119,17 @@ async def get_status():
     upload_count = len(list(UPLOAD_DIR.glob("*.csv")))
     output_count = len(list(OUTPUT_DIR.glob("*.csv")))
     
-    sku_state = {}
-    state_file = STATE_DIR / "sku_counters.json"
-    if state_file.exists():
-        with open(state_file, 'r', encoding='utf-8') as f:
-            sku_state = json.load(f)
-    
-    # Calculate total SKUs - handle both old format (int) and new format (list)
-    total_skus = 0
-    for value in sku_state.values():
-        if isinstance(value, int):
-            total_skus += value
-        elif isinstance(value, list):
-            total_skus += len(value)
+    # SKU numbers come from the allocator (SQLite by default); sku_counters.json is only
+    # the pre-migration snapshot. Numbers are global, so there are no per-product counters
+    sku_allocator = rakuten_processor.sku_allocator
     
     return {
         "uploads": upload_count,
         "outputs": output_count,
-        "products_tracked": len(sku_state),
-        "total_skus_generated": total_skus
+        "total_skus_generated": sku_allocator.high_water,
+        "reserved_sku_ranges": len(sku_allocator.reserved_ranges),
+        "parsed_file_cache": parsed_file_cache.stats(),
+        "jobs": job_queue.stats()
     }
 
 # =====================================
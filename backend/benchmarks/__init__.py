@@ -0,0 +1,4 @@
+"""
+Benchmarks of the processing flows on synthetic Rakuten catalogs
+(see benchmarks.run for usage)
+"""
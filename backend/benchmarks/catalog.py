@@ -0,0 +1,281 @@
+"""
+Synthetic Rakuten RMS catalog generator
+Builds item CSVs with the full RMS column set (same order as an RMS item
+download) and the row layout the processors expect: one parent row per
+product, optional option rows, then SKU rows for every device × color
+combination (device-major, like RMS exports). Text is Japanese and
+Shift-JIS encodable. Columns are built as arrays, so 1M-row catalogs can be
+generated without a per-row Python loop over the 573 columns
+"""
+import random
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+GENERATOR_VERSION = 1
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+
+COLORS = ['ブラック', 'ホワイト', 'ネイビー', 'ピンク', 'ベージュ/グリーン', 'ブルー/ベージュ',
+          'レッド', 'イエロー', 'ブラウン', 'ラベンダー']
+STYLES = ['手帳型', 'ハードケース', 'ソフトケース', 'ショルダー', 'クリアケース', 'レザー']
+SIZE_CATEGORIES = ['M', 'L', 'LL', '3L']
+DEVICE_SERIES = {
+    'アップル': ['iPhone {n}', 'iPhone {n} Pro', 'iPhone {n} Pro Max', 'iPhone {n} mini'],
+    'サムスン': ['Galaxy S{n}', 'Galaxy S{n}+', 'Galaxy A{n}'],
+    'ソニー': ['Xperia {n} V', 'Xperia {n} IV', 'Xperia Ace {n}'],
+    'シャープ': ['AQUOS sense{n}', 'AQUOS R{n}', 'AQUOS wish{n}'],
+    'グーグル': ['Pixel {n}', 'Pixel {n} Pro', 'Pixel {n}a'],
+    'ファーウェイ': ['P{n} lite', 'nova {n}', 'Mate {n} Pro'],
+}
+# 処理ベンチマークで追加する（既存商品にない）機種
+NEW_DEVICES = ['iPhone 17', 'iPhone 17 Pro']
+
+
+def rms_columns() -> List[str]:
+    """Full header of an RMS item CSV (573 columns)"""
+    columns = [
+        PRODUCT_COL, '商品番号', '商品名', '倉庫指定', 'サーチ表示', '消費税', '消費税率',
+        '販売期間指定（開始日時）', '販売期間指定（終了日時）', 'ポイント変倍率',
+        'ポイント変倍率適用期間（開始日時）', 'ポイント変倍率適用期間（終了日時）', '注文ボタン',
+        '予約商品発売日', '商品問い合わせボタン', '闇市パスワード', '在庫表示', '代引料', 'ジャンルID',
+        '非製品属性タグID', 'キャッチコピー', 'PC用商品説明文', 'スマートフォン用商品説明文', 'PC用販売説明文'
+    ]
+    for i in range(1, 21):
+        columns += [f'商品画像タイプ{i}', f'商品画像パス{i}', f'商品画像名（ALT）{i}']
+    columns += [
+        '動画', '白背景画像タイプ', '白背景画像パス', '商品情報レイアウト', 'ヘッダー・フッター・レフトナビ',
+        '表示項目の並び順', '共通説明文（小）', '目玉商品', '共通説明文（大）', 'レビュー本文表示',
+        'メーカー提供情報表示', '定期購入設定', '定期用指定可能なお届け日・月ごとに日付を指定',
+        '定期用指定可能なお届け日・週ごとに曜日を指定', '頒布会設定', '頒布会購入ボタン',
+        '頒布会用指定可能なお届け日・月ごとに日付を指定', '頒布会用指定可能なお届け日・週ごとに曜日を指定',
+        'お届け回数', '商品ページへの発送商品名の表示', '発送商品名', 'バリエーション項目キー定義',
+        'バリエーション項目名定義'
+    ]
+    columns += [f'バリエーション{i}選択肢定義' for i in range(1, 7)]
+    columns += ['選択肢タイプ', '商品オプション項目名']
+    columns += [f'商品オプション選択肢{i}' for i in range(1, 101)]
+    columns += ['商品オプション選択必須', SKU_COL, 'システム連携用SKU番号']
+    for i in range(1, 7):
+        columns += [f'バリエーション項目キー{i}', f'バリエーション項目選択肢{i}']
+    columns += [
+        '通常購入販売価格', '表示価格', '二重価格文言管理番号', '注文受付数', '再入荷お知らせボタン',
+        'のし対応', '在庫数', '在庫戻しフラグ', '在庫切れ時の注文受付', '在庫あり時納期管理番号',
+        '在庫切れ時納期管理番号', '在庫あり時出荷リードタイム', '在庫切れ時出荷リードタイム',
+        '配送リードタイム', 'SKU倉庫指定', '配送方法セット管理番号', '送料', '送料区分1', '送料区分2',
+        '個別送料', '地域別個別送料管理番号', '単品配送設定使用', '海外配送管理番号', 'カタログID',
+        'カタログIDなしの理由', 'セット商品用カタログID', 'SKU画像タイプ', 'SKU画像パス', 'SKU画像名（ALT）',
+        '定期購入販売価格', '定期用初回価格', '頒布会販売価格', '頒布会用初回価格'
+    ]
+    for i in range(1, 101):
+        columns += [f'商品属性（項目）{i}', f'商品属性（値）{i}', f'商品属性（単位）{i}']
+    for i in range(1, 6):
+        columns += [f'自由入力行（項目）{i}', f'自由入力行（値）{i}']
+    return columns
+
+
+def device_pool() -> List[Tuple[str, str]]:
+    """(device name, brand) pairs used by the generated products"""
+    devices = []
+    for brand, templates in DEVICE_SERIES.items():
+        for n in range(10, 17):
+            devices += [(template.format(n=n), brand) for template in templates]
+    return devices
+
+
+def device_attribute_rows(seed: int = 0) -> List[Dict]:
+    """Rows of the device_attributes table for every device (DeviceAttributeResolver loader)"""
+    rng = random.Random(seed)
+    devices = device_pool() + [(name, 'アップル') for name in NEW_DEVICES]
+    return [
+        {'device_name': name, 'attribute_value': f"{brand} {name}",
+         'size_category': rng.choice(SIZE_CATEGORIES), 'brand': brand}
+        for name, brand in devices
+    ]
+
+
+def _plan_products(rows: int, rng: random.Random, option_ratio: float) -> List[Tuple[int, int, bool]]:
+    """(devices, colors, has option row) of each product, totalling exactly rows"""
+    products = []
+    remaining = rows
+    while remaining > 0:
+        devices, colors = rng.randint(8, 30), rng.randint(2, 5)
+        option = rng.random() < option_ratio
+        size = 1 + option + devices * colors
+        if size > remaining:
+            # 最後の商品は1色で残りの行数ちょうどにする
+            devices, colors, option = max(remaining - 1, 0), 1, False
+            size = remaining
+        products.append((devices, colors, option))
+        remaining -= size
+    return products
+
+
+def generate_catalog(rows: int, seed: int = 0, option_ratio: float = 0.2,
+                     sku_start: int = 1) -> pd.DataFrame:
+    """
+    Generate an all-string catalog of exactly rows rows
+
+    Args:
+        option_ratio: Share of products with an option row (選択肢タイプ)
+        sku_start: First SKU管理番号 number (sku_aNNNNNN)
+    """
+    rng = random.Random(seed)
+    pool = device_pool()
+    plan = _plan_products(rows, rng, option_ratio)
+
+    # 行ごとの種類（0=親、1=オプション、2=SKU）と商品・機種・色の番号
+    kinds, products, device_idx, color_idx = [], [], [], []
+    product_devices, product_colors, product_brands = [], [], []
+    for p, (n_devices, n_colors, option) in enumerate(plan):
+        start = rng.randrange(len(pool))
+        devices = [pool[(start + i) % len(pool)] for i in range(n_devices)]
+        colors = rng.sample(COLORS, n_colors)
+        product_devices.append([name for name, _ in devices])
+        product_colors.append([f"{chr(65 + i)}.{c}" for i, c in enumerate(colors)])
+        product_brands.append(devices[0][1] if devices else 'アップル')
+
+        count = 1 + option + n_devices * n_colors
+        kinds.append(np.array([0] + [1] * option + [2] * (n_devices * n_colors), dtype=np.int8))
+        products.append(np.full(count, p, dtype=np.int64))
+        device_idx.append(np.concatenate([np.zeros(1 + option, dtype=np.int64),
+                                          np.repeat(np.arange(n_devices), n_colors)]))
+        color_idx.append(np.concatenate([np.zeros(1 + option, dtype=np.int64),
+                                         np.tile(np.arange(n_colors), n_devices)]))
+
+    kind = np.concatenate(kinds)
+    product = np.concatenate(products)
+    device = np.concatenate(device_idx)
+    color = np.concatenate(color_idx)
+    parent, option_row, sku = kind == 0, kind == 1, kind == 2
+    n = len(kind)
+
+    def per_product(values: List[str]) -> np.ndarray:
+        return np.array(values, dtype=object)[product]
+
+    def only(mask: np.ndarray, values) -> np.ndarray:
+        column = np.full(n, '', dtype=object)
+        column[mask] = values[mask] if isinstance(values, np.ndarray) else values
+        return column
+
+    product_ids = [f"case{p:06d}_{rng.choice(['amc', 'kaiser', 'mirror'])}" for p in range(len(plan))]
+    names = [
+        f"{brand} {rng.choice(STYLES)} スマホケース {' '.join(devs[:3])} 対応 カード収納 ストラップ付き 送料無料"
+        for brand, devs in zip(product_brands, product_devices)
+    ]
+    descriptions = [
+        f"<!--01 S-->\nDM便 送料無料 <br><br>\n{'<br>'.join(devs)}<br>\n"
+        f"素材：合皮（PUレザー）<br>\nカラー：{'、'.join(cols)}<br>\n<!--01 E-->"
+        for devs, cols in zip(product_devices, product_colors)
+    ]
+
+    data: Dict[str, np.ndarray] = {}
+    ids = per_product(product_ids)
+    data[PRODUCT_COL] = ids
+    data['商品番号'] = only(parent, ids)
+    data['商品名'] = only(parent, per_product(names))
+    for col, value in [('倉庫指定', '0'), ('サーチ表示', '1'), ('消費税', '1'), ('注文ボタン', '1'),
+                       ('商品問い合わせボタン', '1'), ('在庫表示', '0'), ('代引料', '0'),
+                       ('ジャンルID', '560271'), ('商品情報レイアウト', '1'),
+                       ('ヘッダー・フッター・レフトナビ', '自動選択'), ('レビュー本文表示', '2'),
+                       ('定期購入設定', '0'), ('頒布会設定', '0'),
+                       ('バリエーション項目キー定義', '本体のカラー|機種'),
+                       ('バリエーション項目名定義', '本体のカラー|機種')]:
+        data[col] = only(parent, value)
+    data['キャッチコピー'] = only(parent, 'スマホケース 新機種ぞくぞく入荷! 手帳型 スマホカバー')
+    data['PC用商品説明文'] = only(parent, per_product(descriptions))
+    data['スマートフォン用商品説明文'] = only(parent, per_product(descriptions))
+    for i in range(1, 11):
+        data[f'商品画像タイプ{i}'] = only(parent, 'CABINET')
+        data[f'商品画像パス{i}'] = only(parent, per_product([f"/case/{pid}_{i:02d}.jpg" for pid in product_ids]))
+        data[f'商品画像名（ALT）{i}'] = only(parent, 'スマホケース 手帳型 カード収納')
+    data['バリエーション1選択肢定義'] = only(parent, per_product(['|'.join(c) for c in product_colors]))
+    data['バリエーション2選択肢定義'] = only(parent, per_product(['|'.join(d) for d in product_devices]))
+
+    data['選択肢タイプ'] = only(option_row, 's')
+    data['商品オプション項目名'] = only(option_row, 'ラッピング')
+    data['商品オプション選択肢1'] = only(option_row, '希望しない')
+    data['商品オプション選択肢2'] = only(option_row, '希望する(+200円)')
+    data['商品オプション選択必須'] = only(option_row, '1')
+
+    sku_numbers = np.full(n, '', dtype=object)
+    sku_numbers[sku] = [f"sku_a{i:06d}" for i in range(sku_start, sku_start + int(sku.sum()))]
+    data[SKU_COL] = sku_numbers
+    flat_devices = [d for devs in product_devices for d in devs]
+    flat_colors = [c for cols in product_colors for c in cols]
+    device_offsets = np.cumsum([0] + [len(d) for d in product_devices[:-1]])
+    color_offsets = np.cumsum([0] + [len(c) for c in product_colors[:-1]])
+    # 機種のない商品（親行のみ）の行は範囲内に丸める（SKU行以外は使わない）
+    device_names = np.array(flat_devices or [''], dtype=object)[
+        np.minimum(device_offsets[product] + device, max(len(flat_devices) - 1, 0))]
+    color_names = np.array(flat_colors, dtype=object)[color_offsets[product] + color]
+    plain_colors = np.array([c.split('.', 1)[-1] for c in color_names], dtype=object)
+    data['システム連携用SKU番号'] = only(sku, ids + '_' + plain_colors + '_[LL]')
+    data['バリエーション項目キー1'] = only(sku, '本体のカラー')
+    data['バリエーション項目選択肢1'] = only(sku, color_names)
+    data['バリエーション項目キー2'] = only(sku, '機種')
+    data['バリエーション項目選択肢2'] = only(sku, device_names)
+    for col, value in [('通常購入販売価格', '1980'), ('表示価格', '1980'), ('二重価格文言管理番号', '1'),
+                       ('再入荷お知らせボタン', '0'), ('のし対応', '0'), ('在庫数', '99999'),
+                       ('在庫戻しフラグ', '1'), ('在庫切れ時の注文受付', '0'), ('在庫あり時納期管理番号', '2'),
+                       ('在庫切れ時納期管理番号', '1'), ('在庫あり時出荷リードタイム', 'リードタイム7日'),
+                       ('SKU倉庫指定', '0'), ('送料', '0'), ('単品配送設定使用', '0'),
+                       ('カタログIDなしの理由', '3')]:
+        data[col] = only(sku, value)
+    attribute_items = ['ブランド名', 'メーカー型番', '代表カラー', 'カラー', 'スマホ・タブレットケースの形状',
+                       'スマホ・タブレットケースの素材', '個数', '機種・対応機種（スマートフォン）']
+    for i, item in enumerate(attribute_items, 1):
+        data[f'商品属性（項目）{i}'] = only(sku, item)
+    data['商品属性（値）1'] = only(sku, per_product([f"amicoco|{b}" for b in product_brands]))
+    data['商品属性（値）2'] = only(sku, per_product([pid.split('_')[-1] for pid in product_ids]))
+    data['商品属性（値）3'] = only(sku, np.array([c.split('/')[0] for c in plain_colors], dtype=object))
+    data['商品属性（値）5'] = only(sku, '手帳')
+    data['商品属性（値）6'] = only(sku, '合皮')
+    data['商品属性（値）8'] = only(sku, device_names)
+
+    empty = np.full(n, '', dtype=object)
+    return pd.DataFrame({col: data.get(col, empty) for col in rms_columns()})
+
+
+def write_catalog(path: Path, rows: int, seed: int = 0, **options) -> Path:
+    """Write a generated catalog as a Shift-JIS CRLF CSV (like an RMS download)"""
+    df = generate_catalog(rows, seed, **options)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(path, index=False, encoding='shift_jis', lineterminator='\r\n')
+    return path
+
+
+def write_catalog_files(output_dir: Path, rows: int, files: int, seed: int = 0,
+                        prefix: str = 'catalog') -> List[Path]:
+    """
+    Write rows spread over several catalogs (batch input); SKU numbers do not
+    overlap between the files
+    """
+    paths = []
+    sku_start = 1
+    per_file = [rows // files + (1 if i < rows % files else 0) for i in range(files)]
+    for i, file_rows in enumerate(per_file):
+        df = generate_catalog(file_rows, seed + i, sku_start=sku_start)
+        sku_start += int((df[SKU_COL] != '').sum())
+        path = output_dir / f"{prefix}_{i + 1:02d}.csv"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        df.to_csv(path, index=False, encoding='shift_jis', lineterminator='\r\n')
+        paths.append(path)
+    return paths
+
+
+def cached_catalog(cache_dir: Path, rows: int, seed: int = 0, files: Optional[int] = None) -> List[Path]:
+    """Catalog file(s) for rows, generated once per size/seed/generator version"""
+    name = f"v{GENERATOR_VERSION}_rows{rows}_seed{seed}" + (f"_files{files}" if files else '')
+    directory = cache_dir / name
+    marker = directory / '.complete'
+    if not marker.exists():
+        if files:
+            paths = write_catalog_files(directory, rows, files, seed)
+        else:
+            paths = [write_catalog(directory / 'catalog.csv', rows, seed)]
+        marker.write_text('\n'.join(p.name for p in paths), encoding='utf-8')
+    return [directory / name for name in marker.read_text(encoding='utf-8').splitlines()]
@@ -0,0 +1,370 @@
+"""
+Scaling benchmark suite
+Runs the processing flows on synthetic catalogs (benchmarks.catalog) at
+several sizes and records wall time, rows/sec and peak RSS as JSON, so runs on
+the same machine can be compared across commits.
+
+Each scenario runs in a fresh process (peak RSS is per process), after its
+setup (e.g. reading the input for 'validate'); only the flow itself is timed.
+
+Usage (from backend/):
+    python -m benchmarks.run --sizes 10k,100k,1m
+    python -m benchmarks.run --sizes 10k --scenarios process,validate --engines standard,vectorized
+    python -m benchmarks.run --sizes 100k --scenarios process --engines vectorized,vectorized+lazy
+    python -m benchmarks.run --sizes 100k --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .catalog import NEW_DEVICES, cached_catalog, device_attribute_rows
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+DEFAULT_WORK_DIR = Path(tempfile.gettempdir()) / 'rakuten_sku_benchmarks'
+SCENARIOS = ['process', 'process_streaming', 'batch', 'split', 'validate']
+# エンジンの違いが結果に影響するシナリオ
+ENGINE_SCENARIOS = {'process', 'process_streaming', 'validate'}
+BATCH_FILES = 4
+
+
+def parse_size(text: str) -> int:
+    """'10k' / '1m' / '2500' -> rows"""
+    text = text.strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linuxはキロバイト、macOSはバイト
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def _device_attributes() -> List[Dict]:
+    return [{'device': row['device_name'], 'attribute_value': row['attribute_value'],
+             'size_category': row['size_category']} for row in device_attribute_rows()]
+
+
+def _engine_name(engine: str) -> str:
+    """'vectorized+lazy' -> 'vectorized'"""
+    return engine.partition('+')[0]
+
+
+def _process_options(engine: str) -> Dict:
+    """Options of a typical /api/process request: add two new devices at the start
+
+    A '+lazy' suffix on the engine processes with lazy_columns
+    """
+    return dict(devices_to_add=list(NEW_DEVICES), add_position='start',
+                device_attributes=_device_attributes(), engine=_engine_name(engine),
+                lazy_columns=engine.endswith('+lazy'))
+
+
+# シナリオ: setup(inputs, work_dir, engine) が計測対象の関数を返す
+def setup_process(inputs: List[Path], work_dir: Path, engine: str) -> Callable[[], Dict]:
+    """read -> process -> validate -> encoding check -> write (non-streaming /api/process)"""
+    from services.csv_processor import CSVProcessor
+    from services.output_metadata import mark_output
+    from services.rakuten_processor import RakutenCSVProcessor
+    from services.validator import Validator
+
+    def run() -> Dict:
+        csv_processor = CSVProcessor()
+        df = csv_processor.read_csv(inputs[0])
+        df = RakutenCSVProcessor(work_dir / 'sku_counters.json').process_csv(df, **_process_options(engine))
+        validator = Validator()
+        result = validator.validate_dataframe(df, engine=_engine_name(engine))
+        df, encoding_issues = validator.fix_output_encoding(df)
+        output = work_dir / 'output.csv'
+        csv_processor.save_csv(df, output)
+        mark_output(output)
+        return {'output_rows': len(df), 'valid': result['valid'], 'encoding_issues': len(encoding_issues)}
+    return run
+
+
+def setup_process_streaming(inputs: List[Path], work_dir: Path, engine: str) -> Callable[[], Dict]:
+    """StreamingCSVPipeline (/api/process with streaming)"""
+    from services.csv_processor import CSVProcessor
+    from services.rakuten_processor import RakutenCSVProcessor
+    from services.streaming_pipeline import StreamingCSVPipeline
+    from services.validator import Validator
+
+    def run() -> Dict:
+        pipeline = StreamingCSVPipeline(CSVProcessor(), RakutenCSVProcessor(work_dir / 'sku_counters.json'),
+                                        Validator())
+        result = pipeline.process_file(inputs[0], work_dir / 'output.csv', **_process_options(engine))
+        return {'output_rows': result['total_rows'], 'valid': result['valid'], 'chunks': result['chunks']}
+    return run
+
+
+def setup_batch(inputs: List[Path], work_dir: Path, engine: str) -> Callable[[], Dict]:
+    """BatchProcessor.process_batch_files over several catalogs"""
+    from services.batch_processor import BatchProcessor
+    from services.device_attribute_resolver import DeviceAttributeResolver
+
+    # バッチは入力と同じディレクトリに出力するため作業ディレクトリにコピーする
+    batch_dir = work_dir / 'batch'
+    batch_dir.mkdir()
+    files = [Path(shutil.copy(path, batch_dir / path.name)) for path in inputs]
+    rows = device_attribute_rows()
+    processor = BatchProcessor(work_dir, device_resolver=DeviceAttributeResolver(loader=lambda: rows))
+
+    def run() -> Dict:
+        result = asyncio.run(processor.process_batch_files(files, devices_to_add=list(NEW_DEVICES),
+                                                           add_position='start'))
+        return {'files': len(files), 'successful_files': result['successful_files'],
+                'workers': processor.workers}
+    return run
+
+
+def setup_split(inputs: List[Path], work_dir: Path, engine: str) -> Callable[[], Dict]:
+    """CSVSplitter.split_file into 60k-row parts (split download)"""
+    from services.csv_processor import CSVProcessor
+    from services.csv_splitter import CSVSplitter
+
+    def run() -> Dict:
+        parts = CSVSplitter(max_rows_per_file=60000, csv_processor=CSVProcessor()).split_file(
+            inputs[0], work_dir, 'split')
+        return {'files': len(parts)}
+    return run
+
+
+def setup_validate(inputs: List[Path], work_dir: Path, engine: str) -> Callable[[], Dict]:
+    """Validator.validate_dataframe and the full encoding check on a parsed catalog"""
+    from services.csv_processor import CSVProcessor
+    from services.validator import Validator
+
+    df = CSVProcessor().read_csv(inputs[0])
+    validator = Validator()
+
+    def run() -> Dict:
+        result = validator.validate_dataframe(df, engine=_engine_name(engine))
+        _, encoding_issues = validator.fix_output_encoding(df)
+        return {'valid': result['valid'], 'violations': len(result['violations']),
+                'encoding_issues': len(encoding_issues)}
+    return run
+
+
+SETUPS = {
+    'process': setup_process,
+    'process_streaming': setup_process_streaming,
+    'batch': setup_batch,
+    'split': setup_split,
+    'validate': setup_validate,
+}
+
+
+def run_scenario(scenario: str, rows: int, engine: str, inputs: List[Path]) -> Dict:
+    """Set up and time one scenario in this process"""
+    # 処理中の大量のprint/ログは端末出力を増やすだけなので捨てる
+    logging.disable(logging.WARNING)
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{scenario}_") as temp, \
+                open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            work_dir = Path(temp)
+            run = SETUPS[scenario](inputs, work_dir, engine)
+            gc.collect()
+            started = time.perf_counter()
+            info = run()
+            wall = time.perf_counter() - started
+    finally:
+        logging.disable(logging.NOTSET)
+
+    peak = peak_rss_bytes()
+    return {
+        'scenario': scenario,
+        'rows': rows,
+        'engine': engine if scenario in ENGINE_SCENARIOS else None,
+        'wall_seconds': round(wall, 4),
+        'rows_per_second': round(rows / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': round(peak / 2 ** 20, 1) if peak is not None else None,
+        'info': info,
+    }
+
+
+def _child(queue, scenario: str, rows: int, engine: str, inputs: List[Path]):
+    try:
+        queue.put(run_scenario(scenario, rows, engine, inputs))
+    except BaseException as e:
+        queue.put({'scenario': scenario, 'rows': rows, 'engine': engine, 'error': f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(scenario: str, rows: int, engine: str, inputs: List[Path]) -> Dict:
+    """Run a scenario in a fresh process so its peak RSS is its own"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue, scenario, rows, engine, inputs))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            if not process.is_alive():
+                # メモリ不足で強制終了された場合など
+                try:
+                    result = queue.get_nowait()
+                except queue_module.Empty:
+                    result = {'scenario': scenario, 'rows': rows, 'engine': engine,
+                              'error': f"process exited with code {process.exitcode}"}
+                break
+    process.join()
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment() -> Dict:
+    import numpy
+    import pandas
+    import polars
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'polars': polars.__version__,
+    }
+
+
+def run_suite(sizes: List[int], scenarios: List[str], engines: List[str], work_dir: Path,
+              seed: int = 0, isolate: bool = True, log: Callable[[str], None] = print) -> Dict:
+    """Run every scenario × size (× engine where it applies) and return the report"""
+    results = []
+    for rows in sizes:
+        for scenario in scenarios:
+            if scenario == 'batch':
+                inputs = cached_catalog(work_dir, rows, seed, files=BATCH_FILES)
+            else:
+                inputs = cached_catalog(work_dir, rows, seed)
+            for engine in (engines if scenario in ENGINE_SCENARIOS else engines[:1]):
+                runner = run_isolated if isolate else run_scenario
+                result = runner(scenario, rows, engine, inputs)
+                results.append(result)
+                if 'error' in result:
+                    log(f"{scenario:18} {rows:>9} {engine:10} ERROR {result['error']}")
+                else:
+                    log(f"{scenario:18} {rows:>9} {result['engine'] or '-':10} "
+                        f"{result['wall_seconds']:9.2f}s {result['rows_per_second']:>12,.0f} rows/s "
+                        f"{result['peak_rss_mb'] or 0:8.0f} MB")
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': _environment(),
+        'settings': {'sizes': sizes, 'scenarios': scenarios, 'engines': engines, 'seed': seed,
+                     'isolated': isolate},
+        'results': results,
+    }
+
+
+def compare_reports(baseline: Dict, current: Dict, tolerance: float = 0.2) -> List[Dict]:
+    """
+    Wall-time ratio (current / baseline) of every result present in both reports
+
+    Returns:
+        One row per (scenario, rows, engine) with 'regressed' set when the
+        ratio exceeds 1 + tolerance
+    """
+    def key(result):
+        return result['scenario'], result['rows'], result.get('engine')
+
+    previous = {key(r): r for r in baseline['results'] if 'error' not in r}
+    rows = []
+    for result in current['results']:
+        old = previous.get(key(result))
+        if old is None or 'error' in result:
+            continue
+        ratio = result['wall_seconds'] / old['wall_seconds'] if old['wall_seconds'] else None
+        rows.append({
+            'scenario': result['scenario'], 'rows': result['rows'], 'engine': result.get('engine'),
+            'baseline_seconds': old['wall_seconds'], 'seconds': result['wall_seconds'], 'ratio': ratio,
+            'regressed': ratio is not None and ratio > 1 + tolerance,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k,100k,1m', help="Comma-separated row counts (e.g. 10k,100k,1m)")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Any of {', '.join(SCENARIOS)}")
+    parser.add_argument('--engines', default='vectorized',
+                        help="Processing/validation engines: standard, vectorized, parallel "
+                             "(append +lazy to process with lazy_columns)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', type=Path, default=DEFAULT_WORK_DIR,
+                        help="Where generated catalogs are cached between runs")
+    parser.add_argument('--output', type=Path, help="Report path (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument('--compare', type=Path, help="Previous report to compare wall times with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown before --compare fails (0.2 = 20%%)")
+    parser.add_argument('--no-isolate', action='store_true',
+                        help="Run scenarios in this process (peak RSS is then cumulative)")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SETUPS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    report = run_suite(
+        sizes=[parse_size(s) for s in args.sizes.split(',') if s.strip()],
+        scenarios=scenarios,
+        engines=[e.strip() for e in args.engines.split(',') if e.strip()],
+        work_dir=args.work_dir,
+        seed=args.seed,
+        isolate=not args.no_isolate,
+    )
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{report['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"Saved {output}")
+
+    failed = any('error' in r for r in report['results'])
+    if args.compare:
+        comparison = compare_reports(json.loads(args.compare.read_text(encoding='utf-8')), report, args.tolerance)
+        for row in comparison:
+            ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+            flag = '  REGRESSED' if row['regressed'] else ''
+            print(f"{row['scenario']:18} {row['rows']:>9} {row['engine'] or '-':10} "
+                  f"{row['baseline_seconds']:9.2f}s -> {row['seconds']:9.2f}s {ratio:>7}{flag}")
+        failed = failed or any(row['regressed'] for row in comparison)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -34,6 +34,94 @@ BRAND_MAPPING = {
     'oppo': 'OPPO',
 }
 
+# ブランド属性DBに値がない場合の商品属性（値）のフォールバック（キーは完全一致）
+_HUAWEI_ATTRIBUTES = [
+    'amicoco|ファーウェイ|アップル',
+    'amicoco|ファーウェイ|グーグル',
+    'amicoco|ファーウェイ|ソニー',
+    'amicoco|ファーウェイ|原セラ',
+    'amicoco|ファーウェイ|ASUS',
+    'amicoco|ファーウェイ|シャープ',
+    'amicoco|ファーウェイ|富士通',
+    'amicoco|ファーウェイ|FCNT',
+    'amicoco|ファーウェイ|楽天モバイル',
+    'amicoco|ファーウェイ|サムスン',
+    'amicoco|ファーウェイ|シャオミ',
+    'amicoco|ファーウェイ|オッポ'
+]
+
+FALLBACK_BRAND_ATTRIBUTES = {
+    'Huawei': _HUAWEI_ATTRIBUTES,
+    'huawei': _HUAWEI_ATTRIBUTES,
+    'iPhone': [
+        'amicoco|アップル|iPhone',
+        'amicoco|アップル|Pro',
+        'amicoco|アップル|Plus',
+        'amicoco|アップル|ProMax',
+        'amicoco|アップル|mini'
+    ],
+    'Galaxy': [
+        'amicoco|サムスン|Galaxy',
+        'amicoco|サムスン|Note',
+        'amicoco|サムスン|Ultra',
+        'amicoco|サムスン|Plus'
+    ],
+    'Xperia': [
+        'amicoco|ソニー|Xperia',
+        'amicoco|ソニー|1',
+        'amicoco|ソニー|5',
+        'amicoco|ソニー|10',
+        'amicoco|ソニー|Ace'
+    ],
+    'AQUOS': [
+        'amicoco|シャープ|AQUOS',
+        'amicoco|シャープ|sense',
+        'amicoco|シャープ|wish',
+        'amicoco|シャープ|R'
+    ],
+    'Pixel': [
+        'amicoco|グーグル|Pixel',
+        'amicoco|グーグル|Pro',
+        'amicoco|グーグル|a'
+    ],
+    'Xiaomi': [
+        'amicoco|シャオミ|Xiaomi',
+        'amicoco|シャオミ|Redmi',
+        'amicoco|シャオミ|Mi',
+        'amicoco|シャオミ|Note'
+    ],
+    'OPPO': [
+        'amicoco|オッポ|OPPO',
+        'amicoco|オッポ|Reno',
+        'amicoco|オッポ|Find',
+        'amicoco|オッポ|A'
+    ],
+    'OnePlus': [
+        'amicoco|ワンプラス|OnePlus',
+        'amicoco|ワンプラス|Pro',
+        'amicoco|ワンプラス|Nord'
+    ],
+    'iPad': [
+        'amicoco|アップル|iPad',
+        'amicoco|アップル|iPadPro',
+        'amicoco|アップル|iPadAir',
+        'amicoco|アップル|iPadmini'
+    ],
+    'Surface': [
+        'amicoco|マイクロソフト|Surface',
+        'amicoco|マイクロソフト|Pro',
+        'amicoco|マイクロソフト|Go',
+        'amicoco|マイクロソフト|Laptop'
+    ]
+}
+
+# フォールバックにもないブランドの属性値
+DEFAULT_BRAND_ATTRIBUTES = [
+    'amicoco|その他|スマートフォン',
+    'amicoco|その他|タブレット',
+    'amicoco|その他|デバイス'
+]
+
 def normalize_brand_name(brand_name: str) -> str:
     """
     ブランド名を正規化して統一形式に変換
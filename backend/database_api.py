@@ -10,6 +10,8 @@ import json
 import io
 import openpyxl
 
+from services.brand_attribute_resolver import brand_attribute_resolver
+
 router = APIRouter(prefix="/api/database", tags=["database"])
 
 DB_PATH = "brand_attributes.db"
@@ -94,6 +96,7 @@ async def create_brand(brand: BrandCreate):
         """, (brand.brand_name, brand.brand_category))
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         brand_id = cursor.lastrowid
         conn.close()
         
@@ -120,6 +123,7 @@ async def delete_brand(brand_name: str):
             raise HTTPException(status_code=404, detail="Brand not found")
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         conn.close()
         
         return {"message": "Brand deleted successfully"}
@@ -151,6 +155,7 @@ async def create_brand_value(value: BrandValueCreate):
         """, (value.brand_name, value.row_index, value.attribute_value))
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         value_id = cursor.lastrowid
         conn.close()
         
@@ -191,6 +196,7 @@ async def update_brand_value(value_id: int, update: BrandValueUpdate):
             raise HTTPException(status_code=404, detail="Value not found")
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         conn.close()
         
         return {"message": "Value updated successfully"}
@@ -212,6 +218,7 @@ async def delete_brand_value(value_id: int):
             raise HTTPException(status_code=404, detail="Value not found")
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         conn.close()
         
         return {"message": "Brand value deleted successfully"}
@@ -367,6 +374,7 @@ async def import_data(file: UploadFile = File(...)):
                         rows_imported += 1
         
         conn.commit()
+        brand_attribute_resolver.invalidate()
         conn.close()
         
         # Clean up temp file
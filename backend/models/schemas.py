@@ -7,6 +7,15 @@ class OutputFormat(str, Enum):
     PER_PRODUCT = "per_product"
     SPLIT_60K = "split_60k"
 
+class ProcessingEngine(str, Enum):
+    STANDARD = "standard"  # 商品ごとの処理
+    VECTORIZED = "vectorized"  # フレーム全体の一括処理（出力は同一）
+    PARALLEL = "parallel"  # 商品シャードのプロセス並列処理（出力は同一）
+
+class SplitStrategy(str, Enum):
+    SEQUENTIAL = "sequential"  # 入力順に6万行まで詰める
+    FFD = "ffd"  # 行数の多い商品から詰めてファイル数を最小化（first-fit decreasing）
+
 class DeviceAction(BaseModel):
     name: str
     action: str  # "add" or "remove"
@@ -28,6 +37,14 @@ class ProcessRequest(BaseModel):
     device_brand: Optional[str] = None  # 機種ブランド
     device_attributes: Optional[List[DeviceAttributeInfo]] = None  # 機種固有の属性情報
     reset_all_devices: Optional[bool] = False  # 全機種削除して再定義
+    engine: ProcessingEngine = ProcessingEngine.STANDARD  # 処理エンジン
+    lazy_columns: Optional[bool] = False  # 処理で使う列だけで処理し、残りの列は最後に元の行から結合（列の多いCSV向け）
+    streaming: Optional[bool] = False  # 商品単位のチャンクで逐次処理（大容量ファイル向け、single・split_60k出力のみ）
+    chunk_rows: Optional[int] = None  # ストリーミング時の1チャンクの行数
+    split_strategy: SplitStrategy = SplitStrategy.SEQUENTIAL  # split_60k出力の分割方法
+    split_keep_order: Optional[bool] = True  # ffdでもファイル内・ファイル間の商品順を入力順に保つ
+    background: Optional[bool] = False  # ジョブIDを即時返し、/api/jobs/{job_id} で進捗・結果を取得
+    debug_trace: Optional[bool] = False  # 診断イベントを記録し、/api/jobs/{job_id}/trace で取得
 
 class ProcessingOptions(BaseModel):
     maintain_column_order: bool = True
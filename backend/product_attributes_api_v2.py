@@ -8,11 +8,13 @@ from typing import List, Optional, Dict, Any
 import os
 import json
 import tempfile
-import chardet
 from pathlib import Path
 import io
 import openpyxl
 
+from services.device_attribute_resolver import device_attribute_resolver
+from services.encoding_sniffer import decode_bytes
+
 router = APIRouter(prefix="/api/product-attributes", tags=["product-attributes"])
 
 DB_PATH = "/app/product_attributes_new.db"
@@ -237,6 +239,7 @@ async def create_device(device: DeviceCreate):
             device_id = cursor.lastrowid
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         
         # Get the device (created or updated)
         cursor.execute("""
@@ -304,6 +307,7 @@ async def update_device(device_id: int, device: DeviceUpdate):
             raise HTTPException(status_code=404, detail="Device not found")
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         conn.close()
         
         return {"message": "Device updated successfully"}
@@ -323,6 +327,7 @@ async def delete_device(device_id: int):
             raise HTTPException(status_code=404, detail="Device not found")
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         conn.close()
         
         return {"message": "Device deleted successfully"}
@@ -403,12 +408,11 @@ async def import_csv(file: UploadFile = File(...)):
     try:
         contents = await file.read()
         
-        # Detect encoding
-        detected = chardet.detect(contents)
-        encoding = detected['encoding'] or 'shift-jis'
+        # Detect encoding (BOM / strict decoding of a bounded sample, CP932 retry for the rest)
+        text, _ = decode_bytes(contents)
         
         # Read CSV
-        df = pd.read_csv(io.StringIO(contents.decode(encoding)))
+        df = pd.read_csv(io.StringIO(text))
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -440,6 +444,7 @@ async def import_csv(file: UploadFile = File(...)):
                 skipped += 1
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         conn.close()
         
         return {
@@ -596,6 +601,7 @@ async def import_excel(file: UploadFile = File(...)):
                 imported += 1
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         conn.close()
         
         return {
@@ -677,6 +683,7 @@ async def clear_all_devices():
         deleted = cursor.rowcount
         
         conn.commit()
+        device_attribute_resolver.invalidate()
         conn.close()
         
         return {
@@ -3,9 +3,10 @@
 商品画像ALT処理サービス
 楽天RMS CSVの商品画像ALTタグを商品名で自動設定
 """
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,8 @@ class AltProcessor:
     IMG_TYPE_COLS = [f"商品画像タイプ{i}" for i in range(1, 21)]
     IMG_ALT_COLS = [f"商品画像名（ALT）{i}" for i in range(1, 21)]
     
+    SKU_ALT_COL = "SKU画像名（ALT）"
+    
     def process_csv(self, input_path: Path, output_path: Path, encoding: str = "cp932") -> dict:
         """
         CSVファイルのALTタグを処理
@@ -32,89 +35,84 @@ class AltProcessor:
             処理結果の情報を含む辞書
         """
         try:
-            # CSVを読み込み
-            df = pd.read_csv(input_path, encoding=encoding)
+            # CSVを読み込み（型変換で値が変わらないよう文字列として読む）
+            df = pd.read_csv(input_path, encoding=encoding, dtype=str, keep_default_na=False)
             logger.info(f"CSVファイル読み込み完了: {len(df)}行")
             
-            # 必須列チェック
-            missing = [c for c in [self.TITLE_COL, self.ID_COL] if c not in df.columns]
-            if missing:
-                raise ValueError(f"必須列が見つかりません: {missing}")
-            
-            # 処理可能な画像タイプ/ALT列のペアを特定（SKU画像は除外）
-            usable_pairs = []
-            for i in range(1, 21):
-                type_col = f"商品画像タイプ{i}"
-                alt_col = f"商品画像名（ALT）{i}"
-                if type_col in df.columns and alt_col in df.columns:
-                    usable_pairs.append((type_col, alt_col))
-            
-            if not usable_pairs:
-                logger.warning("対応する画像タイプ/ALT列が見つかりません")
-                df.to_csv(output_path, index=False, encoding=encoding)
-                return {
-                    "status": "warning",
-                    "message": "処理可能な画像列が見つかりませんでした",
-                    "processed_count": 0
-                }
-            
-            # 親行（各商品管理番号グループの最初の行）のインデックスを取得
-            parent_indices = df.groupby(self.ID_COL, sort=False).head(1).index
-            
-            processed_count = 0
-            updated_alts = []
-            
-            # 親行のみ処理
-            for idx in parent_indices:
-                title = df.at[idx, self.TITLE_COL]
-                title_str = "" if pd.isna(title) else str(title)
-                product_id = df.at[idx, self.ID_COL]
-                
-                row_updated = False
-                for type_col, alt_col in usable_pairs:
-                    # SKU画像はスキップ（念のため確認）
-                    if 'SKU' in type_col or 'SKU' in alt_col:
-                        continue
-                        
-                    # 商品画像タイプに値が入っているかチェック
-                    val = df.at[idx, type_col] if type_col in df.columns else None
-                    has_type = (
-                        val is not None and 
-                        not (isinstance(val, float) and pd.isna(val)) and 
-                        str(val).strip() != ""
-                    )
-                    
-                    if has_type:
-                        # ALTを商品名で強制上書き
-                        df.at[idx, alt_col] = title_str
-                        row_updated = True
-                        updated_alts.append({
-                            "product_id": product_id,
-                            "column": alt_col,
-                            "new_value": title_str
-                        })
-                
-                if row_updated:
-                    processed_count += 1
-            
-            # SKU画像のALTタグを明示的にクリア（全行）
-            if 'SKU画像名（ALT）' in df.columns:
-                df['SKU画像名（ALT）'] = ''
-                logger.info("SKU画像名（ALT）をクリアしました")
+            df, result = self.process_dataframe(df)
             
             # 処理後のCSVを保存
             df.to_csv(output_path, index=False, encoding=encoding, lineterminator='\r\n')
-            
-            logger.info(f"ALT処理完了: {processed_count}個の親行を処理")
-            
-            return {
-                "status": "success",
-                "message": f"{processed_count}個の商品のALTタグを更新しました",
-                "processed_count": processed_count,
-                "total_products": len(parent_indices),
-                "updated_columns": len(updated_alts)
-            }
+            return result
             
         except Exception as e:
             logger.error(f"ALT処理エラー: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+    
+    def process_dataframe(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
+        """
+        DataFrameのALTタグを処理（ファイルを介さない）
+        
+        親行（各商品管理番号グループの最初の行）で商品画像タイプに値がある列の
+        ALTを商品名で上書きし、SKU画像名（ALT）を全行クリアする。
+        入力DataFrameは変更せず、更新した列だけを差し替えたDataFrameを返す。
+        
+        Args:
+            df: 楽天RMS形式のDataFrame
+            
+        Returns:
+            (処理後のDataFrame, 処理結果の情報を含む辞書)
+        """
+        # 必須列チェック
+        missing = [c for c in [self.TITLE_COL, self.ID_COL] if c not in df.columns]
+        if missing:
+            raise ValueError(f"必須列が見つかりません: {missing}")
+        
+        # 処理可能な画像タイプ/ALT列のペアを特定（SKU画像は除外）
+        usable_pairs = [
+            (type_col, alt_col) for type_col, alt_col in zip(self.IMG_TYPE_COLS, self.IMG_ALT_COLS)
+            if type_col in df.columns and alt_col in df.columns
+        ]
+        
+        if not usable_pairs:
+            logger.warning("対応する画像タイプ/ALT列が見つかりません")
+            return df, {
+                "status": "warning",
+                "message": "処理可能な画像列が見つかりませんでした",
+                "processed_count": 0
+            }
+        
+        # 親行（各商品管理番号グループの最初の行）のマスク
+        ids = df[self.ID_COL]
+        parent_mask = (ids.notna() & ~ids.duplicated()).to_numpy()
+        titles = df[self.TITLE_COL].fillna('').astype(str)
+        
+        df = df.copy(deep=False)
+        row_updated = np.zeros(len(df), dtype=bool)
+        updated_columns = 0
+        
+        for type_col, alt_col in usable_pairs:
+            # 商品画像タイプに値が入っている親行のALTを商品名で強制上書き
+            types = df[type_col]
+            has_type = (types.notna() & types.astype(str).str.strip().ne('')).to_numpy()
+            mask = parent_mask & has_type
+            if mask.any():
+                df[alt_col] = df[alt_col].mask(mask, titles)
+                row_updated |= mask
+                updated_columns += int(mask.sum())
+        
+        # SKU画像のALTタグを明示的にクリア（全行）
+        if self.SKU_ALT_COL in df.columns:
+            df[self.SKU_ALT_COL] = ''
+            logger.info("SKU画像名（ALT）をクリアしました")
+        
+        processed_count = int(row_updated.sum())
+        logger.info(f"ALT処理完了: {processed_count}個の親行を処理")
+        
+        return df, {
+            "status": "success",
+            "message": f"{processed_count}個の商品のALTタグを更新しました",
+            "processed_count": processed_count,
+            "total_products": int(parent_mask.sum()),
+            "updated_columns": updated_columns
+        }
@@ -9,23 +9,119 @@ from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import pandas as pd
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
 
+from .alt_processor import AltProcessor
 from .csv_processor import CSVProcessor
+from .device_attribute_resolver import DeviceAttributeResolver
+from .encoding_sniffer import EncodingSniffer
+from .output_metadata import mark_output
+from .parsed_file_cache import ParsedFileCache
 from .device_manager import DeviceManager
+from .rakuten_parallel import ParallelRakutenEngine
 from .rakuten_processor import RakutenCSVProcessor
+from .sku_allocator import PreallocatedSKUAllocator, SKUReservationExhausted
 from .validator import Validator
-import sqlite3
 
 logger = logging.getLogger(__name__)
 
 
+def _init_worker():
+    """Reseed random in each worker so forked processes do not draw the same brand attributes"""
+    random.seed()
+
+
+def _process_file_task(task: Dict, rakuten_processor: Optional[RakutenCSVProcessor] = None) -> Dict:
+    """
+    Process, validate and save one parsed file (runs in a worker process)
+
+    Args:
+        rakuten_processor: Processor allocating SKU numbers itself; by default the
+                           numbers reserved in task['sku_numbers'] are used
+    """
+    file_path = task['file_path']
+    df = task['df']
+    try:
+        logger.info(f"Processing file: {file_path.name}")
+        
+        if rakuten_processor is None:
+            rakuten_processor = RakutenCSVProcessor()
+            rakuten_processor.sku_allocator = PreallocatedSKUAllocator(task['sku_numbers'] or [])
+        
+        # Process with Rakuten processor
+        if task['options']:
+            logger.info(f"[BATCH] Processing with devices_to_add: {task['options']['devices_to_add']}")
+            df = rakuten_processor.process_csv(df, **task['options'])
+        
+        # ALT処理を実行（enable_alt_processingがTrueの場合のみ）
+        if task['enable_alt_processing']:
+            try:
+                df, alt_result = AltProcessor().process_dataframe(df)
+                logger.info(f"[BATCH] ALT processing completed for {file_path.name}: {alt_result['message']}")
+            except Exception as e:
+                logger.warning(f"[BATCH] ALT processing failed for {file_path.name}: {str(e)}, continuing without ALT updates")
+        else:
+            logger.info(f"[BATCH] ALT processing is disabled for {file_path.name}")
+        
+        # Validate
+        validation_result = Validator().validate_dataframe(df)
+        if not validation_result['valid']:
+            return {
+                'file': str(file_path.name),
+                'status': 'validation_failed',
+                'errors': validation_result['errors']
+            }
+        
+        # Save output to the same directory as input file
+        output_dir = file_path.parent
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = output_dir / f"{file_path.stem}_processed_{timestamp}.csv"
+        
+        csv_processor = CSVProcessor()
+        csv_processor.original_columns = task['original_columns']
+        csv_processor.save_csv(df, output_file)
+        mark_output(output_file, rows=len(df))
+        
+        options = task['options'] or {}
+        return {
+            'file': str(file_path.name),
+            'status': 'success',
+            'output_file': str(output_file.name),
+            'output_path': str(output_file),  # フルパスを追加
+            'rows': len(df),
+            'devices_added': len(options.get('devices_to_add') or []),
+            'devices_removed': len(options.get('devices_to_remove') or [])
+        }
+        
+    except SKUReservationExhausted:
+        return {'file': str(file_path.name), 'status': 'error', 'sku_reservation_exhausted': True}
+    except Exception as e:
+        logger.error(f"Error processing {file_path}: {e}")
+        return {
+            'file': str(file_path.name),
+            'status': 'error',
+            'message': str(e)
+        }
+
+
 class BatchProcessor:
     """Handle batch processing of multiple CSV files"""
     
-    def __init__(self, state_dir: Path):
+    def __init__(self, state_dir: Path, parsed_cache: Optional[ParsedFileCache] = None,
+                 encoding_sniffer: Optional[EncodingSniffer] = None,
+                 device_resolver: Optional[DeviceAttributeResolver] = None,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            workers: Worker processes for per-file processing (defaults to the CPU count)
+        """
         self.state_dir = state_dir
-        self.csv_processor = CSVProcessor()
+        self.workers = workers or os.cpu_count() or 1
+        self.device_resolver = device_resolver or DeviceAttributeResolver()
+        self.csv_processor = CSVProcessor(cache=parsed_cache, encoding_sniffer=encoding_sniffer)
         self.device_manager = DeviceManager()
         self.rakuten_processor = RakutenCSVProcessor(state_dir / "sku_counters.json")
         self.validator = Validator()
@@ -53,7 +149,8 @@ class BatchProcessor:
         add_position: Optional[str] = None,
         after_device: Optional[str] = None,
         custom_device_order: Optional[List[str]] = None,
-        process_mode: str = 'auto'  # 'auto', 'same_devices', 'different_devices'
+        process_mode: str = 'auto',  # 'auto', 'same_devices', 'different_devices'
+        workers: Optional[int] = None
     ) -> Dict:
         """
         Process multiple CSV files in batch
@@ -64,6 +161,7 @@ class BatchProcessor:
             devices_to_remove: Devices to remove (applied to all files if apply_to_all=True)
             output_format: Output format for each file
             apply_to_all: Whether to apply device changes to all files
+            workers: Worker processes for this batch (defaults to self.workers; 1 processes in this process)
         
         Returns:
             Batch processing result with file outcomes
@@ -88,11 +186,14 @@ class BatchProcessor:
         # 機種リストを収集してファイルを分類
         file_device_groups = {}  # 機種リストごとにファイルをグループ化
         file_device_info = {}  # 各ファイルの機種情報を保存
+        # 解析時に読み込んだDataFrameを処理でも使う（各ファイルの読み込みは1回）
+        parsed_files = {}
         
         logger.info(f"Analyzing {len(file_paths)} files for device patterns")
         for file_path in file_paths:
             try:
                 df = self.csv_processor.read_csv(file_path)
+                parsed_files[str(file_path)] = df
                 file_devices = self.device_manager.extract_devices(df)
                 device_list_key = tuple(sorted(file_devices))  # 機種リストをキーとして使用
                 
@@ -129,52 +230,81 @@ class BatchProcessor:
             # 異なる機種リストの場合：個別処理
             final_devices_to_add = None  # 各ファイルで個別に処理
         
-        # Process each file（CPUコア数に基づいて最適化）
-        import multiprocessing
-        optimal_workers = min(multiprocessing.cpu_count(), len(file_paths), 4)
-        with ThreadPoolExecutor(max_workers=optimal_workers) as executor:
+        # ファイルごとのタスクを入力順に作成（SKU番号もこの順で事前確保する）
+        tasks = []
+        for file_path in file_paths:
+            # 機種違いの場合は各ファイルで個別に機種を処理
+            if process_mode == 'different_devices' and devices_to_add:
+                # このファイルの既存機種を取得
+                existing_devices = file_device_info.get(str(file_path), [])
+                # 新機種と既存機種を結合（カスタムオーダーがある場合はそれを使用）
+                if custom_device_order:
+                    file_specific_order = custom_device_order
+                else:
+                    # 位置指定に従って機種リストを構成
+                    file_specific_order = self._build_device_order(
+                        existing_devices,
+                        devices_to_add,
+                        add_position,
+                        after_device
+                    )
+                file_devices_to_add = devices_to_add
+                file_custom_order = file_specific_order
+            else:
+                # 同じ機種の場合は共通の処理
+                file_devices_to_add = final_devices_to_add if apply_to_all else devices_to_add
+                file_custom_order = custom_device_order
+            
+            tasks.append(self._prepare_file_task(
+                file_path,
+                parsed_files.get(str(file_path)),
+                file_devices_to_add,
+                devices_to_remove if apply_to_all else None,
+                device_attributes,
+                add_position,
+                after_device,
+                file_custom_order
+            ))
+        self.rakuten_processor._save_sku_state()
+        
+        # Process each file（ファイル単位でプロセス並列、ワーカー数はCPUコア数）
+        # forkでは親のスレッド（ジョブキュー・Polarsのスレッドプール）が持つロックを引き継いで止まるためforkserverで起動
+        workers = min(workers or self.workers, len(tasks))
+        executor = (ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context('forkserver'))
+                    if workers > 1 else None)
+        try:
             futures = []
-            for file_path in file_paths:
-                # 機種違いの場合は各ファイルで個別に機種を処理
-                if process_mode == 'different_devices' and devices_to_add:
-                    # このファイルの既存機種を取得
-                    existing_devices = file_device_info.get(str(file_path), [])
-                    # 新機種と既存機種を結合（カスタムオーダーがある場合はそれを使用）
-                    if custom_device_order:
-                        file_specific_order = custom_device_order
-                    else:
-                        # 位置指定に従って機種リストを構成
-                        file_specific_order = self._build_device_order(
-                            existing_devices,
-                            devices_to_add,
-                            add_position,
-                            after_device
-                        )
-                    file_devices_to_add = devices_to_add
-                    file_custom_order = file_specific_order
+            for task in tasks:
+                if task.get('result') is not None:
+                    # 読み込みに失敗したファイル
+                    futures.append((task, None))
+                elif task['options'] and task['sku_numbers'] is None:
+                    # SKU行数を事前に数えられない入力はこのプロセスで通常の採番で処理
+                    futures.append((task, None))
+                elif executor is not None:
+                    futures.append((task, executor.submit(_process_file_task, task)))
                 else:
-                    # 同じ機種の場合は共通の処理
-                    file_devices_to_add = final_devices_to_add if apply_to_all else devices_to_add
-                    file_custom_order = custom_device_order
-                
-                future = executor.submit(
-                    self._process_single_file,
-                    file_path,
-                    file_devices_to_add,
-                    devices_to_remove if apply_to_all else None,
-                    output_format,
-                    batch_id,
-                    device_attributes,
-                    add_position,
-                    after_device,
-                    file_custom_order
-                )
-                futures.append((file_path, future))
+                    futures.append((task, None))
             
             # Collect results
-            for file_path, future in futures:
+            for task, future in futures:
+                file_path = task['file_path']
                 try:
-                    result = future.result(timeout=300)  # 5 min timeout per file
+                    if task.get('result') is not None:
+                        result = task['result']
+                    elif future is not None:
+                        result = future.result(timeout=300)  # 5 min timeout per file
+                    elif task['options'] and task['sku_numbers'] is None:
+                        result = _process_file_task(task, self.rakuten_processor)
+                    else:
+                        result = _process_file_task(task)
+                    
+                    if result.get('sku_reservation_exhausted'):
+                        # 事前確保したSKU番号が不足した場合はこのプロセスで通常の採番で処理し直す
+                        logger.warning(f"[BATCH] Reserved SKU numbers were not enough for {file_path.name}, reprocessing")
+                        result = _process_file_task(dict(task, sku_numbers=None), self.rakuten_processor)
+                    
                     results.append(result)
                     
                     if result['status'] == 'success':
@@ -192,6 +322,9 @@ class BatchProcessor:
                     self.batch_status[batch_id]['failed_files'] += 1
                 
                 self.batch_status[batch_id]['processed_files'] += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
         
         # Update final status
         self.batch_status[batch_id].update({
@@ -208,26 +341,33 @@ class BatchProcessor:
         
         return self.batch_status[batch_id]
     
-    def _process_single_file(
+    def _prepare_file_task(
         self,
         file_path: Path,
+        df: Optional[pd.DataFrame],
         devices_to_add: Optional[List[str]],
         devices_to_remove: Optional[List[str]],
-        output_format: str,
-        batch_id: str,
         device_attributes: Optional[List[Dict]] = None,
         add_position: Optional[str] = None,
         after_device: Optional[str] = None,
         custom_device_order: Optional[List[str]] = None,
         enable_alt_processing: bool = True
     ) -> Dict:
-        """Process a single file in the batch"""
+        """
+        Build the worker task of one file: DB lookups and SKU reservation happen
+        here in the parent process, in input order
+        """
+        task = {'file_path': file_path, 'df': df, 'result': None, 'sku_numbers': None,
+                'enable_alt_processing': enable_alt_processing}
+        if df is None:
+            task['result'] = {
+                'file': str(file_path.name),
+                'status': 'error',
+                'message': 'Failed to read file'
+            }
+            return task
+        
         try:
-            logger.info(f"Processing file: {file_path.name}")
-            
-            # Read CSV
-            df = self.csv_processor.read_csv(file_path)
-            
             # Get ALL device attributes from database (both new and existing)
             all_devices_in_csv = set()
             if 'バリエーション項目選択肢2' in df.columns:
@@ -239,16 +379,12 @@ class BatchProcessor:
             if all_devices_in_csv:
                 device_attributes = self._get_device_attributes_from_db(list(all_devices_in_csv))
                 logger.info(f"[BATCH] Got attributes for {len(device_attributes)} devices from DB")
-                logger.info(f"[BATCH] Device attributes from DB: {device_attributes}")
             else:
                 device_attributes = device_attributes if device_attributes else None
             
-            # Process with Rakuten processor
+            options = None
             if devices_to_add or devices_to_remove or device_attributes:
-                logger.info(f"[BATCH] Processing with devices_to_add: {devices_to_add}")
-                logger.info(f"[BATCH] Processing with device_attributes: {device_attributes}")
-                df = self.rakuten_processor.process_csv(
-                    df,
+                options = dict(
                     devices_to_add=devices_to_add,
                     devices_to_remove=devices_to_remove,
                     device_attributes=device_attributes,
@@ -257,71 +393,21 @@ class BatchProcessor:
                     after_device=after_device,
                     custom_device_order=custom_device_order
                 )
+                # このファイルのSKU番号を事前確保（ワーカーの処理順に関係なく採番が決まる）
+                sku_count = ParallelRakutenEngine(self.rakuten_processor).count_sku_rows(df, **options)
+                if sku_count is not None:
+                    task['sku_numbers'] = self.rakuten_processor._allocate_sku_numbers(sku_count)
             
-            # ALT処理を実行（enable_alt_processingがTrueの場合のみ）
-            if enable_alt_processing:
-                from services.alt_processor import AltProcessor
-                alt_processor = AltProcessor()
-                
-                # 一時ファイルとして保存してALT処理
-                temp_path = file_path.parent / f"temp_{file_path.stem}.csv"
-                df.to_csv(temp_path, index=False, encoding='shift_jis')
-                
-                try:
-                    # ALT処理を実行
-                    alt_result = alt_processor.process_csv(
-                        input_path=temp_path,
-                        output_path=temp_path,  # 同じファイルに上書き
-                        encoding='shift_jis'
-                    )
-                    logger.info(f"[BATCH] ALT processing completed for {file_path.name}: {alt_result['message']}")
-                    
-                    # 処理後のデータを再読み込み
-                    df = pd.read_csv(temp_path, encoding='shift_jis', dtype=str, keep_default_na=False)
-                    
-                    # 一時ファイルを削除
-                    temp_path.unlink()
-                except Exception as e:
-                    logger.warning(f"[BATCH] ALT processing failed for {file_path.name}: {str(e)}, continuing without ALT updates")
-                    if temp_path.exists():
-                        temp_path.unlink()
-            else:
-                logger.info(f"[BATCH] ALT processing is disabled for {file_path.name}")
-            
-            # Validate
-            validation_result = self.validator.validate_dataframe(df)
-            if not validation_result['valid']:
-                return {
-                    'file': str(file_path.name),
-                    'status': 'validation_failed',
-                    'errors': validation_result['errors']
-                }
-            
-            # Save output to the same directory as input file
-            output_dir = file_path.parent
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = output_dir / f"{file_path.stem}_processed_{timestamp}.csv"
-            
-            self.csv_processor.save_csv(df, output_file)
-            
-            return {
-                'file': str(file_path.name),
-                'status': 'success',
-                'output_file': str(output_file.name),
-                'output_path': str(output_file),  # フルパスを追加
-                'rows': len(df),
-                'devices_added': len(devices_to_add) if devices_to_add else 0,
-                'devices_removed': len(devices_to_remove) if devices_to_remove else 0
-            }
-            
+            task['options'] = options
+            task['original_columns'] = df.columns.tolist()
         except Exception as e:
-            logger.error(f"Error processing {file_path}: {e}")
-            return {
+            logger.error(f"Error preparing {file_path}: {e}")
+            task['result'] = {
                 'file': str(file_path.name),
                 'status': 'error',
                 'message': str(e)
             }
+        return task
     
     def _build_device_order(
         self,
@@ -342,51 +428,35 @@ class BatchProcessor:
     def _get_device_attributes_from_db(self, devices: List[str]) -> List[Dict]:
         """Get device attributes from database for given devices"""
         try:
-            # Connect to database
-            db_path = Path('/app/product_attributes_new.db')
-            if not db_path.exists():
-                # Fallback to local path if not in Docker
-                db_path = Path(__file__).parent.parent / 'product_attributes_new.db'
-            
-            if not db_path.exists():
-                logger.warning("Product attributes database not found")
-                return []
-            
-            conn = sqlite3.connect(str(db_path))
-            cursor = conn.cursor()
-            
-            device_attributes = []
-            for device in devices:
-                # Query database for device attributes
-                cursor.execute('''
-                    SELECT device_name, attribute_value, size_category
-                    FROM device_attributes
-                    WHERE device_name = ?
-                ''', (device,))
-                
-                result = cursor.fetchone()
-                if result:
-                    device_attributes.append({
-                        'device': result[0],
-                        'attribute_value': result[1],
-                        'size_category': result[2] if result[2] else None
-                    })
-                    logger.info(f"[BATCH] Found DB attribute for {device}: {result[1]}")
-                else:
-                    # If device not in database, use device name as attribute_value
-                    device_attributes.append({
-                        'device': device,
-                        'attribute_value': device,
-                        'size_category': None
-                    })
-                    logger.warning(f"[BATCH] No DB attribute found for {device}, using device name")
-            
-            conn.close()
-            return device_attributes
-            
+            # 一括で解決（完全一致・正規化一致のみ、部分一致は使わない）
+            found = self.device_resolver.resolve(devices, partial=False)
+        except FileNotFoundError:
+            logger.warning("Product attributes database not found")
+            return []
         except Exception as e:
             logger.error(f"Error getting device attributes from database: {e}")
             return []
+        
+        device_attributes = []
+        for device in devices:
+            attributes = found.get(str(device))
+            if attributes:
+                device_attributes.append({
+                    'device': device,
+                    'attribute_value': attributes['attribute_value'],
+                    'size_category': attributes['size_category'] or None
+                })
+                logger.info(f"[BATCH] Found DB attribute for {device}: {attributes['attribute_value']}")
+            else:
+                # If device not in database, use device name as attribute_value
+                device_attributes.append({
+                    'device': device,
+                    'attribute_value': device,
+                    'size_category': None
+                })
+                logger.warning(f"[BATCH] No DB attribute found for {device}, using device name")
+        
+        return device_attributes
     
     async def process_folder(
         self,
@@ -0,0 +1,114 @@
+"""
+Brand attribute resolver
+Loads brand_values once into an index keyed by the case-folded, normalized
+brand name (brand_mapping.normalize_brand_name), so any spelling of a brand
+is answered from memory. Spellings stored in the database are preferred in
+the order the per-variant queries used to try them: as given, lower, upper,
+capitalized. The index is rebuilt after invalidate() (called when database_api
+mutates brand values) or when it is older than the TTL
+"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from brand_mapping import normalize_brand_name
+
+logger = logging.getLogger(__name__)
+
+# Docker上のパス、なければローカルのバックエンドディレクトリ
+DEFAULT_DB_PATHS = [
+    Path('/app/brand_attributes.db'),
+    Path(__file__).parent.parent / 'brand_attributes.db'
+]
+
+
+def brand_key(brand_name: str) -> str:
+    """Index key of a brand name"""
+    return normalize_brand_name(str(brand_name).strip()).casefold()
+
+
+class BrandAttributeResolver:
+    """Resolve brand attribute values (row_index > 0, in row order) from memory"""
+
+    def __init__(self, db_path: Optional[Path] = None,
+                 loader: Optional[Callable[[], Optional[List[Dict]]]] = None,
+                 ttl_seconds: float = 300):
+        """
+        Args:
+            db_path: SQLite brand attributes database (defaults to DEFAULT_DB_PATHS)
+            loader: Returns all brand_values rows from another source (e.g. Supabase) instead of SQLite
+            ttl_seconds: Maximum age of the index before it is reloaded
+        """
+        self.db_path = db_path
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        # 正規化キー -> {DB上のブランド名: 属性値リスト}
+        self._index: Optional[Dict[str, Dict[str, List[str]]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the index; the next resolve() reloads it"""
+        with self._lock:
+            self._index = None
+
+    def resolve(self, brand_name: str) -> List[str]:
+        """Attribute values of brand_name, or an empty list when the brand has none"""
+        if not brand_name:
+            return []
+
+        spellings = self._get_index().get(brand_key(brand_name))
+        if not spellings:
+            return []
+
+        for candidate in (brand_name, brand_name.lower(), brand_name.upper(), brand_name.capitalize()):
+            if candidate in spellings:
+                return list(spellings[candidate])
+        return list(next(iter(spellings.values())))
+
+    def _get_index(self) -> Dict[str, Dict[str, List[str]]]:
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.ttl_seconds
+            if self._index is None or expired:
+                self._index = self._build_index(self._load_rows())
+                self._loaded_at = time.monotonic()
+                logger.info(f"Loaded attribute values of {len(self._index)} brands into memory")
+            return self._index
+
+    @staticmethod
+    def _build_index(rows: Iterable[Dict]) -> Dict[str, Dict[str, List[str]]]:
+        index: Dict[str, Dict[str, List[str]]] = {}
+        ordered = sorted(
+            (row for row in rows if row.get('brand_name') and (row.get('row_index') or 0) > 0),
+            key=lambda row: row['row_index']
+        )
+        for row in ordered:
+            spellings = index.setdefault(brand_key(row['brand_name']), {})
+            spellings.setdefault(row['brand_name'], []).append(row['attribute_value'])
+        return index
+
+    def _load_rows(self) -> List[Dict]:
+        if self.loader is not None:
+            return self.loader() or []
+
+        db_path = self.db_path or next((p for p in DEFAULT_DB_PATHS if p.exists()), None)
+        if db_path is None or not Path(db_path).exists():
+            raise FileNotFoundError("Brand attributes database not found")
+
+        conn = sqlite3.connect(str(db_path))
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute("""
+                SELECT brand_name, row_index, attribute_value
+                FROM brand_values
+                WHERE row_index > 0
+            """)]
+        finally:
+            conn.close()
+
+
+# database_api の書き込みで無効化する共有インスタンス
+brand_attribute_resolver = BrandAttributeResolver()
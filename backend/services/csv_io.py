@@ -0,0 +1,134 @@
+"""
+Fast CSV I/O backend for Shift-JIS / CP932 files
+Decodes the whole file in one call and parses it with Polars into all-string
+columns; output is rendered by Polars and encoded to Shift-JIS in one call.
+Inputs or frames that Polars cannot reproduce exactly like the pandas path
+raise FastCSVUnsupported so the caller can fall back to pandas.
+
+Converting string columns between Polars and pandas goes through Arrow
+buffers only when pyarrow is installed; without it every value becomes a
+Python object on the way and the pandas path is faster, so the 'auto'
+backend picks Polars only when pyarrow is available
+"""
+import importlib.util
+import io
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_ENCODING = 'shift_jis'
+LINE_TERMINATOR = '\r\n'
+# Polars renames duplicated header names to name_duplicated_N (pandas uses name.N)
+DUPLICATED_COLUMN_PATTERN = re.compile(r'_duplicated_\d+$')
+# Polars drops whitespace at the start of a line (the first field of a row)
+LEADING_WHITESPACE_PATTERN = re.compile(r'(?:^|\n)[ \t]')
+IO_BACKENDS = ('auto', 'polars', 'pandas')
+
+
+class FastCSVUnsupported(Exception):
+    """The input cannot be handled by the fast backend with pandas-identical results"""
+
+
+def resolve_io_backend(backend: str) -> str:
+    """Resolve 'auto' to 'polars' when pyarrow is installed, otherwise 'pandas'"""
+    backend = backend.lower()
+    if backend not in IO_BACKENDS:
+        raise ValueError(f"Unknown CSV I/O backend: {backend}")
+    if backend == 'auto':
+        return 'polars' if importlib.util.find_spec('pyarrow') is not None else 'pandas'
+    return backend
+
+
+def read_csv_polars(file_path: Path, encoding: str) -> pd.DataFrame:
+    """
+    Read a CSV file into an all-string DataFrame, equivalent to
+    pd.read_csv(dtype=str, keep_default_na=False)
+    """
+    try:
+        # 一括で厳密にデコードする（デコードできない場合の扱いはpandasに任せる）
+        text = file_path.read_bytes().decode(encoding)
+    except (UnicodeDecodeError, LookupError) as e:
+        raise FastCSVUnsupported(str(e)) from e
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    if text.count('\r') != text.count('\r\n'):
+        # CR単独の改行や値の中のCRはpandasと解釈が異なる
+        raise FastCSVUnsupported("bare carriage return in input")
+    if LEADING_WHITESPACE_PATTERN.search(text):
+        raise FastCSVUnsupported("line starting with whitespace")
+    if not text.endswith('\n'):
+        # 末尾に改行がないと最終行の列数超過が検出されない
+        text += '\n'
+
+    try:
+        frame = pl.read_csv(
+            io.BytesIO(text.encode('utf-8')),
+            infer_schema_length=0,
+            missing_utf8_is_empty_string=True
+        )
+    except Exception as e:
+        raise FastCSVUnsupported(str(e)) from e
+
+    if frame.width < 2:
+        # 1列のCSVでは空行がpandasではスキップ、Polarsでは空文字の行になる
+        raise FastCSVUnsupported("single column")
+    # Polarsはヘッダーの "" を1文字の " に戻さない
+    if any(not name or '"' in name or DUPLICATED_COLUMN_PATTERN.search(name) for name in frame.columns):
+        raise FastCSVUnsupported("empty, quoted or duplicated column names")
+
+    return pd.DataFrame({name: frame[name].to_numpy() for name in frame.columns})
+
+
+def _to_polars_strings(name: str, values) -> pl.Series:
+    """Convert a column to a Polars string Series with pandas to_csv formatting"""
+    array = np.asarray(values, dtype=object)
+    missing = pd.isna(array)
+    if pd.api.types.infer_dtype(array, skipna=True) not in ('string', 'empty'):
+        items = [None if m else str(v) for v, m in zip(array.tolist(), missing.tolist())]
+    else:
+        if missing.any():
+            array = array.copy()
+            array[missing] = None
+        items = array.tolist()
+
+    series = pl.Series(name, items, dtype=pl.Utf8)
+    if series.str.contains('\r', literal=True).any():
+        # Polarsは値の中のCRを引用符で囲まない
+        raise FastCSVUnsupported(f"carriage return in column {name}")
+    # pandasは空文字を引用符なしで出力する（Polarsは "" になる）
+    return series.set(series == '', None)
+
+
+def write_csv_polars(df: pd.DataFrame, file_path: Path, columns: List[str],
+                     overrides: Optional[Dict[str, np.ndarray]] = None, append: bool = False):
+    """
+    Write columns of df as CRLF Shift-JIS CSV without copying the DataFrame
+
+    Args:
+        columns: Output column order
+        overrides: Replacement values for some columns (written instead of df[col])
+        append: Append rows without header
+    """
+    overrides = overrides or {}
+    if len(columns) < 2 or len(set(columns)) != len(columns):
+        # 1列のCSVは空行を "" で出力するなどpandas固有の規則がある
+        raise FastCSVUnsupported("single or duplicated columns")
+
+    frame = pl.DataFrame({
+        col: _to_polars_strings(col, overrides[col] if col in overrides else df[col])
+        for col in columns
+    })
+
+    buffer = io.BytesIO()
+    frame.write_csv(buffer, has_header=not append, line_terminator=LINE_TERMINATOR)
+    data = buffer.getvalue().decode('utf-8').encode(OUTPUT_ENCODING, errors='replace')
+
+    with open(file_path, 'ab' if append else 'wb') as f:
+        f.write(data)
@@ -1,78 +1,206 @@
 import pandas as pd
 import polars as pl
-import chardet
 from pathlib import Path
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, Iterator
 import codecs
+import itertools
+import logging
+import os
+
+import numpy as np
+
+from .csv_io import FastCSVUnsupported, read_csv_polars, resolve_io_backend, write_csv_polars
+from .encoding_sniffer import FALLBACK_ENCODINGS, EncodingSniffer
+from .instrumentation import span, trace_event
+from .parsed_file_cache import ParsedFileCache
+
+logger = logging.getLogger(__name__)
 
 class CSVProcessor:
-    def __init__(self):
+    def __init__(self, cache: Optional[ParsedFileCache] = None, io_backend: Optional[str] = None,
+                 encoding_sniffer: Optional[EncodingSniffer] = None):
+        """
+        Args:
+            cache: Shared cache of parsed files; repeated read_csv calls on an unchanged file skip parsing
+            io_backend: 'polars' (bulk decode/encode, falls back to pandas when needed), 'pandas'
+                        or 'auto' (polars when pyarrow is installed); defaults to CSV_IO_BACKEND
+            encoding_sniffer: Shared per-file encoding detection cache
+        """
         self.original_columns = None
         self.encoding = 'shift_jis'
+        self.cache = cache
+        self.encoding_sniffer = encoding_sniffer or EncodingSniffer()
+        self.io_backend = resolve_io_backend(io_backend or os.getenv('CSV_IO_BACKEND', 'auto'))
     
     def detect_encoding(self, file_path: Path) -> str:
-        """Detect file encoding"""
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(10000)
-            result = chardet.detect(raw_data)
-            return result['encoding'] or 'shift_jis'
+        """Detect file encoding (BOM / strict decoding of a bounded sample, cached per file)"""
+        with span('detect_encoding'):
+            return self.encoding_sniffer.detect(file_path)
     
     def read_csv(self, file_path: Path, use_polars: bool = False) -> Union[pd.DataFrame, pl.DataFrame]:
         """Read CSV file with proper encoding"""
+        with span('parse') as stage:
+            df = self._read_csv(file_path, use_polars)
+            stage.rows = len(df)
+        return df
+    
+    def _read_csv(self, file_path: Path, use_polars: bool) -> Union[pd.DataFrame, pl.DataFrame]:
+        if self.cache is not None and not use_polars:
+            cached = self.cache.get(file_path)
+            if cached is not None:
+                df, _ = cached
+                self.original_columns = df.columns.tolist()
+                return df
+        
         # Detect encoding
         encoding = self.detect_encoding(file_path)
         
+        try:
+            df = self._read_frame(file_path, encoding, use_polars)
+        except UnicodeDecodeError as e:
+            # 判定用サンプルより後にCP932固有の文字（①、㈱など）がある場合
+            if encoding not in FALLBACK_ENCODINGS:
+                raise
+            encoding = self._fall_back_encoding(file_path, encoding, e)
+            df = self._read_frame(file_path, encoding, use_polars)
+        
+        if not use_polars:
+            # Store original columns for later
+            self.original_columns = df.columns.tolist()
+            
+            if self.cache is not None:
+                self.cache.put(file_path, df, {'encoding': encoding})
+        
+        return df
+    
+    def _read_frame(self, file_path: Path, encoding: str, use_polars: bool) -> Union[pd.DataFrame, pl.DataFrame]:
         if use_polars:
             # Use polars for large files
-            df = pl.read_csv(
+            return pl.read_csv(
                 file_path,
                 encoding=encoding,
                 truncate_ragged_lines=True
             )
-        else:
-            # Use pandas for standard processing
-            df = pd.read_csv(
-                file_path,
-                encoding=encoding,
-                dtype=str,
-                keep_default_na=False,
-                on_bad_lines='skip'
-            )
-            
-            # Store original columns for later
-            self.original_columns = df.columns.tolist()
         
-        return df
+        if self.io_backend == 'polars':
+            try:
+                return read_csv_polars(file_path, encoding)
+            except FastCSVUnsupported as e:
+                logger.info(f"Fast CSV reader not applicable to {file_path.name} ({e}), using pandas")
+        
+        # Use pandas for standard processing
+        return pd.read_csv(
+            file_path,
+            encoding=encoding,
+            dtype=str,
+            keep_default_na=False,
+            on_bad_lines='skip'
+        )
     
-    def save_csv(self, df: pd.DataFrame, file_path: Path):
-        """Save DataFrame to CSV with Shift-JIS encoding"""
-        # Create a copy to avoid modifying the original DataFrame
-        df_copy = df.copy()
+    def _fall_back_encoding(self, file_path: Path, encoding: str, error: UnicodeDecodeError) -> str:
+        """Switch file_path to the superset encoding after a decode error and remember it"""
+        fallback = FALLBACK_ENCODINGS[encoding]
+        logger.info(f"{file_path.name} is not valid {encoding} ({error.reason} at byte {error.start}), "
+                    f"reading as {fallback}")
+        self.encoding_sniffer.remember(file_path, fallback)
+        return fallback
+    
+    def iter_csv(self, file_path: Path, chunk_rows: int, usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """Read CSV file in chunks of chunk_rows with the same options as read_csv"""
+        encoding = self.detect_encoding(file_path)
+        rows_yielded = 0
+        while True:
+            try:
+                for chunk in self._iter_chunks(file_path, encoding, chunk_rows, usecols, rows_yielded):
+                    rows_yielded += len(chunk)
+                    yield chunk
+                return
+            except UnicodeDecodeError as e:
+                if encoding not in FALLBACK_ENCODINGS:
+                    raise
+                # 読み直し、出力済みの行は読み飛ばして続きから返す
+                encoding = self._fall_back_encoding(file_path, encoding, e)
+    
+    def _iter_chunks(self, file_path: Path, encoding: str, chunk_rows: int, usecols: Optional[List[str]],
+                     skip_rows: int) -> Iterator[pd.DataFrame]:
+        reader = pd.read_csv(
+            file_path,
+            encoding=encoding,
+            dtype=str,
+            keep_default_na=False,
+            on_bad_lines='skip',
+            usecols=(lambda col: col in usecols) if usecols else None,
+            chunksize=chunk_rows
+        )
+        
+        with reader:
+            for i in itertools.count():
+                # yieldを挟まないよう、チャンクの読み込みだけを計測する
+                with span('parse') as stage:
+                    chunk = next(reader, None)
+                    stage.rows = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    return
+                if i == 0 and not usecols:
+                    # Store original columns for later
+                    self.original_columns = chunk.columns.tolist()
+                if skip_rows:
+                    skipped = min(skip_rows, len(chunk))
+                    chunk = chunk.iloc[skipped:]
+                    skip_rows -= skipped
+                    if chunk.empty:
+                        continue
+                yield chunk
+    
+    def save_csv(self, df: pd.DataFrame, file_path: Path, append: bool = False):
+        """Save DataFrame to CSV with Shift-JIS encoding
+        
+        Args:
+            append: Append rows without header to an existing file (streaming output)
+        """
+        with span('write', rows=len(df)):
+            self._save_csv(df, file_path, append)
+    
+    def _save_csv(self, df: pd.DataFrame, file_path: Path, append: bool):
+        columns = df.columns.tolist()
+        overrides = {}
         
         # バリエーション2選択肢定義は親行（商品管理番号あり＆SKU管理番号なし）だけに残す
-        if 'バリエーション2選択肢定義' in df_copy.columns and 'SKU管理番号' in df_copy.columns and '商品管理番号（商品URL）' in df_copy.columns:
+        if 'バリエーション2選択肢定義' in df.columns and 'SKU管理番号' in df.columns and '商品管理番号（商品URL）' in df.columns:
             # 親行の条件：商品管理番号があり、かつSKU管理番号が空
-            parent_mask = (df_copy['商品管理番号（商品URL）'] != '') & \
-                         (df_copy['商品管理番号（商品URL）'].notna()) & \
-                         ((df_copy['SKU管理番号'] == '') | df_copy['SKU管理番号'].isna())
+            parent_mask = (df['商品管理番号（商品URL）'] != '') & \
+                         (df['商品管理番号（商品URL）'].notna()) & \
+                         ((df['SKU管理番号'] == '') | df['SKU管理番号'].isna())
             
-            # 親行以外のすべての行でバリエーション2選択肢定義を空にする
-            non_parent_mask = ~parent_mask
-            df_copy.loc[non_parent_mask, 'バリエーション2選択肢定義'] = ''
+            # 親行以外のすべての行でバリエーション2選択肢定義を空にする（元のDataFrameは変更しない）
+            non_parent_mask = ~parent_mask.to_numpy()
+            definitions = df['バリエーション2選択肢定義'].to_numpy(dtype=object)
+            overrides['バリエーション2選択肢定義'] = np.where(non_parent_mask, '', definitions)
             
-            # デバッグ出力
-            cleared_count = non_parent_mask.sum()
-            parent_count = parent_mask.sum()
-            print(f"[DEBUG] Kept バリエーション2選択肢定義 for {parent_count} parent rows")
-            print(f"[DEBUG] Cleared バリエーション2選択肢定義 for {cleared_count} non-parent rows")
+            trace_event('device_definitions_cleared', parent_rows=int(len(df) - non_parent_mask.sum()),
+                        cleared_rows=int(non_parent_mask.sum()))
         
         # Ensure column order matches original
-        if self.original_columns and set(df_copy.columns) == set(self.original_columns):
-            df_copy = df_copy[self.original_columns]
+        if self.original_columns and set(columns) == set(self.original_columns):
+            columns = self.original_columns
+        
+        if self.io_backend == 'polars':
+            try:
+                write_csv_polars(df, file_path, columns, overrides, append=append)
+                return
+            except FastCSVUnsupported as e:
+                logger.info(f"Fast CSV writer not applicable ({e}), using pandas")
+        
+        # Create a copy to avoid modifying the original DataFrame
+        df_copy = df[columns].copy() if len(set(columns)) == len(columns) else df.copy()
+        for col, values in overrides.items():
+            df_copy[col] = values
         
         # Save with Shift-JIS encoding and CRLF line endings
         df_copy.to_csv(
             file_path,
+            mode='a' if append else 'w',
+            header=not append,
             index=False,
             encoding='shift_jis',
             errors='replace',
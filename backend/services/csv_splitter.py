@@ -1,180 +1,397 @@
 """
 CSV Splitter for large files
-Splits processed CSV files into 60k row chunks while keeping parent products intact
+Splits processed CSV files into 60k row chunks while keeping parent products intact.
+Product boundaries are found in one pass over the product ID column and row
+ranges are written straight to the part files, so no per-product groups or
+concatenated chunk DataFrames are built. SplitPartWriter accepts the data
+incrementally and can run inline with the main output writer.
+
+Two planning strategies are available: 'sequential' fills parts greedily in
+input order, 'ffd' packs products first-fit-decreasing by row count to
+minimize the number of part files (each one is a separate RMS upload)
 """
 import pandas as pd
+import numpy as np
 import logging
 from pathlib import Path
-from typing import List, Tuple, Dict
-import math
+from typing import List, Dict, Optional, Sequence
+
+from .csv_processor import CSVProcessor
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_ID_COLUMNS = ['商品管理番号（商品URL）', '商品管理番号']
+SPLIT_STRATEGIES = ('sequential', 'ffd')
+
+
+def find_product_id_column(columns) -> Optional[str]:
+    """Product ID column of a Rakuten CSV, or None"""
+    return next((col for col in PRODUCT_ID_COLUMNS if col in columns), None)
+
+
+def product_run_starts(product_ids) -> np.ndarray:
+    """Row positions where a new product run starts (single pass over the ID column)"""
+    ids = np.asarray(product_ids, dtype=object)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+
+
+def plan_parts(product_rows: Sequence[int], max_rows: int, strategy: str = 'sequential',
+               keep_order: bool = True) -> List[List[int]]:
+    """
+    Assign products to part files
+
+    Args:
+        product_rows: Row count of each product, in input order
+        max_rows: Maximum rows per part (a larger product gets a part of its own)
+        strategy: 'sequential' (greedy in input order) or 'ffd' (first-fit decreasing)
+        keep_order: With 'ffd', keep products of a part and the parts themselves
+                    in input order instead of packing order
+
+    Returns:
+        Product indices of each part
+    """
+    if strategy not in SPLIT_STRATEGIES:
+        raise ValueError(f"Unknown split strategy: {strategy}")
+    sizes = np.asarray(product_rows, dtype=np.int64)
+
+    if strategy == 'sequential':
+        parts: List[List[int]] = []
+        part_rows = 0
+        for i, size in enumerate(sizes.tolist()):
+            if not parts or (part_rows and part_rows + size > max_rows):
+                parts.append([])
+                part_rows = 0
+            parts[-1].append(i)
+            part_rows += size
+        return parts
+
+    # 行数の多い商品から順に、収まる最初のパートへ詰める
+    parts = []
+    remaining = np.empty(len(sizes), dtype=np.int64)
+    for i in np.argsort(-sizes, kind='stable').tolist():
+        size = sizes[i]
+        fits = np.flatnonzero(remaining[:len(parts)] >= size)
+        if len(fits):
+            parts[fits[0]].append(i)
+            remaining[fits[0]] -= size
+        else:
+            remaining[len(parts)] = max(max_rows - size, 0)
+            parts.append([i])
+
+    if keep_order:
+        parts = sorted((sorted(part) for part in parts), key=lambda part: part[0])
+    return parts
+
+
+def describe_plan(parts: List[List[int]], product_rows: Sequence[int], max_rows: int,
+                  strategy: str) -> Dict:
+    """File count and fill ratio of a plan"""
+    sizes = np.asarray(product_rows, dtype=np.int64)
+    part_rows = [int(sizes[part].sum()) for part in parts]
+    return {
+        'strategy': strategy,
+        'file_count': len(parts),
+        'total_rows': int(sizes.sum()),
+        'max_rows_per_file': max_rows,
+        'part_rows': part_rows,
+        # 出力ファイルの容量（ファイル数×最大行数）に対する行数の割合
+        'fill_ratio': round(sum(part_rows) / (len(parts) * max_rows), 4) if parts else 0.0
+    }
+
+
+class SplitPartWriter:
+    """
+    Write rows to successive part files, starting a new part at a product
+    boundary whenever the next product would exceed max_rows_per_file
+    """
+
+    def __init__(self, output_dir: Path, base_filename: str, max_rows_per_file: int = 60000,
+                 csv_processor: Optional[CSVProcessor] = None):
+        """
+        Args:
+            output_dir: Directory to save part files
+            base_filename: Part files are named {base_filename}_part001.csv, ...
+            csv_processor: Writer of the parts (its column order and I/O backend are used)
+        """
+        self.output_dir = Path(output_dir)
+        self.base_filename = base_filename
+        self.max_rows_per_file = max_rows_per_file
+        self.csv_processor = csv_processor or CSVProcessor()
+        self.paths: List[Path] = []
+        self._part_rows = 0
+        self._part_products = 0
+        self._pending: Optional[pd.DataFrame] = None
+        self._product_id_column: Optional[str] = None
+
+    def write(self, df: pd.DataFrame, complete: bool = True):
+        """
+        Append rows to the parts
+
+        Args:
+            complete: df ends at a product boundary. With False the last product
+                      is held back until the next write (or close) in case it continues
+        """
+        if self._pending is not None:
+            df = pd.concat([self._pending, df], ignore_index=True)
+            self._pending = None
+        if df.empty:
+            return
+
+        if self._product_id_column is None:
+            self._product_id_column = find_product_id_column(df.columns)
+            if self._product_id_column is None:
+                raise ValueError("Product ID column not found in DataFrame")
+
+        starts = product_run_starts(df[self._product_id_column].to_numpy())
+        end = len(df)
+        if not complete:
+            # 末尾の商品は次のチャンクに続く可能性があるため保留
+            end = int(starts[-1])
+            starts = starts[:-1]
+            self._pending = df.iloc[end:]
+        if end:
+            self._write_products(df, starts, end)
+
+    def _write_products(self, df: pd.DataFrame, starts: np.ndarray, end: int):
+        lengths = np.diff(np.append(starts, end))
+        range_start = 0
+
+        for start, length in zip(starts.tolist(), lengths.tolist()):
+            if length > self.max_rows_per_file:
+                logger.warning(
+                    f"Parent product {df[self._product_id_column].iat[start]} has {length} rows, "
+                    f"exceeding max limit of {self.max_rows_per_file}. It will be in its own file."
+                )
+            if self._part_rows and self._part_rows + length > self.max_rows_per_file:
+                # ここまでの行を現在のパートに書き込み、新しいパートを始める
+                self._write_range(df, range_start, start)
+                self._finish_part()
+                range_start = start
+            self._part_rows += length
+            self._part_products += 1
+
+        self._write_range(df, range_start, end)
+
+    def _write_range(self, df: pd.DataFrame, start: int, end: int):
+        if start >= end:
+            return
+        if not self.paths:
+            self._start_part()
+        # 既に書き込んだ行数（行範囲を書く前に加算済み）
+        append = self._part_rows > end - start
+        self.csv_processor.save_csv(df.iloc[start:end], self.paths[-1], append=append)
+
+    def _start_part(self):
+        filename = f"{self.base_filename}_part{len(self.paths) + 1:03d}.csv"
+        self.paths.append(self.output_dir / filename)
+
+    def _finish_part(self):
+        logger.info(f"Saved {self.paths[-1].name}: {self._part_products} products, {self._part_rows} rows")
+        self._start_part()
+        self._part_rows = 0
+        self._part_products = 0
+
+    def close(self) -> List[Path]:
+        """Write held-back rows and return the part files"""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.write(pending)
+        if self.paths and self._part_rows:
+            logger.info(f"Saved {self.paths[-1].name}: {self._part_products} products, {self._part_rows} rows")
+        elif self.paths:
+            # 最後に開始したパートに行がない
+            self.paths.pop()
+        return list(self.paths)
+
+    def discard(self):
+        """Delete the part files written so far"""
+        for path in self.paths:
+            path.unlink(missing_ok=True)
+        self.paths = []
+        self._pending = None
+
+
 class CSVSplitter:
     """Split large CSV files into manageable chunks"""
-    
-    def __init__(self, max_rows_per_file: int = 60000):
+
+    def __init__(self, max_rows_per_file: int = 60000, csv_processor: Optional[CSVProcessor] = None,
+                 strategy: str = 'sequential', keep_order: bool = True):
         """
         Initialize CSV splitter
         Args:
             max_rows_per_file: Maximum rows per output file (default: 60000)
+            csv_processor: Writer/reader of the files (defaults to a new CSVProcessor per split)
+            strategy: Default planning strategy, 'sequential' or 'ffd'
+            keep_order: With 'ffd', keep products in input order within and across files
         """
+        if strategy not in SPLIT_STRATEGIES:
+            raise ValueError(f"Unknown split strategy: {strategy}")
         self.max_rows_per_file = max_rows_per_file
-    
-    def split_by_parent_products(self, df: pd.DataFrame, output_dir: Path, base_filename: str) -> List[Path]:
+        self.csv_processor = csv_processor
+        self.strategy = strategy
+        self.keep_order = keep_order
+
+    def part_writer(self, output_dir: Path, base_filename: str,
+                    csv_processor: Optional[CSVProcessor] = None) -> SplitPartWriter:
+        """Incremental writer for splitting output while it is produced (sequential strategy)"""
+        return SplitPartWriter(
+            output_dir, base_filename, self.max_rows_per_file,
+            csv_processor or self.csv_processor or CSVProcessor()
+        )
+
+    def plan(self, df: pd.DataFrame, strategy: Optional[str] = None,
+             keep_order: Optional[bool] = None) -> Optional[Dict]:
+        """
+        Plan the split of df without writing anything
+
+        Returns:
+            describe_plan() summary plus 'parts' (product indices per file), or None
+            when the product ID column is missing
+        """
+        grouped = self._group_products(df)
+        if grouped is None:
+            return None
+        _, starts = grouped
+        return self._plan_products(np.diff(np.append(starts, len(df))), strategy, keep_order)
+
+    def _plan_products(self, product_rows: np.ndarray, strategy: Optional[str],
+                       keep_order: Optional[bool]) -> Dict:
+        strategy = strategy or self.strategy
+        oversized = product_rows > self.max_rows_per_file
+        if oversized.any():
+            logger.warning(
+                f"{int(oversized.sum())} parent products exceed max limit of {self.max_rows_per_file} rows. "
+                f"Each will be in its own file."
+            )
+        parts = plan_parts(product_rows, self.max_rows_per_file, strategy,
+                           self.keep_order if keep_order is None else keep_order)
+        plan = describe_plan(parts, product_rows, self.max_rows_per_file, strategy)
+        plan['parts'] = parts
+        return plan
+
+    def _group_products(self, df: pd.DataFrame):
+        """(df with each product's rows contiguous, start row of each product)"""
+        product_id_column = find_product_id_column(df.columns)
+        if product_id_column is None:
+            logger.error(f"Product ID column not found in DataFrame")
+            return None
+
+        product_ids = df[product_id_column]
+        starts = product_run_starts(product_ids.to_numpy())
+        if product_ids.iloc[starts].duplicated().any():
+            # 同じ商品の行が離れている場合は初出順に並べ替えてまとめる
+            codes, _ = pd.factorize(product_ids, use_na_sentinel=False)
+            df = df.take(np.argsort(codes, kind='stable'))
+            starts = product_run_starts(df[product_id_column].to_numpy())
+        return df, starts
+
+    def split_by_parent_products(self, df: pd.DataFrame, output_dir: Path, base_filename: str,
+                                 csv_processor: Optional[CSVProcessor] = None,
+                                 strategy: Optional[str] = None,
+                                 keep_order: Optional[bool] = None,
+                                 plan: Optional[Dict] = None) -> List[Path]:
         """
         Split DataFrame into multiple files based on parent products
         Ensures each parent product and its SKUs stay together
-        
+
         Args:
             df: DataFrame to split
             output_dir: Directory to save split files
             base_filename: Base name for output files
-            
+            csv_processor: Writer of the files (e.g. the one that read df, for its column order)
+            strategy: 'sequential' or 'ffd' (defaults to the splitter's strategy)
+            keep_order: With 'ffd', keep products in input order
+            plan: Result of plan() for this df (e.g. already reported to the user)
+
         Returns:
             List of paths to created files
         """
+        grouped = self._group_products(df)
+        if grouped is None:
+            return []
+        df, starts = grouped
+        ends = np.append(starts[1:], len(df))
+
+        if plan is None:
+            plan = self._plan_products(ends - starts, strategy, keep_order)
+        logger.info(
+            f"Found {len(starts)} parent products with total {len(df)} rows; "
+            f"{plan['strategy']} plan: {plan['file_count']} files, fill ratio {plan['fill_ratio']:.1%}"
+        )
+
+        csv_processor = csv_processor or self.csv_processor or CSVProcessor()
         output_files = []
-        
-        # 商品管理番号でグループ化
-        product_id_column = '商品管理番号（商品URL）'
-        if product_id_column not in df.columns:
-            # Try alternative column name
-            product_id_column = '商品管理番号'
-            if product_id_column not in df.columns:
-                logger.error(f"Product ID column not found in DataFrame")
-                return []
-        
-        # 親製品ごとにグループ化してカウント
-        product_groups = []
-        for product_id, group in df.groupby(product_id_column, sort=False):
-            product_groups.append({
-                'product_id': product_id,
-                'rows': len(group),
-                'data': group
-            })
-        
-        logger.info(f"Found {len(product_groups)} parent products with total {len(df)} rows")
-        
-        # 分割ロジック: 親製品単位で6万行を超えない範囲でグループ化
-        current_chunk = []
-        current_rows = 0
-        chunk_number = 1
-        
-        for product_group in product_groups:
-            # 単一の親製品が最大行数を超える場合の警告
-            if product_group['rows'] > self.max_rows_per_file:
-                logger.warning(
-                    f"Parent product {product_group['product_id']} has {product_group['rows']} rows, "
-                    f"exceeding max limit of {self.max_rows_per_file}. It will be in its own file."
-                )
-                # この製品だけで1ファイル作成
-                if current_chunk:
-                    # 現在のチャンクを保存
-                    output_file = self._save_chunk(
-                        current_chunk, output_dir, base_filename, chunk_number
-                    )
-                    output_files.append(output_file)
-                    chunk_number += 1
-                    current_chunk = []
-                    current_rows = 0
-                
-                # 大きな製品を単独で保存
-                output_file = self._save_chunk(
-                    [product_group], output_dir, base_filename, chunk_number
-                )
-                output_files.append(output_file)
-                chunk_number += 1
-                continue
-            
-            # 現在のチャンクに追加すると制限を超える場合
-            if current_rows + product_group['rows'] > self.max_rows_per_file:
-                # 現在のチャンクを保存
-                if current_chunk:
-                    output_file = self._save_chunk(
-                        current_chunk, output_dir, base_filename, chunk_number
-                    )
-                    output_files.append(output_file)
-                    chunk_number += 1
-                
-                # 新しいチャンクを開始
-                current_chunk = [product_group]
-                current_rows = product_group['rows']
-            else:
-                # 現在のチャンクに追加
-                current_chunk.append(product_group)
-                current_rows += product_group['rows']
-        
-        # 最後のチャンクを保存
-        if current_chunk:
-            output_file = self._save_chunk(
-                current_chunk, output_dir, base_filename, chunk_number
-            )
-            output_files.append(output_file)
-        
+        try:
+            for number, products in enumerate(plan['parts'], start=1):
+                output_path = Path(output_dir) / f"{base_filename}_part{number:03d}.csv"
+                csv_processor.save_csv(self._part_rows(df, starts, ends, products), output_path)
+                output_files.append(output_path)
+                logger.info(f"Saved {output_path.name}: {len(products)} products, "
+                            f"{plan['part_rows'][number - 1]} rows")
+        except Exception:
+            for path in output_files:
+                path.unlink(missing_ok=True)
+            raise
+
         logger.info(f"Split into {len(output_files)} files")
         return output_files
-    
-    def _save_chunk(self, chunk: List[Dict], output_dir: Path, base_filename: str, chunk_number: int) -> Path:
+
+    @staticmethod
+    def _part_rows(df: pd.DataFrame, starts: np.ndarray, ends: np.ndarray, products: List[int]) -> pd.DataFrame:
+        """Rows of the given products (a view when they are consecutive)"""
+        products = np.asarray(products)
+        if (np.diff(products) == 1).all():
+            return df.iloc[starts[products[0]]:ends[products[-1]]]
+        rows = np.concatenate([np.arange(starts[i], ends[i]) for i in products])
+        return df.take(rows)
+
+    def split_file(self, file_path: Path, output_dir: Path, base_filename: str,
+                   chunk_rows: int = 20000) -> List[Path]:
         """
-        Save a chunk of product groups to a CSV file
-        
-        Args:
-            chunk: List of product groups
-            output_dir: Output directory
-            base_filename: Base filename
-            chunk_number: Chunk number for filename
-            
+        Split a CSV file reading it in chunks (memory is bounded by chunk_rows
+        and the largest product). Products are assumed to be contiguous rows
+        and are packed sequentially
+
         Returns:
-            Path to saved file
+            List of paths to created files
         """
-        # Combine all DataFrames in the chunk
-        chunk_df = pd.concat([group['data'] for group in chunk], ignore_index=True)
-        
-        # Generate filename
-        filename = f"{base_filename}_part{chunk_number:03d}.csv"
-        output_path = output_dir / filename
-        
-        # Clear バリエーション2選択肢定義 for SKU rows before saving
-        if 'バリエーション2選択肢定義' in chunk_df.columns and 'SKU管理番号' in chunk_df.columns:
-            sku_mask = chunk_df['SKU管理番号'].notna() & (chunk_df['SKU管理番号'] != '')
-            chunk_df.loc[sku_mask, 'バリエーション2選択肢定義'] = ''
-        
-        # Save with Shift-JIS encoding for Rakuten
-        chunk_df.to_csv(
-            output_path,
-            index=False,
-            encoding='shift_jis',
-            line_terminator='\r\n'
-        )
-        
-        total_products = len(chunk)
-        total_rows = len(chunk_df)
-        logger.info(
-            f"Saved {filename}: {total_products} products, {total_rows} rows"
-        )
-        
-        return output_path
-    
-    def estimate_splits(self, total_rows: int, avg_rows_per_product: float) -> Dict:
+        csv_processor = self.csv_processor or CSVProcessor()
+        writer = self.part_writer(output_dir, base_filename, csv_processor)
+        try:
+            for chunk in csv_processor.iter_csv(file_path, chunk_rows):
+                writer.write(chunk, complete=False)
+            output_files = writer.close()
+        except Exception:
+            writer.discard()
+            raise
+
+        logger.info(f"Split {file_path.name} into {len(output_files)} files")
+        return output_files
+
+    def estimate_splits(self, product_rows: Sequence[int], strategy: Optional[str] = None,
+                        keep_order: Optional[bool] = None) -> Dict:
         """
-        Estimate number of split files needed
-        
+        Estimate number of split files needed from the exact plan
+
         Args:
-            total_rows: Total number of rows
-            avg_rows_per_product: Average rows per parent product
-            
+            product_rows: Row count of each parent product (with its SKU rows)
+            strategy: 'sequential' or 'ffd' (defaults to the splitter's strategy)
+
         Returns:
             Dictionary with estimation details
         """
-        estimated_files = math.ceil(total_rows / self.max_rows_per_file)
-        products_per_file = self.max_rows_per_file / avg_rows_per_product
-        
+        plan = self._plan_products(np.asarray(product_rows, dtype=np.int64), strategy, keep_order)
+        total_products = len(product_rows)
+
         return {
-            'total_rows': total_rows,
+            'total_rows': plan['total_rows'],
             'max_rows_per_file': self.max_rows_per_file,
-            'estimated_files': estimated_files,
-            'avg_rows_per_product': avg_rows_per_product,
-            'avg_products_per_file': products_per_file,
-            'note': 'Actual file count may vary to keep parent products intact'
-        }
\ No newline at end of file
+            'estimated_files': plan['file_count'],
+            'avg_rows_per_product': plan['total_rows'] / total_products if total_products else 0.0,
+            'avg_products_per_file': total_products / plan['file_count'] if plan['file_count'] else 0.0,
+            'fill_ratio': plan['fill_ratio'],
+            'part_rows': plan['part_rows'],
+            'strategy': plan['strategy']
+        }
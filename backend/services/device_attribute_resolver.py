@@ -0,0 +1,143 @@
+"""
+Device attribute resolver
+Loads the device_attributes table once into in-memory indexes and resolves
+any number of device names in one call: exact name, then normalized name
+(NFKC, case and whitespace insensitive), then partial match. The index is
+rebuilt after invalidate() (called on product attribute writes) or when it
+is older than the TTL, which covers writers in other processes
+"""
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Docker上のパス、なければローカルのバックエンドディレクトリ
+DEFAULT_DB_PATHS = [
+    Path('/app/product_attributes_new.db'),
+    Path(__file__).parent.parent / 'product_attributes_new.db'
+]
+
+
+def normalize_device_name(name) -> str:
+    """Normalize full-width characters, case and whitespace of a device name"""
+    return ' '.join(unicodedata.normalize('NFKC', str(name)).casefold().split())
+
+
+class DeviceAttributeIndex:
+    """Lookup tiers built from device rows in priority order (first row wins)"""
+
+    def __init__(self, rows: Iterable[Dict]):
+        self.exact: Dict[str, Dict] = {}
+        self.normalized: Dict[str, Dict] = {}
+        self.partial: List[Tuple[str, Dict]] = []
+
+        for row in rows:
+            name = str(row.get('device_name') or '')
+            if not name:
+                continue
+            attributes = {
+                'attribute_value': row.get('attribute_value'),
+                'size_category': row.get('size_category') or '',
+                'brand': row.get('brand') or ''
+            }
+            normalized = normalize_device_name(name)
+            self.exact.setdefault(name, attributes)
+            if normalized not in self.normalized:
+                self.normalized[normalized] = attributes
+                self.partial.append((normalized, attributes))
+
+    def lookup(self, device_name: str, partial: bool = True) -> Optional[Dict]:
+        attributes = self.exact.get(device_name)
+        if attributes is not None:
+            return attributes
+
+        normalized = normalize_device_name(device_name)
+        attributes = self.normalized.get(normalized)
+        if attributes is not None or not partial or not normalized:
+            return attributes
+
+        # 部分一致（優先度順で最初に名前を含むデバイス）
+        return next((attrs for name, attrs in self.partial if normalized in name), None)
+
+
+class DeviceAttributeResolver:
+    """Resolve device attributes from an in-memory index of the device_attributes table"""
+
+    def __init__(self, db_path: Optional[Path] = None,
+                 loader: Optional[Callable[[], Optional[List[Dict]]]] = None,
+                 ttl_seconds: float = 300):
+        """
+        Args:
+            db_path: SQLite product attributes database (defaults to DEFAULT_DB_PATHS)
+            loader: Returns all device rows from another source (e.g. Supabase) instead of SQLite
+            ttl_seconds: Maximum age of the index before it is reloaded
+        """
+        self.db_path = db_path
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._index: Optional[DeviceAttributeIndex] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the index; the next resolve() reloads it"""
+        with self._lock:
+            self._index = None
+
+    def resolve(self, device_names: Iterable, partial: bool = True) -> Dict[str, Dict]:
+        """
+        Attributes of every device that has a match
+
+        Args:
+            partial: Fall back to partial name matches after exact and normalized matches
+
+        Returns:
+            {device name (str): {'attribute_value', 'size_category', 'brand'}}
+        """
+        index = self._get_index()
+        resolved = {}
+        for device_name in device_names:
+            name = str(device_name)
+            attributes = index.lookup(name, partial=partial)
+            if attributes is not None:
+                resolved[name] = dict(attributes)
+        return resolved
+
+    def _get_index(self) -> DeviceAttributeIndex:
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.ttl_seconds
+            if self._index is None or expired:
+                rows = self._load_rows()
+                self._index = DeviceAttributeIndex(rows)
+                self._loaded_at = time.monotonic()
+                logger.info(f"Loaded {len(self._index.exact)} device attributes into memory")
+            return self._index
+
+    def _load_rows(self) -> List[Dict]:
+        if self.loader is not None:
+            return self.loader() or []
+
+        db_path = self.db_path or next((p for p in DEFAULT_DB_PATHS if p.exists()), None)
+        if db_path is None or not Path(db_path).exists():
+            raise FileNotFoundError("Product attributes database not found")
+
+        conn = sqlite3.connect(str(db_path))
+        conn.row_factory = sqlite3.Row
+        try:
+            # 完全一致の検索と同じ優先順（使用回数・更新日時の降順）
+            return [dict(row) for row in conn.execute("""
+                SELECT device_name, attribute_value, size_category, brand
+                FROM device_attributes
+                ORDER BY usage_count DESC, updated_at DESC
+            """)]
+        finally:
+            conn.close()
+
+
+# product_attributes_api_v2 の書き込みで無効化する共有インスタンス
+device_attribute_resolver = DeviceAttributeResolver()
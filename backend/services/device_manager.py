@@ -1,6 +1,8 @@
 import pandas as pd
 from typing import List, Dict, Set
 
+from .instrumentation import trace_event
+
 class DeviceManager:
     def __init__(self):
         # Try multiple possible column names for compatibility
@@ -18,19 +20,15 @@ class DeviceManager:
         devices = []  # Use list to maintain order
         seen = set()  # Track seen devices to avoid duplicates
         
-        print(f"[DEBUG] Extracting devices from DataFrame with {len(df)} rows")
-        
         # Try to extract from variation definition column (parent rows)
         # This should maintain the original order from the CSV
         var_def_col = 'バリエーション2選択肢定義'
         if var_def_col in df.columns:
-            print(f"[DEBUG] Found {var_def_col} column")
             # Process in order of appearance in the DataFrame
             for value in df[var_def_col].dropna():
                 if value and str(value).strip():
                     # Split pipe-delimited list and maintain order
                     device_list = [d.strip() for d in str(value).split('|') if d.strip()]
-                    print(f"[DEBUG] Extracted from variation def: {device_list}")
                     for device in device_list:
                         if device not in seen:
                             devices.append(device)
@@ -39,18 +37,15 @@ class DeviceManager:
         # Also extract from SKU rows (if not already found)
         sku_device_col = 'バリエーション項目選択肢2'
         if sku_device_col in df.columns:
-            print(f"[DEBUG] Found {sku_device_col} column")
             # Process in order of appearance
             for value in df[sku_device_col].dropna():
                 device = str(value).strip()
                 if device and device not in seen:
                     devices.append(device)
                     seen.add(device)
-                    print(f"[DEBUG] Added from SKU row: {device}")
         
         # Fallback to old method if neither column exists
         if not devices:
-            print(f"[DEBUG] No devices found, trying fallback method")
             self.device_column = None
             for col_name in self.device_columns:
                 if col_name in df.columns:
@@ -65,7 +60,7 @@ class DeviceManager:
                         seen.add(device)
         
         # Return list maintaining original order
-        print(f"[DEBUG] Final extracted devices (order preserved): {devices}")
+        trace_event('devices_extracted', rows=len(df), devices=devices)
         return devices
     
     def add_devices(self, df: pd.DataFrame, devices_to_add: List[str]) -> pd.DataFrame:
@@ -0,0 +1,153 @@
+"""
+Encoding sniffer for Rakuten CSV exports
+Detects the encoding from a BOM or by strict decoding of a bounded sample
+starting at the first non-ASCII byte; chardet is only consulted when no
+candidate decodes cleanly. Results are cached per file (path, mtime, size)
+"""
+import codecs
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+import chardet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = 'shift_jis'
+# Bytes decoded after the first non-ASCII byte
+SAMPLE_BYTES = 64 * 1024
+# Maximum bytes read while looking for the first non-ASCII byte
+MAX_SCAN_BYTES = 4 * 1024 * 1024
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# UTF-8 is tried first because Shift-JIS text is almost never valid UTF-8.
+# shift_jis comes before cp932 so that 〜 etc. keep the code points that the
+# Shift-JIS writer can encode; cp932 only catches NEC/IBM extensions (①, ㈱)
+CANDIDATE_ENCODINGS = ['utf-8', 'shift_jis', 'cp932']
+# Only the sample is checked, so a CP932-only character after it still fails
+# the full read; readers then retry with the superset encoding
+FALLBACK_ENCODINGS = {'shift_jis': 'cp932'}
+NON_ASCII_PATTERN = re.compile(rb'[\x80-\xff]')
+
+CacheKey = Tuple[str, int, int]
+
+
+def _decodes(sample: bytes, encoding: str, complete: bool) -> bool:
+    """Strictly decode sample; a multibyte character cut at the end is allowed unless complete"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+    try:
+        decoder.decode(sample, final=complete)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def sniff_encoding(data: bytes, complete: bool = True) -> str:
+    """
+    Detect the encoding of data (the start of a file or a whole upload body)
+
+    Args:
+        complete: data holds the whole content, so a truncated trailing character is an error
+    """
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+
+    match = NON_ASCII_PATTERN.search(data)
+    if match is None:
+        # ASCIIのみ（楽天のエクスポートはShift-JIS）
+        return DEFAULT_ENCODING
+
+    # ASCIIの後の最初の非ASCIIバイトは必ず文字の先頭なので、そこから一定量だけ検証する
+    start = match.start()
+    sample = data[start:start + SAMPLE_BYTES]
+    complete = complete and start + SAMPLE_BYTES >= len(data)
+    for encoding in CANDIDATE_ENCODINGS:
+        if _decodes(sample, encoding, complete):
+            return encoding
+
+    detected = chardet.detect(sample)['encoding']
+    logger.info(f"No candidate encoding decodes the sample, chardet guessed {detected}")
+    return detected or DEFAULT_ENCODING
+
+
+def decode_bytes(data: bytes) -> Tuple[str, str]:
+    """
+    Decode a whole in-memory upload, returning (text, encoding)
+
+    The guess only covers the sample, so a Shift-JIS guess that fails later
+    in the body is retried with its superset encoding
+    """
+    encoding = sniff_encoding(data)
+    try:
+        return data.decode(encoding), encoding
+    except UnicodeDecodeError as e:
+        fallback = FALLBACK_ENCODINGS.get(encoding)
+        if fallback is None:
+            raise
+        logger.info(f"Upload is not valid {encoding} ({e.reason} at byte {e.start}), decoding as {fallback}")
+        return data.decode(fallback), fallback
+
+
+class EncodingSniffer:
+    """Detect file encodings with a bounded read and remember them per file"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[CacheKey, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(file_path: Path) -> CacheKey:
+        stat = file_path.stat()
+        return str(file_path.resolve()), stat.st_mtime_ns, stat.st_size
+
+    def detect(self, file_path: Path) -> str:
+        """Encoding of file_path (cached until the file changes)"""
+        key = self._key(file_path)
+        with self._lock:
+            entry = self._entries.get(key[0])
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(key[0])
+                return entry[1]
+
+        encoding = sniff_encoding(*self._read_sample(file_path))
+        self.remember(file_path, encoding, key)
+        return encoding
+
+    def remember(self, file_path: Path, encoding: str, key: CacheKey = None):
+        """Record the encoding of file_path"""
+        key = key or self._key(file_path)
+        with self._lock:
+            self._entries[key[0]] = (key, encoding)
+            self._entries.move_to_end(key[0])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _read_sample(file_path: Path) -> Tuple[bytes, bool]:
+        """Read up to the first non-ASCII byte plus SAMPLE_BYTES; returns (data, reached EOF)"""
+        with open(file_path, 'rb') as f:
+            data = bytearray()
+            start = None
+            eof = False
+            while start is None and not eof and len(data) < MAX_SCAN_BYTES:
+                chunk = f.read(SAMPLE_BYTES)
+                eof = len(chunk) < SAMPLE_BYTES
+                match = NON_ASCII_PATTERN.search(chunk)
+                if match is not None:
+                    start = len(data) + match.start()
+                data += chunk
+
+            if start is not None and not eof and len(data) < start + SAMPLE_BYTES:
+                needed = start + SAMPLE_BYTES - len(data)
+                chunk = f.read(needed)
+                eof = len(chunk) < needed
+                data += chunk
+        return bytes(data), eof
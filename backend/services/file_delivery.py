@@ -0,0 +1,137 @@
+"""
+File delivery with HTTP caching
+Serves finished output files straight from disk using the ETag recorded in
+their metadata sidecar. Supports conditional requests (If-None-Match /
+If-Modified-Since -> 304) and single byte ranges (Range / If-Range -> 206)
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file"""
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single 'bytes=' range into inclusive (start, end)
+
+    Returns:
+        None when the header should be ignored (other units, syntax errors or
+        multiple ranges, which are answered with the whole file)
+
+    Raises:
+        RangeNotSatisfiable: The range starts beyond the end of the file
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not start_text:
+            # bytes=-N は末尾Nバイト
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(range_header)
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(range_header)
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag"""
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def _iter_file(path: Path, start: int, end: int) -> Iterator[bytes]:
+    remaining = end - start + 1
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            block = f.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def content_disposition(filename: str) -> str:
+    if filename.isascii():
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def file_response(request: Request, path: Path, metadata: Dict, media_type: str,
+                  filename: Optional[str] = None) -> Response:
+    """
+    Response serving path with the validators from its metadata sidecar
+
+    Args:
+        metadata: Output metadata of path (output_metadata.read_output_metadata)
+        filename: Download name sent in Content-Disposition
+    """
+    etag = f'"{metadata["sha256"]}"'
+    mtime = metadata['mtime_ns'] / 1e9
+    last_modified = formatdate(mtime, usegmt=True)
+    size = metadata['size']
+    headers = {
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Accept-Ranges': 'bytes'
+    }
+    if filename:
+        headers['Content-Disposition'] = content_disposition(filename)
+
+    # If-None-Match があれば If-Modified-Since より優先する
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = request.headers.get('if-modified-since')
+    if (_etag_matches(if_none_match, etag) if if_none_match is not None
+            else if_modified_since is not None and _not_modified_since(if_modified_since, mtime)):
+        headers.pop('Content-Disposition', None)
+        return Response(status_code=304, headers=headers)
+
+    # media_typeをそのまま使う（text/*にcharsetが追加されないように）
+    headers['Content-Type'] = media_type
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}', 'ETag': etag})
+        if byte_range is not None:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            headers['Content-Length'] = str(end - start + 1)
+            return StreamingResponse(_iter_file(path, start, end), status_code=206,
+                                     media_type=media_type, headers=headers)
+
+    headers['Content-Length'] = str(size)
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -0,0 +1,298 @@
+"""
+Per-stage instrumentation
+Named spans record wall time, rows processed and the tracemalloc peak of each
+processing stage. Spans are collected on the trace of the running job (a
+context variable, so concurrent jobs on worker threads stay apart) and every
+finished trace is folded into process-wide histograms served by /api/metrics.
+Outside a trace span() is a no-op, so library code can be instrumented freely.
+
+A trace can also keep diagnostic events (trace_event) in a bounded ring
+buffer. Events are off unless enabled for the job; hot loops check
+events_enabled() once so a disabled trace costs nothing per row
+"""
+import bisect
+import contextvars
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# 計測するステージ名（処理順）
+SPAN_NAMES = [
+    'detect_encoding', 'parse', 'attribute_lookup', 'split', 'add_remove',
+    'sku_regeneration', 'system_sku', 'shard_workers', 'validate', 'encoding_check', 'write'
+]
+
+# ジョブ単位のステージ時間（秒）のヒストグラム境界
+WALL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# ジョブごとに保持する診断イベントの既定件数（古いものから捨てる）
+DEFAULT_EVENT_CAPACITY = 10000
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('instrumentation_trace', default=None)
+
+
+class Span:
+    """One open span; rows may be set inside the with block once known"""
+
+    __slots__ = ('name', 'rows', 'started', 'base_memory', 'peak_memory')
+
+    def __init__(self, name: str, rows: Optional[int] = None):
+        self.name = name
+        self.rows = rows
+        self.started = 0.0
+        self.base_memory = 0
+        self.peak_memory = 0
+
+
+class Trace:
+    """Spans of one job, aggregated by name (per-product spans stay one entry each)"""
+
+    def __init__(self):
+        self.spans: Dict[str, Dict] = OrderedDict()
+        # 診断イベントのリングバッファ（enable_events で有効化、無効時はNone）
+        self.events: Optional[deque] = None
+        self.event_count = 0
+        self._started = time.perf_counter()
+        self._stack: List[Span] = []
+        self._lock = threading.Lock()
+
+    def enable_events(self, capacity: int = DEFAULT_EVENT_CAPACITY):
+        """Keep the last capacity diagnostic events of this trace"""
+        self.events = deque(maxlen=max(1, capacity))
+
+    def add_event(self, event: str, fields: Dict):
+        self.event_count += 1
+        self.events.append((self.event_count, time.perf_counter() - self._started,
+                            self._stack[-1].name if self._stack else None, event, fields))
+
+    def event_log(self) -> Dict:
+        """Buffered events (JSON-serializable) with how many were dropped from the ring"""
+        if self.events is None:
+            return {'enabled': False, 'capacity': 0, 'recorded': 0, 'dropped': 0, 'events': []}
+        # deque のコピーはGILの下で一度に行われるため、記録中でも安全
+        buffered = list(self.events)
+        return {
+            'enabled': True,
+            'capacity': self.events.maxlen,
+            'recorded': self.event_count,
+            'dropped': self.event_count - len(buffered),
+            'events': [
+                dict({key: _json_value(value) for key, value in fields.items()},
+                     seq=seq, time=round(elapsed, 6), span=span_name, event=event)
+                for seq, elapsed, span_name, event, fields in buffered
+            ]
+        }
+
+    def _open(self, span: Span):
+        if tracemalloc.is_tracing():
+            # 外側のスパンのピークを退避してからリセットし、このスパンのピークだけを測る
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_memory = max(parent.peak_memory, peak)
+            tracemalloc.reset_peak()
+            span.base_memory = span.peak_memory = current
+        self._stack.append(span)
+        span.started = time.perf_counter()
+
+    def _close(self, span: Span):
+        wall = time.perf_counter() - span.started
+        self._stack.pop()
+        peak_bytes = None
+        if tracemalloc.is_tracing() and span.base_memory:
+            span.peak_memory = max(span.peak_memory, tracemalloc.get_traced_memory()[1])
+            peak_bytes = span.peak_memory - span.base_memory
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_memory = max(parent.peak_memory, span.peak_memory)
+
+        with self._lock:
+            record = self.spans.get(span.name)
+            if record is None:
+                record = self.spans[span.name] = {
+                    'calls': 0, 'wall_seconds': 0.0, 'rows': None, 'peak_memory_bytes': None
+                }
+            record['calls'] += 1
+            record['wall_seconds'] += wall
+            if span.rows is not None:
+                record['rows'] = (record['rows'] or 0) + int(span.rows)
+            if peak_bytes is not None:
+                record['peak_memory_bytes'] = max(record['peak_memory_bytes'] or 0, peak_bytes)
+
+    def summary(self) -> List[Dict]:
+        """Spans in first-seen order (JSON-serializable)"""
+        with self._lock:
+            return [
+                {
+                    'name': name,
+                    'calls': record['calls'],
+                    'wall_seconds': round(record['wall_seconds'], 6),
+                    'rows': record['rows'],
+                    'peak_memory_mb': (None if record['peak_memory_bytes'] is None
+                                       else round(record['peak_memory_bytes'] / 1024 / 1024, 3))
+                }
+                for name, record in self.spans.items()
+            ]
+
+
+@contextmanager
+def span(name: str, rows: Optional[int] = None) -> Iterator[Span]:
+    """
+    Time the with block as stage name on the current trace
+
+    A span's time includes the spans nested inside it. The memory peak is
+    recorded only while tracemalloc is tracing (PYTHONTRACEMALLOC=1) and, as
+    tracemalloc is process-wide, includes allocations of concurrent jobs
+    """
+    current = Span(name, rows)
+    trace = _current_trace.get()
+    if trace is None:
+        yield current
+        return
+    trace._open(current)
+    try:
+        yield current
+    finally:
+        trace._close(current)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def events_enabled() -> bool:
+    """Whether trace_event records anything (check once before a hot loop)"""
+    trace = _current_trace.get()
+    return trace is not None and trace.events is not None
+
+
+def trace_event(event: str, **fields):
+    """
+    Record a diagnostic event on the current trace's ring buffer
+
+    Fields are stored as given and only formatted when the buffer is read,
+    so call sites must not pre-format strings (but should copy lists that
+    are mutated later)
+    """
+    trace = _current_trace.get()
+    if trace is not None and trace.events is not None:
+        trace.add_event(event, fields)
+
+
+def _json_value(value: Any):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        # NaN（pandasの欠損値）はJSONで表せないためNone
+        return None
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    return str(value)
+
+
+@contextmanager
+def tracing(registry: Optional['MetricsRegistry'] = None) -> Iterator[Trace]:
+    """Collect spans of the with block on a new trace; the finished trace is observed by registry"""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        (registry if registry is not None else metrics).observe(trace)
+
+
+class MetricsRegistry:
+    """Process-wide histograms of per-job stage time plus row and memory totals"""
+
+    def __init__(self, buckets=WALL_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages: Dict[str, Dict] = OrderedDict()
+        self._traces = 0
+        self._lock = threading.Lock()
+
+    def observe(self, trace: Trace):
+        """Add one observation per span name of a finished trace"""
+        with self._lock:
+            self._traces += 1
+            for name, record in trace.spans.items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    stage = self._stages[name] = {
+                        'count': 0, 'calls': 0, 'sum': 0.0, 'rows': 0,
+                        'bucket_counts': [0] * (len(self.buckets) + 1), 'max_peak_memory_bytes': None
+                    }
+                stage['count'] += 1
+                stage['calls'] += record['calls']
+                stage['sum'] += record['wall_seconds']
+                stage['rows'] += record['rows'] or 0
+                stage['bucket_counts'][bisect.bisect_left(self.buckets, record['wall_seconds'])] += 1
+                if record['peak_memory_bytes'] is not None:
+                    stage['max_peak_memory_bytes'] = max(stage['max_peak_memory_bytes'] or 0,
+                                                         record['peak_memory_bytes'])
+
+    def snapshot(self) -> Dict:
+        """Cumulative histograms per stage (JSON-serializable)"""
+        with self._lock:
+            stages = {}
+            for name, stage in self._stages.items():
+                cumulative, buckets = 0, []
+                for bound, count in zip(self.buckets + (None,), stage['bucket_counts']):
+                    cumulative += count
+                    buckets.append({'le': '+Inf' if bound is None else bound, 'count': cumulative})
+                stages[name] = {
+                    'count': stage['count'],
+                    'calls': stage['calls'],
+                    'wall_seconds_sum': round(stage['sum'], 6),
+                    'rows_total': stage['rows'],
+                    'max_peak_memory_mb': (None if stage['max_peak_memory_bytes'] is None
+                                           else round(stage['max_peak_memory_bytes'] / 1024 / 1024, 3)),
+                    'buckets': buckets
+                }
+            return {'traces': self._traces, 'stages': stages}
+
+    def prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP rakuten_jobs_traced_total Jobs whose stages were traced',
+            '# TYPE rakuten_jobs_traced_total counter',
+            f"rakuten_jobs_traced_total {snapshot['traces']}",
+            '# HELP rakuten_stage_seconds Wall time per job and stage',
+            '# TYPE rakuten_stage_seconds histogram',
+        ]
+        for name, stage in snapshot['stages'].items():
+            for bucket in stage['buckets']:
+                lines.append(f'rakuten_stage_seconds_bucket{{stage="{name}",le="{bucket["le"]}"}} {bucket["count"]}')
+            lines.append(f'rakuten_stage_seconds_sum{{stage="{name}"}} {stage["wall_seconds_sum"]}')
+            lines.append(f'rakuten_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines += ['# HELP rakuten_stage_rows_total Rows processed per stage',
+                  '# TYPE rakuten_stage_rows_total counter']
+        for name, stage in snapshot['stages'].items():
+            lines.append(f'rakuten_stage_rows_total{{stage="{name}"}} {stage["rows_total"]}')
+        peaks = [(name, stage['max_peak_memory_mb']) for name, stage in snapshot['stages'].items()
+                 if stage['max_peak_memory_mb'] is not None]
+        if peaks:
+            lines += ['# HELP rakuten_stage_peak_memory_bytes Largest tracemalloc peak per stage',
+                      '# TYPE rakuten_stage_peak_memory_bytes gauge']
+            for name, peak_mb in peaks:
+                lines.append(f'rakuten_stage_peak_memory_bytes{{stage="{name}"}} {int(peak_mb * 1024 * 1024)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._traces = 0
+
+
+# /api/metrics が返すプロセス全体の集計
+metrics = MetricsRegistry()
@@ -0,0 +1,208 @@
+"""
+Job queue for CSV processing
+Runs process requests on a bounded thread pool so CPU-bound pandas work and
+blocking database calls stay off the event loop. Each job reports per-stage
+progress and the timing spans of its stages; submissions beyond the worker and
+queue limits are rejected so the caller can answer 429
+"""
+import logging
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .instrumentation import Trace, tracing
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STAGES = ['parse', 'attribute_lookup', 'transform', 'validate', 'write']
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """All workers are busy and the pending queue is full"""
+
+
+class JobError(Exception):
+    """Expected job failure with an HTTP status and optional details (e.g. validation errors)"""
+
+    def __init__(self, message: str, status_code: int = 500, details: Optional[List] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class Job:
+    """State and per-stage progress of one queued job"""
+
+    def __init__(self, job_id: str, kind: str, stages: List[str]):
+        self.id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.stages: Dict[str, Dict] = OrderedDict(
+            (name, {'status': 'pending', 'started_at': None, 'finished_at': None}) for name in stages
+        )
+        self.current_stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.error_status_code: Optional[int] = None
+        self.error_details: Optional[List] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        # 実行中に判明した情報（分割計画など）、進捗と一緒に返す
+        self.info: Dict[str, Any] = {}
+        # 検証違反の一覧（Validatorのviolations）、/violations でページ単位に返す
+        self.violations: List[Dict] = []
+        # ステージごとの計測スパン（実行開始時に設定）
+        self.trace: Optional[Trace] = None
+        self._lock = threading.Lock()
+
+    def start_stage(self, name: str):
+        """Finish the running stage (and any skipped ones before name) and start name"""
+        with self._lock:
+            now = time.time()
+            for stage_name, stage in self.stages.items():
+                if stage_name == name:
+                    break
+                if stage['status'] in ('pending', 'running'):
+                    stage['status'] = 'done' if stage['status'] == 'running' else 'skipped'
+                    stage['finished_at'] = now
+            self.stages[name].update(status='running', started_at=now)
+            self.current_stage = name
+
+    def _finish(self, status: str):
+        now = time.time()
+        with self._lock:
+            for stage in self.stages.values():
+                if stage['status'] == 'running':
+                    stage['status'] = 'done' if status == COMPLETED else 'failed'
+                    stage['finished_at'] = now
+                elif stage['status'] == 'pending' and status == COMPLETED:
+                    stage['status'] = 'skipped'
+            self.current_stage = None
+            self.status = status
+            self.finished_at = now
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            settled = sum(1 for s in self.stages.values() if s['status'] in ('done', 'skipped'))
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'current_stage': self.current_stage,
+                'progress': 1.0 if self.status == COMPLETED else round(settled / max(len(self.stages), 1), 3),
+                'stages': [dict(stage, name=name) for name, stage in self.stages.items()],
+                'error': self.error,
+                'info': dict(self.info),
+                'violation_count': len(self.violations),
+                'spans': self.trace.summary() if self.trace is not None else [],
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobQueue:
+    """Bounded worker pool with job status tracking"""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8,
+                 retention_seconds: float = 3600, max_finished: int = 200):
+        """
+        Args:
+            max_workers: Jobs executed concurrently
+            max_pending: Jobs allowed to wait for a worker; further submissions raise JobQueueFull
+            retention_seconds: How long finished jobs (and their results) stay queryable
+            max_finished: Maximum number of finished jobs kept
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(0, max_pending)
+        self.retention_seconds = retention_seconds
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable, *args, stages: Optional[List[str]] = None, **kwargs) -> Job:
+        """
+        Enqueue fn(job, *args, **kwargs); its return value becomes the job result
+
+        Raises:
+            JobQueueFull: max_workers + max_pending jobs are already queued or running
+        """
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_workers + self.max_pending:
+                raise JobQueueFull(f"{active} jobs are queued or running")
+
+            job = Job(uuid.uuid4().hex, kind, stages if stages is not None else PROCESS_STAGES)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            with tracing() as job.trace:
+                result = fn(job, *args, **kwargs)
+        except Exception as e:
+            job.error = str(e)
+            job.error_status_code = getattr(e, 'status_code', 500)
+            job.error_details = getattr(e, 'details', None)
+            if not isinstance(e, JobError):
+                logger.error(f"Job {job.id} failed: {e}\n{traceback.format_exc()}")
+            job._finish(FAILED)
+            raise
+        job.result = result
+        job._finish(COMPLETED)
+        return result
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """Status of all retained jobs, newest first"""
+        with self._lock:
+            self._prune()
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'queued': statuses.count(QUEUED),
+            'running': statuses.count(RUNNING),
+            'retained': len(statuses)
+        }
+
+    def _prune(self):
+        """Drop finished jobs past retention or beyond max_finished (oldest first)"""
+        cutoff = time.time() - self.retention_seconds
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(finished) - self.max_finished
+        for job in finished:
+            if job.finished_at < cutoff or excess > 0:
+                del self._jobs[job.id]
+                excess -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,90 @@
+"""
+Output file metadata sidecar
+Output invariants (バリエーション2選択肢定義 only on parent rows) are enforced by
+CSVProcessor.save_csv when a file is written. Once the file is complete a
+JSON sidecar ({name}.meta.json) records that, with the size, mtime and SHA-256
+of the file, so downloads can be served straight from disk with an ETag and no
+parsing. A sidecar whose size or mtime no longer matches the file is ignored
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = '.meta.json'
+METADATA_VERSION = 1
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sidecar_path(file_path: Path) -> Path:
+    """Path of the metadata sidecar of file_path"""
+    return file_path.with_name(file_path.name + SIDECAR_SUFFIX)
+
+
+def mark_output(file_path: Path, **info) -> Dict:
+    """
+    Record that file_path is complete and satisfies the output invariants
+
+    Args:
+        info: Extra fields stored in the sidecar (e.g. rows)
+
+    Returns:
+        The stored metadata
+    """
+    file_path = Path(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+
+    stat = file_path.stat()
+    metadata = dict(info)
+    metadata.update({
+        'version': METADATA_VERSION,
+        'invariants_enforced': True,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': digest.hexdigest(),
+        'marked_at': time.time()
+    })
+
+    # 書き込み途中のサイドカーを読まれないよう一時ファイルから置き換える
+    target = sidecar_path(file_path)
+    temp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    temp.write_text(json.dumps(metadata), encoding='utf-8')
+    os.replace(temp, target)
+    return metadata
+
+
+def read_output_metadata(file_path: Path) -> Optional[Dict]:
+    """Metadata of file_path, or None when there is no sidecar or it is stale"""
+    file_path = Path(file_path)
+    try:
+        metadata = json.loads(sidecar_path(file_path).read_text(encoding='utf-8'))
+        stat = file_path.stat()
+    except (OSError, ValueError):
+        return None
+
+    if (metadata.get('version') != METADATA_VERSION or
+            metadata.get('size') != stat.st_size or
+            metadata.get('mtime_ns') != stat.st_mtime_ns):
+        return None
+    return metadata
+
+
+def ensure_output_metadata(file_path: Path, normalize: Callable[[Path], None]) -> Dict:
+    """
+    Metadata of file_path; a file without a valid sidecar (e.g. written by an
+    older version) is normalized once with normalize(file_path) and then marked
+    """
+    metadata = read_output_metadata(file_path)
+    if metadata is None:
+        logger.info(f"No output metadata for {Path(file_path).name}, normalizing once")
+        normalize(file_path)
+        metadata = mark_output(file_path)
+    return metadata
@@ -0,0 +1,98 @@
+"""
+Parsed file cache
+Keeps DataFrames of recently parsed uploads in memory so repeated reads of the
+same file (upload analysis, device lookup, processing, reprocessing) skip
+encoding detection and CSV parsing. Entries are keyed by path plus mtime and
+size, and evicted least-recently-used first when the byte budget is exceeded
+"""
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, int, int]
+
+
+class ParsedFileCache:
+    """LRU cache of parsed CSV files bounded by DataFrame memory usage"""
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Total memory budget for cached DataFrames (0 disables caching)
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[CacheKey, pd.DataFrame, Dict, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(file_path: Path) -> CacheKey:
+        stat = file_path.stat()
+        return str(file_path.resolve()), stat.st_mtime_ns, stat.st_size
+
+    def get(self, file_path: Path) -> Optional[Tuple[pd.DataFrame, Dict]]:
+        """
+        Return (copy of the cached DataFrame, metadata), or None when the file
+        is not cached or has changed since it was parsed
+        """
+        key = self._key(file_path)
+        with self._lock:
+            entry = self._entries.get(key[0])
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key[0])
+            self.hits += 1
+            df, metadata = entry[1], entry[2]
+
+        # Callers modify the frame in place, so hand out a copy
+        return df.copy(), dict(metadata)
+
+    def put(self, file_path: Path, df: pd.DataFrame, metadata: Optional[Dict] = None):
+        """Cache a parsed DataFrame; frames larger than the whole budget are skipped"""
+        if self.max_bytes <= 0:
+            return
+
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            logger.info(f"Not caching {file_path.name}: {size / 1024 / 1024:.1f}MB exceeds cache budget")
+            return
+
+        key = self._key(file_path)
+        with self._lock:
+            self._remove(key[0])
+            self._entries[key[0]] = (key, df.copy(), dict(metadata or {}), size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                evicted_path, _ = next(iter(self._entries.items()))
+                self._remove(evicted_path)
+                logger.debug(f"Evicted parsed file from cache: {evicted_path}")
+
+    def invalidate(self, file_path: Path):
+        """Drop the entry for file_path (e.g. when the file is deleted)"""
+        with self._lock:
+            self._remove(str(file_path.resolve()))
+
+    def _remove(self, path_key: str):
+        entry = self._entries.pop(path_key, None)
+        if entry is not None:
+            self.current_bytes -= entry[3]
+
+    def stats(self) -> Dict:
+        """Cache statistics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,190 @@
+"""
+RakutenCSVProcessor用の並列エンジン
+商品単位でシャードに分割し、ProcessPoolExecutorで各シャードをベクトル化エンジンで処理する。
+SKU番号と商品属性1の抽選結果は親プロセスで商品順に事前確保するため、
+出力・採番結果は単一プロセスの処理と同一になる。
+"""
+import multiprocessing
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.instrumentation import span
+from services.rakuten_vectorized import (
+    VectorizedRakutenEngine, ATTR1_COL, COLOR_COL, DEVICE_COL
+)
+
+
+def _process_shard(task: Dict) -> pd.DataFrame:
+    """ワーカープロセスで1シャードを処理（SKU状態ファイルには触れない）"""
+    from services.rakuten_processor import RakutenCSVProcessor
+
+    engine = VectorizedRakutenEngine(RakutenCSVProcessor())
+    return engine.process(
+        task['df'], sku_numbers=task['sku_numbers'], brand_choices=task['brand_choices'],
+        **task['options']
+    )
+
+
+class ParallelRakutenEngine:
+    """商品シャードをプロセスプールで並列処理する"""
+
+    def __init__(self, processor, workers: Optional[int] = None, shard_size: int = 20000):
+        """
+        Args:
+            workers: ワーカープロセス数（省略時はCPUコア数）
+            shard_size: 1シャードあたりの目安行数（商品の途中では分割しない）
+        """
+        self.processor = processor
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = max(1, shard_size)
+        self.vectorized = VectorizedRakutenEngine(processor)
+
+    def supports(self, df: pd.DataFrame) -> bool:
+        """ベクトル化エンジンと同じ入力のみ対応"""
+        return self.vectorized.supports(df)
+
+    def process(self, df: pd.DataFrame, **options) -> pd.DataFrame:
+        """process_csvと同じ引数で全商品をシャード単位で並列処理"""
+        with span('split', rows=len(df)):
+            codes, product_ids, parent_pos, option_pos, sku_pos = self.vectorized.classify_rows(df)
+            has_parent = parent_pos >= 0
+            if not has_parent.any():
+                return df
+
+            group_shard, row_shard = self._plan_shards(codes, has_parent)
+        n_shards = int(row_shard.max()) + 1
+        if n_shards <= 1 or self.workers <= 1:
+            return self.vectorized.process(df, **options)
+
+        sku_counts, new_counts = self._count_sku_rows(df, codes, has_parent, sku_pos, options)
+
+        # 商品順にSKU番号と商品属性1の抽選結果を事前確保（単一プロセスと同じ消費順序）
+        shard_sku_counts = np.bincount(group_shard[has_parent], weights=sku_counts[has_parent],
+                                       minlength=n_shards).astype(np.int64)
+        shard_new_counts = np.bincount(group_shard[has_parent], weights=new_counts[has_parent],
+                                       minlength=n_shards).astype(np.int64)
+
+        with span('sku_regeneration', rows=int(shard_sku_counts.sum())):
+            sku_numbers = self.processor._allocate_sku_numbers(int(shard_sku_counts.sum()))
+        brand_attributes = options.get('brand_attributes')
+        draws_brand = (bool(brand_attributes) and ATTR1_COL in df.columns
+                       and not options.get('reset_all_devices'))
+        brand_choices = ([random.choice(brand_attributes) for _ in range(int(shard_new_counts.sum()))]
+                         if draws_brand else None)
+
+        order = np.argsort(row_shard, kind='stable')
+        bounds = np.searchsorted(row_shard[order], np.arange(n_shards + 1))
+        sku_bounds = np.concatenate([[0], np.cumsum(shard_sku_counts)])
+        new_bounds = np.concatenate([[0], np.cumsum(shard_new_counts)])
+
+        tasks = []
+        for shard in range(n_shards):
+            rows = order[bounds[shard]:bounds[shard + 1]]
+            tasks.append({
+                'df': df.take(rows),
+                'sku_numbers': sku_numbers[sku_bounds[shard]:sku_bounds[shard + 1]],
+                'brand_choices': (brand_choices[new_bounds[shard]:new_bounds[shard + 1]]
+                                  if brand_choices is not None else None),
+                'options': options,
+            })
+
+        # ワーカー内の追加/削除・採番はこの親プロセスのトレースには記録されないため、まとめて計測する
+        # forkでは親のスレッドが持つロックを引き継いで止まることがあるためforkserverで起動する
+        with span('shard_workers', rows=len(df)):
+            with ProcessPoolExecutor(max_workers=min(self.workers, n_shards),
+                                     mp_context=multiprocessing.get_context('forkserver')) as executor:
+                results = list(executor.map(_process_shard, tasks))
+
+        self.processor._save_sku_state()
+        return pd.concat(results, ignore_index=True)
+
+    def count_sku_rows(self, df: pd.DataFrame, **options) -> Optional[int]:
+        """
+        process_csvの出力SKU行数（事前にSKU番号を確保する件数）
+
+        Returns:
+            SKU行数。ベクトル化エンジンの対象外の入力はNone
+        """
+        if not self.supports(df):
+            return None
+        codes, _, parent_pos, _, sku_pos = self.vectorized.classify_rows(df)
+        has_parent = parent_pos >= 0
+        if not has_parent.any():
+            return 0
+        sku_counts, _ = self._count_sku_rows(df, codes, has_parent, sku_pos, options)
+        return int(sku_counts[has_parent].sum())
+
+    def _plan_shards(self, codes: np.ndarray, has_parent: np.ndarray):
+        """
+        商品の出現順に行数がshard_sizeに達するまで商品をまとめる
+
+        Returns:
+            (商品ごとのシャード番号, 行ごとのシャード番号)　出力されない商品・行は-1
+        """
+        in_group = codes >= 0
+        rows_per_group = np.bincount(codes[in_group], minlength=len(has_parent))
+        rows_per_group[~has_parent] = 0
+        rows_before = np.cumsum(rows_per_group) - rows_per_group
+
+        group_shard = np.full(len(has_parent), -1, dtype=np.int64)
+        _, group_shard[has_parent] = np.unique(rows_before[has_parent] // self.shard_size,
+                                               return_inverse=True)
+        row_shard = np.full(len(codes), -1, dtype=np.int64)
+        row_shard[in_group] = group_shard[codes[in_group]]
+        return group_shard, row_shard
+
+    def _count_sku_rows(self, df: pd.DataFrame, codes: np.ndarray, has_parent: np.ndarray,
+                        sku_pos: np.ndarray, options: Dict):
+        """
+        ベクトル化エンジンと同じ規則で、商品ごとの出力SKU行数と追加SKU行数を算出
+
+        Returns:
+            (商品ごとのSKU行数, 商品ごとの追加SKU行数)
+        """
+        n_groups = len(has_parent)
+        devices = df[DEVICE_COL].to_numpy()
+        colors = df[COLOR_COL].to_numpy()
+
+        if options.get('reset_all_devices'):
+            new_devices = options.get('custom_device_order') or options.get('devices_to_add') or []
+            color_table = pd.DataFrame({'code': codes[sku_pos], 'color': colors[sku_pos]})
+            color_table = color_table[color_table['color'].notna()].drop_duplicates()
+            n_colors = np.bincount(color_table['code'].to_numpy(dtype=np.int64), minlength=n_groups)
+            groups_with_sku = np.bincount(codes[sku_pos], minlength=n_groups) > 0
+            # SKU行のない商品は親行をもとに機種ごとに1行
+            rows_per_device = np.where(groups_with_sku, n_colors, 1)
+            sku_counts = np.where(has_parent, rows_per_device * len(new_devices), 0)
+            return sku_counts, sku_counts
+
+        existing_pos = sku_pos
+        devices_to_remove = options.get('devices_to_remove')
+        if devices_to_remove:
+            existing_pos = existing_pos[~pd.Series(devices[existing_pos]).isin(devices_to_remove).to_numpy()]
+        existing_counts = np.bincount(codes[existing_pos], minlength=n_groups)
+
+        new_counts = np.zeros(n_groups, dtype=np.int64)
+        devices_to_add = options.get('devices_to_add')
+        if devices_to_add:
+            existing = pd.DataFrame({
+                'code': codes[existing_pos],
+                'device': devices[existing_pos],
+                'color': colors[existing_pos],
+            })
+            color_table = existing[existing['color'].notna()].drop_duplicates(['code', 'color'])
+            n_colors = np.bincount(color_table['code'].to_numpy(dtype=np.int64), minlength=n_groups)
+
+            # 既に存在する機種は追加しない（devices_to_addの重複は重複分だけ追加される）
+            multiplicity = Counter(devices_to_add)
+            pairs = existing[existing['device'].notna()].drop_duplicates(['code', 'device'])
+            hits = pairs['device'].map(lambda d: multiplicity.get(d, 0)).to_numpy(dtype=np.int64)
+            present = np.bincount(pairs['code'].to_numpy(dtype=np.int64), weights=hits,
+                                  minlength=n_groups).astype(np.int64)
+            new_counts = n_colors * (len(devices_to_add) - present)
+
+        return existing_counts + new_counts, new_counts
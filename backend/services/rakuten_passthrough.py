@@ -0,0 +1,65 @@
+"""
+RakutenCSVProcessor用の列の遅延展開（パススルー列）
+楽天の商品CSVは数百列あるが、処理で読み書きするのは十数列のみ。
+処理対象の列と元行番号だけの作業用フレームで各エンジンを実行し、
+触れない列は最後に元のフレームから元行番号で一度だけ取り出して結合する。
+行テンプレートのコピー・concat・takeが全列分の複製をしなくなるため、
+列の多いCSVほどメモリとコピー時間が減る。出力は全列で処理した場合と同一になる。
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# 処理で読み書きする列（行の分類に使う列を含む）
+WORKING_COLUMNS = [
+    '商品管理番号（商品URL）', '商品番号', '商品名', 'SKU管理番号', 'システム連携用SKU番号',
+    '選択肢タイプ', '商品オプション項目名',
+    'バリエーション1選択肢定義', 'バリエーション2選択肢定義',
+    'バリエーション項目選択肢1', 'バリエーション項目選択肢2',
+    '商品属性（値）1', '商品属性（値）3', '商品属性（値）8',
+]
+
+# 作業用フレームで各行の元の位置を保持する列（行のコピーとともに引き継がれる）
+SOURCE_ROW_COL = '__source_row__'
+
+
+class PassthroughColumns:
+    """作業用フレームの作成と、処理結果への触れない列の結合"""
+
+    def __init__(self, source: pd.DataFrame):
+        self.source = source
+        working = set(WORKING_COLUMNS)
+        self.working_columns: List[str] = [col for col in source.columns if col in working]
+        self.passthrough_columns: List[str] = [col for col in source.columns if col not in working]
+
+    @staticmethod
+    def supports(df: pd.DataFrame) -> bool:
+        """列名が一意で、省略できる列がある入力のみ対象（それ以外は全列で処理）"""
+        if df.columns.duplicated().any() or SOURCE_ROW_COL in df.columns:
+            return False
+        return any(col not in WORKING_COLUMNS for col in df.columns)
+
+    def narrow(self) -> pd.DataFrame:
+        """処理対象の列と元行番号だけの作業用フレーム（インデックスは元のまま）"""
+        working = self.source[self.working_columns].copy()
+        working[SOURCE_ROW_COL] = np.arange(len(self.source), dtype=np.int64)
+        return working
+
+    def expand(self, result: pd.DataFrame) -> pd.DataFrame:
+        """処理結果に触れない列を元行から取り出して結合し、全列のフレームに戻す
+
+        列順は元のフレームの順で、処理中に追加された列は末尾に並ぶ（全列で処理した場合と同じ）
+        """
+        positions = pd.to_numeric(result[SOURCE_ROW_COL]).fillna(-1).to_numpy(dtype=np.int64)
+        if (positions >= 0).all():
+            expanded = self.source.take(positions)
+        else:
+            # 元行のない行（現在の処理では発生しない）は全列処理と同じく欠損値にする
+            expanded = self.source.reset_index(drop=True).reindex(positions)
+        expanded.index = result.index
+
+        for col in result.columns:
+            if col != SOURCE_ROW_COL:
+                expanded[col] = result[col].values
+        return expanded
@@ -2,7 +2,6 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Tuple
-import json
 import logging
 import random
 import re
@@ -10,59 +9,90 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from brand_mapping import normalize_brand_name, get_brand_db_name
+from services.rakuten_vectorized import VectorizedRakutenEngine
+from services.rakuten_parallel import ParallelRakutenEngine
+from services.rakuten_passthrough import PassthroughColumns
+from services.sku_allocator import create_sku_allocator
+from services.instrumentation import events_enabled, span, trace_event
 
 logger = logging.getLogger(__name__)
 
 class RakutenCSVProcessor:
     """楽天RMS CSV処理クラス - 正しい親子構造を維持"""
     
-    def __init__(self, sku_state_file: Path = None):
+    def __init__(self, sku_state_file: Path = None, parallel_workers: int = None,
+                 parallel_shard_size: int = 20000):
+        """
+        Args:
+            parallel_workers: 並列エンジンのワーカープロセス数（省略時はCPUコア数）
+            parallel_shard_size: 並列エンジンの1シャードあたりの目安行数
+        """
         self.sku_state_file = sku_state_file
-        self.global_sku_counter = self._load_global_counter()
-        self.used_sku_numbers = self._load_used_skus()
-        
-    def _load_global_counter(self) -> int:
-        """グローバルSKUカウンターを読み込み"""
-        if self.sku_state_file and self.sku_state_file.exists():
-            with open(self.sku_state_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('global_counter', 0)
-        return 0
+        self.parallel_workers = parallel_workers
+        self.parallel_shard_size = parallel_shard_size
+        self.sku_allocator = create_sku_allocator(sku_state_file)
     
-    def _load_used_skus(self) -> set:
-        """使用済みSKU番号を読み込み"""
-        if self.sku_state_file and self.sku_state_file.exists():
-            with open(self.sku_state_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return set(data.get('used_skus', []))
-        return set()
+    @property
+    def global_sku_counter(self) -> int:
+        """最後に払い出したSKU番号"""
+        return self.sku_allocator.high_water
     
     def _save_sku_state(self):
         """SKU採番状態を保存"""
-        if self.sku_state_file:
-            self.sku_state_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.sku_state_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'global_counter': self.global_sku_counter,
-                    'used_skus': list(self.used_sku_numbers)
-                }, f, ensure_ascii=False, indent=2)
+        self.sku_allocator.save()
     
     def process_csv(self, df: pd.DataFrame, devices_to_add: List[str] = None, 
                    devices_to_remove: List[str] = None, add_position: str = 'start',
                    after_device: str = None, custom_device_order: List[str] = None,
                    insert_index: int = None, brand_attributes: List[str] = None,
                    device_attributes: List[Dict] = None, apply_db_attributes_to_existing: bool = True,
-                   reset_all_devices: bool = False) -> pd.DataFrame:
+                   reset_all_devices: bool = False, engine: str = 'standard',
+                   lazy_columns: bool = False) -> pd.DataFrame:
         """CSVを処理して機種を追加/削除（複数商品対応）
         
         Args:
             reset_all_devices: 全機種を削除して新しい機種リストで再定義
             custom_device_order: 機種の完全な順序指定（並び替え機能）
+            engine: 'standard'（商品ごとの処理）、'vectorized'（フレーム全体の一括処理）
+                    または 'parallel'（商品シャードのプロセス並列処理）。出力はいずれも同一
+            lazy_columns: 処理で使う列だけで処理し、残りの列は最後に元の行から結合する
+                          （列の多いCSVでメモリ・コピー時間を削減、出力は同一）
         """
         
-        # デバッグログを簡略化（処理速度改善）
+        if lazy_columns and PassthroughColumns.supports(df):
+            passthrough = PassthroughColumns(df)
+            result = self.process_csv(
+                passthrough.narrow(), devices_to_add=devices_to_add, devices_to_remove=devices_to_remove,
+                add_position=add_position, after_device=after_device,
+                custom_device_order=custom_device_order, insert_index=insert_index,
+                brand_attributes=brand_attributes, device_attributes=device_attributes,
+                apply_db_attributes_to_existing=apply_db_attributes_to_existing,
+                reset_all_devices=reset_all_devices, engine=engine
+            )
+            return passthrough.expand(result)
+        
+        if engine in ('vectorized', 'parallel'):
+            if engine == 'parallel':
+                frame_engine = ParallelRakutenEngine(self, self.parallel_workers, self.parallel_shard_size)
+            else:
+                frame_engine = VectorizedRakutenEngine(self)
+            if frame_engine.supports(df):
+                return frame_engine.process(
+                    df, devices_to_add=devices_to_add, devices_to_remove=devices_to_remove,
+                    add_position=add_position, after_device=after_device,
+                    custom_device_order=custom_device_order, insert_index=insert_index,
+                    brand_attributes=brand_attributes, device_attributes=device_attributes,
+                    apply_db_attributes_to_existing=apply_db_attributes_to_existing,
+                    reset_all_devices=reset_all_devices
+                )
+            logger.warning(f"{engine.capitalize()} engine does not support this CSV layout, using standard engine")
+        
+        # 診断イベントはジョブのトレースで有効な場合のみ記録（行ごとの判定を避けるため一度だけ確認）
+        debug = events_enabled()
         if devices_to_add or devices_to_remove or custom_device_order or reset_all_devices:
-            print(f"[DEBUG] Processing with: add={devices_to_add}, remove={devices_to_remove}, reset={reset_all_devices}")
+            trace_event('process_options', devices_to_add=list(devices_to_add or []),
+                        devices_to_remove=list(devices_to_remove or []),
+                        reset_all_devices=reset_all_devices)
         
         # 商品管理番号の列を特定
         product_col = '商品管理番号（商品URL）'
@@ -72,7 +102,8 @@ class RakutenCSVProcessor:
         device_def_col = 'バリエーション2選択肢定義'  # 機種定義列
         
         # 複数商品を分割して処理
-        products = self._split_products(df, product_col, sku_col)
+        with span('split', rows=len(df)):
+            products = self._split_products(df, product_col, sku_col)
         
         result_dfs = []
         
@@ -84,82 +115,86 @@ class RakutenCSVProcessor:
             if not sku_rows.empty:
                 if device_def_col in sku_rows.columns:
                     sku_rows[device_def_col] = ''
-                    print(f"[DEBUG] Cleared existing {device_def_col} in {len(sku_rows)} SKU rows")
                 if 'バリエーション1選択肢定義' in sku_rows.columns:
                     sku_rows['バリエーション1選択肢定義'] = ''
-                    print(f"[DEBUG] Cleared existing バリエーション1選択肢定義 in {len(sku_rows)} SKU rows")
+                if debug:
+                    trace_event('cleared_sku_definitions', product=product_data['product_id'], rows=len(sku_rows))
             
             if not parent_rows.empty:
                 product_id = parent_rows.iloc[0][product_col]
                 
-                # 全機種削除して再定義（reset_all_devices=True）
-                if reset_all_devices:
-                    # 既存のSKU行を全て削除
-                    sku_rows = pd.DataFrame()
-                    
-                    # custom_device_orderまたはdevices_to_addから新しい機種リストを作成
-                    if custom_device_order:
-                        new_devices = custom_device_order
-                    elif devices_to_add:
-                        new_devices = devices_to_add
-                    else:
-                        new_devices = []
+                with span('add_remove') as stage:
+                    # 全機種削除して再定義（reset_all_devices=True）
+                    if reset_all_devices:
+                        # 既存のSKU行を全て削除
+                        sku_rows = pd.DataFrame()
                     
-                    if new_devices:
-                        # 新しい機種でSKU行を作成（カラーバリエーションを考慮）
-                        # 元のSKU行からカラー情報を取得
-                        original_sku_rows = product_data['sku_rows']
-                        if not original_sku_rows.empty and color_col in original_sku_rows.columns:
-                            colors = original_sku_rows[color_col].dropna().unique()
+                        # custom_device_orderまたはdevices_to_addから新しい機種リストを作成
+                        if custom_device_order:
+                            new_devices = custom_device_order
+                        elif devices_to_add:
+                            new_devices = devices_to_add
                         else:
-                            colors = [None]  # カラーバリエーションなし
+                            new_devices = []
+                    
+                        if new_devices:
+                            # 新しい機種でSKU行を作成（カラーバリエーションを考慮）
+                            # 元のSKU行からカラー情報を取得
+                            original_sku_rows = product_data['sku_rows']
+                            if not original_sku_rows.empty and color_col in original_sku_rows.columns:
+                                colors = original_sku_rows[color_col].dropna().unique()
+                            else:
+                                colors = [None]  # カラーバリエーションなし
                         
-                        # 各機種・カラーの組み合わせでSKU行を作成
-                        new_sku_rows = []
-                        for device in new_devices:
-                            for color in colors:
-                                new_row = parent_rows.iloc[0].copy()
-                                new_row[device_col] = device
-                                if color is not None:
-                                    new_row[color_col] = color
-                                new_row[sku_col] = ''  # 後で採番される
-                                # SKU行のバリエーション1・2選択肢定義を確実に空にする
-                                if device_def_col in new_row.index:
-                                    new_row[device_def_col] = ''
-                                if 'バリエーション1選択肢定義' in new_row.index:
-                                    new_row['バリエーション1選択肢定義'] = ''
-                                print(f"[DEBUG] Cleared variation definitions for new SKU row: device={device}, color={color}")
-                                new_sku_rows.append(new_row)
+                            # 各機種・カラーの組み合わせでSKU行を作成
+                            new_sku_rows = []
+                            for device in new_devices:
+                                for color in colors:
+                                    new_row = parent_rows.iloc[0].copy()
+                                    new_row[device_col] = device
+                                    if color is not None:
+                                        new_row[color_col] = color
+                                    new_row[sku_col] = ''  # 後で採番される
+                                    # SKU行のバリエーション1・2選択肢定義を確実に空にする
+                                    if device_def_col in new_row.index:
+                                        new_row[device_def_col] = ''
+                                    if 'バリエーション1選択肢定義' in new_row.index:
+                                        new_row['バリエーション1選択肢定義'] = ''
+                                    if debug:
+                                        trace_event('reset_sku_row', product=product_id, device=device, color=color)
+                                    new_sku_rows.append(new_row)
                         
-                        if new_sku_rows:
-                            sku_rows = pd.DataFrame(new_sku_rows)
+                            if new_sku_rows:
+                                # 親行のコピーはインデックスが重複するため振り直す（SKU採番の重複防止）
+                                sku_rows = pd.DataFrame(new_sku_rows).reset_index(drop=True)
                 
-                # 通常の処理（reset_all_devices=False）
-                else:
-                    # 機種削除
-                    if devices_to_remove:
-                        sku_rows = self._remove_devices(sku_rows, devices_to_remove, device_col)
+                    # 通常の処理（reset_all_devices=False）
+                    else:
+                        # 機種削除
+                        if devices_to_remove:
+                            sku_rows = self._remove_devices(sku_rows, devices_to_remove, device_col)
                     
-                    # 既存のSKU行にデータベースの属性値を適用
-                    if apply_db_attributes_to_existing and device_attributes:
-                        sku_rows = self._apply_db_attributes_to_existing(sku_rows, device_col, device_attributes)
+                        # 既存のSKU行にデータベースの属性値を適用
+                        if apply_db_attributes_to_existing and device_attributes:
+                            sku_rows = self._apply_db_attributes_to_existing(sku_rows, device_col, device_attributes)
                 
-                    # 機種追加（この製品に存在しない機種を追加）- reset_all_devicesでない場合のみ
-                    devices_to_add_for_product = []  
-                    if devices_to_add:
-                        # この製品の既存のSKU行にある機種を取得
-                        existing_devices_in_product = set(sku_rows[device_col].dropna().unique()) if device_col in sku_rows.columns and not sku_rows.empty else set()
+                        # 機種追加（この製品に存在しない機種を追加）- reset_all_devicesでない場合のみ
+                        devices_to_add_for_product = []  
+                        if devices_to_add:
+                            # この製品の既存のSKU行にある機種を取得
+                            existing_devices_in_product = set(sku_rows[device_col].dropna().unique()) if device_col in sku_rows.columns and not sku_rows.empty else set()
                         
-                        # devices_to_addの中で、この製品にまだ存在しない機種を特定
-                        devices_to_add_for_product = [d for d in devices_to_add if d not in existing_devices_in_product]
+                            # devices_to_addの中で、この製品にまだ存在しない機種を特定
+                            devices_to_add_for_product = [d for d in devices_to_add if d not in existing_devices_in_product]
                         
-                        if devices_to_add_for_product:
-                            new_sku_rows = self._add_devices(
-                                parent_rows, sku_rows, devices_to_add_for_product, 
-                                product_id, product_col, device_col, color_col, sku_col,
-                                brand_attributes, device_attributes
-                            )
-                            sku_rows = pd.concat([new_sku_rows, sku_rows], ignore_index=True)
+                            if devices_to_add_for_product:
+                                new_sku_rows = self._add_devices(
+                                    parent_rows, sku_rows, devices_to_add_for_product, 
+                                    product_id, product_col, device_col, color_col, sku_col,
+                                    brand_attributes, device_attributes
+                                )
+                                sku_rows = pd.concat([new_sku_rows, sku_rows], ignore_index=True)
+                    stage.rows = len(sku_rows)
                 
                 # バリエーション2選択肢定義を更新（親行）- 位置指定に対応
                 if device_def_col in parent_rows.columns and not sku_rows.empty:
@@ -197,33 +232,31 @@ class RakutenCSVProcessor:
                         )
                 
                 # 全てのSKU番号を新規採番（sku_aプレフィックス）
-                sku_rows = self._regenerate_all_skus(sku_rows, sku_col)
+                with span('sku_regeneration', rows=len(sku_rows)):
+                    sku_rows = self._regenerate_all_skus(sku_rows, sku_col)
                 
                 # システム連携用SKU番号を生成（device_attributesからsize_categoryを使用）
-                sku_rows = self._generate_system_sku_numbers(sku_rows, product_id, device_col, color_col, device_attributes)
+                with span('system_sku', rows=len(sku_rows)):
+                    sku_rows = self._generate_system_sku_numbers(sku_rows, product_id, device_col, color_col, device_attributes)
                 
                 # SKU行のバリエーション1・2選択肢定義を確実に空にする（親行のみに保持）
                 if device_def_col in sku_rows.columns:
                     sku_rows[device_def_col] = ''
-                    print(f"[DEBUG] Cleared {device_def_col} in SKU rows for product {product_id}")
                 if 'バリエーション1選択肢定義' in sku_rows.columns:
                     sku_rows['バリエーション1選択肢定義'] = ''
-                    print(f"[DEBUG] Cleared バリエーション1選択肢定義 in SKU rows for product {product_id}")
                 
-                # 確認のため、SKU行にバリエーション定義が残っていないかチェック
-                variation_check_cols = ['バリエーション1選択肢定義', 'バリエーション2選択肢定義']
-                for col in variation_check_cols:
-                    if col in sku_rows.columns:
-                        remaining_defs = sku_rows[col].dropna()
-                        remaining_defs = remaining_defs[remaining_defs != '']
-                        if not remaining_defs.empty:
-                            print(f"[WARNING] {col} still contains data in SKU rows: {len(remaining_defs)} rows affected")
-                        else:
-                            print(f"[SUCCESS] {col} successfully cleared from all SKU rows")
+                # 確認のため、SKU行にバリエーション定義が残っていないかチェック（診断時のみ）
+                if debug:
+                    for col in ['バリエーション1選択肢定義', 'バリエーション2選択肢定義']:
+                        if col in sku_rows.columns:
+                            remaining_defs = sku_rows[col].dropna()
+                            remaining_defs = remaining_defs[remaining_defs != '']
+                            trace_event('sku_definitions_check', product=product_id, column=col,
+                                        remaining_rows=len(remaining_defs))
                 
                 # 親行の重複を確実に除去（最初の1行のみ保持）
                 if not parent_rows.empty and len(parent_rows) > 1:
-                    print(f"[WARNING] Product {product_id} has {len(parent_rows)} parent rows before final concat, reducing to 1")
+                    logger.warning(f"Product {product_id} has {len(parent_rows)} parent rows before final concat, reducing to 1")
                     parent_rows = parent_rows.iloc[[0]]
                 
                 # 親行、オプション行、SKU行を結合
@@ -260,24 +293,24 @@ class RakutenCSVProcessor:
         
         # エラーチェック：必須カラムの存在確認
         if product_col not in df.columns:
-            print(f"[ERROR] Required column '{product_col}' not found in DataFrame")
+            logger.error(f"Required column '{product_col}' not found in DataFrame")
             return products
         if sku_col not in df.columns:
-            print(f"[ERROR] Required column '{sku_col}' not found in DataFrame")
+            logger.error(f"Required column '{sku_col}' not found in DataFrame")
             return products
         
         # 商品IDでグループ化（sort=Falseで高速化）
         try:
             grouped = df.groupby(product_col, sort=False)
         except Exception as e:
-            print(f"[ERROR] Failed to group by {product_col}: {str(e)}")
+            logger.error(f"Failed to group by {product_col}: {str(e)}")
             return products
         
         for product_id, group in grouped:
             # ベクトル化された操作でマスクを作成（高速化）
             # エラーチェック: groupが空でないことを確認
             if group.empty:
-                print(f"[WARNING] Empty group for product {product_id}")
+                logger.warning(f"Empty group for product {product_id}")
                 continue
             
             try:
@@ -329,7 +362,7 @@ class RakutenCSVProcessor:
                     
                     # 親行の重複を除去（最初の1行のみ保持）
                     if len(parent_rows) > 1:
-                        print(f"[WARNING] Product {product_id} has {len(parent_rows)} parent rows, keeping first")
+                        logger.warning(f"Product {product_id} has {len(parent_rows)} parent rows, keeping first")
                         parent_rows = parent_rows.iloc[[0]]
                 
                 # 結果を追加
@@ -341,7 +374,7 @@ class RakutenCSVProcessor:
                 })
                 
             except Exception as e:
-                print(f"[ERROR] Failed to process product {product_id}: {str(e)}")
+                logger.error(f"Failed to process product {product_id}: {str(e)}")
                 # エラーが発生した場合でも、空のデータで追加
                 products.append({
                     'parent_rows': pd.DataFrame(),
@@ -350,10 +383,11 @@ class RakutenCSVProcessor:
                     'product_id': product_id
                 })
         
-        print(f"Found {len(products)} unique products (by 商品管理番号)")
-        for i, product in enumerate(products):
-            product_id = product.get('product_id', 'Unknown')
-            print(f"  Product {i+1} ({product_id}): {len(product['parent_rows'])} parent rows, {len(product['sku_rows'])} SKU rows")
+        trace_event('products_split', products=len(products))
+        if events_enabled():
+            for product in products:
+                trace_event('product_rows', product=product.get('product_id'),
+                            parent_rows=len(product['parent_rows']), sku_rows=len(product['sku_rows']))
         
         return products
     
@@ -386,19 +420,13 @@ class RakutenCSVProcessor:
         if device_col not in sku_rows.columns:
             return sku_rows
         
-        # 削除前の機種リスト
-        before_devices = set(sku_rows[device_col].dropna().unique())
-        
         mask = ~sku_rows[device_col].isin(devices_to_remove)
         result = sku_rows[mask].copy()
         
-        # 削除後の機種リスト
-        after_devices = set(result[device_col].dropna().unique()) if not result.empty else set()
-        
-        # 実際に削除された機種
-        actually_removed = before_devices - after_devices
-        if actually_removed:
-            print(f"[DEBUG] Actually removed devices from SKU rows: {actually_removed}")
+        # 実際に削除された機種（診断時のみ集計）
+        if events_enabled() and not mask.all():
+            actually_removed = sku_rows.loc[~mask, device_col].dropna().unique().tolist()
+            trace_event('devices_removed', devices=actually_removed, rows=int((~mask).sum()))
         
         return result
     
@@ -422,6 +450,7 @@ class RakutenCSVProcessor:
         
         # 各SKU行に対して商品属性8のみ適用
         if device_col in sku_rows.columns and product_attr8_col in sku_rows.columns:
+            debug = events_enabled()
             for idx, row in sku_rows.iterrows():
                 device_name = row[device_col]
                 if pd.notna(device_name):
@@ -431,7 +460,8 @@ class RakutenCSVProcessor:
                         attr_value = device_attr_map[device_name_str].get('attribute_value')
                         if attr_value:
                             sku_rows.at[idx, product_attr8_col] = attr_value
-                            print(f"[DB Apply] Updated {device_name_str} product_attr8 with: {attr_value}")
+                            if debug:
+                                trace_event('db_attribute_applied', device=device_name_str, attr8=attr_value)
                     
                     # 商品属性2と4は変更しない（元の値を保持）
                     # if product_attr2_col in sku_rows.columns:
@@ -446,6 +476,7 @@ class RakutenCSVProcessor:
                     product_col: str, device_col: str, color_col: str, sku_col: str,
                     brand_attributes: List[str] = None, device_attributes: List[Dict] = None) -> pd.DataFrame:
         """新しい機種のSKU行を追加"""
+        debug = events_enabled()
         
         # 商品属性列の列名を定義
         product_attr1_col = '商品属性（値）1'
@@ -482,7 +513,7 @@ class RakutenCSVProcessor:
                     base_row['バリエーション2選択肢定義'] = ''
                 if 'バリエーション1選択肢定義' in base_row.index:
                     base_row['バリエーション1選択肢定義'] = ''
-                print(f"[DEBUG] Cleared variation definitions from parent row template")
+                trace_event('template_from_parent', product=product_id)
                 color_sku_map[''] = base_row
         
         new_rows = []
@@ -527,7 +558,8 @@ class RakutenCSVProcessor:
                         # sizeを商品属性（値）3に設定（これは残す）
                         if product_attr3_col in new_row.index and device_info.get('size'):
                             new_row[product_attr3_col] = device_info['size']
-                            print(f"[DEBUG] Set product_attr3 for {device}: {device_info['size']}")
+                            if debug:
+                                trace_event('attr3_set', device=device, size=device_info['size'])
                         
                         # 商品属性（値）4は変更しない（空白のまま）
                         # if product_attr4_col in new_row.index and device_info.get('size_category'):
@@ -541,7 +573,8 @@ class RakutenCSVProcessor:
                         # ブランド名を正規化（ブランドDBの形式に合わせる）
                         normalized_brand = get_brand_db_name(random_attribute) if '|' not in random_attribute else random_attribute
                         new_row[product_attr1_col] = normalized_brand
-                        print(f"[DEBUG] Set product_attr1 for {device}: {normalized_brand} (original: {random_attribute})")
+                        if debug:
+                            trace_event('attr1_set', device=device, value=normalized_brand, original=random_attribute)
                     
                     # 商品属性（値）8にattribute_valueを設定（device_attributesから取得）
                     if product_attr8_col in new_row.index:
@@ -549,11 +582,13 @@ class RakutenCSVProcessor:
                         if device in device_attr_map and device_attr_map[device].get('attribute_value'):
                             attribute_value = device_attr_map[device]['attribute_value']
                             new_row[product_attr8_col] = attribute_value
-                            print(f"[DEBUG] Set product_attr8 (attribute_value) for {device}: {attribute_value}")
+                            if debug:
+                                trace_event('attr8_set', device=device, value=attribute_value, source='device_attributes')
                         else:
                             # device_attributesがない場合はdevice名をそのまま設定
                             new_row[product_attr8_col] = device
-                            print(f"[DEBUG] Set product_attr8 (fallback to device_name) for {device}: {device}")
+                            if debug:
+                                trace_event('attr8_set', device=device, value=device, source='device_name')
                     
                     # SKU番号は後で全体的に再採番するので、一時的に空にする
                     new_row[sku_col] = ""
@@ -564,7 +599,8 @@ class RakutenCSVProcessor:
                         new_row[device_def_col] = ''
                     if 'バリエーション1選択肢定義' in new_row.index:
                         new_row['バリエーション1選択肢定義'] = ''
-                    print(f"[DEBUG] Cleared variation definitions for new device row: {device}")
+                    if debug:
+                        trace_event('sku_row_added', product=product_id, device=device, color=color)
                     
                     new_rows.append(new_row)
         
@@ -579,20 +615,14 @@ class RakutenCSVProcessor:
             return sku_rows
         
         # 全ての行に新しいSKU番号を割り当て
-        for idx in sku_rows.index:
-            # 次の未使用番号を見つける
-            while True:
-                self.global_sku_counter += 1
-                new_sku = f"sku_a{self.global_sku_counter:06d}"
-                
-                # この番号が未使用であることを確認
-                if new_sku not in self.used_sku_numbers:
-                    sku_rows.at[idx, sku_col] = new_sku
-                    self.used_sku_numbers.add(new_sku)
-                    break
+        sku_rows[sku_col] = self._allocate_sku_numbers(len(sku_rows))
         
         return sku_rows
     
+    def _allocate_sku_numbers(self, count: int) -> List[str]:
+        """未使用のSKU番号をcount件まとめて連続ブロックで払い出す（採番順は1件ずつの場合と同一）"""
+        return self.sku_allocator.allocate(count)
+    
     def _generate_system_sku_numbers(self, sku_rows: pd.DataFrame, product_id: str, 
                                     device_col: str, color_col: str, 
                                     device_attributes: List[Dict] = None) -> pd.DataFrame:
@@ -614,6 +644,7 @@ class RakutenCSVProcessor:
                         device_size_map[device_name] = size_category
         
         # 各SKU行に対してシステム連携用SKU番号を生成
+        debug = events_enabled()
         for idx, row in sku_rows.iterrows():
             # 商品ID、デバイス、カラーを取得
             device = row.get(device_col, '')
@@ -634,7 +665,8 @@ class RakutenCSVProcessor:
                 final_size = size_category if size_category else fallback_size
                 
                 system_sku = f"{product_id}_{clean_color}_{final_size}"
-                print(f"[SYSTEM_SKU] Device: {device}, Size: {final_size} (from DB: {size_category}), SKU: {system_sku}")
+                if debug:
+                    trace_event('system_sku', device=device, size=final_size, db_size=size_category, sku=system_sku)
                 
                 sku_rows.at[idx, system_sku_col] = system_sku
         
@@ -674,6 +706,30 @@ class RakutenCSVProcessor:
                     original_devices_from_parent = [d.strip() for d in str(var_def).split('|') if d.strip()]
                     break
         
+        device_list = self._compose_device_list(
+            all_sku_devices, original_devices_from_parent, devices_to_add,
+            add_position, after_device, custom_device_order
+        )
+        
+        # パイプ区切りで結合（楽天RMS仕様）
+        device_definition = '|'.join(device_list)
+        
+        # すべての親行のバリエーション2選択肢定義を確実に更新
+        updated_count = 0
+        for idx in parent_rows.index:
+            if device_def_col in parent_rows.columns:
+                parent_rows.loc[idx, device_def_col] = device_definition
+                updated_count += 1
+        
+        trace_event('device_definition_updated', definition=device_definition, parent_rows=updated_count)
+        
+        return parent_rows
+    
+    def _compose_device_list(self, all_sku_devices: List[str], original_devices_from_parent: List[str],
+                             devices_to_add: List[str] = None, add_position: str = 'start',
+                             after_device: str = None, custom_device_order: List[str] = None) -> List[str]:
+        """親行の機種定義とSKU行の機種から、バリエーション2選択肢定義の機種リストを組み立てる"""
+        
         # 削除処理の場合: SKU行に存在する機種のみを保持（順序は元の定義から維持）
         # 元の定義の順序を維持しつつ、SKU行に存在する機種のみをフィルタリング
         if original_devices_from_parent:
@@ -682,7 +738,7 @@ class RakutenCSVProcessor:
             # 削除された機種を検出
             removed_devices = [d for d in original_devices_from_parent if d not in sku_device_set]
             if removed_devices:
-                print(f"[DEBUG] Devices removed from definition: {removed_devices}")
+                trace_event('devices_removed_from_definition', devices=removed_devices)
             # 元の順序を維持しつつ、SKU行に存在する機種のみを抽出
             base_device_order = [d for d in original_devices_from_parent if d in sku_device_set]
             # SKU行にあるが元の定義にない機種を末尾に追加（念のため）
@@ -715,49 +771,25 @@ class RakutenCSVProcessor:
             device_list = base_device_order + new_devices
         elif add_position == 'after' and after_device:
             # 特定機種の後に追加
-            print(f"[DEBUG] new_devices to insert: {new_devices}")
-            
             device_list = []
             found_position = False
             
             # 基準デバイスを順番に処理
             for device in base_device_order:
                 device_list.append(device)
-                print(f"[DEBUG] Checking device: '{device}' == '{after_device}' ? {device == after_device}")
                 if device == after_device:
-                    print(f"[DEBUG] Found after_device! Inserting new devices: {new_devices}")
                     device_list.extend(new_devices)
                     found_position = True
             
             # after_deviceが見つからない場合は末尾に追加
             if not found_position:
-                print(f"[DEBUG] after_device '{after_device}' not found in base_device_order, adding at end")
                 device_list.extend(new_devices)
+            trace_event('devices_inserted', position='after', after_device=after_device,
+                        found=found_position, devices=new_devices)
         else:
             # デフォルトは元の順序を維持して末尾に新機種を追加（バッチ処理で重要）
             # 元のCSVの機種順序を壊さないようにする
             device_list = base_device_order + new_devices
-            print(f"[DEBUG] Default: preserving original order, adding new devices at end")
-        
-        # パイプ区切りで結合（楽天RMS仕様）
-        device_definition = '|'.join(device_list)
-        print(f"Device definition string: {device_definition}")
-        
-        # すべての親行のバリエーション2選択肢定義を確実に更新
-        updated_count = 0
-        for idx in parent_rows.index:
-            if device_def_col in parent_rows.columns:
-                parent_rows.loc[idx, device_def_col] = device_definition
-                updated_count += 1
-                print(f"Updated parent row at index {idx}")
-        
-        print(f"Total parent rows updated: {updated_count}")
-        
-        # 確認のため、更新後の値をチェック
-        if device_def_col in parent_rows.columns:
-            unique_defs = parent_rows[device_def_col].unique()
-            print(f"Unique device definitions after update: {len(unique_defs)}")
-            for def_val in unique_defs[:2]:  # 最初の2つを表示
-                print(f"  - {str(def_val)[:100]}...")
+            trace_event('devices_inserted', position='default_end', devices=new_devices)
         
-        return parent_rows
\ No newline at end of file
+        return device_list
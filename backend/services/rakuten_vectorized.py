@@ -0,0 +1,412 @@
+"""
+RakutenCSVProcessor用のベクトル化エンジン
+商品ごとのループ・iterrows・大量のpd.concatを行わず、フレーム全体に対して
+グループ単位のマスクで機種の追加/削除/並び替え/SKU再採番をまとめて実行する。
+出力は標準エンジン（RakutenCSVProcessor.process_csv）と同一になる。
+"""
+import random
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from brand_mapping import get_brand_db_name
+from services.instrumentation import span
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+DEVICE_COL = 'バリエーション項目選択肢2'
+COLOR_COL = 'バリエーション項目選択肢1'
+DEVICE_DEF_COL = 'バリエーション2選択肢定義'
+COLOR_DEF_COL = 'バリエーション1選択肢定義'
+SYSTEM_SKU_COL = 'システム連携用SKU番号'
+ATTR1_COL = '商品属性（値）1'
+ATTR3_COL = '商品属性（値）3'
+ATTR8_COL = '商品属性（値）8'
+
+# 出力内での並び順（商品ごとに 親行 → オプション行 → 追加SKU行 → 既存SKU行）
+SECTION_PARENT = 0
+SECTION_OPTION = 1
+SECTION_NEW_SKU = 2
+SECTION_EXISTING_SKU = 3
+
+
+def _filled_mask(df: pd.DataFrame, col: str) -> Optional[np.ndarray]:
+    """列が存在すれば「値あり（NaNでも空文字でもない）」のマスクを返す"""
+    if col not in df.columns:
+        return None
+    values = df[col]
+    return (values.notna() & (values != '')).to_numpy()
+
+
+class VectorizedRakutenEngine:
+    """標準エンジンと同じ規則をフレーム全体へのベクトル演算で適用する"""
+
+    def __init__(self, processor):
+        # SKU採番・機種定義の組み立てはRakutenCSVProcessorと共有する
+        self.processor = processor
+
+    def supports(self, df: pd.DataFrame) -> bool:
+        """ベクトル化エンジンで処理できる入力かを判定（できない場合は標準エンジンを使う）"""
+        required = [PRODUCT_COL, SKU_COL, DEVICE_COL, COLOR_COL]
+        if any(col not in df.columns for col in required):
+            return False
+        return not df.columns.duplicated().any()
+
+    def classify_rows(self, df: pd.DataFrame):
+        """
+        行を親行 / オプション行 / SKU行に分類（標準エンジンの_split_productsと同じ規則）
+
+        Returns:
+            (商品コード, 商品ID, 商品ごとの親行位置（親行なしは-1）, オプション行位置, SKU行位置)
+            オプション行・SKU行は親行のある商品のみ
+        """
+        n_rows = len(df)
+        codes, product_ids = pd.factorize(df[PRODUCT_COL], sort=False)
+        in_group = codes >= 0
+        n_groups = len(product_ids)
+
+        is_sku = _filled_mask(df, SKU_COL) & in_group
+
+        valid_parent = np.ones(n_rows, dtype=bool)
+        has_name = _filled_mask(df, '商品名')
+        if has_name is not None:
+            valid_parent &= has_name
+        has_number = _filled_mask(df, '商品番号')
+        if has_number is not None:
+            valid_parent |= has_number
+
+        option_like = np.zeros(n_rows, dtype=bool)
+        for col in ('選択肢タイプ', '商品オプション項目名'):
+            filled = _filled_mask(df, col)
+            if filled is not None:
+                option_like |= filled
+
+        non_sku = in_group & ~is_sku
+        is_option = non_sku & option_like & ~valid_parent
+        group_has_option = np.zeros(n_groups, dtype=bool)
+        group_has_option[codes[is_option]] = True
+
+        # オプション行がある商品は条件を満たす行、ない商品は先頭の非SKU行を親行とする
+        row_group_option = np.zeros(n_rows, dtype=bool)
+        row_group_option[in_group] = group_has_option[codes[in_group]]
+        parent_candidates = np.flatnonzero(non_sku & (valid_parent | ~row_group_option))
+        parent_pos = np.full(n_groups, -1, dtype=np.int64)
+        if len(parent_candidates):
+            _, first = np.unique(codes[parent_candidates], return_index=True)
+            parent_pos[codes[parent_candidates[first]]] = parent_candidates[first]
+
+        # 親行のない商品は標準エンジン同様に出力しない
+        row_kept = np.zeros(n_rows, dtype=bool)
+        row_kept[in_group] = parent_pos[codes[in_group]] >= 0
+        option_pos = np.flatnonzero(is_option & row_kept)
+        sku_pos = np.flatnonzero(is_sku & row_kept)
+        return codes, product_ids, parent_pos, option_pos, sku_pos
+
+    def process(self, df: pd.DataFrame, devices_to_add: List[str] = None,
+                devices_to_remove: List[str] = None, add_position: str = 'start',
+                after_device: str = None, custom_device_order: List[str] = None,
+                insert_index: int = None, brand_attributes: List[str] = None,
+                device_attributes: List[Dict] = None, apply_db_attributes_to_existing: bool = True,
+                reset_all_devices: bool = False, sku_numbers: Optional[List[str]] = None,
+                brand_choices: Optional[List[str]] = None) -> pd.DataFrame:
+        """process_csvと同じ引数で全商品を一括処理
+
+        Args:
+            sku_numbers: 事前に確保したSKU番号（並列処理用、出力順のSKU行数と一致すること）
+            brand_choices: 事前に抽選した商品属性1の値（並列処理用、追加SKU行数と一致すること）
+        """
+        with span('split', rows=len(df)):
+            codes, product_ids, parent_pos, option_pos, sku_pos = self.classify_rows(df)
+        has_parent = parent_pos >= 0
+
+        if not has_parent.any():
+            return df
+
+        with span('add_remove') as stage:
+            device_attr_map = {}
+            for attr in device_attributes or []:
+                if isinstance(attr, dict) and 'device' in attr:
+                    device_attr_map[attr['device']] = attr
+
+            # --- 新規SKU行の計画（元行の位置と上書き値） ---
+            new_src = np.empty(0, dtype=np.int64)
+            new_code = np.empty(0, dtype=np.int64)
+            new_device: List = []
+            new_color: Optional[List] = None
+            added_by_group: Dict[int, List[str]] = {}
+
+            if reset_all_devices:
+                existing_pos = np.empty(0, dtype=np.int64)
+                new_devices = custom_device_order or devices_to_add or []
+                if new_devices:
+                    new_src, new_code, new_device, new_color = self._plan_reset_rows(
+                        df, codes, parent_pos, sku_pos, new_devices
+                    )
+            else:
+                existing_pos = sku_pos
+                if devices_to_remove:
+                    removed = df[DEVICE_COL].to_numpy()[existing_pos]
+                    existing_pos = existing_pos[~pd.Series(removed).isin(devices_to_remove).to_numpy()]
+                if devices_to_add:
+                    new_src, new_code, new_device, added_by_group = self._plan_added_rows(
+                        df, codes, existing_pos, devices_to_add
+                    )
+
+            # --- 出力行の順序を決定して一度だけ組み立てる ---
+            src = np.concatenate([parent_pos[has_parent], option_pos, new_src, existing_pos])
+            group = np.concatenate([
+                np.flatnonzero(has_parent), codes[option_pos], new_code, codes[existing_pos]
+            ])
+            section = np.concatenate([
+                np.full(int(has_parent.sum()), SECTION_PARENT),
+                np.full(len(option_pos), SECTION_OPTION),
+                np.full(len(new_src), SECTION_NEW_SKU),
+                np.full(len(existing_pos), SECTION_EXISTING_SKU),
+            ])
+            sequence = np.concatenate([
+                parent_pos[has_parent], option_pos, np.arange(len(new_src)), existing_pos
+            ])
+            order = np.lexsort((sequence, section, group))
+            src, group, section = src[order], group[order], section[order]
+
+            result = df.take(src).reset_index(drop=True)
+            columns = {}
+
+            def column(col: str) -> np.ndarray:
+                if col not in columns:
+                    columns[col] = result[col].to_numpy(dtype=object, copy=True)
+                return columns[col]
+
+            sku_mask = section >= SECTION_NEW_SKU
+            new_mask = section == SECTION_NEW_SKU
+            existing_mask = section == SECTION_EXISTING_SKU
+            new_index = order[new_mask] - (len(parent_pos[has_parent]) + len(option_pos))
+
+            if SYSTEM_SKU_COL not in result.columns:
+                # 標準エンジンはSKU行にのみ列を作るため、親行・オプション行は欠損値になる
+                system_values = np.full(len(result), np.nan, dtype=object)
+                system_values[sku_mask] = ''
+                columns[SYSTEM_SKU_COL] = system_values
+
+            # 既存SKU行にDBの属性値（商品属性8）を適用
+            if (not reset_all_devices and apply_db_attributes_to_existing and device_attributes
+                    and ATTR8_COL in result.columns and existing_mask.any()):
+                existing_devices = pd.Series(column(DEVICE_COL)[existing_mask])
+                db_values = existing_devices.astype(str).map({
+                    name: attr.get('attribute_value') for name, attr in device_attr_map.items()
+                })
+                applicable = (existing_devices.notna() & db_values.notna()
+                              & db_values.astype(bool)).to_numpy()
+                attr8 = column(ATTR8_COL)
+                targets = np.flatnonzero(existing_mask)[applicable]
+                attr8[targets] = db_values.to_numpy()[applicable]
+
+            if new_mask.any():
+                self._fill_new_rows(
+                    column, result.columns, new_mask, new_index, new_device, new_color,
+                    device_attr_map, brand_attributes, reset_all_devices, brand_choices
+                )
+
+            # SKU行のバリエーション1・2選択肢定義は常に空（親行のみに保持）
+            for col in (DEVICE_DEF_COL, COLOR_DEF_COL):
+                if col in result.columns:
+                    column(col)[sku_mask] = ''
+
+            # 親行のバリエーション2選択肢定義を更新
+            if DEVICE_DEF_COL in result.columns and sku_mask.any():
+                self._update_definitions(
+                    column, group, section, sku_mask, devices_to_add, add_position, after_device,
+                    custom_device_order, reset_all_devices, added_by_group
+                )
+            stage.rows = len(result)
+
+        # 全てのSKU番号を出力順に新規採番
+        sku_count = int(sku_mask.sum())
+        with span('sku_regeneration', rows=sku_count):
+            if sku_numbers is not None:
+                if len(sku_numbers) != sku_count:
+                    raise ValueError(f"Expected {sku_count} reserved SKU numbers, got {len(sku_numbers)}")
+                column(SKU_COL)[sku_mask] = np.array(sku_numbers, dtype=object)
+            elif sku_count:
+                column(SKU_COL)[sku_mask] = self.processor._allocate_sku_numbers(sku_count)
+
+        with span('system_sku', rows=sku_count):
+            self._fill_system_skus(column, group, sku_mask, product_ids, device_attr_map)
+
+        for col, values in columns.items():
+            result[col] = values
+
+        if sku_numbers is None:
+            self.processor._save_sku_state()
+        return result
+
+    def _plan_reset_rows(self, df: pd.DataFrame, codes: np.ndarray, parent_pos: np.ndarray,
+                         sku_pos: np.ndarray, new_devices: List[str]):
+        """reset_all_devices用：親行をもとに 機種 × 既存カラー の行を計画"""
+        colors = df[COLOR_COL].to_numpy()
+        sku_codes = codes[sku_pos]
+        color_table = pd.DataFrame({'code': sku_codes, 'color': colors[sku_pos]})
+        color_table = color_table[color_table['color'].notna()].drop_duplicates(['code', 'color'])
+
+        # SKU行のない商品はカラー指定なし（親行のカラーをそのまま使う）1行ずつ
+        groups_with_sku = np.zeros(len(parent_pos), dtype=bool)
+        groups_with_sku[sku_codes] = True
+        no_sku_groups = np.flatnonzero((parent_pos >= 0) & ~groups_with_sku)
+
+        plan_code = np.concatenate([color_table['code'].to_numpy(dtype=np.int64), no_sku_groups])
+        plan_color = np.concatenate([color_table['color'].to_numpy(dtype=object),
+                                     np.full(len(no_sku_groups), None, dtype=object)])
+        plan_rank = np.concatenate([np.arange(len(color_table)), np.zeros(len(no_sku_groups))])
+
+        n_devices = len(new_devices)
+        code = np.repeat(plan_code, n_devices)
+        color = np.repeat(plan_color, n_devices)
+        color_rank = np.repeat(plan_rank, n_devices)
+        device_rank = np.tile(np.arange(n_devices), len(plan_code))
+
+        order = np.lexsort((color_rank, device_rank, code))
+        code, color, device_rank = code[order], color[order], device_rank[order]
+        device = [new_devices[i] for i in device_rank]
+        return parent_pos[code], code, device, list(color)
+
+    def _plan_added_rows(self, df: pd.DataFrame, codes: np.ndarray, existing_pos: np.ndarray,
+                         devices_to_add: List[str]):
+        """機種追加用：既存の各カラーの先頭SKU行をテンプレートに 追加機種 × カラー の行を計画"""
+        existing = pd.DataFrame({
+            'code': codes[existing_pos],
+            'device': df[DEVICE_COL].to_numpy()[existing_pos],
+            'color': df[COLOR_COL].to_numpy()[existing_pos],
+            'pos': existing_pos,
+        })
+
+        existing_pairs = existing[existing['device'].notna()][['code', 'device']].drop_duplicates()
+        existing_by_group = existing_pairs.groupby('code', sort=False)['device'].agg(set).to_dict()
+
+        added_by_group = {}
+        for code in pd.unique(existing['code']):
+            present = existing_by_group.get(code, set())
+            added = [d for d in devices_to_add if d not in present]
+            if added:
+                added_by_group[int(code)] = added
+
+        templates = existing[existing['color'].notna()].drop_duplicates(['code', 'color'])
+        templates = templates.assign(color_rank=templates.groupby('code', sort=False).cumcount())
+        to_add = pd.DataFrame({'device': list(devices_to_add),
+                               'device_rank': np.arange(len(devices_to_add))})
+        plan = templates[['code', 'pos', 'color_rank']].merge(to_add, how='cross')
+
+        if not existing_pairs.empty and not plan.empty:
+            plan = plan.merge(existing_pairs.assign(_present=True), on=['code', 'device'], how='left')
+            plan = plan[plan['_present'].isna()]
+
+        plan = plan.sort_values(['code', 'device_rank', 'color_rank'], kind='stable')
+        return (plan['pos'].to_numpy(dtype=np.int64), plan['code'].to_numpy(dtype=np.int64),
+                plan['device'].tolist(), added_by_group)
+
+    def _fill_new_rows(self, column, result_columns, new_mask: np.ndarray, new_index: np.ndarray,
+                       new_device: List, new_color: Optional[List], device_attr_map: Dict,
+                       brand_attributes: Optional[List[str]], reset_all_devices: bool,
+                       brand_choices: Optional[List[str]] = None):
+        """新規SKU行の機種・カラー・商品属性を設定"""
+        targets = np.flatnonzero(new_mask)
+        devices = np.array(new_device, dtype=object)[new_index]
+        column(DEVICE_COL)[targets] = devices
+
+        if reset_all_devices:
+            # 親行のコピーにカラーを設定（カラー指定なしの行は親行の値を保持）
+            colors = np.array(new_color, dtype=object)[new_index]
+            has_color = np.array([c is not None for c in colors], dtype=bool)
+            column(COLOR_COL)[targets[has_color]] = colors[has_color]
+        else:
+            if ATTR3_COL in result_columns:
+                sizes = np.array([
+                    device_attr_map[d].get('size') if d in device_attr_map else None for d in devices
+                ], dtype=object)
+                has_size = np.array([bool(s) for s in sizes], dtype=bool)
+                column(ATTR3_COL)[targets[has_size]] = sizes[has_size]
+
+            if ATTR1_COL in result_columns and brand_attributes:
+                # 標準エンジンと同じ順序（商品 → 機種 → カラー）で乱数を消費する
+                if brand_choices is not None and len(brand_choices) != len(targets):
+                    raise ValueError(f"Expected {len(targets)} brand choices, got {len(brand_choices)}")
+                normalized = {}
+                picks = []
+                for i in range(len(targets)):
+                    attribute = (brand_choices[i] if brand_choices is not None
+                                 else random.choice(brand_attributes))
+                    if attribute not in normalized:
+                        normalized[attribute] = (get_brand_db_name(attribute)
+                                                 if '|' not in attribute else attribute)
+                    picks.append(normalized[attribute])
+                column(ATTR1_COL)[targets] = np.array(picks, dtype=object)[new_index]
+
+            if ATTR8_COL in result_columns:
+                column(ATTR8_COL)[targets] = np.array([
+                    device_attr_map[d]['attribute_value']
+                    if d in device_attr_map and device_attr_map[d].get('attribute_value') else d
+                    for d in devices
+                ], dtype=object)
+
+        column(SKU_COL)[targets] = ''
+
+    def _update_definitions(self, column, group: np.ndarray, section: np.ndarray,
+                            sku_mask: np.ndarray, devices_to_add: Optional[List[str]],
+                            add_position: str, after_device: Optional[str],
+                            custom_device_order: Optional[List[str]], reset_all_devices: bool,
+                            added_by_group: Dict[int, List[str]]):
+        """商品ごとのSKU機種リストから親行のバリエーション2選択肢定義を組み立てる"""
+        devices = column(DEVICE_COL)
+        sku_devices = pd.DataFrame({'group': group[sku_mask], 'device': devices[sku_mask]})
+        sku_devices = sku_devices[sku_devices['device'].notna()]
+        sku_devices['device'] = sku_devices['device'].astype(str)
+        device_lists = (sku_devices.drop_duplicates(['group', 'device'])
+                        .groupby('group', sort=False)['device'].agg(list).to_dict())
+
+        groups_with_sku = np.unique(group[sku_mask])
+        parent_rows = np.flatnonzero(section == SECTION_PARENT)
+        parent_by_group = dict(zip(group[parent_rows], parent_rows))
+        definitions = column(DEVICE_DEF_COL)
+
+        for g in groups_with_sku:
+            row = parent_by_group[g]
+            var_def = definitions[row]
+            original = []
+            if pd.notna(var_def) and var_def:
+                original = [d.strip() for d in str(var_def).split('|') if d.strip()]
+
+            if reset_all_devices:
+                added, custom = [], custom_device_order or devices_to_add
+            elif custom_device_order:
+                added, custom = [], custom_device_order
+            else:
+                added, custom = added_by_group.get(int(g), []), None
+
+            device_list = self.processor._compose_device_list(
+                list(device_lists.get(g, [])), original, added, add_position, after_device, custom
+            )
+            definitions[row] = '|'.join(device_list)
+
+    def _fill_system_skus(self, column, group: np.ndarray, sku_mask: np.ndarray,
+                          product_ids, device_attr_map: Dict):
+        """システム連携用SKU番号（商品ID_カラー_サイズカテゴリ）をまとめて生成"""
+        size_map = {}
+        for name, attr in device_attr_map.items():
+            size_category = attr.get('size_category', '')
+            if size_category:
+                size_map[name] = size_category
+
+        targets = np.flatnonzero(sku_mask)
+        devices = pd.Series(column(DEVICE_COL)[targets])
+        colors = pd.Series(column(COLOR_COL)[targets])
+        valid = (devices.notna() & colors.notna()).to_numpy()
+        if not valid.any():
+            return
+
+        targets = targets[valid]
+        devices = devices[valid].reset_index(drop=True)
+        colors = colors[valid].reset_index(drop=True)
+        clean_colors = colors.astype(str).str.replace(r'^[A-Z]\.\s*', '', regex=True)
+        sizes = devices.map(size_map).fillna('LL')
+        ids = pd.Series(np.asarray(product_ids, dtype=object)[group[targets]]).astype(str)
+        column(SYSTEM_SKU_COL)[targets] = (ids + '_' + clean_colors + '_' + sizes).to_numpy(dtype=object)
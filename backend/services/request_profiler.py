@@ -0,0 +1,358 @@
+"""
+Opt-in request profiling
+A request carrying the admin profile token (X-Profile-Token header or
+?profile= query) runs under cProfile with tracemalloc enabled. The CPU
+profile (pstats), an allocation snapshot and metadata (input hash, engine,
+options, app version) are stored under data/state/profiles/<id>/ so slow
+customer files can be inspected and profiles compared between versions.
+Only one profiling session runs at a time
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import pstats
+import re
+import shutil
+import subprocess
+import threading
+import time
+import tracemalloc
+import uuid
+import zipfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_QUERY = 'profile'
+
+CPU_PROFILE_FILE = 'profile.pstats'
+CPU_REPORT_FILE = 'profile.txt'
+ALLOCATION_SNAPSHOT_FILE = 'allocations.snapshot'
+ALLOCATION_REPORT_FILE = 'allocations.txt'
+META_FILE = 'meta.json'
+
+_STDLIB_PATH = re.compile(r'.*/lib/python\d+\.\d+/')
+
+# スナップショットから除外する計測自体の割り当て
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+class ProfilerBusy(Exception):
+    """Another profiling session is running"""
+
+
+class ProfileAccessDenied(Exception):
+    """Profiling is disabled or the token does not match"""
+
+
+def file_sha256(paths: Iterable[Path]) -> str:
+    """SHA-256 over the contents of paths, in order"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def source_commit() -> Optional[str]:
+    """Commit of the running code (None outside a git checkout)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to site-packages or the backend directory so profiles from different hosts line up"""
+    normalized = filename.replace('\\', '/')
+    if 'site-packages/' in normalized:
+        return normalized.rsplit('site-packages/', 1)[1]
+    stdlib = _STDLIB_PATH.search(normalized)
+    if stdlib:
+        return normalized[stdlib.end():]
+    backend_dir = str(Path(__file__).resolve().parent.parent).replace('\\', '/') + '/'
+    if normalized.startswith(backend_dir):
+        return normalized[len(backend_dir):]
+    return normalized
+
+
+def _function_totals(stats: pstats.Stats) -> Dict[str, Dict]:
+    """Per-function calls and times keyed by file:function (line numbers shift between versions)"""
+    totals: Dict[str, Dict] = {}
+    for (filename, _, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        key = f"{_short_path(filename)}:{name}"
+        entry = totals.setdefault(key, {'calls': 0, 'tottime': 0.0, 'cumtime': 0.0})
+        entry['calls'] += calls
+        entry['tottime'] += tottime
+        # 再帰・同名関数の合算で二重に数えないよう累積時間は最大値
+        entry['cumtime'] = max(entry['cumtime'], cumtime)
+    return totals
+
+
+class ProfileSession:
+    """One running profile; stop() writes the results and releases the profiler"""
+
+    def __init__(self, profiler: 'RequestProfiler', kind: str, input_paths: Optional[List[Path]],
+                 meta: Optional[Dict]):
+        self.profiler = profiler
+        self.id = f"{datetime.now():%Y%m%d_%H%M%S}_{kind}_{uuid.uuid4().hex[:8]}"
+        self.kind = kind
+        self.input_paths: List[Path] = list(input_paths or [])
+        self.meta = dict(meta or {})
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._cpu = cProfile.Profile()
+        self._started_tracemalloc = False
+        self._baseline = None
+        self._stopped = False
+
+    def add_inputs(self, paths: Iterable[Path]):
+        """Input files known only after the session started (e.g. the saved upload)"""
+        self.input_paths.extend(paths)
+
+    def _start(self):
+        if tracemalloc.is_tracing():
+            # 既に計測中（PYTHONTRACEMALLOC）なら開始時点との差分だけを記録する
+            self._baseline = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        else:
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._cpu.enable()
+
+    def stop(self, error: Optional[str] = None) -> Dict:
+        """Disable profiling and write the profile directory; returns the metadata"""
+        if self._stopped:
+            return self.meta
+        self._stopped = True
+        self._cpu.disable()
+        wall = time.perf_counter() - self._started
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            traced_memory = tracemalloc.get_traced_memory()[0]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            return self._write(wall, snapshot, traced_memory, error)
+        finally:
+            self.profiler._release()
+
+    def _write(self, wall: float, snapshot, traced_memory: int, error: Optional[str]) -> Dict:
+        existing = [path for path in self.input_paths if Path(path).exists()]
+        input_hash = file_sha256(existing) if existing else None
+        directory = self.profiler.profile_dir / self.id
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._cpu.dump_stats(directory / CPU_PROFILE_FILE)
+        report = io.StringIO()
+        pstats.Stats(self._cpu, stream=report).sort_stats('cumulative').print_stats(60)
+        (directory / CPU_REPORT_FILE).write_text(report.getvalue(), encoding='utf-8')
+
+        snapshot.dump(str(directory / ALLOCATION_SNAPSHOT_FILE))
+        if self._baseline is not None:
+            top = [str(stat) for stat in snapshot.compare_to(self._baseline, 'lineno')[:60]]
+        else:
+            top = [str(stat) for stat in snapshot.statistics('lineno')[:60]]
+        (directory / ALLOCATION_REPORT_FILE).write_text('\n'.join(top) + '\n', encoding='utf-8')
+
+        self.meta.update({
+            'profile_id': self.id,
+            'kind': self.kind,
+            'status': 'error' if error else 'ok',
+            'error': error,
+            'input_hash': input_hash,
+            'input_files': [{'name': Path(path).name, 'bytes': Path(path).stat().st_size} for path in existing],
+            'started_at': self.started_at,
+            'wall_seconds': round(wall, 6),
+            'traced_memory_mb': round(traced_memory / 1024 / 1024, 3),
+            'allocations_relative_to_start': self._baseline is not None,
+            'app_version': self.profiler.app_version,
+            'commit': source_commit(),
+        })
+        (directory / META_FILE).write_text(json.dumps(self.meta, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f"Saved {self.kind} profile {self.id} ({wall:.2f}s)")
+        return self.meta
+
+    def __enter__(self) -> 'ProfileSession':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop(error=f"{exc_type.__name__}: {exc}" if exc_type is not None else None)
+        return False
+
+
+class RequestProfiler:
+    """Starts profiling sessions and reads back stored profiles"""
+
+    def __init__(self, profile_dir: Path, token: Optional[str] = None, app_version: Optional[str] = None,
+                 max_profiles: int = 50):
+        """
+        Args:
+            profile_dir: Directory holding one sub-directory per profile
+            token: Admin token enabling profiling and the profile endpoints (None disables both)
+            app_version: Recorded with each profile to compare versions
+            max_profiles: Oldest profiles beyond this count are deleted
+        """
+        self.profile_dir = Path(profile_dir)
+        self.token = token or None
+        self.app_version = app_version
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None
+
+    def check_token(self, value: Optional[str]):
+        """Raises ProfileAccessDenied unless profiling is enabled and value is the admin token"""
+        if not self.enabled:
+            raise ProfileAccessDenied("Profiling is disabled (set PROFILE_TOKEN)")
+        if not value or not hmac.compare_digest(value.encode(), self.token.encode()):
+            raise ProfileAccessDenied("Invalid profile token")
+
+    def requested(self, headers, query_params) -> bool:
+        """Whether the request asks for profiling; a wrong token raises ProfileAccessDenied"""
+        value = headers.get(PROFILE_HEADER) or query_params.get(PROFILE_QUERY)
+        if not value:
+            return False
+        self.check_token(value)
+        return True
+
+    def start(self, kind: str, input_paths: Optional[List[Path]] = None, meta: Optional[Dict] = None) -> ProfileSession:
+        """
+        Start profiling the calling thread
+
+        Raises:
+            ProfilerBusy: another session is running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Another request is being profiled, retry later")
+        try:
+            session = ProfileSession(self, kind, input_paths, meta)
+            session._start()
+        except Exception:
+            self._lock.release()
+            raise
+        return session
+
+    def _release(self):
+        self._prune()
+        self._lock.release()
+
+    def _prune(self):
+        profiles = self._stored_profiles()
+        for directory, _ in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _stored_profiles(self) -> List:
+        """(directory, metadata) of every stored profile, oldest first"""
+        if not self.profile_dir.exists():
+            return []
+        profiles = [
+            (path, json.loads((path / META_FILE).read_text(encoding='utf-8')))
+            for path in self.profile_dir.iterdir() if (path / META_FILE).exists()
+        ]
+        return sorted(profiles, key=lambda item: item[1].get('started_at', 0))
+
+    def _directory(self, profile_id: str) -> Optional[Path]:
+        directory = self.profile_dir / profile_id
+        if Path(profile_id).name != profile_id or not (directory / META_FILE).exists():
+            return None
+        return directory
+
+    def list_profiles(self, input_hash: Optional[str] = None) -> List[Dict]:
+        """Metadata of stored profiles, newest first"""
+        return [
+            meta for _, meta in reversed(self._stored_profiles())
+            if input_hash is None or (meta.get('input_hash') or '').startswith(input_hash)
+        ]
+
+    def get(self, profile_id: str, limit: int = 30) -> Optional[Dict]:
+        """Metadata with the top functions (by cumulative time) and top allocation sites"""
+        directory = self._directory(profile_id)
+        if directory is None:
+            return None
+        meta = json.loads((directory / META_FILE).read_text(encoding='utf-8'))
+        totals = _function_totals(pstats.Stats(str(directory / CPU_PROFILE_FILE)))
+        functions = sorted(totals.items(), key=lambda item: item[1]['cumtime'], reverse=True)[:limit]
+        snapshot = tracemalloc.Snapshot.load(str(directory / ALLOCATION_SNAPSHOT_FILE))
+        return dict(meta, functions=[
+            {'function': key, 'calls': entry['calls'], 'tottime': round(entry['tottime'], 6),
+             'cumtime': round(entry['cumtime'], 6)}
+            for key, entry in functions
+        ], allocations=[
+            {'location': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ])
+
+    def archive(self, profile_id: str) -> Optional[bytes]:
+        """All files of a profile as a ZIP"""
+        directory = self._directory(profile_id)
+        if directory is None:
+            return None
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for path in sorted(directory.iterdir()):
+                archive.write(path, f"{profile_id}/{path.name}")
+        return buffer.getvalue()
+
+    def diff(self, base_id: str, target_id: str, limit: int = 30) -> Optional[Dict]:
+        """
+        Compare two profiles: per-function time deltas (matched by file and
+        function name) and allocation size deltas per file
+        """
+        base_dir, target_dir = self._directory(base_id), self._directory(target_id)
+        if base_dir is None or target_dir is None:
+            return None
+        base_meta = json.loads((base_dir / META_FILE).read_text(encoding='utf-8'))
+        target_meta = json.loads((target_dir / META_FILE).read_text(encoding='utf-8'))
+
+        base = _function_totals(pstats.Stats(str(base_dir / CPU_PROFILE_FILE)))
+        target = _function_totals(pstats.Stats(str(target_dir / CPU_PROFILE_FILE)))
+        empty = {'calls': 0, 'tottime': 0.0, 'cumtime': 0.0}
+        functions = []
+        for key in base.keys() | target.keys():
+            before, after = base.get(key, empty), target.get(key, empty)
+            functions.append({
+                'function': key,
+                'base_calls': before['calls'], 'target_calls': after['calls'],
+                'base_tottime': round(before['tottime'], 6), 'target_tottime': round(after['tottime'], 6),
+                'delta_tottime': round(after['tottime'] - before['tottime'], 6),
+                'base_cumtime': round(before['cumtime'], 6), 'target_cumtime': round(after['cumtime'], 6),
+                'delta_cumtime': round(after['cumtime'] - before['cumtime'], 6),
+            })
+        functions.sort(key=lambda entry: abs(entry['delta_tottime']), reverse=True)
+
+        base_snapshot = tracemalloc.Snapshot.load(str(base_dir / ALLOCATION_SNAPSHOT_FILE))
+        target_snapshot = tracemalloc.Snapshot.load(str(target_dir / ALLOCATION_SNAPSHOT_FILE))
+        allocations = [
+            {'file': _short_path(stat.traceback[0].filename), 'size_kb': round(stat.size / 1024, 1),
+             'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff}
+            for stat in target_snapshot.compare_to(base_snapshot, 'filename')[:limit]
+        ]
+
+        base_wall, target_wall = base_meta['wall_seconds'], target_meta['wall_seconds']
+        return {
+            'base': base_meta,
+            'target': target_meta,
+            'same_input': base_meta.get('input_hash') is not None
+                          and base_meta.get('input_hash') == target_meta.get('input_hash'),
+            'wall_seconds': {'base': base_wall, 'target': target_wall,
+                             'ratio': round(target_wall / base_wall, 3) if base_wall else None},
+            'functions': functions[:limit],
+            'allocations': allocations,
+        }
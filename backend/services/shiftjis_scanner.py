@@ -0,0 +1,169 @@
+"""
+Bulk Shift-JIS compatibility scanner
+Finds characters the output encoding cannot represent across a whole
+DataFrame. The set of encodable characters is computed once per encoding and
+compiled into a single negated character-class regex; each column is joined
+into one string and searched in one pass, so clean columns cost one regex scan
+and only the matches are mapped back to (row, column, position).
+
+Outputs are written as Shift-JIS (csv_io.OUTPUT_ENCODING). Text decoded as
+CP932 can contain the Microsoft variants of some characters (～, －, ∥, ￠, ￡, ￢)
+that Shift-JIS cannot encode; fix_frame maps those to their Shift-JIS
+equivalents instead of replacing them with '?'
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .csv_io import OUTPUT_ENCODING
+
+DEFAULT_REPLACEMENT = '?'
+# CP932（Windows）の文字 -> Shift-JISで同じ見た目の文字
+CP932_VARIANTS = {
+    '\uff5e': '\u301c',  # FULLWIDTH TILDE -> WAVE DASH
+    '\uff0d': '\u2212',  # FULLWIDTH HYPHEN-MINUS -> MINUS SIGN
+    '\u2225': '\u2016',  # PARALLEL TO -> DOUBLE VERTICAL LINE
+    '\uffe0': '\u00a2',  # FULLWIDTH CENT SIGN -> CENT SIGN
+    '\uffe1': '\u00a3',  # FULLWIDTH POUND SIGN -> POUND SIGN
+    '\uffe2': '\u00ac',  # FULLWIDTH NOT SIGN -> NOT SIGN
+    '\u2014': '\u2015',  # EM DASH -> HORIZONTAL BAR
+}
+
+
+@lru_cache(maxsize=None)
+def unencodable_pattern(encoding: str = OUTPUT_ENCODING) -> 're.Pattern':
+    """Regex matching any single character that encoding cannot encode"""
+    ranges = []
+    start = None
+    for code in range(0x10000):
+        try:
+            chr(code).encode(encoding)
+            encodable = True
+        except UnicodeEncodeError:
+            encodable = False
+        if encodable and start is None:
+            start = code
+        elif not encodable and start is not None:
+            ranges.append((start, code - 1))
+            start = None
+    if start is not None:
+        ranges.append((start, 0xFFFF))
+
+    # BMP外の文字は常に文字クラスの外（=エンコード不可）になる
+    body = ''.join(
+        re.escape(chr(lo)) if lo == hi else f"{re.escape(chr(lo))}-{re.escape(chr(hi))}"
+        for lo, hi in ranges
+    )
+    return re.compile(f"[^{body}]")
+
+
+def _string_values(values) -> List[str]:
+    """Cell values as strings; missing and non-string cells render as ASCII and are skipped"""
+    return [v if isinstance(v, str) else '' for v in values]
+
+
+def scan_column(values, encoding: str = OUTPUT_ENCODING) -> List[Tuple[int, int, str]]:
+    """
+    Unencodable characters in a sequence of cells
+
+    Returns:
+        (row position, character position in the cell, character) triples
+    """
+    if len(values) == 0:
+        return []
+    # 区切り文字1つで連結して1回で検索し、一致位置だけを行へ戻す
+    try:
+        strings = values
+        joined = '\n'.join(strings)
+    except TypeError:
+        strings = _string_values(values)
+        joined = '\n'.join(strings)
+    pattern = unencodable_pattern(encoding)
+    first = pattern.search(joined)
+    if first is None:
+        return []
+
+    starts = np.cumsum([0] + [len(s) + 1 for s in strings[:-1]])
+    found = []
+    for match in pattern.finditer(joined, first.start()):
+        row = int(np.searchsorted(starts, match.start(), side='right')) - 1
+        found.append((row, match.start() - int(starts[row]), match.group()))
+    return found
+
+
+def _text_columns(df: pd.DataFrame) -> List[int]:
+    return [i for i, dtype in enumerate(df.dtypes) if pd.api.types.is_string_dtype(dtype)]
+
+
+def scan_frame(df: pd.DataFrame, encoding: str = OUTPUT_ENCODING) -> List[Dict]:
+    """
+    Every character of df that encoding cannot encode
+
+    Returns:
+        One record per character: row (position), column, position (in the
+        cell), char and codepoint ('U+XXXX'), in column then row order
+    """
+    issues = []
+    for i in _text_columns(df):
+        column = df.columns[i]
+        for row, position, char in scan_column(df.iloc[:, i].to_numpy(dtype=object), encoding):
+            issues.append({
+                'row': row,
+                'column': column,
+                'position': position,
+                'char': char,
+                'codepoint': f"U+{ord(char):04X}"
+            })
+    return issues
+
+
+def summarize_issues(issues: List[Dict], sample_size: int = 100) -> Dict:
+    """Counts per column and character with the first sample_size issues"""
+    columns: Dict[str, int] = {}
+    characters: Dict[str, int] = {}
+    for issue in issues:
+        columns[issue['column']] = columns.get(issue['column'], 0) + 1
+        characters[issue['char']] = characters.get(issue['char'], 0) + 1
+    return {
+        'issue_count': len(issues),
+        'columns': columns,
+        'characters': characters,
+        'issues': issues[:sample_size]
+    }
+
+
+def fix_frame(df: pd.DataFrame, replacement: str = DEFAULT_REPLACEMENT,
+              replacements: Optional[Dict[str, str]] = None,
+              encoding: str = OUTPUT_ENCODING) -> Tuple[pd.DataFrame, int]:
+    """
+    Replace unencodable characters column by column
+
+    Args:
+        replacement: Used for characters without an entry in replacements
+        replacements: Character -> encodable replacement (e.g. CP932_VARIANTS)
+
+    Returns:
+        (frame with the affected columns replaced, number of characters replaced);
+        df itself is not modified
+    """
+    replacements = replacements or {}
+    pattern = unencodable_pattern(encoding)
+
+    def substitute(match) -> str:
+        return replacements.get(match.group(), replacement)
+
+    result = df.copy(deep=False)
+    replaced = 0
+    for i in _text_columns(df):
+        found = scan_column(df.iloc[:, i].to_numpy(dtype=object), encoding)
+        if not found:
+            continue
+        values = df.iloc[:, i].to_numpy(dtype=object).copy()
+        for row in sorted({row for row, _, _ in found}):
+            values[row] = pattern.sub(substitute, values[row])
+        result.isetitem(i, values)
+        replaced += len(found)
+    return result, replaced
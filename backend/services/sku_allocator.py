@@ -0,0 +1,296 @@
+"""
+Block-reservation SKU allocator
+Issues sku_a numbers in contiguous blocks from a persisted high-water mark.
+Numbers above the mark that are already taken are kept as merged ranges,
+so the state stays a few bytes instead of every SKU string ever issued.
+
+Two state backends are available: a JSON file owned by one process, and a
+SQLite database in WAL mode that several workers and processes can reserve
+from concurrently
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SKU_PREFIX = 'sku_a'
+SKU_NUMBER_PATTERN = re.compile(r'^sku_a(\d+)$')
+
+
+def format_sku_numbers(blocks: Iterable[Tuple[int, int]]) -> List[str]:
+    """Format inclusive (start, end) number blocks as sku_a000001 strings"""
+    return [f"{SKU_PREFIX}{number:06d}" for start, end in blocks for number in range(start, end + 1)]
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort inclusive ranges and merge overlapping or adjacent ones"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def numbers_to_ranges(numbers: Iterable[int]) -> List[Tuple[int, int]]:
+    """Collapse a collection of numbers into merged inclusive ranges"""
+    return merge_ranges((n, n) for n in set(numbers))
+
+
+def plan_blocks(high_water: int, count: int,
+                reserved_ranges: Iterator[Tuple[int, int]]) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Plan the next count numbers above high_water, skipping reserved ranges
+
+    Args:
+        reserved_ranges: Sorted, disjoint ranges above high_water; only consumed as far as needed
+
+    Returns:
+        (inclusive (start, end) blocks, number of leading reserved ranges that were passed)
+    """
+    blocks = []
+    passed = 0
+    remaining = count
+    start = high_water + 1
+    next_range = next(reserved_ranges, None) if count > 0 else None
+
+    while remaining > 0:
+        if next_range is not None and next_range[0] < start + remaining:
+            taken_start, taken_end = next_range
+            if taken_start > start:
+                blocks.append((start, taken_start - 1))
+                remaining -= taken_start - start
+            start = taken_end + 1
+            passed += 1
+            next_range = next(reserved_ranges, None)
+        else:
+            blocks.append((start, start + remaining - 1))
+            remaining = 0
+
+    return blocks, passed
+
+
+class SKUBlockAllocator:
+    """Allocate unique sku_a numbers in blocks, skipping numbers that are already taken"""
+
+    def __init__(self, state_file: Optional[Path] = None):
+        self.state_file = state_file
+        # Highest number issued so far; everything at or below it is treated as used
+        self.high_water = 0
+        # Sorted, disjoint inclusive ranges above high_water that must be skipped
+        self.reserved_ranges: List[Tuple[int, int]] = []
+        # Jobs running on worker threads share one allocator
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load state, migrating the legacy {'global_counter', 'used_skus'} format"""
+        if not self.state_file or not self.state_file.exists():
+            return
+
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.high_water = int(data.get('global_counter', 0))
+        if 'reserved_ranges' in data:
+            ranges = [tuple(r) for r in data['reserved_ranges']]
+        else:
+            used_numbers = []
+            for sku in data.get('used_skus', []):
+                match = SKU_NUMBER_PATTERN.match(str(sku))
+                if match:
+                    used_numbers.append(int(match.group(1)))
+            ranges = numbers_to_ranges(used_numbers)
+            if used_numbers:
+                logger.info(f"Migrated {len(used_numbers)} used SKUs to {len(ranges)} ranges")
+
+        self.reserved_ranges = [(s, e) for s, e in merge_ranges(ranges) if e > self.high_water]
+        if self.reserved_ranges and self.reserved_ranges[0][0] <= self.high_water:
+            self.reserved_ranges[0] = (self.high_water + 1, self.reserved_ranges[0][1])
+
+    def save(self):
+        """Persist the high-water mark and reserved ranges (atomic replace)"""
+        if not self.state_file:
+            return
+
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_suffix(self.state_file.suffix + '.tmp')
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'global_counter': self.high_water,
+                    'reserved_ranges': [list(r) for r in self.reserved_ranges]
+                }, f)
+            os.replace(tmp_file, self.state_file)
+
+    def reserve_blocks(self, count: int) -> List[Tuple[int, int]]:
+        """Reserve count numbers and return them as inclusive (start, end) blocks"""
+        with self._lock:
+            blocks, passed = plan_blocks(self.high_water, count, iter(self.reserved_ranges))
+            del self.reserved_ranges[:passed]
+            if blocks:
+                self.high_water = blocks[-1][1]
+            return blocks
+
+    def allocate(self, count: int) -> List[str]:
+        """Reserve count numbers and return them as SKU strings in ascending order"""
+        return format_sku_numbers(self.reserve_blocks(count))
+
+
+class PreallocatedSKUAllocator(SKUBlockAllocator):
+    """
+    Hands out SKU numbers reserved in advance by another allocator
+
+    Used in worker processes so numbering is decided by the parent; asking
+    for more numbers than were reserved raises SKUReservationExhausted
+    """
+
+    def __init__(self, sku_numbers: List[str]):
+        super().__init__(None)
+        self.sku_numbers = list(sku_numbers)
+        self.position = 0
+
+    def allocate(self, count: int) -> List[str]:
+        if self.position + count > len(self.sku_numbers):
+            raise SKUReservationExhausted(
+                f"{count} SKU numbers requested, {len(self.sku_numbers) - self.position} reserved numbers left")
+        numbers = self.sku_numbers[self.position:self.position + count]
+        self.position += count
+        return numbers
+
+
+class SKUReservationExhausted(RuntimeError):
+    """More SKU numbers were requested than reserved in advance"""
+
+
+class SQLiteSKUAllocator(SKUBlockAllocator):
+    """
+    SKU allocator backed by SQLite in WAL mode
+
+    Every reservation is a short BEGIN IMMEDIATE transaction, so concurrent
+    workers and processes never issue the same number and a committed
+    reservation survives a crash. There is no in-memory state to save
+    """
+
+    def __init__(self, db_path: Path, legacy_state_file: Optional[Path] = None):
+        """
+        Args:
+            legacy_state_file: JSON state imported on first use when the database is empty
+        """
+        self.db_path = db_path
+        self.legacy_state_file = legacy_state_file
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (reopened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout = 30000")
+            # In WAL mode NORMAL still keeps committed reservations across an application crash
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        """Create tables, enable WAL and migrate the JSON state once"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sku_allocator_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    high_water INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sku_reserved_ranges (
+                    range_start INTEGER PRIMARY KEY,
+                    range_end INTEGER NOT NULL
+                )
+            """)
+            if conn.execute("SELECT 1 FROM sku_allocator_state").fetchone() is None:
+                legacy = SKUBlockAllocator(self.legacy_state_file)
+                conn.execute("INSERT INTO sku_allocator_state (id, high_water) VALUES (1, ?)",
+                             (legacy.high_water,))
+                conn.executemany("INSERT INTO sku_reserved_ranges (range_start, range_end) VALUES (?, ?)",
+                                 legacy.reserved_ranges)
+                if self.legacy_state_file and self.legacy_state_file.exists():
+                    logger.info(f"Migrated SKU state from {self.legacy_state_file} "
+                                f"(high water {legacy.high_water})")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def load(self):
+        """State lives in the database"""
+
+    def save(self):
+        """Reservations are committed as they are made"""
+
+    @property
+    def high_water(self) -> int:
+        conn = self._connect()
+        return conn.execute("SELECT high_water FROM sku_allocator_state WHERE id = 1").fetchone()[0]
+
+    @property
+    def reserved_ranges(self) -> List[Tuple[int, int]]:
+        conn = self._connect()
+        return [tuple(r) for r in conn.execute(
+            "SELECT range_start, range_end FROM sku_reserved_ranges ORDER BY range_start")]
+
+    def reserve_blocks(self, count: int) -> List[Tuple[int, int]]:
+        """Atomically reserve count numbers and return them as inclusive (start, end) blocks"""
+        if count <= 0:
+            return []
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            high_water = conn.execute(
+                "SELECT high_water FROM sku_allocator_state WHERE id = 1").fetchone()[0]
+            ranges = conn.execute(
+                "SELECT range_start, range_end FROM sku_reserved_ranges ORDER BY range_start")
+            blocks, passed = plan_blocks(high_water, count, (tuple(r) for r in ranges))
+            ranges.close()
+
+            new_high_water = blocks[-1][1]
+            if passed:
+                conn.execute("DELETE FROM sku_reserved_ranges WHERE range_end <= ?", (new_high_water,))
+            conn.execute("UPDATE sku_allocator_state SET high_water = ? WHERE id = 1", (new_high_water,))
+            conn.execute("COMMIT")
+            return blocks
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+
+def create_sku_allocator(state_file: Optional[Path] = None,
+                         backend: Optional[str] = None) -> SKUBlockAllocator:
+    """
+    Create the allocator for state_file
+
+    Args:
+        backend: 'sqlite' (default, state in <state_file>.db) or 'json';
+                 falls back to the SKU_STATE_BACKEND environment variable
+    """
+    backend = (backend or os.getenv('SKU_STATE_BACKEND', 'sqlite')).lower()
+    if state_file is None or backend == 'json':
+        return SKUBlockAllocator(state_file)
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown SKU state backend: {backend}")
+    return SQLiteSKUAllocator(state_file.with_suffix('.db'), legacy_state_file=state_file)
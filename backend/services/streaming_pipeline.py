@@ -0,0 +1,273 @@
+"""
+Streaming pipeline for large CSV files
+Reads the upload in chunks cut at product boundaries, processes each group of
+complete products and appends the result to the output file incrementally
+"""
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .csv_processor import CSVProcessor
+from .csv_splitter import SplitPartWriter
+from .rakuten_processor import RakutenCSVProcessor
+from .shiftjis_scanner import summarize_issues
+from .validator import Validator
+from .validator_vectorized import DUPLICATE_SKU, duplicate_sku_message, violation
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+DEVICE_COL = 'バリエーション項目選択肢2'
+DEVICE_DEF_COL = 'バリエーション2選択肢定義'
+
+
+class NonContiguousProductError(ValueError):
+    """A product's rows are not contiguous, so it cannot be processed chunk by chunk"""
+
+
+class ChunkColumnsMismatchError(ValueError):
+    """A processed chunk has different columns than the header already written"""
+
+
+class StreamingCSVPipeline:
+    """Process a CSV file product group by product group with bounded memory"""
+
+    def __init__(self, csv_processor: CSVProcessor, rakuten_processor: RakutenCSVProcessor,
+                 validator: Validator, chunk_rows: int = 20000):
+        """
+        Args:
+            chunk_rows: Rows read per chunk. Peak memory is bounded by this or by the
+                        largest single product, whichever is larger
+        """
+        self.csv_processor = csv_processor
+        self.rakuten_processor = rakuten_processor
+        self.validator = validator
+        self.chunk_rows = chunk_rows
+
+    def iter_product_chunks(self, file_path: Path, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yield DataFrames that only contain complete products
+
+        Rows of the product at the end of a chunk are carried over to the next chunk,
+        so a product is never split between two yielded DataFrames
+        """
+        carry = None
+        seen_products = set()
+
+        for chunk in self.csv_processor.iter_csv(file_path, chunk_rows or self.chunk_rows):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+                carry = None
+            if chunk.empty:
+                continue
+
+            product_ids = chunk[PRODUCT_COL].to_numpy()
+            last_id = product_ids[-1]
+            # 末尾の商品が始まる位置（ここまでの行は商品が完結している）
+            other_rows = np.flatnonzero(product_ids != last_id)
+            tail_start = other_rows[-1] + 1 if len(other_rows) else 0
+
+            if tail_start == 0:
+                # チャンク全体が1商品の場合は次のチャンクと結合する
+                carry = chunk
+                continue
+
+            complete = chunk.iloc[:tail_start]
+            self._check_contiguous(complete[PRODUCT_COL], seen_products)
+            carry = chunk.iloc[tail_start:].reset_index(drop=True)
+            yield complete.reset_index(drop=True)
+
+        if carry is not None and not carry.empty:
+            self._check_contiguous(carry[PRODUCT_COL], seen_products)
+            yield carry
+
+    def _check_contiguous(self, product_ids: pd.Series, seen_products: set):
+        """Raise if a product that was already completed appears again"""
+        run_starts = product_ids.ne(product_ids.shift())
+        run_ids = product_ids[run_starts]
+
+        already_seen = np.array([pid in seen_products for pid in run_ids], dtype=bool)
+        repeated = run_ids[run_ids.duplicated().to_numpy() | already_seen]
+        if not repeated.empty:
+            raise NonContiguousProductError(
+                f"Rows of product {repeated.iloc[0]} are not contiguous; streaming mode requires grouped products"
+            )
+        seen_products.update(run_ids.tolist())
+
+    def scan_devices(self, file_path: Path) -> Dict:
+        """
+        Collect the devices used in the file and verify product contiguity
+        Only the product and device columns are read
+        """
+        definition_devices = {}
+        sku_devices = {}
+        row_count = 0
+        contiguous = True
+        seen_products = set()
+        last_id = None
+
+        columns = [PRODUCT_COL, DEVICE_DEF_COL, DEVICE_COL]
+        for chunk in self.csv_processor.iter_csv(file_path, self.chunk_rows, usecols=columns):
+            row_count += len(chunk)
+
+            if DEVICE_DEF_COL in chunk.columns:
+                definitions = chunk[DEVICE_DEF_COL]
+                definitions = definitions[definitions.str.strip() != '']
+                for device in definitions.str.split('|').explode().str.strip():
+                    if device:
+                        definition_devices.setdefault(device, None)
+
+            if DEVICE_COL in chunk.columns:
+                for device in chunk[DEVICE_COL].str.strip().unique():
+                    if device:
+                        sku_devices.setdefault(device, None)
+
+            if contiguous and PRODUCT_COL in chunk.columns and not chunk.empty:
+                product_ids = chunk[PRODUCT_COL]
+                if product_ids.iloc[0] == last_id:
+                    # 前のチャンクから続く商品は完結扱いにしない
+                    seen_products.discard(last_id)
+                try:
+                    self._check_contiguous(product_ids, seen_products)
+                except NonContiguousProductError as e:
+                    logger.warning(str(e))
+                    contiguous = False
+                last_id = product_ids.iloc[-1]
+
+        devices = list(definition_devices)
+        devices.extend(d for d in sku_devices if d not in definition_devices)
+
+        return {
+            'devices': devices,
+            'row_count': row_count,
+            'contiguous': contiguous
+        }
+
+    def process_file(self, input_path: Path, output_path: Optional[Path],
+                     chunk_rows: Optional[int] = None, part_writer: Optional[SplitPartWriter] = None,
+                     **process_options) -> Dict:
+        """
+        Process input_path chunk by chunk and append the results to output_path
+
+        Args:
+            output_path: Main output file (None when only part files are wanted)
+            part_writer: Also write each processed chunk to 60k-row part files;
+                         its part files are returned as 'part_files'
+            process_options: Keyword arguments passed to RakutenCSVProcessor.process_csv
+
+        Returns:
+            Dictionary with totals, or validation errors if a chunk failed validation
+        """
+        header: Optional[List[str]] = None
+        total_rows = 0
+        sku_count = 0
+        chunk_count = 0
+        warnings = []
+        encoding_issues = []
+        # 入力から引き継いで書き込んだSKU番号（チャンク内の重複はバリデーターが、チャンク間の重複はここで検出する）
+        # この実行で採番した番号は採番器が重複なく払い出すため保持せず、メモリはチャンク単位に収まる
+        carried_skus = set()
+
+        try:
+            for chunk in self.iter_product_chunks(input_path, chunk_rows):
+                input_skus = chunk[SKU_COL].copy() if SKU_COL in chunk.columns else None
+                result = self.rakuten_processor.process_csv(chunk, **process_options)
+
+                validation_result = self.validator.validate_dataframe(
+                    result, engine=process_options.get('engine', 'standard')
+                )
+                if validation_result['valid']:
+                    duplicates = self._cross_chunk_duplicates(result, input_skus, carried_skus)
+                    if duplicates:
+                        validation_result = {
+                            'valid': False,
+                            'errors': [duplicate_sku_message(duplicates)],
+                            'violations': duplicates
+                        }
+                if not validation_result['valid']:
+                    self._discard_output(output_path, part_writer)
+                    return {
+                        'valid': False,
+                        'errors': validation_result['errors'],
+                        'violations': validation_result['violations']
+                    }
+                warnings.extend(validation_result['warnings'])
+
+                if header is None:
+                    header = result.columns.tolist()
+                elif result.columns.tolist() != header:
+                    # 列の並びだけが違う場合は揃え、列そのものが違う場合は途中から列がずれた出力を書かない
+                    missing = [col for col in header if col not in result.columns]
+                    extra = [col for col in result.columns if col not in header]
+                    if missing or extra:
+                        raise ChunkColumnsMismatchError(
+                            f"Chunk {chunk_count + 1} columns differ from the output header "
+                            f"(missing: {missing}, extra: {extra})"
+                        )
+                    result = result[header]
+
+                # 出力全体の文字コードチェック（行番号は出力全体での位置）
+                result, chunk_issues = self.validator.fix_output_encoding(result)
+                for issue in chunk_issues:
+                    issue['row'] += total_rows
+                encoding_issues.extend(chunk_issues)
+
+                if output_path is not None:
+                    self.csv_processor.save_csv(result, output_path, append=chunk_count > 0)
+                if part_writer is not None:
+                    # チャンクは商品単位で完結しているため、そのまま分割ファイルへ書き込む
+                    part_writer.write(result)
+
+                chunk_count += 1
+                total_rows += len(result)
+                if SKU_COL in result.columns:
+                    sku_count += int(result[SKU_COL].notna().sum())
+                logger.info(f"Streamed chunk {chunk_count}: {len(chunk)} rows in, {len(result)} rows out")
+            part_files = part_writer.close() if part_writer is not None else []
+        except Exception:
+            self._discard_output(output_path, part_writer)
+            raise
+
+        return {
+            'valid': True,
+            'warnings': warnings,
+            'chunks': chunk_count,
+            'total_rows': total_rows,
+            'sku_count': sku_count,
+            'part_files': part_files,
+            'encoding_report': summarize_issues(encoding_issues)
+        }
+
+    @staticmethod
+    def _cross_chunk_duplicates(result: pd.DataFrame, input_skus: Optional[pd.Series],
+                                carried_skus: set) -> List[Dict]:
+        """
+        SKUs of result already carried over from the input by an earlier chunk
+
+        Numbers allocated in this run are unique by construction, so only SKUs of
+        result that also appear in the chunk's input_skus are added to carried_skus
+        """
+        if SKU_COL not in result.columns:
+            return []
+        skus = result[SKU_COL]
+        skus = skus[skus.notna() & (skus != '')]
+        repeated = skus[skus.isin(carried_skus)]
+        if not repeated.empty:
+            # 前のチャンクに1回、このチャンクに出現した回数
+            counts = repeated.value_counts(sort=False)
+            return [violation(DUPLICATE_SKU, 'error', count=int(count) + 1, sku=sku)
+                    for sku, count in counts.items()]
+        if input_skus is not None:
+            carried_skus.update(skus[skus.isin(input_skus)])
+        return []
+
+    @staticmethod
+    def _discard_output(output_path: Optional[Path], part_writer: Optional[SplitPartWriter]):
+        if output_path is not None:
+            output_path.unlink(missing_ok=True)
+        if part_writer is not None:
+            part_writer.discard()
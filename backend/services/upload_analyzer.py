@@ -0,0 +1,172 @@
+"""
+Upload analyzer for Rakuten CSV files
+Computes the ordered device list, per-product device lists, product info and
+SKU counts of an uploaded file with column operations instead of row loops.
+Results match DeviceManager.extract_devices, CSVProcessor.get_product_info and
+the product_devices logic previously inlined in the upload endpoints
+"""
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+PRODUCT_NAME_COL = '商品名'
+DEVICE_COL = 'バリエーション項目選択肢2'
+DEVICE_DEF_COL = 'バリエーション2選択肢定義'
+# Legacy column checked when neither device column yields anything
+LEGACY_DEVICE_COLUMNS = ['バリエーション2:選択肢', DEVICE_COL, DEVICE_DEF_COL]
+VARIATION_COLUMNS = [f'バリエーション{i}:選択肢' for i in range(1, 7)]
+
+
+def _split_devices(value) -> List[str]:
+    """Split a pipe-delimited device definition into stripped, non-empty names"""
+    return [d.strip() for d in str(value).split('|') if d.strip()]
+
+
+class UploadAnalyzer:
+    """Analyze an uploaded CSV once for the upload and device endpoints"""
+
+    def analyze(self, df: pd.DataFrame, include_products: bool = True) -> Dict:
+        """
+        Analyze a DataFrame read by CSVProcessor.read_csv
+
+        Args:
+            include_products: Also build the per-product info list
+
+        Returns:
+            Dictionary with devices, product_devices, products (optional), row_count and column_count
+        """
+        codes, product_ids = None, None
+        if PRODUCT_COL in df.columns:
+            codes, product_ids = pd.factorize(df[PRODUCT_COL], sort=False)
+
+        result = {
+            'devices': self.extract_devices(df),
+            'product_devices': self.product_devices(df),
+            'row_count': len(df),
+            'column_count': len(df.columns)
+        }
+        if include_products:
+            result['products'] = self._product_info(df, codes, product_ids) if codes is not None else []
+        return result
+
+    def extract_devices(self, df: pd.DataFrame) -> List[str]:
+        """Unique device names in order of appearance (definitions first, then SKU rows)"""
+        devices: Dict[str, None] = {}
+
+        if DEVICE_DEF_COL in df.columns:
+            # 同じ定義文字列は一度だけ分割する（出現順は維持される）
+            for value in pd.unique(df[DEVICE_DEF_COL].dropna()):
+                if value and str(value).strip():
+                    for device in _split_devices(value):
+                        devices.setdefault(device, None)
+
+        if DEVICE_COL in df.columns:
+            self._add_stripped(devices, df[DEVICE_COL])
+
+        if not devices:
+            fallback_col = next((col for col in LEGACY_DEVICE_COLUMNS if col in df.columns), None)
+            if fallback_col:
+                self._add_stripped(devices, df[fallback_col])
+
+        return list(devices)
+
+    @staticmethod
+    def _add_stripped(devices: Dict[str, None], values: pd.Series):
+        for value in pd.unique(values.dropna()):
+            device = str(value).strip()
+            if device:
+                devices.setdefault(device, None)
+
+    def product_devices(self, df: pd.DataFrame) -> Dict[str, List[str]]:
+        """Device list of each product, from parent row definitions or else from SKU rows"""
+        if PRODUCT_COL not in df.columns:
+            return {}
+
+        product = df[PRODUCT_COL]
+        product_devices = {}
+
+        if SKU_COL in df.columns and DEVICE_DEF_COL in df.columns:
+            sku = df[SKU_COL]
+            definitions = df[DEVICE_DEF_COL]
+            parent_mask = product.notna() & (sku.isna() | (sku == ''))
+            parent_mask &= definitions.notna() & (definitions.astype(str).str.strip() != '')
+
+            parents = pd.DataFrame({
+                'product': product[parent_mask],
+                'devices': [_split_devices(v) for v in definitions[parent_mask]]
+            })
+            parents = parents[parents['devices'].map(len) > 0]
+            # 同じ商品の親行が複数ある場合は最初の位置に最後の定義が入る（辞書の上書きと同じ）
+            keys = parents.drop_duplicates('product', keep='first')['product']
+            values = dict(zip(parents['product'], parents['devices']))
+            product_devices = {key: values[key] for key in keys}
+
+        if not product_devices and DEVICE_COL in df.columns and SKU_COL in df.columns:
+            product_devices = self._product_devices_from_sku_rows(df)
+
+        return product_devices
+
+    def _product_devices_from_sku_rows(self, df: pd.DataFrame) -> Dict[str, List[str]]:
+        """Fallback: attach SKU row devices to the preceding parent row's product"""
+        product = df[PRODUCT_COL]
+        sku = df[SKU_COL]
+        device = df[DEVICE_COL]
+
+        parent_mask = product.notna() & sku.isna()
+        current_product = product.where(parent_mask).ffill()
+
+        product_devices = {pid: [] for pid in pd.unique(product[parent_mask])}
+        child_mask = (~parent_mask & sku.notna() & current_product.notna()
+                      & (current_product != '') & device.notna())
+        children = pd.DataFrame({'product': current_product[child_mask], 'device': device[child_mask]})
+        children = children.drop_duplicates()
+        for pid, devices in children.groupby('product', sort=False)['device']:
+            product_devices[pid] = devices.tolist()
+
+        return product_devices
+
+    def _product_info(self, df: pd.DataFrame, codes: np.ndarray, product_ids: pd.Index) -> List[Dict]:
+        """Per-product name, variation count and SKU count, sorted by product ID"""
+        valid = codes >= 0
+        n_products = len(product_ids)
+        if n_products == 0:
+            return []
+
+        _, first_rows = np.unique(codes, return_index=True)
+        if not valid.all():
+            # 欠損した商品管理番号（コード-1）の先頭行を除外
+            first_rows = first_rows[1:]
+
+        if SKU_COL in df.columns:
+            sku_counts = np.bincount(codes[valid & df[SKU_COL].notna().to_numpy()], minlength=n_products)
+        else:
+            sku_counts = np.zeros(n_products, dtype=np.int64)
+
+        variation_counts = np.ones(n_products, dtype=np.int64)
+        for col in VARIATION_COLUMNS:
+            if col in df.columns:
+                filled = valid & df[col].notna().to_numpy()
+                pairs = pd.DataFrame({'code': codes[filled], 'value': df[col].to_numpy()[filled]})
+                unique_counts = np.bincount(pairs.drop_duplicates()['code'].to_numpy(dtype=np.int64),
+                                            minlength=n_products)
+                variation_counts *= np.maximum(unique_counts, 1)
+
+        names: Optional[np.ndarray] = None
+        if PRODUCT_NAME_COL in df.columns:
+            names = df[PRODUCT_NAME_COL].to_numpy()[first_rows]
+
+        products = []
+        for code in np.argsort(np.asarray(product_ids, dtype=object), kind='stable'):
+            products.append({
+                "product_id": product_ids[code],
+                "product_name": names[code] if names is not None else "",
+                "variation_count": int(variation_counts[code]),
+                "sku_count": int(sku_counts[code])
+            })
+        return products
@@ -1,15 +1,43 @@
 import pandas as pd
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from .validator_vectorized import (
+    VectorizedValidator, violation, duplicate_skus, duplicate_sku_message,
+    VARIATION_LIMIT, SKU_LIMIT
+)
+from .instrumentation import span
+from .shiftjis_scanner import (
+    CP932_VARIANTS, DEFAULT_REPLACEMENT, fix_frame, scan_frame, summarize_issues, unencodable_pattern
+)
 
 class Validator:
     def __init__(self):
         self.max_variations_per_attribute = 40
         self.max_skus_per_product = 400
     
-    def validate_dataframe(self, df: pd.DataFrame) -> Dict:
-        """Validate DataFrame against Rakuten RMS constraints"""
+    def validate_dataframe(self, df: pd.DataFrame, engine: str = 'standard') -> Dict:
+        """
+        Validate DataFrame against Rakuten RMS constraints
+
+        Args:
+            engine: 'standard'（商品ごとのループ）、'vectorized'/'parallel'（1回のgroupby集計）
+
+        Returns:
+            valid, errors, warnings and violations (one record per violation,
+            with type/level/product_id/variation/count/limit/sku)
+        """
+        with span('validate', rows=len(df)):
+            return self._validate_dataframe(df, engine)
+    
+    def _validate_dataframe(self, df: pd.DataFrame, engine: str) -> Dict:
+        if engine in ('vectorized', 'parallel'):
+            return VectorizedValidator(
+                self.max_variations_per_attribute, self.max_skus_per_product
+            ).validate(df)
+
         errors = []
         warnings = []
+        violations = []
         
         # Check if required columns exist
         required_columns = ['商品管理番号（商品URL）']
@@ -30,6 +58,10 @@ class Validator:
                     if col_name in group.columns:
                         unique_count = group[col_name].dropna().nunique()
                         if unique_count > self.max_variations_per_attribute:
+                            violations.append(violation(
+                                VARIATION_LIMIT, 'error', product_id, i, unique_count,
+                                self.max_variations_per_attribute
+                            ))
                             errors.append(
                                 f"Product {product_id}: Variation {i} has {unique_count} options "
                                 f"(max: {self.max_variations_per_attribute})"
@@ -38,30 +70,33 @@ class Validator:
                 # Check total SKU count
                 sku_count = len(group)
                 if sku_count > self.max_skus_per_product:
+                    violations.append(violation(
+                        SKU_LIMIT, 'error', product_id, count=sku_count, limit=self.max_skus_per_product
+                    ))
                     errors.append(
                         f"Product {product_id}: Has {sku_count} SKUs "
                         f"(max: {self.max_skus_per_product})"
                     )
                 elif sku_count > self.max_skus_per_product * 0.9:
+                    violations.append(violation(
+                        SKU_LIMIT, 'warning', product_id, count=sku_count, limit=self.max_skus_per_product
+                    ))
                     warnings.append(
                         f"Product {product_id}: Has {sku_count} SKUs "
                         f"(approaching limit of {self.max_skus_per_product})"
                     )
         
         # Check for duplicate SKUs
-        if 'SKU管理番号' in df.columns:
-            # Filter out empty SKUs and check for duplicates
-            non_empty_skus = df[df['SKU管理番号'].notna() & (df['SKU管理番号'] != '')]
-            if len(non_empty_skus) > 0:
-                sku_duplicates = non_empty_skus['SKU管理番号'].duplicated()
-                if sku_duplicates.any():
-                    duplicate_skus = non_empty_skus[sku_duplicates]['SKU管理番号'].unique()
-                    errors.append(f"Duplicate SKUs found: {', '.join(duplicate_skus[:5])}")
+        duplicates = duplicate_skus(df)
+        if duplicates:
+            errors.append(duplicate_sku_message(duplicates))
+            violations.extend(duplicates)
         
         return {
             "valid": len(errors) == 0,
             "errors": errors,
-            "warnings": warnings
+            "warnings": warnings,
+            "violations": violations
         }
     
     def validate_encoding(self, text: str) -> bool:
@@ -73,32 +108,31 @@ class Validator:
             return False
     
     def clean_for_shiftjis(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Clean DataFrame for Shift-JIS encoding"""
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].apply(lambda x: self._clean_text(x) if pd.notna(x) else x)
-        return df
+        """Clean DataFrame for Shift-JIS encoding (returns a new frame)"""
+        cleaned, _ = fix_frame(df)
+        return cleaned
+    
+    def fix_output_encoding(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
+        """
+        Check every value of an output frame for non-Shift-JIS characters
+
+        Returns:
+            (frame to write, issues found); CP932 variants are mapped to their
+            Shift-JIS equivalents, other characters become '?' as the writer would
+        """
+        with span('encoding_check', rows=len(df)):
+            issues = scan_frame(df)
+            if issues:
+                df, _ = fix_frame(df, replacements=CP932_VARIANTS)
+        return df, issues
     
     def _clean_text(self, text: str) -> str:
         """Clean text to be Shift-JIS compatible"""
         if not isinstance(text, str):
             return str(text)
         
-        # Try to encode as Shift-JIS, replace problematic characters
-        try:
-            text.encode('shift_jis')
-            return text
-        except UnicodeEncodeError:
-            # Replace problematic characters
-            cleaned = []
-            for char in text:
-                try:
-                    char.encode('shift_jis')
-                    cleaned.append(char)
-                except UnicodeEncodeError:
-                    # Replace with placeholder or skip
-                    cleaned.append('?')
-            return ''.join(cleaned)
+        # Replace problematic characters
+        return unencodable_pattern().sub(DEFAULT_REPLACEMENT, text)
     
     def check_data_integrity(self, df: pd.DataFrame) -> Dict:
         """Check overall data integrity"""
@@ -118,16 +152,13 @@ class Validator:
         if not has_variations:
             issues.append("No variation columns found")
         
-        # Check for mixed encoding issues
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                sample = df[col].dropna().head(100)
-                for value in sample:
-                    if not self.validate_encoding(str(value)):
-                        issues.append(f"Column '{col}' contains non-Shift-JIS characters")
-                        break
+        # Check for mixed encoding issues (every value, not a sample)
+        encoding_issues = scan_frame(df)
+        for col in dict.fromkeys(issue['column'] for issue in encoding_issues):
+            issues.append(f"Column '{col}' contains non-Shift-JIS characters")
         
         return {
             "has_issues": len(issues) > 0,
-            "issues": issues
-        }
\ No newline at end of file
+            "issues": issues,
+            "encoding_issues": summarize_issues(encoding_issues)
+        }
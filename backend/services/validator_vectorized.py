@@ -0,0 +1,129 @@
+"""
+Validator用のベクトル化エンジン
+商品ごとのgroupbyループを行わず、1回の groupby().agg で商品ごとの行数と
+バリエーションごとの選択肢数を求め、重複SKUは1回のハッシュ走査で検出する。
+エラー・警告メッセージは標準エンジン（Validator.validate_dataframe）と同一になる。
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+VARIATION_COLS = [(i, f'バリエーション{i}:選択肢') for i in range(1, 7)]
+
+# 違反テーブルの種類
+VARIATION_LIMIT = 'variation_limit'
+SKU_LIMIT = 'sku_limit'
+DUPLICATE_SKU = 'duplicate_sku'
+
+
+def violation(kind: str, level: str, product_id=None, variation=None, count=None,
+              limit=None, sku=None) -> Dict:
+    """違反テーブルの1行（全種類で同じ列を持つ）"""
+    return {
+        'type': kind,
+        'level': level,
+        'product_id': product_id,
+        'variation': variation,
+        'count': count,
+        'limit': limit,
+        'sku': sku
+    }
+
+
+def variation_message(product_id, variation: int, count: int, limit: int) -> str:
+    return f"Product {product_id}: Variation {variation} has {count} options (max: {limit})"
+
+
+def sku_count_message(product_id, count: int, limit: int, level: str) -> str:
+    if level == 'error':
+        return f"Product {product_id}: Has {count} SKUs (max: {limit})"
+    return f"Product {product_id}: Has {count} SKUs (approaching limit of {limit})"
+
+
+def duplicate_skus(df: pd.DataFrame) -> List[Dict]:
+    """重複しているSKU（最初に重複した順）と出現回数"""
+    if SKU_COL not in df.columns:
+        return []
+    skus = df[SKU_COL]
+    skus = skus[skus.notna() & (skus != '')]
+    duplicated = skus.duplicated()
+    if not duplicated.any():
+        return []
+    values = skus[duplicated].unique()
+    counts = skus[skus.isin(values)].value_counts()
+    return [violation(DUPLICATE_SKU, 'error', count=int(counts[sku]), sku=sku) for sku in values]
+
+
+def duplicate_sku_message(duplicates: List[Dict]) -> str:
+    return f"Duplicate SKUs found: {', '.join(d['sku'] for d in duplicates[:5])}"
+
+
+class VectorizedValidator:
+    """Validator.validate_dataframe のベクトル化版"""
+
+    def __init__(self, max_variations_per_attribute: int, max_skus_per_product: int):
+        self.max_variations_per_attribute = max_variations_per_attribute
+        self.max_skus_per_product = max_skus_per_product
+
+    def validate(self, df: pd.DataFrame) -> Dict:
+        errors = []
+        warnings = []
+        violations = []
+
+        if PRODUCT_COL not in df.columns:
+            errors.append(f"Missing required columns: {PRODUCT_COL}")
+        else:
+            # (商品の順位, 項目順, 違反) を集めてから標準エンジンと同じ順に並べる
+            found = self._product_violations(df)
+            found.sort(key=lambda item: (item[0], item[1]))
+            for _, _, record in found:
+                violations.append(record)
+                if record['type'] == VARIATION_LIMIT:
+                    errors.append(variation_message(record['product_id'], record['variation'],
+                                                    record['count'], record['limit']))
+                else:
+                    target = errors if record['level'] == 'error' else warnings
+                    target.append(sku_count_message(record['product_id'], record['count'],
+                                                    record['limit'], record['level']))
+
+        duplicates = duplicate_skus(df)
+        if duplicates:
+            errors.append(duplicate_sku_message(duplicates))
+            violations.extend(duplicates)
+
+        return {
+            "valid": len(errors) == 0,
+            "errors": errors,
+            "warnings": warnings,
+            "violations": violations
+        }
+
+    def _product_violations(self, df: pd.DataFrame) -> List:
+        variation_cols = [(i, col) for i, col in VARIATION_COLS if col in df.columns]
+        spec = {'rows': (PRODUCT_COL, 'size')}
+        spec.update({f'v{i}': (col, 'nunique') for i, col in variation_cols})
+        # 商品管理番号順（groupbyの既定）に1回で集計
+        stats = df.groupby(PRODUCT_COL, sort=True).agg(**spec)
+        product_ids = stats.index.tolist()
+
+        found = []
+        for i, _ in variation_cols:
+            counts = stats[f'v{i}'].to_numpy()
+            for pos in (counts > self.max_variations_per_attribute).nonzero()[0].tolist():
+                found.append((pos, i, violation(
+                    VARIATION_LIMIT, 'error', product_ids[pos], i, int(counts[pos]),
+                    self.max_variations_per_attribute
+                )))
+
+        rows = stats['rows'].to_numpy()
+        over = rows > self.max_skus_per_product
+        near = ~over & (rows > self.max_skus_per_product * 0.9)
+        for level, mask in (('error', over), ('warning', near)):
+            for pos in mask.nonzero()[0].tolist():
+                found.append((pos, len(VARIATION_COLS) + 1, violation(
+                    SKU_LIMIT, level, product_ids[pos], count=int(rows[pos]),
+                    limit=self.max_skus_per_product
+                )))
+        return found
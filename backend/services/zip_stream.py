@@ -0,0 +1,214 @@
+"""
+Streaming ZIP archives
+Member files are deflated in parallel worker threads (zlib releases the GIL)
+and the archive is emitted in member order as compressed data becomes
+available, so the first bytes go out as soon as the first block of the first
+member is compressed. Local headers use data descriptors (sizes and CRC follow
+the data), which lets a member be sent before it is fully compressed.
+
+Finished archives are kept in a cache directory keyed by the names and SHA-256
+of their members; a repeat download of the same files is served from disk
+"""
+import hashlib
+import logging
+import os
+import queue
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+from .output_metadata import mark_output, read_output_metadata
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024
+EMIT_BLOCK_SIZE = 256 * 1024
+# ZIP64を使わない形式の上限（サイズ・オフセットは32ビット）
+ZIP32_LIMIT = 0xFFFFFFFF
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIR = struct.Struct('<IHHHHIIH')
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+
+class ArchiveTooLarge(ValueError):
+    """The members do not fit in a ZIP archive without ZIP64 extensions"""
+
+
+class _MemberDone:
+    """End of a member's compressed data"""
+
+    def __init__(self, crc: int, size: int, compressed_size: int):
+        self.crc = crc
+        self.size = size
+        self.compressed_size = compressed_size
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _compress_member(path: Path, out: queue.Queue, compresslevel: int):
+    """Deflate path into out block by block, then put _MemberDone (or the exception)"""
+    try:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS) if compresslevel else None
+        crc = size = compressed_size = 0
+        pending = []
+        pending_bytes = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                data = compressor.compress(block) if compressor else block
+                if data:
+                    pending.append(data)
+                    pending_bytes += len(data)
+                if pending_bytes >= EMIT_BLOCK_SIZE:
+                    out.put(b''.join(pending))
+                    compressed_size += pending_bytes
+                    pending, pending_bytes = [], 0
+        if compressor:
+            pending.append(compressor.flush())
+            pending_bytes += len(pending[-1])
+        if pending_bytes:
+            out.put(b''.join(pending))
+            compressed_size += pending_bytes
+        out.put(_MemberDone(crc, size, compressed_size))
+    except BaseException as e:
+        out.put(e)
+
+
+def stream_zip(members: Sequence[Tuple[str, Path]], max_workers: Optional[int] = None,
+               compresslevel: int = 6) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of members
+
+    Args:
+        members: (name in archive, file path) pairs, in archive order
+        max_workers: Members compressed concurrently (defaults to the CPU count)
+        compresslevel: zlib level 1-9, 0 stores the members uncompressed
+
+    Raises:
+        ArchiveTooLarge: Before anything is yielded, when the archive would need ZIP64
+    """
+    stats = [path.stat() for _, path in members]
+    if len(members) > 0xFFFF or sum(s.st_size for s in stats) + 1024 * len(members) > ZIP32_LIMIT:
+        raise ArchiveTooLarge(f"{len(members)} files are too large for a ZIP archive without ZIP64")
+    return _generate_zip(members, stats, max_workers or os.cpu_count() or 1, compresslevel)
+
+
+def _generate_zip(members, stats, max_workers: int, compresslevel: int) -> Iterator[bytes]:
+    method = METHOD_DEFLATED if compresslevel else METHOD_STORED
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='zip')
+    queues = [queue.Queue() for _ in members]
+    submitted = 0
+
+    try:
+        offset = 0
+        central_directory = []
+        for index, ((name, _), stat, out) in enumerate(zip(members, stats, queues)):
+            # 出力中のメンバーの先 max_workers 個まで圧縮を先行させる（メモリ上のバッファを制限）
+            while submitted < min(index + 1 + max_workers, len(members)):
+                executor.submit(_compress_member, members[submitted][1], queues[submitted], compresslevel)
+                submitted += 1
+
+            encoded_name = name.encode('utf-8')
+            flags = FLAG_DATA_DESCRIPTOR | (0 if name.isascii() else FLAG_UTF8)
+            dos_time, dos_date = _dos_datetime(stat.st_mtime)
+            header = LOCAL_HEADER.pack(0x04034b50, 20, flags, method, dos_time, dos_date,
+                                       0, 0, 0, len(encoded_name), 0) + encoded_name
+            yield header
+
+            while True:
+                item = out.get()
+                if isinstance(item, _MemberDone):
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+
+            descriptor = DATA_DESCRIPTOR.pack(0x08074b50, item.crc, item.compressed_size, item.size)
+            yield descriptor
+            central_directory.append(CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | 20, 20, flags, method, dos_time, dos_date,
+                item.crc, item.compressed_size, item.size, len(encoded_name), 0, 0, 0, 0,
+                0o644 << 16, offset
+            ) + encoded_name)
+            offset += len(header) + item.compressed_size + len(descriptor)
+
+        directory = b''.join(central_directory)
+        yield directory
+        yield END_OF_CENTRAL_DIR.pack(0x06054b50, 0, 0, len(members), len(members),
+                                      len(directory), offset, 0)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ZipArchiveCache:
+    """Directory of finished archives keyed by their members' names and hashes"""
+
+    def __init__(self, cache_dir: Path, max_workers: Optional[int] = None, compresslevel: int = 6):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self.compresslevel = compresslevel
+
+    @staticmethod
+    def cache_key(members: Sequence[Tuple[str, str]]) -> str:
+        """Key of an archive from (name in archive, member SHA-256) pairs"""
+        digest = hashlib.sha256()
+        for name, member_hash in members:
+            digest.update(name.encode('utf-8') + b'\0' + member_hash.encode('ascii') + b'\n')
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.zip"
+
+    def get(self, key: str) -> Optional[Tuple[Path, dict]]:
+        """Cached archive and its metadata, or None"""
+        path = self.path_for(key)
+        metadata = read_output_metadata(path)
+        return (path, metadata) if metadata is not None else None
+
+    def stream(self, members: Sequence[Tuple[str, Path]], key: str) -> Iterator[bytes]:
+        """
+        Stream the archive of members while writing it to the cache; the cache
+        entry only appears once the whole archive has been produced
+
+        Raises:
+            ArchiveTooLarge: Before anything is yielded
+        """
+        chunks = stream_zip(members, self.max_workers, self.compresslevel)
+        return self._tee(chunks, key)
+
+    def _tee(self, chunks: Iterator[bytes], key: str) -> Iterator[bytes]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        target = self.path_for(key)
+        temp = target.with_name(f"{target.name}.{os.getpid()}.{id(chunks)}.tmp")
+        completed = False
+        try:
+            with open(temp, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temp, target)
+            mark_output(target)
+            completed = True
+            logger.info(f"Cached ZIP archive {target.name}")
+        finally:
+            if not completed:
+                # 途中で切断された場合はキャッシュに残さない
+                chunks.close()
+                temp.unlink(missing_ok=True)
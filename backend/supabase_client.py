@@ -68,6 +68,20 @@ class SupabaseConnection:
         response = self.client.table('brand_values').select('*').eq('brand_name', brand_name).order('row_index').execute()
         return response.data
     
+    def get_all_brand_values(self, page_size: int = 1000):
+        """Get all brand values from Supabase (paged)"""
+        if not self.client:
+            return None
+        
+        rows = []
+        while True:
+            response = (self.client.table('brand_values').select('*')
+                        .order('brand_name').order('row_index')
+                        .range(len(rows), len(rows) + page_size - 1).execute())
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                return rows
+    
     def create_brand(self, brand_data: dict):
         """Create a new brand in Supabase"""
         if not self.client:
@@ -14,6 +14,109 @@ export interface ProcessRequest {
     size_category?: string;
   }>;
   anve_mode?: boolean;
+  engine?: 'standard' | 'vectorized' | 'parallel';
+  lazy_columns?: boolean;
+  streaming?: boolean;
+  chunk_rows?: number;
+  split_strategy?: 'sequential' | 'ffd';
+  split_keep_order?: boolean;
+  background?: boolean;
+  debug_trace?: boolean;
+}
+
+export interface SplitPlan {
+  strategy: 'sequential' | 'ffd';
+  file_count: number;
+  total_rows: number;
+  max_rows_per_file: number;
+  part_rows: number[];
+  fill_ratio: number;
+}
+
+export interface JobStage {
+  name: 'parse' | 'attribute_lookup' | 'transform' | 'validate' | 'write';
+  status: 'pending' | 'running' | 'done' | 'skipped' | 'failed';
+  started_at: number | null;
+  finished_at: number | null;
+}
+
+export interface JobStatus {
+  job_id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  current_stage: string | null;
+  progress: number;
+  stages: JobStage[];
+  error: string | null;
+  info: { split_plan?: SplitPlan; encoding_report?: EncodingReport; profile_id?: string; streaming_fallback?: string };
+  violation_count: number;
+  spans: StageSpan[];
+  created_at: number;
+  started_at: number | null;
+  finished_at: number | null;
+}
+
+export interface StageSpan {
+  name: string;
+  calls: number;
+  wall_seconds: number;
+  rows: number | null;
+  peak_memory_mb: number | null;
+}
+
+export interface EncodingIssue {
+  row: number;
+  column: string;
+  position: number;
+  char: string;
+  codepoint: string;
+}
+
+export interface EncodingReport {
+  issue_count: number;
+  columns: Record<string, number>;
+  characters: Record<string, number>;
+  issues: EncodingIssue[];
+}
+
+export interface Violation {
+  type: 'variation_limit' | 'sku_limit' | 'duplicate_sku';
+  level: 'error' | 'warning';
+  product_id: string | null;
+  variation: number | null;
+  count: number | null;
+  limit: number | null;
+  sku: string | null;
+}
+
+export interface ViolationPage {
+  job_id: string;
+  total: number;
+  offset: number;
+  limit: number;
+  counts: Record<string, number>;
+  violations: Violation[];
+}
+
+export interface TraceEvent {
+  seq: number;
+  time: number;
+  span: string | null;
+  event: string;
+  [field: string]: unknown;
+}
+
+export interface JobTrace {
+  job_id: string;
+  enabled: boolean;
+  capacity: number;
+  recorded: number;
+  dropped: number;
+  total: number;
+  offset: number;
+  limit: number;
+  counts: Record<string, number>;
+  events: TraceEvent[];
 }
 
 export interface ProcessResponse {
@@ -21,6 +124,10 @@ export interface ProcessResponse {
   output_files: string[];
   total_rows: number;
   sku_count: number;
+  split_plan?: SplitPlan;
+  encoding_report?: EncodingReport;
+  spans?: StageSpan[];
+  profile_id?: string;
 }
 
 export interface UploadResponse {
@@ -30,6 +137,8 @@ export interface UploadResponse {
   product_devices?: Record<string, string[]>;
   row_count: number;
   column_count: number;
+  encoding?: string;
+  profile_id?: string;
 }
 
 export interface ProductInfo {
@@ -23,6 +23,43 @@ def sample_csv_data():
     
     return pd.DataFrame(data)
 
+@pytest.fixture
+def rakuten_csv_data():
+    """楽天RMS形式（親行・オプション行・SKU行）のサンプルCSVデータを提供"""
+    import pandas as pd
+    
+    columns = [
+        '商品管理番号（商品URL）', '商品番号', '商品名', 'SKU管理番号', 'システム連携用SKU番号',
+        'バリエーション1選択肢定義', 'バリエーション2選択肢定義',
+        'バリエーション項目選択肢1', 'バリエーション項目選択肢2',
+        '商品属性（値）1', '商品属性（値）3', '商品属性（値）8',
+        '選択肢タイプ', '商品オプション項目名'
+    ]
+    
+    def row(**values):
+        base = {col: '' for col in columns}
+        base.update(values)
+        return base
+    
+    rows = [
+        row(**{'商品管理番号（商品URL）': 'case001', '商品名': '手帳型ケース',
+               'バリエーション1選択肢定義': 'A.ブラック|B.ホワイト',
+               'バリエーション2選択肢定義': 'iPhone 14|iPhone 15'}),
+        row(**{'商品管理番号（商品URL）': 'case001', '選択肢タイプ': 's', '商品オプション項目名': 'ラッピング'}),
+        row(**{'商品管理番号（商品URL）': 'case001', 'SKU管理番号': 'old001',
+               'バリエーション項目選択肢1': 'A.ブラック', 'バリエーション項目選択肢2': 'iPhone 14'}),
+        row(**{'商品管理番号（商品URL）': 'case001', 'SKU管理番号': 'old002',
+               'バリエーション項目選択肢1': 'B.ホワイト', 'バリエーション項目選択肢2': 'iPhone 14'}),
+        row(**{'商品管理番号（商品URL）': 'case001', 'SKU管理番号': 'old003',
+               'バリエーション項目選択肢1': 'A.ブラック', 'バリエーション項目選択肢2': 'iPhone 15'}),
+        row(**{'商品管理番号（商品URL）': 'case002', '商品名': 'ハードケース',
+               'バリエーション2選択肢定義': 'Pixel 8'}),
+        row(**{'商品管理番号（商品URL）': 'case002', 'SKU管理番号': 'old004',
+               'バリエーション項目選択肢1': 'レッド', 'バリエーション項目選択肢2': 'Pixel 8'}),
+    ]
+    
+    return pd.DataFrame(rows, columns=columns)
+
 @pytest.fixture
 def test_state_file(tmp_path):
     """一時的な状態ファイルのパスを提供"""
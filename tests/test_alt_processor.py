@@ -0,0 +1,53 @@
+"""AltProcessorのテスト"""
+import pandas as pd
+from services.alt_processor import AltProcessor
+
+
+def _alt_frame():
+    return pd.DataFrame({
+        '商品管理番号（商品URL）': ['item-a', 'item-a', 'item-b', 'item-b'],
+        '商品名': ['ケースA', '', 'ケースB', ''],
+        '商品画像タイプ1': ['CABINET', '', 'CABINET', ''],
+        '商品画像名（ALT）1': ['旧ALT', '', '', ''],
+        '商品画像タイプ2': ['', '', 'CABINET', 'CABINET'],
+        '商品画像名（ALT）2': ['残す', '', '', 'SKU行'],
+        'SKU画像名（ALT）': ['', 'SKU ALT', '', 'SKU ALT'],
+        '在庫数': ['007', '', '010', ''],
+    })
+
+
+class TestAltProcessor:
+    """ALT処理のテスト"""
+
+    def test_process_dataframe(self):
+        """親行の画像タイプがある列だけ商品名で上書きし、SKU ALTをクリアすること"""
+        df = _alt_frame()
+        original = df.copy()
+
+        result_df, result = AltProcessor().process_dataframe(df)
+
+        assert result_df['商品画像名（ALT）1'].tolist() == ['ケースA', '', 'ケースB', '']
+        # 画像タイプが空の親行・SKU行は変更しない
+        assert result_df['商品画像名（ALT）2'].tolist() == ['残す', '', 'ケースB', 'SKU行']
+        assert result_df['SKU画像名（ALT）'].tolist() == ['', '', '', '']
+        assert result == {
+            'status': 'success',
+            'message': '2個の商品のALTタグを更新しました',
+            'processed_count': 2,
+            'total_products': 2,
+            'updated_columns': 3
+        }
+        # 入力DataFrameは変更しない
+        pd.testing.assert_frame_equal(df, original)
+
+    def test_process_csv_keeps_strings(self, tmp_path):
+        """ファイル経由でも値を文字列のまま保持すること"""
+        input_path = tmp_path / 'input.csv'
+        output_path = tmp_path / 'output.csv'
+        _alt_frame().to_csv(input_path, index=False, encoding='cp932')
+
+        AltProcessor().process_csv(input_path, output_path)
+
+        output = pd.read_csv(output_path, encoding='cp932', dtype=str, keep_default_na=False)
+        assert output['在庫数'].tolist() == ['007', '', '010', '']
+        assert output['商品画像名（ALT）1'].tolist() == ['ケースA', '', 'ケースB', '']
@@ -0,0 +1,64 @@
+"""BatchProcessorのテスト"""
+import asyncio
+
+import pandas as pd
+from services.batch_processor import BatchProcessor
+from services.csv_processor import CSVProcessor
+from services.device_attribute_resolver import DeviceAttributeResolver
+from services.rakuten_processor import RakutenCSVProcessor
+
+
+def _write_files(df, tmp_path):
+    paths = []
+    for name in ('a', 'b'):
+        file_df = df.copy()
+        file_df['商品管理番号（商品URL）'] = file_df['商品管理番号（商品URL）'] + name
+        path = tmp_path / f'{name}.csv'
+        file_df.to_csv(path, index=False, encoding='shift_jis')
+        paths.append(path)
+    return paths
+
+
+class TestBatchProcessor:
+    """バッチ処理のテスト"""
+
+    def test_process_pool_numbering_is_deterministic(self, rakuten_csv_data, tmp_path):
+        """プロセス並列でもファイル順に事前確保したSKU番号が使われること"""
+        paths = _write_files(rakuten_csv_data, tmp_path)
+        batch = BatchProcessor(
+            tmp_path / 'state', workers=2,
+            device_resolver=DeviceAttributeResolver(tmp_path / 'missing.db')
+        )
+
+        result = asyncio.run(batch.process_batch_files(paths, devices_to_add=['iPhone 16'], process_mode='same_devices'))
+
+        assert result['successful_files'] == 2
+        outputs = [CSVProcessor().read_csv(tmp_path / r['output_file']) for r in result['results']]
+
+        # 単一プロセスでファイル順に処理した場合と同じ採番
+        reference = RakutenCSVProcessor()
+        for path, output in zip(paths, outputs):
+            expected = reference.process_csv(
+                CSVProcessor().read_csv(path), devices_to_add=result['all_devices'],
+                apply_db_attributes_to_existing=True
+            )
+            assert output['SKU管理番号'].tolist() == expected['SKU管理番号'].tolist()
+
+        skus = pd.concat(outputs)['SKU管理番号']
+        skus = skus[skus != '']
+        assert skus.is_unique
+        assert batch.rakuten_processor.global_sku_counter == len(skus)
+
+    def test_each_file_is_read_once(self, rakuten_csv_data, tmp_path, monkeypatch):
+        """解析と処理で同じファイルを再読み込みしないこと"""
+        paths = _write_files(rakuten_csv_data, tmp_path)
+        batch = BatchProcessor(tmp_path / 'state', workers=1,
+                               device_resolver=DeviceAttributeResolver(tmp_path / 'missing.db'))
+        reads = []
+        original_read = batch.csv_processor.read_csv
+        monkeypatch.setattr(batch.csv_processor, 'read_csv', lambda path: reads.append(path) or original_read(path))
+
+        result = asyncio.run(batch.process_batch_files(paths, devices_to_add=['iPhone 16']))
+
+        assert result['successful_files'] == 2
+        assert reads == paths
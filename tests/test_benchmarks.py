@@ -0,0 +1,110 @@
+"""ベンチマーク用カタログ生成とベンチマーク実行のテスト"""
+import pandas as pd
+import pytest
+from benchmarks.catalog import (
+    NEW_DEVICES, device_attribute_rows, generate_catalog, rms_columns, write_catalog_files
+)
+from benchmarks.run import compare_reports, parse_size, run_suite
+from services.csv_processor import CSVProcessor
+from services.rakuten_processor import RakutenCSVProcessor
+from services.shiftjis_scanner import scan_frame
+from services.validator import Validator
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+
+
+class TestCatalogGenerator:
+    """合成カタログのテスト"""
+
+    @pytest.mark.parametrize('rows', [1, 2, 57, 1000])
+    def test_exact_row_count_and_full_columns(self, rows):
+        """指定行数ちょうど、RMSの全列を持つこと"""
+        df = generate_catalog(rows, seed=rows)
+        assert len(df) == rows
+        assert df.columns.tolist() == rms_columns()
+        assert len(rms_columns()) == 573
+
+    def test_row_layout(self):
+        """親行・オプション行・SKU行の構成と選択肢定義が一致すること"""
+        df = generate_catalog(2000, seed=1)
+        assert df[PRODUCT_COL].is_monotonic_increasing
+
+        for _, group in df.groupby(PRODUCT_COL):
+            parent = group.iloc[0]
+            assert parent[SKU_COL] == '' and parent['選択肢タイプ'] == ''
+            options = group[group['選択肢タイプ'] != '']
+            skus = group[group[SKU_COL] != '']
+            assert len(group) == 1 + len(options) + len(skus)
+            assert (options.index < skus.index.min()).all()
+
+            devices = parent['バリエーション2選択肢定義'].split('|')
+            colors = parent['バリエーション1選択肢定義'].split('|')
+            assert skus['バリエーション項目選択肢2'].unique().tolist() == devices
+            assert set(skus['バリエーション項目選択肢1']) == set(colors)
+            assert len(skus) == len(devices) * len(colors)
+
+        assert df.loc[df[SKU_COL] != '', SKU_COL].is_unique
+        assert scan_frame(df) == []
+
+    def test_batch_files_do_not_share_skus(self, tmp_path):
+        """複数ファイルの合計行数とSKU番号の重複がないこと"""
+        paths = write_catalog_files(tmp_path, 1000, 3)
+        frames = [CSVProcessor().read_csv(path) for path in paths]
+
+        assert sum(len(df) for df in frames) == 1000
+        skus = pd.concat([df.loc[df[SKU_COL] != '', SKU_COL] for df in frames])
+        assert skus.is_unique
+
+    def test_processing_engines_agree(self, tmp_path):
+        """生成したカタログを各エンジンで処理でき、結果が一致すること"""
+        df = generate_catalog(400, seed=3)
+        attributes = [{'device': r['device_name'], 'attribute_value': r['attribute_value'],
+                       'size_category': r['size_category']} for r in device_attribute_rows()]
+        outputs = {}
+        for engine in ('standard', 'vectorized'):
+            processor = RakutenCSVProcessor(tmp_path / f"{engine}.json")
+            outputs[engine] = processor.process_csv(df.copy(), devices_to_add=list(NEW_DEVICES),
+                                                    add_position='start', device_attributes=attributes,
+                                                    engine=engine)
+
+        pd.testing.assert_frame_equal(outputs['standard'], outputs['vectorized'])
+        assert Validator().validate_dataframe(outputs['vectorized'])['valid']
+
+
+class TestBenchmarkRunner:
+    """ベンチマーク実行のテスト"""
+
+    def test_parse_size(self):
+        assert parse_size('10k') == 10_000
+        assert parse_size('1m') == 1_000_000
+        assert parse_size('2500') == 2500
+        assert parse_size('1.5k') == 1500
+
+    def test_report_fields(self, tmp_path):
+        """壁時間・行/秒・ピークRSSが記録されること"""
+        report = run_suite([300], ['validate', 'split'], ['standard', 'vectorized'], tmp_path,
+                           isolate=False, log=lambda line: None)
+
+        assert [(r['scenario'], r['engine']) for r in report['results']] == [
+            ('validate', 'standard'), ('validate', 'vectorized'), ('split', None)
+        ]
+        for result in report['results']:
+            assert result['rows'] == 300
+            assert result['wall_seconds'] > 0
+            assert result['rows_per_second'] == pytest.approx(300 / result['wall_seconds'], rel=0.01)
+            assert result['peak_rss_mb'] > 0
+        assert report['results'][0]['info']['valid'] is True
+        assert report['settings']['sizes'] == [300]
+
+    def test_compare_reports(self):
+        """許容範囲を超えて遅くなった結果だけが退行となること"""
+        def report(seconds):
+            return {'results': [
+                {'scenario': 'process', 'rows': 10, 'engine': 'vectorized', 'wall_seconds': seconds[0]},
+                {'scenario': 'split', 'rows': 10, 'engine': None, 'wall_seconds': seconds[1]},
+            ]}
+
+        rows = compare_reports(report([1.0, 1.0]), report([1.5, 1.1]), tolerance=0.2)
+        assert [(r['scenario'], r['regressed']) for r in rows] == [('process', True), ('split', False)]
+        assert rows[0]['ratio'] == pytest.approx(1.5)
@@ -0,0 +1,66 @@
+"""BrandAttributeResolverのテスト"""
+import sqlite3
+
+import pytest
+from services.brand_attribute_resolver import BrandAttributeResolver
+
+
+@pytest.fixture
+def brand_db(tmp_path):
+    """brand_valuesテーブルを持つ一時データベース"""
+    db_path = tmp_path / 'brand_attributes.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE brand_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            brand_name TEXT, row_index INTEGER, attribute_value TEXT
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO brand_values (brand_name, row_index, attribute_value) VALUES (?, ?, ?)",
+        [
+            ('iphone', 2, 'amicoco|アップル|Pro'),
+            ('iphone', 0, 'ヘッダー'),
+            ('iphone', 1, 'amicoco|アップル|iPhone'),
+            ('huawei', 1, 'amicoco|ファーウェイ|アップル'),
+            ('HUAWEI', 1, 'amicoco|ファーウェイ|旧'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+class TestBrandAttributeResolver:
+    """ブランド属性の解決のテスト"""
+
+    def test_resolves_any_casing(self, brand_db):
+        """表記ゆれに関係なく row_index 順の属性値を返すこと"""
+        resolver = BrandAttributeResolver(brand_db)
+
+        expected = ['amicoco|アップル|iPhone', 'amicoco|アップル|Pro']
+        assert resolver.resolve('iPhone') == expected
+        assert resolver.resolve('IPHONE ') == expected
+        assert resolver.resolve('Unknown') == []
+
+    def test_prefers_spelling_order(self, brand_db):
+        """DBに複数の表記がある場合は入力どおり→小文字→大文字の順で優先すること"""
+        resolver = BrandAttributeResolver(brand_db)
+
+        assert resolver.resolve('HUAWEI') == ['amicoco|ファーウェイ|旧']
+        assert resolver.resolve('Huawei') == ['amicoco|ファーウェイ|アップル']
+
+    def test_invalidate_reloads(self, brand_db):
+        """無効化後にDBの変更を反映すること"""
+        resolver = BrandAttributeResolver(brand_db)
+        assert resolver.resolve('Galaxy') == []
+
+        conn = sqlite3.connect(brand_db)
+        conn.execute("INSERT INTO brand_values (brand_name, row_index, attribute_value) "
+                     "VALUES ('galaxy', 1, 'amicoco|サムスン|Galaxy')")
+        conn.commit()
+        conn.close()
+
+        assert resolver.resolve('Galaxy') == []
+        resolver.invalidate()
+        assert resolver.resolve('Galaxy') == ['amicoco|サムスン|Galaxy']
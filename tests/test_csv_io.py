@@ -0,0 +1,60 @@
+"""Polars CSV I/O バックエンドのテスト"""
+import pandas as pd
+import pytest
+from services.csv_io import FastCSVUnsupported, read_csv_polars, resolve_io_backend
+from services.csv_processor import CSVProcessor
+
+
+class TestPolarsCSVIO:
+    """polars/pandasバックエンドの出力一致のテスト"""
+
+    def test_save_matches_pandas_bytes(self, rakuten_csv_data, tmp_path):
+        """polarsで書いたファイルがpandasと同一バイトになること"""
+        df = rakuten_csv_data.copy()
+        df.loc[2, '商品名'] = '①特殊文字,"引用"'
+        before = df.copy()
+
+        CSVProcessor(io_backend='polars').save_csv(df, tmp_path / 'polars.csv')
+        CSVProcessor(io_backend='pandas').save_csv(df, tmp_path / 'pandas.csv')
+
+        assert (tmp_path / 'polars.csv').read_bytes() == (tmp_path / 'pandas.csv').read_bytes()
+        # 元のDataFrameは変更されないこと
+        pd.testing.assert_frame_equal(df, before)
+
+    def test_append_matches_pandas_bytes(self, rakuten_csv_data, tmp_path):
+        """追記モードでもpandasと同一バイトになること"""
+        for backend in ('polars', 'pandas'):
+            processor = CSVProcessor(io_backend=backend)
+            path = tmp_path / f'{backend}.csv'
+            processor.save_csv(rakuten_csv_data.head(3), path)
+            processor.save_csv(rakuten_csv_data.tail(4), path, append=True)
+
+        assert (tmp_path / 'polars.csv').read_bytes() == (tmp_path / 'pandas.csv').read_bytes()
+
+    def test_read_matches_pandas(self, rakuten_csv_data, tmp_path):
+        """polarsで読んだDataFrameがpandasと一致すること"""
+        path = tmp_path / 'upload.csv'
+        rakuten_csv_data.to_csv(path, index=False, encoding='shift_jis', lineterminator='\r\n')
+
+        polars_df = CSVProcessor(io_backend='polars').read_csv(path)
+        pandas_df = CSVProcessor(io_backend='pandas').read_csv(path)
+
+        pd.testing.assert_frame_equal(polars_df, pandas_df)
+        pd.testing.assert_frame_equal(polars_df, rakuten_csv_data)
+
+    def test_unsupported_input_falls_back(self, tmp_path):
+        """polarsで再現できない入力はpandasにフォールバックすること"""
+        path = tmp_path / 'bare_cr.csv'
+        path.write_bytes('a,b\r1,2\n3,4\n'.encode('shift_jis'))
+
+        with pytest.raises(FastCSVUnsupported):
+            read_csv_polars(path, 'shift_jis')
+        df = CSVProcessor(io_backend='polars').read_csv(path)
+        pd.testing.assert_frame_equal(df, CSVProcessor(io_backend='pandas').read_csv(path))
+
+    def test_resolve_backend(self):
+        """不明なバックエンド名はエラーになること"""
+        assert resolve_io_backend('auto') in ('polars', 'pandas')
+        assert resolve_io_backend('Polars') == 'polars'
+        with pytest.raises(ValueError):
+            resolve_io_backend('arrow')
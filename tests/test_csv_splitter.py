@@ -0,0 +1,107 @@
+"""CSVSplitterのテスト"""
+import pandas as pd
+from services.csv_processor import CSVProcessor
+from services.csv_splitter import CSVSplitter, product_run_starts
+
+
+def _products(sizes):
+    """指定行数の商品を並べたDataFrame"""
+    rows = []
+    for i, size in enumerate(sizes):
+        for j in range(size):
+            rows.append({'商品管理番号（商品URL）': f'p{i:02d}', 'SKU管理番号': f's{i:02d}_{j}' if j else '',
+                         'バリエーション2選択肢定義': 'iPhone 15', '商品名': f'商品{i}'})
+    return pd.DataFrame(rows)
+
+
+def _read_parts(paths):
+    return [CSVProcessor().read_csv(path) for path in paths]
+
+
+class TestCSVSplitter:
+    """商品単位の分割のテスト"""
+
+    def test_product_run_starts(self):
+        """商品IDの変わり目を1回の走査で求めること"""
+        assert product_run_starts(['a', 'a', 'b', 'c', 'c']).tolist() == [0, 2, 3]
+        assert product_run_starts([]).tolist() == []
+
+    def test_split_keeps_products_together(self, tmp_path):
+        """商品を分割せずに最大行数以内のファイルへ分けること"""
+        df = _products([3, 4, 2, 7, 1])
+
+        paths = CSVSplitter(max_rows_per_file=6).split_by_parent_products(df, tmp_path, 'out')
+
+        assert [p.name for p in paths] == [f'out_part00{i}.csv' for i in range(1, 5)]
+        parts = _read_parts(paths)
+        # 7行の商品は単独のファイルになる
+        assert [part['商品管理番号（商品URL）'].unique().tolist() for part in parts] == \
+            [['p00'], ['p01', 'p02'], ['p03'], ['p04']]
+        combined = pd.concat(parts, ignore_index=True)
+        assert combined['SKU管理番号'].tolist() == df['SKU管理番号'].tolist()
+        # SKU行のバリエーション2選択肢定義はクリアされる
+        assert (combined.loc[combined['SKU管理番号'] != '', 'バリエーション2選択肢定義'] == '').all()
+
+    def test_non_contiguous_products_are_grouped(self, tmp_path):
+        """離れた行の商品は初出順にまとめること"""
+        df = _products([2, 2])
+        df = pd.concat([df, df.iloc[[1]]], ignore_index=True)
+
+        paths = CSVSplitter(max_rows_per_file=3).split_by_parent_products(df, tmp_path, 'out')
+
+        parts = _read_parts(paths)
+        assert [part['商品管理番号（商品URL）'].tolist() for part in parts] == \
+            [['p00', 'p00', 'p00'], ['p01', 'p01']]
+
+    def test_incremental_writer_matches_split(self, tmp_path):
+        """チャンクごとに書き込んでも一括分割と同じ結果になること"""
+        df = _products([3, 4, 2, 7, 1, 5])
+        splitter = CSVSplitter(max_rows_per_file=6)
+        expected = _read_parts(splitter.split_by_parent_products(df, tmp_path, 'whole'))
+
+        # 商品途中で区切ったチャンク
+        writer = splitter.part_writer(tmp_path, 'chunked')
+        for start in range(0, len(df), 4):
+            writer.write(df.iloc[start:start + 4], complete=False)
+        assert len(writer.close()) == len(expected)
+
+        # ファイルから読みながら分割
+        source = tmp_path / 'source.csv'
+        CSVProcessor().save_csv(df, source)
+        from_file = splitter.split_file(source, tmp_path, 'streamed', chunk_rows=4)
+
+        for paths in (writer.paths, from_file):
+            for part, expected_part in zip(_read_parts(paths), expected):
+                pd.testing.assert_frame_equal(part, expected_part)
+
+    def test_ffd_plan_minimizes_files(self, tmp_path):
+        """ffdでは入力順の分割よりファイル数が少なくなること"""
+        sizes = [4, 5, 2, 5, 1, 3]
+        df = _products(sizes)
+        splitter = CSVSplitter(max_rows_per_file=10)
+
+        sequential = splitter.plan(df)
+        ffd = splitter.plan(df, strategy='ffd')
+
+        assert sequential['file_count'] == 3
+        assert ffd['file_count'] == 2
+        assert ffd['fill_ratio'] == 1.0
+        # 入力順を保持：ファイル内・ファイル間とも商品の初出順
+        assert ffd['parts'] == [[0, 2, 4, 5], [1, 3]]
+        unordered = splitter.plan(df, strategy='ffd', keep_order=False)
+        assert unordered['parts'] == [[1, 3], [0, 5, 2, 4]]
+
+        paths = splitter.split_by_parent_products(df, tmp_path, 'out', strategy='ffd')
+        parts = _read_parts(paths)
+        assert [part['商品管理番号（商品URL）'].unique().tolist() for part in parts] == \
+            [['p00', 'p02', 'p04', 'p05'], ['p01', 'p03']]
+        assert sorted(len(part) for part in parts) == [10, 10]
+
+    def test_estimate_splits_uses_plan(self):
+        """平均ではなく実際の計画からファイル数を見積もること"""
+        splitter = CSVSplitter(max_rows_per_file=10)
+
+        estimate = splitter.estimate_splits([6, 6, 6])
+        assert estimate['estimated_files'] == 3
+        assert estimate['fill_ratio'] == 0.6
+        assert splitter.estimate_splits([6, 4, 6, 4], strategy='ffd')['estimated_files'] == 2
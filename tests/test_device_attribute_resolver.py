@@ -0,0 +1,76 @@
+"""DeviceAttributeResolverのテスト"""
+import sqlite3
+
+import pytest
+from services.batch_processor import BatchProcessor
+from services.device_attribute_resolver import DeviceAttributeResolver
+
+
+@pytest.fixture
+def attributes_db(tmp_path):
+    """device_attributesテーブルを持つ一時データベース"""
+    db_path = tmp_path / 'product_attributes_new.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE device_attributes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            brand TEXT, device_name TEXT, attribute_value TEXT, size_category TEXT,
+            usage_count INTEGER DEFAULT 0, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO device_attributes (brand, device_name, attribute_value, size_category, usage_count) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            ('iPhone', 'iPhone 15', 'iPhone15', 'L', 1),
+            ('iPhone', 'iPhone 15', 'iPhone 15（人気）', 'L', 5),
+            ('iPhone', 'iPhone 15 Pro Max', 'iPhone15ProMax', 'LL', 0),
+            ('Google Pixel', 'Pixel 8', 'Pixel8', 'M', 0),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+class TestDeviceAttributeResolver:
+    """デバイス属性の一括解決のテスト"""
+
+    def test_resolution_tiers(self, attributes_db):
+        """完全一致→正規化一致→部分一致の順で解決すること"""
+        resolver = DeviceAttributeResolver(attributes_db)
+
+        result = resolver.resolve(['iPhone 15', 'ｐｉｘｅｌ　８', 'Pro Max', 'Unknown'])
+
+        # 同名の場合は使用回数が多い行を優先
+        assert result['iPhone 15']['attribute_value'] == 'iPhone 15（人気）'
+        assert result['ｐｉｘｅｌ　８'] == {'attribute_value': 'Pixel8', 'size_category': 'M',
+                                           'brand': 'Google Pixel'}
+        assert result['Pro Max']['attribute_value'] == 'iPhone15ProMax'
+        assert 'Unknown' not in result
+        assert 'Pro Max' not in resolver.resolve(['Pro Max'], partial=False)
+
+    def test_index_is_reused_until_invalidated(self, attributes_db):
+        """一度読み込んだ索引を再利用し、無効化後に再読み込みすること"""
+        resolver = DeviceAttributeResolver(attributes_db)
+        resolver.resolve(['Pixel 8'])
+
+        conn = sqlite3.connect(attributes_db)
+        conn.execute("UPDATE device_attributes SET attribute_value = 'Pixel8-new' WHERE device_name = 'Pixel 8'")
+        conn.commit()
+        conn.close()
+
+        assert resolver.resolve(['Pixel 8'])['Pixel 8']['attribute_value'] == 'Pixel8'
+        resolver.invalidate()
+        assert resolver.resolve(['Pixel 8'])['Pixel 8']['attribute_value'] == 'Pixel8-new'
+
+    def test_batch_processor_uses_resolver(self, attributes_db, tmp_path):
+        """バッチ処理は解決できない機種に機種名を属性値として使うこと"""
+        batch = BatchProcessor(tmp_path, device_resolver=DeviceAttributeResolver(attributes_db))
+
+        result = batch._get_device_attributes_from_db(['Pixel 8', 'Pro Max'])
+
+        assert result == [
+            {'device': 'Pixel 8', 'attribute_value': 'Pixel8', 'size_category': 'M'},
+            {'device': 'Pro Max', 'attribute_value': 'Pro Max', 'size_category': None},
+        ]
@@ -0,0 +1,106 @@
+"""EncodingSnifferのテスト"""
+import codecs
+from unittest.mock import patch
+
+import pytest
+from services.csv_processor import CSVProcessor
+from services.encoding_sniffer import SAMPLE_BYTES, EncodingSniffer, decode_bytes, sniff_encoding
+
+
+class TestEncodingSniffer:
+    """文字コード判定のテスト"""
+
+    def test_detects_rakuten_encodings(self):
+        """BOM・UTF-8・Shift-JIS・CP932拡張文字を判定できること"""
+        text = '商品管理番号（商品URL）,商品名\r\ncase001,手帳型ケース 〜\r\n'
+
+        assert sniff_encoding(text.encode('shift_jis')) == 'shift_jis'
+        assert sniff_encoding(text.encode('utf-8')) == 'utf-8'
+        assert sniff_encoding(codecs.BOM_UTF8 + text.encode('utf-8')) == 'utf-8-sig'
+        # NEC特殊文字はShift-JISでは読めないのでCP932
+        assert sniff_encoding('①ケース'.encode('cp932')) == 'cp932'
+        assert sniff_encoding(b'a,b\r\n1,2\r\n') == 'shift_jis'
+
+    def test_truncated_sample_does_not_fail(self):
+        """サンプル末尾でマルチバイト文字が途切れても判定を誤らないこと"""
+        # 1バイト文字を挟むことでサンプル末尾が2バイト文字の途中になる
+        data = ('あx' + 'あ' * SAMPLE_BYTES).encode('shift_jis')
+        assert len(data[:SAMPLE_BYTES].decode('shift_jis', errors='ignore').encode('shift_jis')) < SAMPLE_BYTES
+
+        assert sniff_encoding(data, complete=False) == 'shift_jis'
+        assert sniff_encoding(data) == 'shift_jis'
+
+    def test_ascii_prefix_is_skipped(self, tmp_path):
+        """先頭がASCIIのみでも後続の日本語から判定すること"""
+        path = tmp_path / 'upload.csv'
+        path.write_bytes(b'a,b\r\n' * 50000 + '1,テスト\r\n'.encode('utf-8'))
+
+        assert EncodingSniffer().detect(path) == 'utf-8'
+
+    def test_result_is_cached_per_file(self, tmp_path):
+        """同じファイルは再判定せず、更新されたら再判定すること"""
+        path = tmp_path / 'upload.csv'
+        path.write_bytes('商品名\r\nケース\r\n'.encode('shift_jis'))
+        sniffer = EncodingSniffer()
+
+        with patch('services.encoding_sniffer.sniff_encoding', wraps=sniff_encoding) as sniff:
+            assert sniffer.detect(path) == 'shift_jis'
+            assert sniffer.detect(path) == 'shift_jis'
+            assert sniff.call_count == 1
+
+            path.write_bytes('商品名\r\nケース\r\n'.encode('utf-8') + b'x')
+            assert sniffer.detect(path) == 'utf-8'
+            assert sniff.call_count == 2
+
+
+def _cp932_after_sample(tmp_path, rows=8000):
+    """Shift-JISで読める行が判定サンプルより長く続き、最後の行だけCP932固有の文字を含むCSV"""
+    lines = ['商品管理番号（商品URL）,商品名'] + [f'case{i:06d},手帳型ケース' for i in range(rows)]
+    lines.append('case_last,①㈱ケース')
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(('\r\n'.join(lines) + '\r\n').encode('cp932'))
+    assert path.stat().st_size > SAMPLE_BYTES * 2
+    return path
+
+
+class TestCP932Fallback:
+    """判定サンプルより後のCP932固有文字のテスト"""
+
+    @pytest.mark.parametrize('io_backend', ['pandas', 'polars'])
+    def test_read_retries_with_cp932(self, tmp_path, io_backend):
+        """Shift-JISで読めない場合はCP932で読み直し、判定結果を更新すること"""
+        path = _cp932_after_sample(tmp_path)
+        sniffer = EncodingSniffer()
+        processor = CSVProcessor(io_backend=io_backend, encoding_sniffer=sniffer)
+        assert sniffer.detect(path) == 'shift_jis'
+
+        df = processor.read_csv(path)
+
+        assert len(df) == 8001
+        assert df['商品名'].iloc[-1] == '①㈱ケース'
+        assert sniffer.detect(path) == 'cp932'
+
+    def test_chunked_read_continues_after_yielded_rows(self, tmp_path):
+        """チャンク読み込みの途中で失敗しても、出力済みの行を重複させずに続きを返すこと"""
+        # pandasの読み込みバッファより大きくし、最初のチャンクを返した後で失敗させる
+        path = _cp932_after_sample(tmp_path, rows=40000)
+        processor = CSVProcessor(io_backend='pandas')
+
+        chunks = list(processor.iter_csv(path, chunk_rows=1000))
+
+        ids = [value for chunk in chunks for value in chunk['商品管理番号（商品URL）']]
+        assert len(ids) == 40001 and len(set(ids)) == 40001
+        assert chunks[-1]['商品名'].iloc[-1] == '①㈱ケース'
+        assert processor.detect_encoding(path) == 'cp932'
+
+    def test_in_memory_upload_retries_with_cp932(self):
+        """メモリ上のアップロード全体のデコードでも、サンプル後のCP932固有文字で失敗しないこと"""
+        body = ('brand,device_name\r\n' + 'アップル,iPhone 15\r\n' * 8000 + 'NEC,①㈱端末\r\n').encode('cp932')
+        assert body.index('①'.encode('cp932')) > SAMPLE_BYTES
+        assert sniff_encoding(body) == 'shift_jis'
+
+        text, encoding = decode_bytes(body)
+
+        assert encoding == 'cp932'
+        assert text.endswith('NEC,①㈱端末\r\n')
+        assert decode_bytes('商品名\r\n'.encode('utf-8')) == ('商品名\r\n', 'utf-8')
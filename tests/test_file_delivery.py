@@ -0,0 +1,90 @@
+"""出力ファイルのメタデータと配信のテスト"""
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+from services.file_delivery import file_response
+from services.output_metadata import ensure_output_metadata, mark_output, read_output_metadata
+
+
+def _get(path, metadata, headers=None):
+    """file_responseを返すアプリにリクエストを送る"""
+    app = FastAPI()
+
+    @app.get('/file')
+    async def serve(request: Request):
+        return file_response(request, path, metadata, 'text/csv', 'out.csv')
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get('/file', headers=headers or {})
+
+    return asyncio.run(send())
+
+
+class TestOutputMetadata:
+    """メタデータサイドカーのテスト"""
+
+    def test_sidecar_is_invalidated_by_changes(self, tmp_path):
+        """ファイルが変更されるとメタデータが無効になること"""
+        path = tmp_path / 'out.csv'
+        path.write_bytes(b'a,b\r\n1,2\r\n')
+
+        metadata = mark_output(path, rows=1)
+        assert read_output_metadata(path) == metadata
+        assert metadata['rows'] == 1 and metadata['size'] == 10
+
+        path.write_bytes(b'a,b\r\n1,2\r\n3,4\r\n')
+        assert read_output_metadata(path) is None
+
+    def test_ensure_normalizes_once(self, tmp_path):
+        """メタデータのないファイルは一度だけ正規化されること"""
+        path = tmp_path / 'out.csv'
+        path.write_bytes(b'a,b\r\n1,2\r\n')
+        calls = []
+
+        for _ in range(3):
+            ensure_output_metadata(path, calls.append)
+
+        assert calls == [path]
+
+
+class TestFileResponse:
+    """条件付きリクエスト・Rangeのテスト"""
+
+    def test_validators_and_not_modified(self, tmp_path):
+        """ETag/Last-Modifiedを返し、一致すれば304になること"""
+        path = tmp_path / 'out.csv'
+        path.write_bytes(b'0123456789')
+        metadata = mark_output(path)
+
+        response = _get(path, metadata)
+        assert response.status_code == 200
+        assert response.content == b'0123456789'
+        etag = response.headers['etag']
+        assert etag == f'"{metadata["sha256"]}"'
+        assert response.headers['accept-ranges'] == 'bytes'
+
+        assert _get(path, metadata, {'If-None-Match': etag}).status_code == 304
+        assert _get(path, metadata, {'If-None-Match': '"other"'}).status_code == 200
+        last_modified = response.headers['last-modified']
+        assert _get(path, metadata, {'If-Modified-Since': last_modified}).status_code == 304
+
+    def test_range_requests(self, tmp_path):
+        """単一のRangeに206で応答し、範囲外は416になること"""
+        path = tmp_path / 'out.csv'
+        path.write_bytes(b'0123456789')
+        metadata = mark_output(path)
+
+        response = _get(path, metadata, {'Range': 'bytes=2-5'})
+        assert response.status_code == 206
+        assert response.content == b'2345'
+        assert response.headers['content-range'] == 'bytes 2-5/10'
+
+        assert _get(path, metadata, {'Range': 'bytes=-3'}).content == b'789'
+        assert _get(path, metadata, {'Range': 'bytes=7-'}).content == b'789'
+        assert _get(path, metadata, {'Range': 'bytes=10-'}).status_code == 416
+        # If-Rangeが一致しない場合は全体を返す
+        stale = _get(path, metadata, {'Range': 'bytes=2-5', 'If-Range': '"other"'})
+        assert stale.status_code == 200 and stale.content == b'0123456789'
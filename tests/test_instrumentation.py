@@ -0,0 +1,116 @@
+"""ステージ別計測（スパン・メトリクス）のテスト"""
+import tracemalloc
+
+import pytest
+from services.csv_processor import CSVProcessor
+from services.instrumentation import MetricsRegistry, Trace, current_trace, span, tracing
+from services.job_queue import JobQueue
+from services.rakuten_processor import RakutenCSVProcessor
+from services.validator import Validator
+
+
+def _by_name(trace: Trace):
+    return {record['name']: record for record in trace.summary()}
+
+
+class TestSpans:
+    """スパンのテスト"""
+
+    def test_noop_outside_trace(self):
+        """トレース外では何も記録せず、行数の設定もできること"""
+        assert current_trace() is None
+        with span('parse') as stage:
+            stage.rows = 10
+        assert current_trace() is None
+
+    def test_aggregates_by_name(self):
+        """同じ名前のスパンは呼び出し回数・時間・行数を合算すること"""
+        registry = MetricsRegistry()
+        with tracing(registry) as trace:
+            for rows in (3, 4):
+                with span('add_remove', rows=rows):
+                    with span('sku_regeneration'):
+                        pass
+        records = _by_name(trace)
+
+        assert [record['name'] for record in trace.summary()] == ['sku_regeneration', 'add_remove']
+        assert records['add_remove']['calls'] == 2
+        assert records['add_remove']['rows'] == 7
+        assert records['sku_regeneration']['rows'] is None
+        assert records['add_remove']['wall_seconds'] >= records['sku_regeneration']['wall_seconds'] > 0
+
+    def test_memory_peak_with_nesting(self):
+        """tracemalloc有効時は各スパンのピークを記録し、外側は内側のピーク以上になること"""
+        tracemalloc.start()
+        try:
+            with tracing(MetricsRegistry()) as trace:
+                with span('parse'):
+                    with span('detect_encoding'):
+                        data = bytearray(8 * 1024 * 1024)
+                        del data
+                    with span('write'):
+                        pass
+        finally:
+            tracemalloc.stop()
+        records = _by_name(trace)
+
+        assert records['detect_encoding']['peak_memory_mb'] >= 7.9
+        assert records['parse']['peak_memory_mb'] >= records['detect_encoding']['peak_memory_mb']
+        assert records['write']['peak_memory_mb'] < 1
+
+
+class TestMetricsRegistry:
+    """メトリクス集計のテスト"""
+
+    def test_histogram_and_prometheus(self):
+        """ジョブごとに1件ずつ累積ヒストグラムへ加算されること"""
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        for wall in (0.05, 0.5, 5.0):
+            trace = Trace()
+            trace.spans['parse'] = {'calls': 2, 'wall_seconds': wall, 'rows': 100, 'peak_memory_bytes': None}
+            registry.observe(trace)
+        stage = registry.snapshot()['stages']['parse']
+
+        assert registry.snapshot()['traces'] == 3
+        assert stage['count'] == 3 and stage['calls'] == 6 and stage['rows_total'] == 300
+        assert stage['buckets'] == [{'le': 0.1, 'count': 1}, {'le': 1.0, 'count': 2}, {'le': '+Inf', 'count': 3}]
+        assert stage['wall_seconds_sum'] == pytest.approx(5.55)
+
+        text = registry.prometheus()
+        assert 'rakuten_stage_seconds_bucket{stage="parse",le="1.0"} 2' in text
+        assert 'rakuten_stage_seconds_count{stage="parse"} 3' in text
+        assert 'rakuten_stage_rows_total{stage="parse"} 300' in text
+
+
+class TestJobSpans:
+    """ジョブ実行時のスパンのテスト"""
+
+    @pytest.mark.parametrize('engine', ['standard', 'vectorized'])
+    def test_processing_stages_are_recorded(self, tmp_path, rakuten_csv_data, engine):
+        """読み込みから書き込みまでの各ステージがジョブ状態に含まれること"""
+        input_path = tmp_path / 'input.csv'
+        rakuten_csv_data.to_csv(input_path, index=False, encoding='shift_jis')
+        queue = JobQueue(max_workers=1)
+
+        def task(job):
+            csv_processor = CSVProcessor(io_backend='pandas')
+            df = csv_processor.read_csv(input_path)
+            df = RakutenCSVProcessor(tmp_path / 'state.json').process_csv(
+                df, devices_to_add=['iPhone 16'], devices_to_remove=['iPhone 15'], engine=engine
+            )
+            assert Validator().validate_dataframe(df, engine=engine)['valid']
+            df, _ = Validator().fix_output_encoding(df)
+            csv_processor.save_csv(df, tmp_path / 'output.csv')
+            return len(df)
+
+        job = queue.submit('process', task)
+        output_rows = job.future.result(30)
+        queue.shutdown()
+        spans = {record['name']: record for record in job.to_dict()['spans']}
+
+        assert set(spans) == {'detect_encoding', 'parse', 'split', 'add_remove', 'sku_regeneration',
+                              'system_sku', 'validate', 'encoding_check', 'write'}
+        assert spans['parse']['rows'] == len(rakuten_csv_data)
+        assert spans['write']['rows'] == output_rows
+        assert spans['sku_regeneration']['rows'] == 6
+        assert all(record['wall_seconds'] >= 0 for record in spans.values())
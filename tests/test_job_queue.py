@@ -0,0 +1,73 @@
+"""JobQueueのテスト"""
+import threading
+
+import pytest
+from services.job_queue import COMPLETED, FAILED, JobError, JobQueue, JobQueueFull
+
+
+class TestJobQueue:
+    """ジョブキューのテスト"""
+
+    def test_stage_progress_and_result(self):
+        """段階ごとの進捗と結果を記録すること"""
+        queue = JobQueue(max_workers=1)
+        reached_transform = threading.Event()
+        release = threading.Event()
+
+        def task(job, value):
+            job.start_stage('parse')
+            job.start_stage('transform')
+            reached_transform.set()
+            release.wait(5)
+            return {'value': value}
+
+        job = queue.submit('process', task, 42)
+        assert reached_transform.wait(5)
+        status = job.to_dict()
+        stages = {stage['name']: stage['status'] for stage in status['stages']}
+        assert status['current_stage'] == 'transform'
+        assert stages == {'parse': 'done', 'attribute_lookup': 'skipped', 'transform': 'running',
+                          'validate': 'pending', 'write': 'pending'}
+        assert status['progress'] == 0.4
+
+        release.set()
+        assert job.future.result(5) == {'value': 42}
+        assert job.status == COMPLETED
+        assert job.to_dict()['progress'] == 1.0
+        queue.shutdown()
+
+    def test_backpressure(self):
+        """同時実行数と待機数を超えた投入は拒否すること"""
+        queue = JobQueue(max_workers=1, max_pending=1)
+        release = threading.Event()
+
+        def task(job):
+            release.wait(5)
+
+        queue.submit('process', task)
+        queue.submit('process', task)
+        with pytest.raises(JobQueueFull):
+            queue.submit('process', task)
+
+        release.set()
+        queue.shutdown()
+        # 完了後は再び投入できること
+        assert queue.stats()['queued'] == 0 and queue.stats()['running'] == 0
+
+    def test_failure_keeps_error_details(self):
+        """失敗したジョブはステータスコードと詳細を保持すること"""
+        queue = JobQueue(max_workers=1)
+
+        def task(job):
+            job.start_stage('validate')
+            raise JobError('Validation failed', status_code=400, details=['too many SKUs'])
+
+        job = queue.submit('process', task)
+        with pytest.raises(JobError):
+            job.future.result(5)
+
+        assert job.status == FAILED
+        assert (job.error, job.error_status_code, job.error_details) == ('Validation failed', 400, ['too many SKUs'])
+        assert job.stages['validate']['status'] == 'failed'
+        assert queue.get(job.id) is job
+        queue.shutdown()
@@ -0,0 +1,54 @@
+"""ParsedFileCacheのテスト"""
+import os
+from services.csv_processor import CSVProcessor
+from services.parsed_file_cache import ParsedFileCache
+
+
+def _write(df, path):
+    df.to_csv(path, index=False, encoding='shift_jis')
+    return path
+
+
+class TestParsedFileCache:
+    """解析済みファイルキャッシュのテスト"""
+
+    def test_second_read_hits_cache(self, rakuten_csv_data, tmp_path):
+        """同じファイルの2回目の読み込みは解析せずキャッシュから返すこと"""
+        path = _write(rakuten_csv_data, tmp_path / 'upload.csv')
+        cache = ParsedFileCache()
+        processor = CSVProcessor(cache=cache)
+
+        first = processor.read_csv(path)
+        first.loc[0, '商品名'] = 'changed'
+        second = processor.read_csv(path)
+
+        assert cache.stats()['hits'] == 1
+        assert second.loc[0, '商品名'] == '手帳型ケース'
+        assert processor.original_columns == rakuten_csv_data.columns.tolist()
+
+    def test_modified_file_is_reparsed(self, rakuten_csv_data, tmp_path):
+        """ファイルが更新された場合は再解析すること"""
+        path = _write(rakuten_csv_data, tmp_path / 'upload.csv')
+        processor = CSVProcessor(cache=ParsedFileCache())
+        processor.read_csv(path)
+
+        _write(rakuten_csv_data.head(2), path)
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert len(processor.read_csv(path)) == 2
+
+    def test_evicts_least_recently_used(self, rakuten_csv_data, tmp_path):
+        """容量を超えた場合は最も古く使われたエントリを破棄すること"""
+        paths = [_write(rakuten_csv_data, tmp_path / f'upload{i}.csv') for i in range(3)]
+        size = int(rakuten_csv_data.memory_usage(index=True, deep=True).sum())
+        cache = ParsedFileCache(max_bytes=size * 2)
+
+        cache.put(paths[0], rakuten_csv_data)
+        cache.put(paths[1], rakuten_csv_data)
+        cache.get(paths[0])
+        cache.put(paths[2], rakuten_csv_data)
+
+        assert cache.get(paths[0]) is not None
+        assert cache.get(paths[1]) is None
+        assert cache.stats()['entries'] == 2
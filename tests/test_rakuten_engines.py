@@ -0,0 +1,136 @@
+"""RakutenCSVProcessorの処理エンジンのテスト"""
+import random
+import pandas as pd
+import pytest
+from services.rakuten_passthrough import PassthroughColumns, SOURCE_ROW_COL
+from services.rakuten_processor import RakutenCSVProcessor
+
+
+DEVICE_ATTRIBUTES = [
+    {'device': 'iPhone 16', 'attribute_value': 'アップル|iPhone16', 'size_category': 'M', 'size': '6.1'},
+    {'device': 'iPhone 14', 'attribute_value': 'アップル|iPhone14', 'size_category': 'S'},
+]
+
+SCENARIOS = [
+    {},
+    {'devices_to_add': ['iPhone 16', 'Pixel 8'], 'brand_attributes': ['amicoco|アップル|iPhone', 'Huawei'],
+     'device_attributes': DEVICE_ATTRIBUTES},
+    {'devices_to_remove': ['iPhone 14']},
+    {'custom_device_order': ['iPhone 15', 'iPhone 14']},
+    {'devices_to_add': ['iPhone 16'], 'reset_all_devices': True},
+    {'devices_to_add': ['iPhone 16'], 'devices_to_remove': ['iPhone 15'], 'add_position': 'after',
+     'after_device': 'iPhone 14', 'device_attributes': DEVICE_ATTRIBUTES},
+]
+
+
+def _run(df, engine, state_file, **options):
+    """同じ乱数系列で処理を実行"""
+    processor = RakutenCSVProcessor(state_file)
+    random.seed(0)
+    return processor.process_csv(df.copy(), engine=engine, **options)
+
+
+class TestVectorizedEngine:
+    """ベクトル化エンジンのテスト"""
+    
+    @pytest.mark.parametrize('options', SCENARIOS)
+    def test_matches_standard_engine(self, rakuten_csv_data, tmp_path, options):
+        """標準エンジンとバイト単位で同一のCSVを出力すること"""
+        standard = _run(rakuten_csv_data, 'standard', tmp_path / 'standard.json', **options)
+        vectorized = _run(rakuten_csv_data, 'vectorized', tmp_path / 'vectorized.json', **options)
+        
+        assert vectorized.to_csv(index=False) == standard.to_csv(index=False)
+    
+    def test_reset_generates_unique_skus(self, rakuten_csv_data, tmp_path):
+        """全機種再定義で生成したSKU番号が重複しないこと"""
+        for engine in ('standard', 'vectorized'):
+            result = _run(rakuten_csv_data, engine, tmp_path / f'{engine}.json',
+                          devices_to_add=['iPhone 16', 'iPhone 17'], reset_all_devices=True)
+            skus = result.loc[result['SKU管理番号'] != '', 'SKU管理番号']
+            assert len(skus) == 6
+            assert skus.is_unique
+    
+    def test_falls_back_without_variation_columns(self, rakuten_csv_data, tmp_path):
+        """必須列がない場合は標準エンジンで処理すること"""
+        df = rakuten_csv_data.drop(columns=['バリエーション項目選択肢1'])
+        standard = _run(df, 'standard', tmp_path / 'standard.json', devices_to_remove=['iPhone 14'])
+        vectorized = _run(df, 'vectorized', tmp_path / 'vectorized.json', devices_to_remove=['iPhone 14'])
+        
+        assert vectorized.to_csv(index=False) == standard.to_csv(index=False)
+
+
+class TestParallelEngine:
+    """並列エンジンのテスト"""
+    
+    @pytest.mark.parametrize('options', SCENARIOS)
+    def test_matches_vectorized_engine(self, rakuten_csv_data, tmp_path, options):
+        """商品ごとにシャード分割しても出力とSKU採番が単一プロセスと同一であること"""
+        vectorized_processor = RakutenCSVProcessor(tmp_path / 'vectorized.json')
+        random.seed(0)
+        vectorized = vectorized_processor.process_csv(rakuten_csv_data.copy(), engine='vectorized', **options)
+        
+        parallel_processor = RakutenCSVProcessor(tmp_path / 'parallel.json', parallel_workers=2,
+                                                 parallel_shard_size=1)
+        random.seed(0)
+        parallel = parallel_processor.process_csv(rakuten_csv_data.copy(), engine='parallel', **options)
+        
+        assert parallel.to_csv(index=False) == vectorized.to_csv(index=False)
+        assert parallel_processor.global_sku_counter == vectorized_processor.global_sku_counter
+
+
+def _wide(df):
+    """処理で触れない列（行ごとに異なる値）を途中と末尾に加えたCSV"""
+    df = df.copy()
+    df.insert(2, '販売価格', [str(1000 + i) for i in range(len(df))])
+    df['商品属性（値）2'] = [f'attr2-{i}' for i in range(len(df))]
+    df['在庫数'] = [str(i) for i in range(len(df))]
+    return df
+
+
+class TestLazyColumns:
+    """列の遅延展開（lazy_columns）のテスト"""
+    
+    @pytest.mark.parametrize('engine', ['standard', 'vectorized', 'parallel'])
+    @pytest.mark.parametrize('options', SCENARIOS)
+    def test_matches_full_columns(self, rakuten_csv_data, tmp_path, engine, options):
+        """触れない列を後から結合しても、全列で処理した場合と同一のフレームになること"""
+        df = _wide(rakuten_csv_data)
+        full = _run(df, engine, tmp_path / 'full.json', **options)
+        lazy = _run(df, engine, tmp_path / 'lazy.json', lazy_columns=True, **options)
+        
+        pd.testing.assert_frame_equal(lazy, full)
+    
+    def test_added_column_is_appended(self, rakuten_csv_data, tmp_path):
+        """処理中に作られる列（システム連携用SKU番号）は全列処理と同じく末尾に並ぶこと"""
+        df = _wide(rakuten_csv_data).drop(columns=['システム連携用SKU番号'])
+        full = _run(df, 'standard', tmp_path / 'full.json', devices_to_add=['iPhone 16'])
+        lazy = _run(df, 'standard', tmp_path / 'lazy.json', devices_to_add=['iPhone 16'], lazy_columns=True)
+        
+        assert lazy.columns[-1] == 'システム連携用SKU番号'
+        pd.testing.assert_frame_equal(lazy, full)
+    
+    def test_engines_see_only_working_columns(self, rakuten_csv_data):
+        """作業用フレームは処理対象の列と元行番号のみで、追加行は元行の値を引き継ぐこと"""
+        df = _wide(rakuten_csv_data)
+        passthrough = PassthroughColumns(df)
+        working = passthrough.narrow()
+        
+        assert set(working.columns) == set(rakuten_csv_data.columns) | {SOURCE_ROW_COL}
+        assert passthrough.passthrough_columns == ['販売価格', '商品属性（値）2', '在庫数']
+        
+        # 元行2（case001のSKU行）をコピーした行は、その行の触れない列の値を持つ
+        result = pd.concat([working.iloc[[2]], working], ignore_index=True)
+        expanded = passthrough.expand(result)
+        assert expanded['販売価格'].tolist() == ['1002'] + df['販売価格'].tolist()
+        assert expanded.columns.tolist() == df.columns.tolist()
+    
+    def test_unsupported_layout_uses_full_columns(self, rakuten_csv_data, tmp_path):
+        """列名の重複がある場合や省略できる列がない場合は全列で処理すること"""
+        assert not PassthroughColumns.supports(rakuten_csv_data)
+        duplicated = pd.concat([_wide(rakuten_csv_data), rakuten_csv_data[['商品名']]], axis=1)
+        assert not PassthroughColumns.supports(duplicated)
+        
+        full = _run(rakuten_csv_data, 'standard', tmp_path / 'full.json', devices_to_add=['iPhone 16'])
+        lazy = _run(rakuten_csv_data, 'standard', tmp_path / 'lazy.json', devices_to_add=['iPhone 16'],
+                    lazy_columns=True)
+        pd.testing.assert_frame_equal(lazy, full)
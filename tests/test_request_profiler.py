@@ -0,0 +1,107 @@
+"""リクエストプロファイラーのテスト"""
+import hashlib
+import io
+import json
+import tracemalloc
+import zipfile
+
+import pytest
+from services.request_profiler import (
+    META_FILE, ProfileAccessDenied, ProfilerBusy, RequestProfiler, file_sha256
+)
+
+
+def _work(n):
+    """プロファイル対象の処理（割り当てあり）"""
+    return sum(len(str(i) * 3) for i in range(n))
+
+
+class TestRequestProfiler:
+    """プロファイルの保存・読み出しのテスト"""
+
+    def test_token_check(self, tmp_path):
+        """トークン未設定なら無効、不一致なら拒否、指定がなければプロファイルしないこと"""
+        disabled = RequestProfiler(tmp_path)
+        with pytest.raises(ProfileAccessDenied):
+            disabled.requested({'X-Profile-Token': 'x'}, {})
+
+        profiler = RequestProfiler(tmp_path, token='secret')
+        assert profiler.requested({}, {}) is False
+        assert profiler.requested({}, {'profile': 'secret'}) is True
+        assert profiler.requested({'X-Profile-Token': 'secret'}, {}) is True
+        with pytest.raises(ProfileAccessDenied):
+            profiler.requested({'X-Profile-Token': 'wrong'}, {})
+
+    def test_session_writes_profile_with_input_hash(self, tmp_path):
+        """CPUプロファイル・割り当てスナップショット・入力ハッシュ付きメタデータを保存すること"""
+        input_path = tmp_path / 'input.csv'
+        input_path.write_bytes('商品管理番号（商品URL）\ncase001\n'.encode('shift_jis'))
+        profiler = RequestProfiler(tmp_path / 'profiles', token='secret', app_version='1.0.0')
+
+        with profiler.start('process', [input_path], meta={'engine': 'vectorized'}) as session:
+            _work(20000)
+
+        assert not tracemalloc.is_tracing()
+        directory = tmp_path / 'profiles' / session.id
+        meta = json.loads((directory / META_FILE).read_text(encoding='utf-8'))
+        assert meta['input_hash'] == hashlib.sha256(input_path.read_bytes()).hexdigest()
+        assert meta['engine'] == 'vectorized' and meta['kind'] == 'process' and meta['status'] == 'ok'
+        assert meta['app_version'] == '1.0.0'
+
+        profile = profiler.get(session.id)
+        assert any(f['function'].endswith(':_work') for f in profile['functions'])
+        assert profile['allocations']
+
+        names = zipfile.ZipFile(io.BytesIO(profiler.archive(session.id))).namelist()
+        assert sorted(names) == sorted(f"{session.id}/{path.name}" for path in directory.iterdir())
+
+    def test_error_is_recorded_and_profiler_released(self, tmp_path):
+        """例外時もプロファイルを保存し、同時実行は1件に制限されること"""
+        profiler = RequestProfiler(tmp_path, token='secret')
+        session = profiler.start('upload')
+        with pytest.raises(ProfilerBusy):
+            profiler.start('upload')
+
+        with pytest.raises(ValueError):
+            with session:
+                raise ValueError('broken file')
+
+        assert profiler.list_profiles()[0]['status'] == 'error'
+        assert profiler.list_profiles()[0]['error'] == 'ValueError: broken file'
+        with profiler.start('upload'):
+            pass
+
+    def test_list_filter_and_diff(self, tmp_path):
+        """同じ入力のプロファイルを絞り込み、関数ごとの差分を比較できること"""
+        input_path = tmp_path / 'input.csv'
+        input_path.write_text('a\n1\n')
+        profiler = RequestProfiler(tmp_path / 'profiles', token='secret')
+
+        with profiler.start('process', [input_path]) as base:
+            _work(1000)
+        with profiler.start('process', [input_path]) as target:
+            _work(50000)
+        with profiler.start('upload'):
+            pass
+
+        input_hash = file_sha256([input_path])
+        assert [p['profile_id'] for p in profiler.list_profiles(input_hash[:12])] == [target.id, base.id]
+
+        diff = profiler.diff(base.id, target.id)
+        assert diff['same_input'] is True
+        work = next(f for f in diff['functions'] if f['function'].endswith(':_work'))
+        assert work['base_calls'] == work['target_calls'] == 1
+        assert work['delta_cumtime'] > 0
+        assert profiler.diff(base.id, 'missing') is None
+        assert profiler.get('../profiles') is None
+
+    def test_oldest_profiles_are_pruned(self, tmp_path):
+        """保持件数を超えた古いプロファイルは削除されること"""
+        profiler = RequestProfiler(tmp_path, token='secret', max_profiles=2)
+        ids = []
+        for _ in range(3):
+            with profiler.start('upload') as session:
+                pass
+            ids.append(session.id)
+
+        assert sorted(p['profile_id'] for p in profiler.list_profiles()) == sorted(ids[1:])
@@ -0,0 +1,115 @@
+"""Shift-JIS互換性スキャナーのテスト"""
+import numpy as np
+import pandas as pd
+import pytest
+from services.shiftjis_scanner import (
+    CP932_VARIANTS, fix_frame, scan_column, scan_frame, summarize_issues, unencodable_pattern
+)
+from services.validator import Validator
+
+
+def _slow_issues(df):
+    """1文字ずつエンコードする参照実装"""
+    issues = []
+    for col in df.columns:
+        for row, value in enumerate(df[col]):
+            if not isinstance(value, str):
+                continue
+            for position, char in enumerate(value):
+                try:
+                    char.encode('shift_jis')
+                except UnicodeEncodeError:
+                    issues.append((row, col, position, char))
+    return issues
+
+
+class TestShiftJISScanner:
+    """スキャナーのテスト"""
+
+    def test_pattern_matches_encoder(self):
+        """正規表現の判定が1文字ずつのエンコード結果と一致すること"""
+        pattern = unencodable_pattern('shift_jis')
+        for code in list(range(0, 0x10000, 7)) + [0x2460, 0xFF5E, 0x1F600]:
+            char = chr(code)
+            try:
+                char.encode('shift_jis')
+                encodable = True
+            except UnicodeEncodeError:
+                encodable = False
+            assert (pattern.fullmatch(char) is None) == encodable, hex(code)
+
+    def test_scan_reports_exact_positions(self):
+        """行・列・文字位置を正確に報告すること"""
+        df = pd.DataFrame({
+            '商品名': ['ケース①', 'カバー', '～新作～'],
+            '説明': ['', np.nan, 'ok😀'],
+        })
+        issues = scan_frame(df)
+
+        assert [(i['row'], i['column'], i['position'], i['char']) for i in issues] == _slow_issues(df)
+        assert issues[0] == {'row': 0, 'column': '商品名', 'position': 3, 'char': '①', 'codepoint': 'U+2460'}
+        assert issues[-1]['codepoint'] == 'U+1F600'
+
+    def test_random_text_matches_reference(self):
+        """ランダムな文字列で参照実装と一致すること"""
+        rng = np.random.default_rng(0)
+        alphabet = list('abcあいう漢字ｶﾅ①②～－∥\n,"') + ['😀', 'é']
+        values = [''.join(rng.choice(alphabet, size=rng.integers(0, 8))) for _ in range(300)]
+        df = pd.DataFrame({'a': values, 'b': values[::-1]})
+
+        issues = scan_frame(df)
+        assert [(i['row'], i['column'], i['position'], i['char']) for i in issues] == _slow_issues(df)
+
+    def test_clean_column_is_empty(self):
+        """問題のない列は空のリスト"""
+        assert scan_column(np.array(['abc', 'テスト', ''], dtype=object)) == []
+        assert scan_column(np.array([], dtype=object)) == []
+
+    def test_fix_frame_replaces_column_wise(self):
+        """置換表の文字は置き換え、それ以外は ? になり、元のフレームは変更されないこと"""
+        df = pd.DataFrame({'a': ['1～2', 'ok', '①'], 'b': ['x', 'y', 'z'], 'n': [1, 2, 3]})
+        fixed, replaced = fix_frame(df, replacements=CP932_VARIANTS)
+
+        assert replaced == 2
+        assert fixed['a'].tolist() == ['1〜2', 'ok', '?']
+        assert fixed['b'].tolist() == ['x', 'y', 'z']
+        assert fixed['n'].tolist() == [1, 2, 3]
+        assert df['a'].tolist() == ['1～2', 'ok', '①']
+        assert scan_frame(fixed) == []
+
+    def test_summary_counts(self):
+        """列ごと・文字ごとの件数"""
+        df = pd.DataFrame({'a': ['①①', '～'], 'b': ['①', '']})
+        summary = summarize_issues(scan_frame(df), sample_size=2)
+
+        assert summary['issue_count'] == 4
+        assert summary['columns'] == {'a': 3, 'b': 1}
+        assert summary['characters'] == {'①': 3, '～': 1}
+        assert len(summary['issues']) == 2
+
+
+class TestValidatorEncoding:
+    """Validatorの文字コードチェック"""
+
+    def test_fixed_output_matches_writer(self, tmp_path):
+        """CP932固有文字以外は Shift-JIS の書き込み（errors='replace'）と同じ結果になること"""
+        df = pd.DataFrame({'a': ['①テスト', 'abc'], 'b': ['😀', 'ｶﾅ']})
+        fixed, issues = Validator().fix_output_encoding(df)
+
+        assert len(issues) == 2
+        expected = df.to_csv(index=False).encode('shift_jis', errors='replace')
+        assert fixed.to_csv(index=False).encode('shift_jis') == expected
+
+    def test_check_data_integrity_scans_every_value(self):
+        """先頭100件以降の値も検査されること"""
+        df = pd.DataFrame({'バリエーション1:選択肢': ['a'] * 500 + ['①']})
+        result = Validator().check_data_integrity(df)
+
+        assert result['issues'] == ["Column 'バリエーション1:選択肢' contains non-Shift-JIS characters"]
+        assert result['encoding_issues']['issues'][0]['row'] == 500
+
+    def test_clean_for_shiftjis(self):
+        """Shift-JISで表現できない文字が ? に置き換わること"""
+        df = pd.DataFrame({'a': ['①a', None]})
+        cleaned = Validator().clean_for_shiftjis(df)
+        assert cleaned['a'].tolist() == ['?a', None]
@@ -0,0 +1,105 @@
+"""SKUBlockAllocatorのテスト"""
+import json
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from services.sku_allocator import (
+    PreallocatedSKUAllocator, SKUBlockAllocator, SKUReservationExhausted, SQLiteSKUAllocator,
+    create_sku_allocator, merge_ranges
+)
+
+
+def _allocate_from_db(args):
+    """別プロセスから同じデータベースで採番"""
+    db_path, count = args
+    allocator = SQLiteSKUAllocator(db_path)
+    return [sku for _ in range(count) for sku in allocator.allocate(3)]
+
+
+class TestSKUBlockAllocator:
+    """ブロック採番のテスト"""
+
+    def test_allocates_contiguous_block(self, test_state_file):
+        """連続した番号を払い出し、最大値を保持すること"""
+        allocator = SKUBlockAllocator(test_state_file)
+
+        assert allocator.allocate(3) == ['sku_a000001', 'sku_a000002', 'sku_a000003']
+        assert allocator.high_water == 3
+
+    def test_migrates_legacy_state_and_skips_used(self, test_state_file):
+        """旧形式のused_skusを範囲に変換し、使用済み番号を飛ばすこと"""
+        test_state_file.write_text(json.dumps({
+            'global_counter': 2,
+            'used_skus': ['sku_a000001', 'sku_a000002', 'sku_a000004', 'sku_a000005', 'other']
+        }), encoding='utf-8')
+        allocator = SKUBlockAllocator(test_state_file)
+
+        assert allocator.reserved_ranges == [(4, 5)]
+        assert allocator.allocate(3) == ['sku_a000003', 'sku_a000006', 'sku_a000007']
+        assert allocator.reserved_ranges == []
+
+    def test_save_and_reload(self, test_state_file):
+        """保存した状態から採番を続けられること"""
+        test_state_file.write_text(json.dumps({
+            'global_counter': 0, 'used_skus': ['sku_a000010']
+        }), encoding='utf-8')
+        allocator = SKUBlockAllocator(test_state_file)
+        allocator.allocate(2)
+        allocator.save()
+
+        data = json.loads(test_state_file.read_text(encoding='utf-8'))
+        assert data == {'global_counter': 2, 'reserved_ranges': [[10, 10]]}
+
+        reloaded = SKUBlockAllocator(test_state_file)
+        assert reloaded.allocate(9)[-2:] == ['sku_a000011', 'sku_a000012']
+
+    def test_formats_beyond_six_digits(self):
+        """6桁を超える番号もゼロ埋めなしで連番になること"""
+        allocator = SKUBlockAllocator()
+        allocator.high_water = 999999
+
+        assert allocator.allocate(2) == ['sku_a1000000', 'sku_a1000001']
+
+    def test_merge_ranges(self):
+        """重なる範囲・隣接する範囲をまとめること"""
+        assert merge_ranges([(5, 6), (1, 2), (3, 3), (8, 9), (9, 12)]) == [(1, 3), (5, 6), (8, 12)]
+
+    def test_preallocated_numbers(self):
+        """事前確保した番号を順に払い出し、不足したらエラーになること"""
+        allocator = PreallocatedSKUAllocator(['sku_a000007', 'sku_a000008', 'sku_a000010'])
+
+        assert allocator.allocate(2) == ['sku_a000007', 'sku_a000008']
+        with pytest.raises(SKUReservationExhausted):
+            allocator.allocate(2)
+
+
+class TestSQLiteSKUAllocator:
+    """SQLiteバックエンドのテスト"""
+
+    def test_migrates_json_state_on_first_use(self, test_state_file):
+        """初回利用時にJSONの状態を取り込み、以降はデータベースから採番すること"""
+        test_state_file.write_text(json.dumps({
+            'global_counter': 5, 'used_skus': ['sku_a000006']
+        }), encoding='utf-8')
+        allocator = create_sku_allocator(test_state_file, backend='sqlite')
+
+        assert isinstance(allocator, SQLiteSKUAllocator)
+        assert allocator.allocate(2) == ['sku_a000007', 'sku_a000008']
+
+        # JSONが古い内容で上書きされても再移行しない
+        test_state_file.write_text(json.dumps({'global_counter': 0}), encoding='utf-8')
+        reopened = create_sku_allocator(test_state_file, backend='sqlite')
+        assert reopened.high_water == 8
+        assert reopened.reserved_ranges == []
+
+    def test_concurrent_processes_never_share_numbers(self, tmp_path):
+        """複数プロセスから同時に採番しても重複しないこと"""
+        db_path = tmp_path / 'sku_state.db'
+        SQLiteSKUAllocator(db_path)
+
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_allocate_from_db, [(db_path, 50)] * 4))
+
+        skus = [sku for result in results for sku in result]
+        assert len(skus) == 600
+        assert len(set(skus)) == 600
+        assert SQLiteSKUAllocator(db_path).high_water == 600
@@ -0,0 +1,128 @@
+"""StreamingCSVPipelineのテスト"""
+import random
+import pandas as pd
+import pytest
+from services.csv_processor import CSVProcessor
+from services.rakuten_processor import RakutenCSVProcessor
+from services.streaming_pipeline import ChunkColumnsMismatchError, StreamingCSVPipeline, NonContiguousProductError
+from services.validator import Validator
+
+
+def _pipeline(state_file, chunk_rows=3):
+    return StreamingCSVPipeline(CSVProcessor(), RakutenCSVProcessor(state_file), Validator(),
+                                chunk_rows=chunk_rows)
+
+
+def _write(df, path):
+    df.to_csv(path, index=False, encoding='shift_jis')
+    return path
+
+
+class TestStreamingPipeline:
+    """ストリーミング処理のテスト"""
+
+    def test_chunks_never_split_products(self, rakuten_csv_data, test_state_file, tmp_path):
+        """チャンク境界で商品が分割されないこと"""
+        path = _write(rakuten_csv_data, tmp_path / 'input.csv')
+        pipeline = _pipeline(test_state_file, chunk_rows=2)
+
+        chunks = list(pipeline.iter_product_chunks(path))
+        products = [chunk['商品管理番号（商品URL）'].unique().tolist() for chunk in chunks]
+
+        flattened = [pid for ids in products for pid in ids]
+        assert flattened == ['case001', 'case002']
+        assert sum(len(chunk) for chunk in chunks) == len(rakuten_csv_data)
+
+    def test_non_contiguous_products_are_rejected(self, rakuten_csv_data, test_state_file, tmp_path):
+        """商品行が連続していない場合はエラーとなること"""
+        df = pd.concat([rakuten_csv_data, rakuten_csv_data.iloc[[1]]], ignore_index=True)
+        path = _write(df, tmp_path / 'input.csv')
+        pipeline = _pipeline(test_state_file)
+
+        assert pipeline.scan_devices(path)['contiguous'] is False
+        with pytest.raises(NonContiguousProductError):
+            list(pipeline.iter_product_chunks(path))
+
+    def test_process_file_matches_in_memory(self, rakuten_csv_data, test_state_file, tmp_path):
+        """ストリーミング処理の結果がメモリ内処理と一致すること"""
+        path = _write(rakuten_csv_data, tmp_path / 'input.csv')
+        options = {'devices_to_add': ['iPhone 16'], 'devices_to_remove': ['iPhone 14']}
+
+        csv_processor = CSVProcessor()
+        random.seed(0)
+        expected = RakutenCSVProcessor(tmp_path / 'memory_state.json').process_csv(
+            csv_processor.read_csv(path), **options)
+        csv_processor.save_csv(expected, tmp_path / 'memory.csv')
+
+        random.seed(0)
+        result = _pipeline(test_state_file).process_file(path, tmp_path / 'stream.csv', **options)
+
+        assert result['valid'] is True
+        assert result['total_rows'] == len(expected)
+        assert (tmp_path / 'stream.csv').read_bytes() == (tmp_path / 'memory.csv').read_bytes()
+
+    def test_process_file_writes_parts_inline(self, rakuten_csv_data, test_state_file, tmp_path):
+        """分割ファイルを本体の書き込みと同時に出力すること"""
+        from services.csv_splitter import CSVSplitter
+
+        path = _write(rakuten_csv_data, tmp_path / 'input.csv')
+        pipeline = _pipeline(test_state_file, chunk_rows=2)
+        part_writer = CSVSplitter(max_rows_per_file=6).part_writer(tmp_path, 'out', pipeline.csv_processor)
+
+        result = pipeline.process_file(path, tmp_path / 'out.csv', part_writer=part_writer,
+                                       devices_to_add=['iPhone 16'])
+
+        assert result['valid'] is True
+        parts = [CSVProcessor().read_csv(p) for p in result['part_files']]
+        assert len(parts) == 2
+        assert [part['商品管理番号（商品URL）'].unique().tolist() for part in parts] == [['case001'], ['case002']]
+        pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True),
+                                      CSVProcessor().read_csv(tmp_path / 'out.csv'))
+
+    def test_duplicate_skus_across_chunks_are_rejected(self, rakuten_csv_data, test_state_file, tmp_path):
+        """入力から引き継いだSKU番号が別のチャンクで再び出た場合は検証エラーとし、出力を残さないこと"""
+        df = rakuten_csv_data.copy()
+        df.loc[df['SKU管理番号'] == 'old004', 'SKU管理番号'] = 'old001'
+        path = _write(df, tmp_path / 'input.csv')
+        pipeline = _pipeline(test_state_file, chunk_rows=2)
+        # 入力のSKU番号を採番し直さずそのまま出力する処理で重複を起こす
+        pipeline.rakuten_processor.process_csv = lambda chunk, **options: chunk.copy()
+
+        result = pipeline.process_file(path, tmp_path / 'out.csv')
+
+        assert result['valid'] is False
+        assert result['errors'] == ['Duplicate SKUs found: old001']
+        assert [(v['type'], v['sku'], v['count']) for v in result['violations']] == [
+            ('duplicate_sku', 'old001', 2)
+        ]
+        assert not (tmp_path / 'out.csv').exists()
+
+    def test_allocated_skus_are_not_retained(self):
+        """この実行で採番したSKU番号は保持せず、入力から引き継いだ番号のみ保持すること"""
+        result = pd.DataFrame({'SKU管理番号': ['', 'sku_a000001', 'old001']})
+        carried_skus = set()
+
+        duplicates = StreamingCSVPipeline._cross_chunk_duplicates(
+            result, pd.Series(['old001', 'old002']), carried_skus)
+
+        assert duplicates == []
+        assert carried_skus == {'old001'}
+
+    def test_chunk_with_different_columns_is_rejected(self, rakuten_csv_data, test_state_file, tmp_path):
+        """後のチャンクの列が出力ヘッダーと異なる場合は列を落とさずエラーとすること"""
+        path = _write(rakuten_csv_data, tmp_path / 'input.csv')
+        pipeline = _pipeline(test_state_file, chunk_rows=2)
+        process_csv = pipeline.rakuten_processor.process_csv
+        calls = []
+
+        def process_with_new_column(chunk, **options):
+            result = process_csv(chunk, **options)
+            calls.append(chunk)
+            if len(calls) > 1:
+                result['追加列'] = ''
+            return result
+
+        pipeline.rakuten_processor.process_csv = process_with_new_column
+        with pytest.raises(ChunkColumnsMismatchError, match="extra: \\['追加列'\\]"):
+            pipeline.process_file(path, tmp_path / 'out.csv')
+        assert not (tmp_path / 'out.csv').exists()
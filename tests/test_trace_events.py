@@ -0,0 +1,79 @@
+"""ジョブ単位の診断イベント（リングバッファ）のテスト"""
+import numpy as np
+
+from services.device_manager import DeviceManager
+from services.instrumentation import MetricsRegistry, events_enabled, span, trace_event, tracing
+from services.rakuten_processor import RakutenCSVProcessor
+
+
+class TestTraceEvents:
+    """診断イベントのテスト"""
+
+    def test_disabled_by_default(self):
+        """トレース外・無効なトレースでは何も記録しないこと"""
+        trace_event('ignored', value=1)
+        with tracing(MetricsRegistry()) as trace:
+            assert events_enabled() is False
+            trace_event('ignored', value=1)
+
+        assert trace.events is None
+        assert trace.event_log() == {'enabled': False, 'capacity': 0, 'recorded': 0, 'dropped': 0, 'events': []}
+
+    def test_ring_buffer_keeps_latest(self):
+        """上限を超えた古いイベントは破棄され、破棄件数が返ること"""
+        with tracing(MetricsRegistry()) as trace:
+            trace.enable_events(3)
+            with span('split'):
+                for i in range(5):
+                    trace_event('step', index=i)
+        log = trace.event_log()
+
+        assert log['recorded'] == 5 and log['dropped'] == 2
+        assert [e['index'] for e in log['events']] == [2, 3, 4]
+        assert [e['seq'] for e in log['events']] == [3, 4, 5]
+        assert all(e['span'] == 'split' and e['event'] == 'step' for e in log['events'])
+
+    def test_fields_are_json_values(self):
+        """numpyの値・欠損値・任意のオブジェクトをJSONで表せる値に変換すること"""
+        with tracing(MetricsRegistry()) as trace:
+            trace.enable_events()
+            trace_event('values', count=np.int64(3), missing=float('nan'),
+                        devices=np.array(['iPhone 16']), path=object, nested={1: (np.float64(0.5),)})
+        event = trace.event_log()['events'][0]
+
+        assert event['count'] == 3 and isinstance(event['count'], int)
+        assert event['missing'] is None
+        assert event['devices'] == ['iPhone 16']
+        assert event['path'] == str(object)
+        assert event['nested'] == {'1': [0.5]}
+        assert event['span'] is None
+
+
+class TestProcessingEvents:
+    """処理中の診断イベントのテスト"""
+
+    def test_processing_records_events_instead_of_printing(self, test_state_file, rakuten_csv_data, capsys):
+        """有効時はSKU行の追加・採番をイベントとして記録し、標準出力には何も出さないこと"""
+        processor = RakutenCSVProcessor(test_state_file)
+        with tracing(MetricsRegistry()) as trace:
+            trace.enable_events()
+            processor.process_csv(rakuten_csv_data.copy(), devices_to_add=['iPhone 16'],
+                                  devices_to_remove=['iPhone 15'])
+            DeviceManager().extract_devices(rakuten_csv_data)
+        counts = {}
+        for event in trace.event_log()['events']:
+            counts[event['event']] = counts.get(event['event'], 0) + 1
+
+        assert counts['sku_row_added'] >= 1
+        assert counts['system_sku'] >= 1
+        assert counts['devices_extracted'] == 1
+        assert capsys.readouterr().out == ''
+
+    def test_disabled_processing_is_silent(self, test_state_file, rakuten_csv_data, capsys):
+        """無効時もデバッグ出力をしないこと"""
+        processor = RakutenCSVProcessor(test_state_file)
+        with tracing(MetricsRegistry()) as trace:
+            processor.process_csv(rakuten_csv_data.copy(), devices_to_add=['iPhone 16'])
+
+        assert trace.event_log()['recorded'] == 0
+        assert capsys.readouterr().out == ''
@@ -0,0 +1,44 @@
+"""UploadAnalyzerのテスト"""
+import numpy as np
+from services.csv_processor import CSVProcessor
+from services.device_manager import DeviceManager
+from services.upload_analyzer import UploadAnalyzer
+
+
+class TestUploadAnalyzer:
+    """アップロード解析のテスト"""
+
+    def test_matches_existing_helpers(self, rakuten_csv_data, sample_csv_data):
+        """機種一覧・商品情報が既存の処理と一致すること"""
+        analyzer = UploadAnalyzer()
+        for df in (rakuten_csv_data, sample_csv_data):
+            result = analyzer.analyze(df)
+
+            assert result['devices'] == DeviceManager().extract_devices(df)
+            assert result['products'] == CSVProcessor().get_product_info(df)
+            assert result['row_count'] == len(df)
+
+    def test_product_devices_from_parent_definitions(self, rakuten_csv_data):
+        """親行のバリエーション2選択肢定義から商品ごとの機種を取得すること"""
+        result = UploadAnalyzer().analyze(rakuten_csv_data)
+
+        assert result['product_devices'] == {
+            'case001': ['iPhone 14', 'iPhone 15'],
+            'case002': ['Pixel 8'],
+        }
+
+    def test_product_devices_fallback_to_sku_rows(self, rakuten_csv_data):
+        """定義がない場合は直前の親行の商品にSKU行の機種をまとめること"""
+        df = rakuten_csv_data.copy()
+        df['バリエーション2選択肢定義'] = ''
+        # フォールバックでは SKU管理番号が欠損値の行を親行とみなす
+        df.loc[df['SKU管理番号'] == '', 'SKU管理番号'] = np.nan
+        df = df[df['選択肢タイプ'] == '']
+
+        result = UploadAnalyzer().analyze(df, include_products=False)
+
+        assert result['product_devices'] == {
+            'case001': ['iPhone 14', 'iPhone 15'],
+            'case002': ['Pixel 8'],
+        }
+        assert 'products' not in result
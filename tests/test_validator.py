@@ -0,0 +1,86 @@
+"""Validatorのテスト（標準エンジンとベクトル化エンジンの一致）"""
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from services.validator import Validator
+
+PRODUCT_COL = '商品管理番号（商品URL）'
+SKU_COL = 'SKU管理番号'
+
+
+def _catalog(seed):
+    """制限超過・警告・重複SKUを含むランダムなカタログ"""
+    rng = random.Random(seed)
+    rows = []
+    sku = 0
+    for p in range(rng.randint(5, 12)):
+        product_id = f"prod{rng.randint(0, 999):03d}"
+        size = rng.choice([3, 20, 365, 401, 50])
+        options = rng.choice([10, 41, 45])
+        for r in range(size):
+            sku += 1
+            rows.append({
+                PRODUCT_COL: product_id,
+                SKU_COL: f"sku{sku if rng.random() > 0.01 else rng.randint(1, 50)}",
+                'バリエーション1:選択肢': f"opt{r % options}",
+                'バリエーション2:選択肢': '' if r % 7 else 'x',
+            })
+    return pd.DataFrame(rows)
+
+
+def _both(df):
+    validator = Validator()
+    return validator.validate_dataframe(df), validator.validate_dataframe(df, engine='vectorized')
+
+
+class TestValidatorEngines:
+    """ベクトル化エンジンが標準エンジンと同じ結果を返すこと"""
+
+    @pytest.mark.parametrize('seed', range(8))
+    def test_random_catalogs_match(self, seed):
+        """ランダムなカタログでエラー・警告・違反テーブルが一致すること"""
+        standard, vectorized = _both(_catalog(seed))
+        assert vectorized == standard
+
+    def test_messages_and_violations(self):
+        """各違反のメッセージと違反テーブルの内容"""
+        df = pd.concat([
+            pd.DataFrame({PRODUCT_COL: 'big', SKU_COL: [f"b{i}" for i in range(401)],
+                          'バリエーション1:選択肢': [f"o{i % 41}" for i in range(401)]}),
+            pd.DataFrame({PRODUCT_COL: 'near', SKU_COL: [f"n{i}" for i in range(370)] + ['b1'],
+                          'バリエーション1:選択肢': 'a'}),
+        ], ignore_index=True)
+        _, result = _both(df)
+
+        assert result['valid'] is False
+        assert result['errors'] == [
+            "Product big: Variation 1 has 41 options (max: 40)",
+            "Product big: Has 401 SKUs (max: 400)",
+            "Duplicate SKUs found: b1",
+        ]
+        assert result['warnings'] == ["Product near: Has 371 SKUs (approaching limit of 400)"]
+        assert [(v['type'], v['level'], v['product_id']) for v in result['violations']] == [
+            ('variation_limit', 'error', 'big'),
+            ('sku_limit', 'error', 'big'),
+            ('sku_limit', 'warning', 'near'),
+            ('duplicate_sku', 'error', None),
+        ]
+        assert result['violations'][-1]['sku'] == 'b1'
+        assert result['violations'][-1]['count'] == 2
+
+    def test_all_duplicates_listed(self):
+        """メッセージは5件までだが違反テーブルには全ての重複SKUが入ること"""
+        skus = [f"s{i}" for i in range(8)] * 2 + ['', '', np.nan, np.nan]
+        df = pd.DataFrame({PRODUCT_COL: [f"p{i}" for i in range(len(skus))], SKU_COL: skus})
+        standard, vectorized = _both(df)
+
+        assert vectorized == standard
+        assert vectorized['errors'] == ["Duplicate SKUs found: s0, s1, s2, s3, s4"]
+        assert [v['sku'] for v in vectorized['violations']] == [f"s{i}" for i in range(8)]
+
+    def test_missing_product_column(self):
+        """商品管理番号列がない場合のエラー"""
+        standard, vectorized = _both(pd.DataFrame({SKU_COL: ['a', 'b']}))
+        assert vectorized == standard
+        assert vectorized['errors'] == ["Missing required columns: 商品管理番号（商品URL）"]
@@ -0,0 +1,52 @@
+"""ストリーミングZIPのテスト"""
+import io
+import os
+import zipfile
+
+import pytest
+from services.zip_stream import ZipArchiveCache, stream_zip
+
+
+def _members(tmp_path):
+    members = []
+    for i, name in enumerate(['a.csv', '商品_b.csv', 'c.csv']):
+        path = tmp_path / name
+        path.write_bytes(os.urandom(1000) + ('商品,SKU\r\n' * 20000 * (i + 1)).encode('shift_jis'))
+        members.append((name, path))
+    return members
+
+
+class TestZipStream:
+    """ZIPストリームのテスト"""
+
+    @pytest.mark.parametrize('compresslevel', [6, 0])
+    def test_stream_is_valid_zip(self, tmp_path, compresslevel):
+        """並列圧縮しながら出力したZIPが展開できること"""
+        members = _members(tmp_path)
+
+        data = b''.join(stream_zip(members, max_workers=2, compresslevel=compresslevel))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            assert archive.namelist() == [name for name, _ in members]
+            for name, path in members:
+                assert archive.read(name) == path.read_bytes()
+
+    def test_cache_serves_finished_archive(self, tmp_path):
+        """最後まで出力したアーカイブだけがキャッシュされること"""
+        members = _members(tmp_path)
+        cache = ZipArchiveCache(tmp_path / 'cache', max_workers=2)
+        key = cache.cache_key([(name, 'hash') for name, _ in members])
+
+        # 途中で切断された場合はキャッシュしない
+        chunks = cache.stream(members, key)
+        next(chunks)
+        chunks.close()
+        assert cache.get(key) is None
+        assert list((tmp_path / 'cache').iterdir()) == []
+
+        data = b''.join(cache.stream(members, key))
+        path, metadata = cache.get(key)
+        assert path.read_bytes() == data
+        assert metadata['size'] == len(data)
+        assert cache.cache_key([(name, 'other') for name, _ in members]) != key